@@ -4,6 +4,7 @@ import type React from "react"
 import { createContext, useContext, useState, useCallback, useRef, useEffect } from "react"
 import type { AegisOneResponse, ApiConfig, EventItem } from "./types"
 import { useSettings } from "./settings-context"
+import { dedupeEvents, expandTelemetry } from "./telemetry"
 
 interface AegisContextValue {
   data: AegisOneResponse | null
@@ -69,6 +70,13 @@ export function AegisProvider({ children }: { children: React.ReactNode }) {
       }
 
       const result: AegisOneResponse = await response.json()
+      // Batched payloads from the firmware arrive as one columnar item
+      if (result.telemetry) {
+        result.telemetry = expandTelemetry(result.telemetry)
+      }
+      if (result.events) {
+        result.events = dedupeEvents(result.events)
+      }
       
       // Debug: Log telemetry data to see what we're getting
       if (result.telemetry && result.telemetry.length > 0) {
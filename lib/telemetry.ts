@@ -0,0 +1,87 @@
+import type { EventItem, TelemetryBatch, TelemetryItem } from "./types"
+
+// Default distance thresholds of the firmware's get_proximity_status(), only
+// for readings without the node's own proximity: the node's thresholds can
+// be changed remotely, so what it reports is what it acted on
+const DIST_WARNING = 100
+const DIST_DANGER = 30
+
+export function isTelemetryBatch(item: unknown): item is TelemetryBatch {
+  return (
+    typeof item === "object" &&
+    item !== null &&
+    "ts0" in item &&
+    Array.isArray((item as TelemetryBatch).ts)
+  )
+}
+
+function proximityFor(distance: number): TelemetryItem["proximity"] {
+  if (distance <= DIST_DANGER) return "DANGER"
+  if (distance <= DIST_WARNING) return "WARNING"
+  return "SAFE"
+}
+
+// Expand a columnar batch into one TelemetryItem per reading. Window and
+// spectrum features are per-batch snapshots and stay on the newest reading.
+export function unpackTelemetryBatch(batch: TelemetryBatch): TelemetryItem[] {
+  const items: TelemetryItem[] = batch.ts.map((delta, i) => ({
+    deviceId: batch.deviceId,
+    ts: batch.ts0 + delta,
+    temp: batch.temp[i],
+    vib: batch.vib[i],
+    distance: batch.distance[i],
+    proximity:
+      batch.proximity?.[i] ??
+      (batch.distance[i] !== undefined ? proximityFor(batch.distance[i]) : undefined),
+    status: batch.status[i],
+  }))
+
+  const last = items[items.length - 1]
+  if (last) {
+    last.vibRms = batch.vibRms
+    last.vibCrest = batch.vibCrest
+    last.vibP2p = batch.vibP2p
+    last.vibBands = batch.vibBands
+    last.vibPeakHz = batch.vibPeakHz
+    last.vibBandHz = batch.vibBandHz
+    last.loopLagMs = batch.loopLagMs
+    last.rate = batch.rate
+    last.sampleMs = batch.sampleMs
+    last.seq = batch.seq
+    last.vibDropped = batch.vibDropped
+    last.reconnects = batch.reconnects
+    last.offlineMs = batch.offlineMs
+    last.eventQueue = batch.eventQueue
+    last.memFree = batch.memFree
+    last.allocPerPass = batch.allocPerPass
+    last.allocMaxPass = batch.allocMaxPass
+    last.gcMaxUs = batch.gcMaxUs
+  }
+  return items
+}
+
+// Normalize an API telemetry list that may mix single readings and batches
+export function expandTelemetry(items: (TelemetryItem | TelemetryBatch)[]): TelemetryItem[] {
+  const out: TelemetryItem[] = []
+  for (const item of items) {
+    if (isTelemetryBatch(item)) {
+      out.push(...unpackTelemetryBatch(item))
+    } else {
+      out.push(item)
+    }
+  }
+  return out
+}
+
+// Events are retried until acknowledged, so one event can be stored more
+// than once under the same eventId. Keep the first copy of each.
+export function dedupeEvents(events: EventItem[]): EventItem[] {
+  const seen = new Set<string>()
+  return events.filter((event) => {
+    if (event.eventId === undefined) return true
+    const key = `${event.deviceId}/${event.eventId}`
+    if (seen.has(key)) return false
+    seen.add(key)
+    return true
+  })
+}
@@ -9,6 +9,150 @@ export interface TelemetryItem {
   // Ultrasonic sensor data (optional - for M5Core2)
   distance?: number      // Distance in cm
   proximity?: "SAFE" | "WARNING" | "DANGER"  // Safety zone status
+  // Windowed vibration features (optional - for M5Core2)
+  vibRms?: number        // RMS of the sample window in g
+  vibCrest?: number      // Crest factor (peak / RMS)
+  vibP2p?: number        // Peak-to-peak in g
+  // Vibration spectrum (optional - for M5Core2)
+  vibBands?: number[]    // Band energies in g², equal-width bands from 0 Hz
+  vibPeakHz?: number     // Dominant frequency in Hz
+  vibBandHz?: number     // Width of each band in Hz
+  loopLagMs?: number     // Worst scheduler loop lag since the previous message
+  rate?: "fast" | "normal" | "slow" | "saver"  // Adaptive sampling level
+  sampleMs?: number      // Current interval between readings
+  seq?: number           // Message sequence number; a gap means a lost message
+  vibDropped?: number    // IMU samples dropped by the acquisition ring since boot
+  reconnects?: number    // MQTT reconnects since boot
+  offlineMs?: number     // Time offline since the first drop, including a current outage
+  eventQueue?: number    // Events waiting for an acknowledgement
+  // Memory profile (only while MEM_PROFILE is on)
+  memFree?: number       // gc.mem_free() in bytes
+  allocPerPass?: number  // Mean bytes allocated per publisher pass
+  allocMaxPass?: number  // Worst bytes allocated in one pass
+  gcMaxUs?: number       // Longest garbage collection pause in microseconds
+}
+
+// Columnar multi-reading payload (aegisone/telemetry/batch and
+// aegisone/telemetry/replay). Reading i was taken at ts0 + ts[i].
+export interface TelemetryBatch {
+  deviceId: string
+  ts0: number
+  ts: number[]
+  temp: number[]
+  vib: number[]
+  distance: number[]
+  status: string[]
+  proximity?: (TelemetryItem["proximity"] | null)[]  // The node's own; absent from older nodes
+  battery?: number
+  vibRms?: number
+  vibCrest?: number
+  vibP2p?: number
+  vibBands?: number[]
+  vibPeakHz?: number
+  vibBandHz?: number
+  loopLagMs?: number
+  rate?: "fast" | "normal" | "slow" | "saver"
+  sampleMs?: number
+  seq?: number
+  vibDropped?: number
+  reconnects?: number
+  offlineMs?: number
+  eventQueue?: number
+  memFree?: number
+  allocPerPass?: number
+  allocMaxPass?: number
+  gcMaxUs?: number
+}
+
+// Edge rollup (aegisone/telemetry/rollup): one aggregation window of every
+// reading the node took, aligned to the wall clock (windowMs 60000 or 900000)
+export interface ChannelRollup {
+  min: number
+  max: number
+  mean: number
+  std: number            // Population standard deviation
+  overMs: number         // Time at or past the warning threshold (distance: at or below)
+}
+
+export interface TelemetryRollup {
+  deviceId: string
+  ts0: number            // Window start
+  windowMs: number
+  n: number              // Readings in the window
+  temp: ChannelRollup
+  vib: ChannelRollup
+  distance: ChannelRollup
+  statusMs: Record<"RUNNING" | "WARNING" | "CRITICAL", number>
+}
+
+// Per-stage timing window (aegisone/health, only while profiling is on).
+// Durations are estimated from log-linear microsecond buckets (within 12.5%).
+export interface StageTiming {
+  n: number
+  p50Us: number
+  p95Us: number
+  maxUs: number
+  overruns: number       // Runs longer than the stage's task period
+}
+
+// Acknowledged event delivery; counters since boot, latencies over the window
+export interface EventDelivery {
+  depth: number          // Waiting plus in flight
+  inflight: number
+  sent: number
+  acked: number
+  retries: number
+  expired: number        // Given up after the last retry
+  dropped: number        // Oldest waiting events dropped while the queue was full
+  duplicates: number     // Acknowledgements for events no longer in flight
+  shed: number           // Telemetry readings skipped while events backed up
+  ackP50Ms: number
+  ackP95Ms: number
+  ackMaxMs: number
+}
+
+export interface DeviceHealth {
+  deviceId: string
+  ts: number
+  seq: number
+  windowMs: number       // Time covered by the histograms
+  loopLagMs: number
+  acqDropped: number     // IMU samples dropped by the acquisition ring since boot
+  acqLate: number        // Times the acquisition thread was held off a whole period
+  reconnects: number     // MQTT reconnects since boot
+  offlineMs: number      // Time offline since the first drop
+  events: EventDelivery
+  bootMs: BootTimes
+  configVersion: number  // Remote configuration in force (0: firmware defaults)
+  snapshots: SnapshotStats | null
+  stages: Record<string, StageTiming>
+}
+
+// Milliseconds from firmware start; a mark is missing until it happened
+export interface BootTimes {
+  sample?: number        // First reading on screen
+  connect?: number       // First MQTT connection
+  publish?: number       // First successful publish
+}
+
+// Waveform snapshots since boot (chunks on aegisone/snapshots, binary)
+export interface SnapshotStats {
+  taken: number          // CRITICAL triggers that started a capture
+  missed: number         // Triggers while a snapshot was still held
+  short: number          // Windows closed early because sampling stopped
+  sent: number           // Snapshots fully uploaded
+  chunks: number
+}
+
+// Answer of a node to a configuration document (aegisone/config/ack)
+export interface ConfigAck {
+  deviceId: string
+  version: number        // Version of the document answered
+  status: 'applied' | 'current' | 'stale' | 'rejected'
+  configVersion: number  // Version in force after the document
+  saved: boolean         // Written to flash, so it survives a reboot
+  ts: number
+  error?: string         // Why the document was rejected
 }
 
 export interface EventDetails {
@@ -23,9 +167,14 @@ export interface EventDetails {
   tn: boolean
   tp: boolean
   vib: number
+  clearedSeverity?: string
+  durationMs?: number
+  suppressed?: number
+  configVersion?: number // On the STATUS event sent at connect
 }
 
 export interface EventItem {
+  eventId?: number       // Same on every retry of an event
   eventType: string
   severity: string
   eventTs: number
@@ -0,0 +1,144 @@
+# ============================================================================
+# AegisOne Acquisition Thread
+# IMU sampling in a _thread worker, handed over through a lock-free
+# single-producer/single-consumer ring
+# ============================================================================
+# The worker thread reads the accelerometer at a fixed rate and pushes each
+# magnitude into a SampleRing; the main thread drains the ring into the
+# VibSampler window from its IMU task. TLS publishes and LVGL redraws on the
+# main thread then no longer decide when a sample is taken: the worker is
+# preempted back in on its own period.
+#
+# The ring needs no lock. Only the producer writes `head` and only the
+# consumer writes `tail`; a slot is written before `head` moves past it and
+# read before `tail` does, and one slot is always left empty so that
+# head == tail means empty. Each index is a small int, so its update is a
+# single store on MicroPython and under the CPython GIL.
+#
+# Backpressure: when the ring is full the producer drops the NEW sample and
+# counts it in `dropped`. It never blocks (sampling must keep its period)
+# and never overwrites unread slots (that would mean moving `tail`, which
+# belongs to the consumer). The vibration window is rebuilt from the most
+# recent samples anyway, so a stalled consumer loses the newest data for the
+# stall and then catches up; `dropped` tells the backend how much. Size the
+# ring for the longest main-thread stall tolerated (ACQ_RING_SAMPLES).
+#
+# MicroPython on the ESP32 keeps a GIL and runs _thread workers on the same
+# core as the interpreter, so this buys preemptive scheduling, not true
+# parallelism; code that blocks inside C without releasing the GIL still
+# delays the worker. start() raises if _thread is unavailable and the
+# caller falls back to the hardware timer.
+# ============================================================================
+
+import time
+from array import array
+
+
+class SampleRing:
+    """Lock-free SPSC ring of floats; a full ring drops the new sample"""
+
+    def __init__(self, capacity):
+        self.size = capacity + 1  # one slot stays empty
+        self.buf = array('f', bytes(4 * self.size))
+        self.head = 0     # next slot to write (producer only)
+        self.tail = 0     # next slot to read (consumer only)
+        self.pushed = 0   # producer only
+        self.dropped = 0  # producer only
+
+    def push(self, v):
+        """Producer: add a sample; False (and counted) when full"""
+        head = self.head
+        nxt = head + 1
+        if nxt == self.size:
+            nxt = 0
+        if nxt == self.tail:
+            self.dropped += 1
+            return False
+        self.buf[head] = v
+        self.head = nxt
+        self.pushed += 1
+        return True
+
+    def drain(self, sink, limit=None):
+        """Consumer: pass queued samples to sink(v) in order; returns the count"""
+        tail = self.tail
+        head = self.head  # read once: later pushes wait for the next drain
+        size = self.size
+        buf = self.buf
+        n = 0
+        while tail != head:
+            if limit is not None and n >= limit:
+                break
+            sink(buf[tail])
+            tail += 1
+            if tail == size:
+                tail = 0
+            n += 1
+            self.tail = tail
+        return n
+
+    def __len__(self):
+        n = self.head - self.tail
+        return n + self.size if n < 0 else n
+
+
+class Acquisition:
+    """Samples read() every period_us in a worker thread into a SampleRing"""
+
+    def __init__(self, read, period_us, capacity):
+        self.read = read
+        self.period_us = period_us
+        self.ring = SampleRing(capacity)
+        self.running = False
+        self.alive = False
+        self.late = 0     # periods missed by more than one period (resynced)
+        self.errors = 0   # read() returned None
+
+    def start(self, stack_size=None):
+        """Start the worker thread"""
+        import _thread
+        if stack_size:
+            _thread.stack_size(stack_size)
+        self.running = True
+        try:
+            _thread.start_new_thread(self._run, ())
+        except Exception:
+            self.running = False
+            raise
+
+    def stop(self, timeout_ms=100):
+        """Ask the worker to exit and wait briefly for it"""
+        self.running = False
+        start = time.ticks_ms()
+        while self.alive and time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+            time.sleep_ms(1)
+
+    def drain(self, sink, limit=None):
+        """Main thread: hand the samples taken so far to sink(v)"""
+        return self.ring.drain(sink, limit)
+
+    def _run(self):
+        self.alive = True
+        read = self.read
+        push = self.ring.push
+        period = self.period_us
+        due = time.ticks_us()
+        try:
+            while self.running:
+                v = read()
+                if v is None:
+                    self.errors += 1
+                else:
+                    push(v)
+                due = time.ticks_add(due, period)
+                wait = time.ticks_diff(due, time.ticks_us())
+                if wait < -period:
+                    # Held off for more than a period: resynchronise
+                    self.late += 1
+                    due = time.ticks_us()
+                elif wait > 1000:
+                    time.sleep_ms(wait // 1000)  # releases the GIL
+                elif wait > 0:
+                    time.sleep_us(wait)
+        finally:
+            self.alive = False
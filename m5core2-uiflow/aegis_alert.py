@@ -0,0 +1,143 @@
+# ============================================================================
+# AegisOne Alert State Machine
+# Threshold alerts with hysteresis, dwell times and coalesced episodes
+# ============================================================================
+# Each channel has a warning and a critical threshold. A channel that has
+# reached a level keeps it until the value falls back past the threshold by
+# its hysteresis, so a reading sitting on a threshold does not flap.
+#
+# A higher level must hold for its dwell time before it is entered; the
+# hysteresis applies while it is pending too, so noise around a threshold
+# does not restart the dwell. A lower level must hold for clear_ms before
+# the machine steps down. Once back to RUNNING the episode stays open for
+# the cooldown of its peak severity. A re-entry in that window joins the
+# same episode, so a flapping machine gives one ENTERED event per severity
+# and one CLEARED event per episode.
+#
+# Every pass where a threshold is exceeded but no event is emitted (each of
+# which used to publish an event) is counted as suppressed. The count is
+# reported by the CLEARED event.
+# ============================================================================
+
+import time
+
+RUNNING = 0
+WARNING = 1
+CRITICAL = 2
+SEVERITIES = ('RUNNING', 'WARNING', 'CRITICAL')
+
+ENTERED = 'entered'
+CLEARED = 'cleared'
+
+
+class AlertMachine:
+    """Turns per-pass readings into ENTERED/CLEARED alert events"""
+
+    def __init__(self, dwell_ms=(0, 1000, 0), clear_ms=5000, cooldown_ms=(0, 60000, 60000)):
+        self.dwell_ms = dwell_ms
+        self.clear_ms = clear_ms
+        self.cooldown_ms = cooldown_ms
+        self.rules = []
+
+        self.level = RUNNING
+        self.candidate = RUNNING
+        self.since = None
+        self.over = False
+        self.peak = RUNNING
+        self.start = None
+        self.cleared_at = None
+        self.suppressed = 0
+
+        self.entered = 0
+        self.cleared = 0
+        self.suppressed_total = 0
+
+    def watch(self, warning, critical, hysteresis, rising=True):
+        """Add a channel; falling channels (distance) alert at or below"""
+        self.rules.append(self._rule(warning, critical, hysteresis, rising))
+
+    def retune(self, index, warning, critical, hysteresis):
+        """New thresholds for a channel; the current level and episode are kept"""
+        self.rules[index] = self._rule(warning, critical, hysteresis, self.rules[index][0])
+
+    def _rule(self, warning, critical, hysteresis, rising):
+        # Release levels are precomputed so a pass does no float arithmetic
+        if rising:
+            return (True, warning, critical, warning - hysteresis, critical - hysteresis)
+        return (False, warning, critical, warning + hysteresis, critical + hysteresis)
+
+    def classify(self, values):
+        """Highest level reached by any channel, held by the hysteresis"""
+        held = self.level if self.level > self.candidate else self.candidate
+        level = RUNNING
+        over = False
+        for i in range(len(values)):
+            rising, warning, critical, warning_release, critical_release = self.rules[i]
+            x = values[i]
+            if rising:
+                w = x >= warning
+                c = x >= critical or (held == CRITICAL and x > critical_release)
+                h = held >= WARNING and x > warning_release
+            else:
+                w = x <= warning
+                c = x <= critical or (held == CRITICAL and x < critical_release)
+                h = held >= WARNING and x < warning_release
+            if w:
+                over = True
+            if c:
+                level = CRITICAL
+            elif level == RUNNING and (w or h):
+                level = WARNING
+        self.over = over
+        return level
+
+    def update(self, now_ms, *values):
+        """One threshold pass; returns (kind, severity, duration_ms, suppressed) or None"""
+        raw = self.classify(values)
+        if raw != self.candidate or self.since is None:
+            self.candidate = raw
+            self.since = now_ms
+        held_ms = time.ticks_diff(now_ms, self.since)
+
+        event = None
+        if raw > self.level:
+            if held_ms >= self.dwell_ms[raw]:
+                event = self._enter(raw, now_ms)
+        elif raw < self.level:
+            if held_ms >= self.clear_ms:
+                self.level = raw
+                if raw == RUNNING:
+                    self.cleared_at = now_ms
+        elif (self.cleared_at is not None
+              and time.ticks_diff(now_ms, self.cleared_at) >= self.cooldown_ms[self.peak]):
+            event = self._clear()
+
+        if self.over and event is None:
+            self.suppressed += 1
+            self.suppressed_total += 1
+        return event
+
+    def _enter(self, level, now_ms):
+        self.level = level
+        self.cleared_at = None
+        if self.peak == RUNNING:
+            self.start = now_ms
+        if level <= self.peak:
+            return None  # coalesced into the open episode
+        self.peak = level
+        self.entered += 1
+        return (ENTERED, level, 0, self.suppressed)
+
+    def _clear(self):
+        event = (CLEARED, self.peak, time.ticks_diff(self.cleared_at, self.start),
+                 self.suppressed)
+        self.peak = RUNNING
+        self.start = None
+        self.cleared_at = None
+        self.suppressed = 0
+        self.cleared += 1
+        return event
+
+    def active(self):
+        """True while an episode is open (including its cooldown)"""
+        return self.peak != RUNNING
@@ -0,0 +1,115 @@
+# ============================================================================
+# AegisOne Telemetry Batch
+# Collects readings into one columnar MQTT payload with a flush policy
+# ============================================================================
+# Payload layout (JSON):
+#   {"deviceId": ..., "ts0": <base ms>, "ts": [deltas ms], "temp": [...],
+#    "vib": [...], "distance": [...], "status": [...], "proximity": [...],
+#    "battery": <latest>}
+# proximity is the node's own (its distance limits can be changed
+# remotely), null for a reading added without one.
+#
+# A batch is due when it holds max_readings, when its estimated encoded
+# size reaches max_bytes, or when the oldest reading is max_age_ms old.
+# ============================================================================
+
+import json
+import time
+
+# Rough encoded size, used for the byte limit without encoding on every add
+HEADER_BYTES = 110
+READING_BYTES = 40
+
+
+class TelemetryBatch:
+    """Columnar buffer of readings flushed as a single message"""
+
+    def __init__(self, device_id, max_readings=10, max_age_ms=10000, max_bytes=1024):
+        self.device_id = device_id
+        self.max_readings = max_readings
+        self.max_age_ms = max_age_ms
+        self.max_bytes = max_bytes
+        self.ts = []
+        self.temp = []
+        self.vib = []
+        self.distance = []
+        self.status = []
+        self.proximity = []
+        self.battery = None
+        self.opened_ms = 0
+        # Reused by encode() so a flush only allocates the JSON text
+        self._dts = []
+        self._payload = {
+            "deviceId": device_id,
+            "ts0": 0,
+            "ts": self._dts,
+            "temp": self.temp,
+            "vib": self.vib,
+            "distance": self.distance,
+            "status": self.status,
+            "proximity": self.proximity
+        }
+
+    def __len__(self):
+        return len(self.ts)
+
+    def add(self, ts, temp, vib, dist, status, battery=None, proximity=None):
+        """Append one reading; returns True when the batch should be flushed"""
+        if not self.ts:
+            self.opened_ms = time.ticks_ms()
+        self.ts.append(ts)
+        self.temp.append(round(temp, 2))
+        self.vib.append(round(vib, 3))
+        self.distance.append(round(dist, 1))
+        self.status.append(status)
+        self.proximity.append(proximity)
+        if battery is not None:
+            self.battery = battery
+        return self.full()
+
+    def size_estimate(self):
+        """Approximate encoded size in bytes"""
+        return HEADER_BYTES + READING_BYTES * len(self.ts)
+
+    def full(self):
+        """True when the reading count or byte limit is reached"""
+        return len(self.ts) >= self.max_readings or self.size_estimate() >= self.max_bytes
+
+    def due(self, now_ms=None):
+        """True when the batch is full or its oldest reading has aged out"""
+        if not self.ts:
+            return False
+        if self.full():
+            return True
+        if now_ms is None:
+            now_ms = time.ticks_ms()
+        return time.ticks_diff(now_ms, self.opened_ms) >= self.max_age_ms
+
+    def encode(self, extra=None):
+        """Encode the batch as a columnar JSON payload"""
+        ts0 = self.ts[0] if self.ts else 0
+        dts = self._dts
+        del dts[:]
+        for t in self.ts:
+            dts.append(t - ts0)
+        payload = self._payload
+        payload["ts0"] = ts0
+        if self.battery is not None:
+            payload["battery"] = self.battery
+        if extra:
+            payload.update(extra)
+        text = json.dumps(payload)
+        if extra:
+            for key in extra:
+                del payload[key]
+        return text
+
+    def clear(self):
+        """Empty the batch, keeping the column lists"""
+        del self.ts[:]
+        del self.temp[:]
+        del self.vib[:]
+        del self.distance[:]
+        del self.status[:]
+        del self.proximity[:]
+        self.opened_ms = 0
@@ -0,0 +1,128 @@
+# ============================================================================
+# AegisOne Remote Configuration
+# Versioned setting documents: validated, persisted, applied all at once
+# ============================================================================
+# A document carries a version and some settings. It is merged onto the
+# node's current settings (or onto the firmware defaults with reset) and
+# the result is checked as a whole: only names in the schema, numbers of
+# the right kind inside their range, and every ordered pair (a warning
+# below its critical level, the danger distance below the warning one)
+# still in order. Nothing is applied unless everything passes.
+#
+# Versions only move forward. A document older than the one in force is
+# stale; the one in force again (a rollout retrying a node that already
+# has it) is acknowledged without being applied twice.
+#
+# The accepted document is written to flash (temp file + rename) before
+# the node applies it, so a reboot comes back with the same settings.
+# Applying is the firmware's job: it assigns the values and recomputes
+# whatever was derived from them in one call, without yielding, so no task
+# ever sees half of a document.
+# ============================================================================
+
+import json
+from aegis_core import replace
+
+APPLIED = 'applied'
+CURRENT = 'current'
+STALE = 'stale'
+REJECTED = 'rejected'
+
+
+class Config:
+    """Settings in force, their version and the rules a document must pass"""
+
+    def __init__(self, schema, defaults, ordered=()):
+        # schema: name -> (int or float, min, max); ordered: (lower, higher) pairs
+        self.schema = schema
+        self.defaults = defaults
+        self.ordered = ordered
+        self.version = 0
+        self.overrides = {}
+
+        self.applied = 0
+        self.rejected = 0
+        self.stale = 0
+
+    def values(self):
+        """Every schema setting as currently in force"""
+        out = dict(self.defaults)
+        out.update(self.overrides)
+        return out
+
+    def check(self, settings, reset=False):
+        """Merged overrides for settings, or raise ValueError naming the problem"""
+        if not isinstance(settings, dict):
+            raise ValueError("settings must be an object")
+        overrides = {} if reset else dict(self.overrides)
+        for name, value in settings.items():
+            rule = self.schema.get(name)
+            if rule is None:
+                raise ValueError("unknown setting " + name)
+            kind, lo, hi = rule
+            # bool is an int to Python; a JSON true is never a number here
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(name + " must be a number")
+            if kind is int:
+                if value != int(value):
+                    raise ValueError(name + " must be a whole number")
+                value = int(value)
+            else:
+                value = float(value)
+            if value < lo or value > hi:
+                raise ValueError("{} out of range {}..{}".format(name, lo, hi))
+            overrides[name] = value
+        merged = dict(self.defaults)
+        merged.update(overrides)
+        for lower, higher in self.ordered:
+            if merged[lower] >= merged[higher]:
+                raise ValueError(lower + " must be below " + higher)
+        return overrides
+
+    def offer(self, version, settings, reset=False):
+        """(status, overrides or None, error) for a received document"""
+        if isinstance(version, bool) or not isinstance(version, int) or version <= 0:
+            self.rejected += 1
+            return REJECTED, None, "version must be a positive integer"
+        if version < self.version:
+            self.stale += 1
+            return STALE, None, None
+        if version == self.version:
+            return CURRENT, None, None
+        try:
+            overrides = self.check(settings, reset)
+        except ValueError as e:
+            self.rejected += 1
+            return REJECTED, None, str(e)
+        return APPLIED, overrides, None
+
+    def commit(self, version, overrides):
+        self.version = version
+        self.overrides = overrides
+        self.applied += 1
+
+    def save(self, path):
+        """Write the version and overrides (temp file + rename)"""
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(json.dumps({"version": self.version, "settings": self.overrides}))
+        replace(tmp, path)
+
+    def load(self, path):
+        """Restore a saved document; False if there is none or it no longer
+        passes (e.g. saved by a firmware with other settings)"""
+        try:
+            with open(path) as f:
+                text = f.read()
+        except OSError:
+            return False
+        try:
+            data = json.loads(text)
+            version = data["version"]
+            overrides = self.check(data["settings"], True)
+        except (ValueError, KeyError, TypeError) as e:
+            print("Saved config ignored:", e)
+            return False
+        self.version = version
+        self.overrides = overrides
+        return True
@@ -0,0 +1,212 @@
+# ============================================================================
+# AegisOne Node Core
+# What the full and the simple node share: status rules, sensor drivers,
+# the telemetry payload, boot timing and replacing files on flash
+# ============================================================================
+# Both node scripts classify readings with one Limits, read their sensors
+# through the drivers below and fill the same JSON telemetry fields, so a
+# threshold, a driver fix or a field name changes in one place. A driver
+# is an object whose read() returns the latest value; a failed read is
+# printed and the previous value kept. Each script is a profile that
+# picks its drivers: the simple node takes one IMU sample per reading, a
+# fixed distance and its own battery-voltage temperature, the full node
+# samples vibration through aegis_vib's window (its own read_vibration())
+# and ranges through aegis_range.
+#
+# Modules a node may never need (the ranger, the AWS client) are imported
+# on first use, so the first reading is on screen before the network
+# stack is loaded. BootTimer records the milliseconds from the start of
+# the script to the first sample, connection and publish.
+#
+# Like the other aegis_* modules this file can be shipped precompiled
+# (host/build_mpy.py); the node scripts themselves stay source.
+# ============================================================================
+
+import os
+import time
+
+
+class Limits:
+    """Warning and critical thresholds; distance alarms at or below its limits"""
+
+    def __init__(self, temp_warning=35.0, temp_critical=45.0, vib_warning=1.5,
+                 vib_critical=2.5, dist_warning=100, dist_danger=30):
+        self.temp_warning = temp_warning
+        self.temp_critical = temp_critical
+        self.vib_warning = vib_warning
+        self.vib_critical = vib_critical
+        self.dist_warning = dist_warning
+        self.dist_danger = dist_danger
+
+    def status(self, temp, vib, dist):
+        """RUNNING, WARNING or CRITICAL; a limit reached counts as crossed"""
+        if temp >= self.temp_critical or vib >= self.vib_critical or dist <= self.dist_danger:
+            return "CRITICAL"
+        if temp >= self.temp_warning or vib >= self.vib_warning or dist <= self.dist_warning:
+            return "WARNING"
+        return "RUNNING"
+
+    def proximity(self, dist):
+        """SAFE, WARNING or DANGER"""
+        if dist <= self.dist_danger:
+            return "DANGER"
+        if dist <= self.dist_warning:
+            return "WARNING"
+        return "SAFE"
+
+
+# ============================================================================
+# Sensor drivers
+# ============================================================================
+
+class AxpTemperature:
+    """Placeholder temperature from the AXP192 battery voltage reading.
+    With an ENV III unit, return env3.temperature from read() instead."""
+
+    def __init__(self, power):
+        self.power = power
+        self.value = 0.0
+
+    def read(self):
+        try:
+            self.value = self.power.getVbatVoltage() * 0.01 + 25
+        except Exception as e:
+            print("Temp read error:", e)
+        return self.value
+
+
+class BatteryTemperature:
+    """The simple node's placeholder: 25 C at 3.7 V battery, 10 C per volt.
+    Kept apart from AxpTemperature so its readings match its own history."""
+
+    def __init__(self, power):
+        self.power = power
+        self.value = 0.0
+
+    def read(self):
+        try:
+            self.value = 25.0 + (self.power.getBatVoltage() - 3.7) * 10
+        except Exception as e:
+            print("Temp read error:", e)
+        return self.value
+
+
+class AxpBattery:
+    """Battery percentage estimated from the voltage (3.2 V empty, 4.2 V full)"""
+
+    def __init__(self, power):
+        self.power = power
+        self.value = 100
+
+    def read(self):
+        try:
+            percentage = int((self.power.getBatVoltage() - 3.2) / (4.2 - 3.2) * 100)
+            self.value = max(0, min(100, percentage))
+        except Exception:
+            pass
+        return self.value
+
+
+class ImuShock:
+    """Deviation of one accelerometer sample from 1 g"""
+
+    def __init__(self, imu):
+        self.imu = imu
+        self.imu0 = None
+        self.value = 0.0
+
+    def read(self):
+        try:
+            if self.imu0 is None:
+                self.imu0 = self.imu.IMU()
+            ax, ay, az = self.imu0.acceleration
+            self.value = abs((ax * ax + ay * ay + az * az) ** 0.5 - 1.0)
+        except Exception as e:
+            print("Vibration read error:", e)
+        return self.value
+
+
+class UltrasonicDistance:
+    """Filtered distance from an HC-SR04 style ranger (see aegis_range.py)"""
+
+    def __init__(self, machine, trig_pin, echo_pin, k=5):
+        self.machine = machine
+        self.trig_pin = trig_pin
+        self.echo_pin = echo_pin
+        self.k = k
+        self.ranger = None
+        self.value = 0.0
+
+    def read(self):
+        try:
+            # Pins and echo IRQ are configured once
+            if self.ranger is None:
+                from aegis_range import Ranger
+                self.ranger = Ranger(self.machine, self.trig_pin, self.echo_pin, self.k)
+            # Collects the previous ping's echo and starts the next one
+            distance = self.ranger.poll()
+            if distance is not None:
+                self.value = distance
+        except Exception as e:
+            print("Distance read error:", e)
+        return self.value
+
+
+class FixedDistance:
+    """A node without a ranger reports a constant, clear distance"""
+
+    def __init__(self, cm=150.0):
+        self.value = cm
+
+    def read(self):
+        return self.value
+
+
+# ============================================================================
+# Telemetry and boot timing
+# ============================================================================
+
+def fill_telemetry(payload, ts, temp, vib, dist, status, proximity, battery):
+    """Fill the reading fields of a JSON telemetry dict in place"""
+    payload["temp"] = round(temp, 2)
+    payload["vib"] = round(vib, 3)
+    payload["distance"] = round(dist, 1)
+    payload["proximity"] = proximity
+    payload["status"] = status
+    payload["battery"] = battery
+    payload["ts"] = ts
+    return payload
+
+
+class BootTimer:
+    """Milliseconds from t0 (the start of the script) to named first events"""
+
+    def __init__(self, t0):
+        self.t0 = t0
+        self.marks = {}
+
+    def mark(self, name):
+        """Record the first occurrence of name; True if this was it"""
+        if name in self.marks:
+            return False
+        self.marks[name] = time.ticks_diff(time.ticks_ms(), self.t0)
+        return True
+
+    def report(self):
+        return dict(self.marks)
+
+
+# ============================================================================
+# Flash files
+# ============================================================================
+
+def replace(tmp, path):
+    """Move a freshly written tmp file over path. Renaming over the old file
+    leaves one of the two on flash at every moment, where removing it first
+    loses it on a power cut; only a filesystem that refuses to rename over
+    an existing file gets the remove."""
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        os.remove(path)
+        os.rename(tmp, path)
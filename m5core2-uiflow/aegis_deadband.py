@@ -0,0 +1,64 @@
+# ============================================================================
+# AegisOne Report-by-Exception
+# Deadband filter with heartbeat keyframes and message sequence numbers
+# ============================================================================
+# A reading is reported when any channel has moved more than its deadband
+# from the last reported value, when the status changes, or when
+# heartbeat_ms has passed since the last report (a keyframe). Between
+# reports the backend holds the last value, so the reconstruction error of
+# each channel is bounded by its deadband.
+#
+# Every live message carries seq, incremented only after a successful
+# publish: silence with consecutive seq values is suppression, a gap in
+# seq is a lost message. seq restarts at 1 after a reboot.
+# ============================================================================
+
+import time
+
+
+class Deadband:
+    """Decides which readings are reported and numbers the messages"""
+
+    def __init__(self, bands, heartbeat_ms=60000):
+        self.bands = bands
+        self.heartbeat_ms = heartbeat_ms
+        self.last = [0.0] * len(bands)
+        self.last_status = None
+        self.last_report = None
+
+        self.seq = 0
+        self.reported = 0
+        self.suppressed = 0
+        self.keyframes = 0
+
+    def offer(self, now_ms, status, *values):
+        """True if the reading must be reported; it then becomes the reference"""
+        changed = (self.last_report is None or status != self.last_status
+                   or self._moved(values))
+        if not changed:
+            if time.ticks_diff(now_ms, self.last_report) < self.heartbeat_ms:
+                self.suppressed += 1
+                return False
+            self.keyframes += 1
+        for i in range(len(values)):
+            self.last[i] = values[i]
+        self.last_status = status
+        self.last_report = now_ms
+        self.reported += 1
+        return True
+
+    def _moved(self, values):
+        bands = self.bands
+        last = self.last
+        for i in range(len(values)):
+            if abs(values[i] - last[i]) > bands[i]:
+                return True
+        return False
+
+    def next_seq(self):
+        """Sequence number for the message being published"""
+        return self.seq + 1
+
+    def sent(self):
+        """Record a successful publish of next_seq()"""
+        self.seq += 1
@@ -0,0 +1,206 @@
+# ============================================================================
+# AegisOne Streaming Anomaly Detector
+# Per-channel EWMA baseline with a Welford warm-up and optional CUSUM
+# ============================================================================
+# Each channel keeps a running mean and variance in O(1) per sample. The
+# first 1/alpha samples use Welford's cumulative update; after that the
+# baseline is an exponentially weighted mean/variance with weight alpha.
+#
+# A sample raises a SPIKE when it is more than k standard deviations from
+# the baseline. With CUSUM enabled, standardised residuals are also
+# accumulated on both sides (slack cusum_k) and a DRIFT is raised when a
+# sum passes cusum_h (and held until it falls below cusum_h / 2), which
+# catches slow changes a z-score misses. The sums are capped at twice
+# cusum_h so a long excursion clears quickly once it ends. The baseline
+# stops learning while a channel is out of control, so an anomaly is not
+# absorbed into it, until the excursion has lasted relearn samples: then
+# the new level is accepted as normal.
+#
+# The onset of an excursion is the first sample of the current run of
+# out-of-control samples (|z| > k or a non-zero CUSUM); the detection
+# latency is the time from onset to the alarm.
+# ============================================================================
+
+import json
+import time
+from math import sqrt
+from aegis_core import replace
+
+OK = 0
+SPIKE = 1
+DRIFT = 2
+ALARM_NAMES = ('', 'spike', 'drift')
+
+
+class Baseline:
+    """Streaming mean/variance of one channel with z-score and CUSUM alarms"""
+
+    def __init__(self, alpha=0.01, k=4.0, min_std=0.0, cusum=True,
+                 cusum_k=0.5, cusum_h=8.0, relearn=3600):
+        self.alpha = alpha
+        self.k = k
+        self.min_std = min_std
+        self.cusum = cusum
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.relearn = relearn
+        self.warmup = int(1 / alpha)
+        self.reset()
+
+    def reset(self):
+        """Forget the baseline and start learning again"""
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.s_hi = 0.0
+        self.s_lo = 0.0
+        self.z = 0.0
+        self.out = 0
+        self.alarm = OK
+        self.onset = None
+        self.latency_ms = None
+
+    def std(self):
+        s = sqrt(self.var) if self.var > 0 else 0.0
+        return s if s > self.min_std else self.min_std
+
+    def ready(self):
+        return self.n >= self.warmup
+
+    def _learn(self, x):
+        d = x - self.mean
+        if self.n < self.warmup:
+            self.n += 1
+            self.mean += d / self.n
+            self.var += (d * (x - self.mean) - self.var) / self.n
+        else:
+            a = self.alpha
+            inc = a * d
+            self.mean += inc
+            self.var = (1 - a) * (self.var + d * inc)
+
+    def update(self, x, now_ms):
+        """Add one sample; returns the alarm state (OK, SPIKE or DRIFT)"""
+        if not self.ready():
+            self._learn(x)
+            return OK
+
+        std = self.std()
+        z = (x - self.mean) / std if std > 0 else 0.0
+        self.z = z
+        if self.cusum:
+            cap = 2 * self.cusum_h
+            s = self.s_hi + z - self.cusum_k
+            self.s_hi = cap if s > cap else s if s > 0 else 0.0
+            s = self.s_lo - z - self.cusum_k
+            self.s_lo = cap if s > cap else s if s > 0 else 0.0
+
+        spike = z > self.k or z < -self.k
+        h = self.cusum_h if self.alarm == OK else self.cusum_h / 2
+        drift = self.cusum and (self.s_hi > h or self.s_lo > h)
+        excursion = spike or self.s_hi > 0 or self.s_lo > 0
+        if excursion and self.onset is None:
+            self.onset = now_ms
+        elif not excursion:
+            self.onset = None
+
+        alarm = SPIKE if spike else DRIFT if drift else OK
+        if alarm != OK and self.alarm == OK:
+            self.latency_ms = time.ticks_diff(now_ms, self.onset)
+        elif alarm == OK:
+            self.latency_ms = None
+        self.alarm = alarm
+
+        # Learn only while in control (half-way up the CUSUM at most), or
+        # once an excursion has lasted long enough to be the new normal
+        h = self.cusum_h / 2
+        if not spike and self.s_hi <= h and self.s_lo <= h:
+            self.out = 0
+            self._learn(x)
+        else:
+            self.out += 1
+            if self.out >= self.relearn:
+                self._learn(x)
+        return alarm
+
+    def drift_pct(self, x):
+        """Deviation of x from the baseline in percent, or None"""
+        if not self.ready() or self.mean == 0:
+            return None
+        return (x - self.mean) / abs(self.mean) * 100
+
+    def state(self):
+        return (self.n, self.mean, self.var, self.s_hi, self.s_lo)
+
+    def restore(self, state):
+        self.n, self.mean, self.var, self.s_hi, self.s_lo = state
+
+
+class Detector:
+    """Named Baselines updated together and persisted as one file"""
+
+    def __init__(self, names, baselines):
+        self.names = names
+        self.channels = baselines
+        self.alarms = 0
+        self.saves = 0
+
+    def update(self, now_ms, *values):
+        """Add one sample per channel; True when any channel newly alarms"""
+        raised = False
+        for i in range(len(values)):
+            ch = self.channels[i]
+            before = ch.alarm
+            if ch.update(values[i], now_ms) != OK and before == OK:
+                raised = True
+        if raised:
+            self.alarms += 1
+        return raised
+
+    def channel(self, name):
+        return self.channels[self.names.index(name)]
+
+    def active(self):
+        """Names of alarmed channels, e.g. ['vib_drift']"""
+        out = []
+        for i in range(len(self.channels)):
+            a = self.channels[i].alarm
+            if a != OK:
+                out.append(self.names[i] + '_' + ALARM_NAMES[a])
+        return out
+
+    def latency_ms(self):
+        """Longest detection latency among alarmed channels, or None"""
+        worst = None
+        for ch in self.channels:
+            if ch.latency_ms is not None and (worst is None or ch.latency_ms > worst):
+                worst = ch.latency_ms
+        return worst
+
+    def reset(self):
+        for ch in self.channels:
+            ch.reset()
+
+    def save(self, path):
+        """Write the learned baselines (temp file + rename)"""
+        data = {}
+        for i in range(len(self.channels)):
+            data[self.names[i]] = self.channels[i].state()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(data))
+        replace(tmp, path)
+        self.saves += 1
+
+    def load(self, path):
+        """Restore baselines saved by save(); False if there are none"""
+        try:
+            with open(path) as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            return False
+        for i in range(len(self.channels)):
+            state = data.get(self.names[i])
+            if state is not None and len(state) == 5:
+                self.channels[i].restore(state)
+        return True
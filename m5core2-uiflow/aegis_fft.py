@@ -0,0 +1,157 @@
+# ============================================================================
+# AegisOne Vibration Spectrum
+# In-place radix-2 FFT over the IMU sample window with band-energy features
+# ============================================================================
+# All buffers (real/imag work arrays, twiddles, Hann window, bit-reversal
+# table and band accumulators) are allocated once in Spectrum(); analyse()
+# reuses them on every call. A 256-point spectrum needs ~5 KB of RAM.
+# ============================================================================
+
+from array import array
+from math import cos, sin, pi
+
+
+class Spectrum:
+    """Fixed-size FFT with precomputed tables and band-energy reduction"""
+
+    def __init__(self, n=256, bands=8):
+        if n < 4 or n & (n - 1):
+            raise ValueError("FFT size must be a power of two")
+        if bands < 1 or (n // 2) % bands:
+            raise ValueError("bands must divide n/2")
+        self.n = n
+        self.nbands = bands
+        half = n // 2
+
+        self.re = array('f', bytes(4 * n))
+        self.im = array('f', bytes(4 * n))
+
+        # Twiddles e^(-2*pi*i*k/n) for k < n/2
+        self.wr = array('f', [cos(2 * pi * k / n) for k in range(half)])
+        self.wi = array('f', [-sin(2 * pi * k / n) for k in range(half)])
+
+        # Hann window
+        self.win = array('f', [0.5 - 0.5 * cos(2 * pi * k / n) for k in range(n)])
+
+        # Bit-reversal permutation
+        bits = 0
+        while (1 << bits) < n:
+            bits += 1
+        rev = array('H', bytes(2 * n))
+        for i in range(n):
+            r = 0
+            x = i
+            for _ in range(bits):
+                r = (r << 1) | (x & 1)
+                x >>= 1
+            rev[i] = r
+        self.rev = rev
+
+        # Hann coherent power gain, used to scale band energies back to g^2
+        acc = 0.0
+        for k in range(n):
+            acc += self.win[k] * self.win[k]
+        self.norm = 2.0 / (acc * n)
+
+        self.bands = array('f', bytes(4 * bands))
+        self.peak_bin = 0
+        self.peak_hz = 0.0
+        self.band_hz = 0.0
+
+    def load(self, buf, start=0):
+        """Copy n samples from a ring buffer (oldest at start), windowed and de-meaned"""
+        n = self.n
+        size = len(buf)
+        re = self.re
+        im = self.im
+        win = self.win
+        mean = 0.0
+        j = start
+        for i in range(n):
+            v = buf[j]
+            re[i] = v
+            mean += v
+            j += 1
+            if j >= size:
+                j = 0
+        mean /= n
+        for i in range(n):
+            re[i] = (re[i] - mean) * win[i]
+            im[i] = 0.0
+
+    def transform(self):
+        """In-place iterative radix-2 FFT of re/im"""
+        n = self.n
+        re = self.re
+        im = self.im
+        rev = self.rev
+        wr = self.wr
+        wi = self.wi
+
+        for i in range(n):
+            j = rev[i]
+            if j > i:
+                t = re[i]
+                re[i] = re[j]
+                re[j] = t
+                t = im[i]
+                im[i] = im[j]
+                im[j] = t
+
+        size = 2
+        while size <= n:
+            half = size >> 1
+            step = n // size
+            for start in range(0, n, size):
+                k = 0
+                for a in range(start, start + half):
+                    b = a + half
+                    c = wr[k]
+                    s = wi[k]
+                    tr = c * re[b] - s * im[b]
+                    ti = c * im[b] + s * re[b]
+                    re[b] = re[a] - tr
+                    im[b] = im[a] - ti
+                    re[a] += tr
+                    im[a] += ti
+                    k += step
+            size <<= 1
+
+    def reduce(self, rate_hz):
+        """Sum one-sided power into equal-width bands and find the dominant bin"""
+        n = self.n
+        re = self.re
+        im = self.im
+        bands = self.bands
+        width = (n // 2) // self.nbands
+        norm = self.norm
+        best = 0.0
+        best_bin = 0
+        k = 1  # skip DC
+        for b in range(self.nbands):
+            acc = 0.0
+            end = (b + 1) * width
+            while k < end:
+                p = re[k] * re[k] + im[k] * im[k]
+                acc += p
+                if p > best:
+                    best = p
+                    best_bin = k
+                k += 1
+            bands[b] = acc * norm
+        self.peak_bin = best_bin
+        self.peak_hz = best_bin * rate_hz / n
+        self.band_hz = width * rate_hz / n
+        return self.peak_hz
+
+    def analyse(self, sampler):
+        """Run the FFT over the newest n samples of a VibSampler"""
+        if sampler.filled() < self.n:
+            return False
+        start = sampler.idx - self.n
+        if start < 0:
+            start += sampler.size
+        self.load(sampler.buf, start)
+        self.transform()
+        self.reduce(sampler.rate_hz)
+        return True
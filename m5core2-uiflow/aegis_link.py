@@ -0,0 +1,116 @@
+# ============================================================================
+# AegisOne Connection Supervisor
+# MQTT link health, jittered exponential reconnect backoff and offline
+# accounting
+# ============================================================================
+# The link is taken down when WiFi is lost, when the broker stops
+# answering a keepalive probe, or after fail_limit publishes in a row
+# have raised. While down, reconnects are attempted after a delay drawn
+# uniformly from zero to a ceiling that starts at base_ms and doubles with
+# every attempt up to cap_ms ("full jitter"). The spread matters after a
+# power blip: every node on the floor loses the link at the same moment,
+# and without jitter they would all reconnect at the same moment too.
+#
+# A link that stays up for stable_ms resets the backoff; one that drops
+# sooner keeps growing it, so a flapping broker is not hammered. Offline
+# time is counted from the first drop, not from boot.
+# ============================================================================
+
+import random
+import time
+
+
+class Backoff:
+    """Capped exponential backoff with full jitter"""
+
+    def __init__(self, base_ms=5000, cap_ms=300000):
+        self.base_ms = base_ms
+        self.cap_ms = cap_ms
+        self.attempt = 0
+
+    def ceiling_ms(self):
+        if self.attempt >= 20:
+            return self.cap_ms
+        return min(self.cap_ms, self.base_ms << self.attempt)
+
+    def next_ms(self):
+        """Delay before the next attempt; each call widens the window"""
+        ceiling = self.ceiling_ms()
+        self.attempt += 1
+        return (ceiling * random.getrandbits(16)) >> 16
+
+    def reset(self):
+        self.attempt = 0
+
+
+class Link:
+    """Connection state, failure counting and reconnect statistics"""
+
+    def __init__(self, fail_limit=2, base_ms=5000, cap_ms=300000, stable_ms=60000):
+        self.fail_limit = fail_limit
+        self.stable_ms = stable_ms
+        self.backoff = Backoff(base_ms, cap_ms)
+
+        self.up = False
+        self.failures = 0      # consecutive failed publishes
+        self.up_at = None
+        self.down_at = None
+        self.last_ok = None
+
+        self.drops = 0
+        self.reconnects = 0
+        self.attempts = 0
+        self.offline_ms = 0    # closed outages only; see offline()
+
+    def connected(self, now_ms):
+        """A connect attempt succeeded"""
+        if self.up:
+            return
+        if self.down_at is not None:
+            self.offline_ms += time.ticks_diff(now_ms, self.down_at)
+            self.reconnects += 1
+        self.up = True
+        self.failures = 0
+        self.up_at = now_ms
+        self.last_ok = now_ms
+        self.down_at = None
+
+    def lost(self, now_ms):
+        """Take the link down; True if it was up"""
+        if not self.up:
+            return False
+        self.up = False
+        self.drops += 1
+        self.down_at = now_ms
+        if time.ticks_diff(now_ms, self.up_at) >= self.stable_ms:
+            self.backoff.reset()
+        return True
+
+    def ok(self, now_ms):
+        """A publish went through"""
+        self.failures = 0
+        self.last_ok = now_ms
+
+    def failed(self, now_ms):
+        """A publish raised; True if that took the link down"""
+        self.failures += 1
+        if self.failures >= self.fail_limit:
+            return self.lost(now_ms)
+        return False
+
+    def idle_ms(self, now_ms):
+        """Time since the last successful publish"""
+        if self.last_ok is None:
+            return 0
+        return time.ticks_diff(now_ms, self.last_ok)
+
+    def retry_ms(self):
+        """Delay before the next connect attempt"""
+        self.attempts += 1
+        return self.backoff.next_ms()
+
+    def offline(self, now_ms):
+        """Total time offline since the first drop, including the current outage"""
+        if self.down_at is None:
+            return self.offline_ms
+        return self.offline_ms + time.ticks_diff(now_ms, self.down_at)
@@ -0,0 +1,92 @@
+# ============================================================================
+# AegisOne Memory Scheduling
+# Garbage collection at a known idle point, with optional instrumentation
+# ============================================================================
+# MicroPython collects automatically when an allocation fails or, with
+# gc.threshold(), after a number of bytes has been allocated, i.e. at some
+# random point of whichever task happens to allocate. GcScheduler.setup()
+# collects once and raises the automatic threshold to a safety net; tick(),
+# called by the publisher once per pass just before it sleeps, then
+# collects when collect_bytes have been allocated since the previous
+# collection or max_interval_ms has passed. Frequent small collections
+# keep every pause short and away from sampling and publishing.
+#
+# With profile set, tick() also records the bytes allocated per pass
+# (gc.mem_alloc() between consecutive ticks, passes containing an automatic
+# collection are not counted) and every collection is timed with ticks_us.
+# ============================================================================
+
+import gc
+import time
+
+
+class GcScheduler:
+    """Collects garbage in idle time and measures allocation per pass"""
+
+    def __init__(self, collect_bytes=16384, max_interval_ms=10000, profile=False):
+        self.collect_bytes = collect_bytes
+        self.max_interval_ms = max_interval_ms
+        self.profile = profile
+        self.last_collect = time.ticks_ms()
+        self.base_alloc = 0
+        self.last_alloc = None
+
+        self.collections = 0
+        self.pause_us = 0
+        self.max_pause_us = 0
+        self.passes = 0
+        self.pass_bytes = 0
+        self.max_pass_bytes = 0
+
+    def setup(self):
+        """Collect now and leave the automatic collector as a safety net"""
+        self.collect()
+        try:
+            gc.threshold(self.collect_bytes * 4)
+        except AttributeError:
+            pass
+
+    def collect(self):
+        """Run a collection now and time it"""
+        start = time.ticks_us()
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), start)
+        self.collections += 1
+        self.pause_us = pause
+        if pause > self.max_pause_us:
+            self.max_pause_us = pause
+        self.last_collect = time.ticks_ms()
+        self.base_alloc = gc.mem_alloc()
+        self.last_alloc = self.base_alloc if self.profile else None
+
+    def tick(self, now_ms=None):
+        """End of a pass: account its allocations and collect if due"""
+        if now_ms is None:
+            now_ms = time.ticks_ms()
+        alloc = gc.mem_alloc()
+        if alloc < self.base_alloc:
+            self.base_alloc = alloc  # the automatic collector ran
+        if self.profile:
+            if self.last_alloc is not None and alloc >= self.last_alloc:
+                used = alloc - self.last_alloc
+                self.passes += 1
+                self.pass_bytes += used
+                if used > self.max_pass_bytes:
+                    self.max_pass_bytes = used
+            self.last_alloc = alloc
+        if (alloc - self.base_alloc >= self.collect_bytes
+                or time.ticks_diff(now_ms, self.last_collect) >= self.max_interval_ms):
+            self.collect()
+            return True
+        return False
+
+    def take(self):
+        """(mem_free, mean bytes per pass, worst bytes per pass, worst pause us)
+        since the previous call"""
+        mean = self.pass_bytes // self.passes if self.passes else 0
+        report = (gc.mem_free(), mean, self.max_pass_bytes, self.max_pause_us)
+        self.passes = 0
+        self.pass_bytes = 0
+        self.max_pass_bytes = 0
+        self.max_pause_us = 0
+        return report
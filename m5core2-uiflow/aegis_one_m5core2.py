@@ -4,26 +4,63 @@
 # ============================================================================
 # Features:
 # - Temperature monitoring (internal + external sensor)
-# - Vibration monitoring (IMU accelerometer)
-# - Ultrasonic distance/proximity detection
-# - Beautiful dashboard UI with status indicators
+# - Vibration monitoring (IMU accelerometer, 500 Hz windowed features)
+# - IMU acquisition in its own thread behind a lock-free sample ring
+# - Ultrasonic distance/proximity detection (IRQ-timed, median filtered)
+# - Beautiful dashboard UI with status indicators (dirty-tracked, rate-capped)
 # - AWS IoT Core integration with proper telemetry format
 # - Local alerts (screen, buzzer, vibration motor)
 # - Battery monitoring
 # - Touch button controls
-# - Auto-reconnection and error handling
+# - Supervised MQTT link with jittered exponential reconnect backoff
+# - Acknowledged QoS 1 event delivery with an in-flight window and retries
+# - Per-minute and 15-minute edge rollups (min/max/mean/stddev, dwell)
+# - Offline store-and-forward queue on flash with batched replay
+# - Batched columnar telemetry payloads with a size/age flush policy
+# - Selectable JSON / struct / CBOR wire format
+# - Cooperative uasyncio tasks with non-blocking alerts
+# - Adaptive sampling/publish rate with light sleep when steady
+# - Report-by-exception deadband with heartbeats and sequence numbers
+# - Streaming EWMA/CUSUM anomaly detector with a persisted baseline
+# - Alert state machine with hysteresis, dwell times and coalesced events
+# - Allocation-light hot path with idle-time garbage collection
+# - Per-stage timing histograms published as device health
 # - Configurable thresholds
+# - Shared node core (aegis_core.py), first reading shown before connecting
+# - Remote configuration: versioned, validated, persisted, hot-applied
+# - Pre/post-trigger vibration waveform snapshots on CRITICAL, sent in chunks
 # ============================================================================
 
+import time
+BOOT_TICKS = time.ticks_ms()  # boot timing includes the imports below
+
 from m5stack import *
 from m5stack_ui import *
 from uiflow import *
-from IoTcloud.AWS import AWS
 import wifiCfg
-import time
 import json
 import machine
 import imu
+import random
+from aegis_core import (Limits, AxpTemperature, AxpBattery, UltrasonicDistance,
+                        fill_telemetry, BootTimer)
+from aegis_vib import VibSampler
+from aegis_store import StoreForward, unpack_reading
+from aegis_batch import TelemetryBatch
+from aegis_wire import WireEncoder, FORMAT_JSON
+from aegis_sched import every, run, sleep_ms, LoopLag, AlertPlayer, CommandQueue
+from aegis_view import View
+from aegis_rate import RateController
+from aegis_deadband import Deadband
+from aegis_detect import Baseline, Detector
+from aegis_alert import AlertMachine, ENTERED, SEVERITIES, CRITICAL
+from aegis_mem import GcScheduler
+from aegis_prof import Profiler
+from aegis_link import Link
+from aegis_outbox import Outbox
+from aegis_rollup import Rollup
+from aegis_config import Config, APPLIED, CURRENT
+from aegis_snap import Capture
 
 # ============================================================================
 # CONFIGURATION - EDIT THESE VALUES
@@ -44,11 +81,92 @@ AWS_KEY_PATH = '/flash/res/private.pem.key'
 TOPIC_TELEMETRY = 'aegisone/telemetry'
 TOPIC_EVENTS = 'aegisone/events'
 TOPIC_COMMANDS = 'aegisone/commands'
+TOPIC_REPLAY = 'aegisone/telemetry/replay'
+TOPIC_TELEMETRY_BATCH = 'aegisone/telemetry/batch'
+TOPIC_HEALTH = 'aegisone/health'
+TOPIC_ROLLUP = 'aegisone/telemetry/rollup'
+TOPIC_EVENT_ACKS = 'aegisone/events/ack/'  # + deviceId: {"deviceId": d, "eventId": n}
+TOPIC_CONFIG_ACK = 'aegisone/config/ack'
+TOPIC_SNAPSHOTS = 'aegisone/snapshots'    # binary chunks, see aegis_snap.py
+TOPIC_SHADOW_DELTA = '$aws/things/' + AWS_THING_NAME + '/shadow/update/delta'
+TOPIC_SHADOW_UPDATE = '$aws/things/' + AWS_THING_NAME + '/shadow/update'
 
 # Device Configuration
 DEVICE_ID = 'aegis-one-m5-01'
 PUBLISH_INTERVAL_MS = 5000  # 5 seconds
 
+# Store-and-Forward (readings kept on flash while offline)
+QUEUE_DIR = '/flash/queue'
+QUEUE_SEGMENT_BYTES = 16384  # ~680 readings per segment
+QUEUE_MAX_SEGMENTS = 8       # oldest segment dropped beyond this (~7.5 h)
+REPLAY_BATCH = 20            # readings per replay message
+REPLAY_INTERVAL_MS = 1000    # pacing between replay messages
+
+# Connection Supervisor (link health and reconnection)
+MQTT_KEEPALIVE_S = 60
+LINK_CHECK_MS = 1000         # WiFi check interval while connected
+LINK_FAIL_LIMIT = 2          # consecutive failed publishes that drop the link
+LINK_BACKOFF_MIN_MS = 5000   # first reconnect window (jittered 0..5 s)
+LINK_BACKOFF_MAX_MS = 300000 # backoff ceiling (5 minutes)
+LINK_STABLE_MS = 60000       # up this long resets the backoff
+LINK_IDLE_MS = 90000         # probe the broker after this long without a publish
+LINK_BOOT_SPREAD_MS = 2000   # first broker connect 0..2 s after boot (jittered)
+WIFI_CONNECT_S = 20          # wait for an association before giving up
+WIFI_POLL_MS = 250           # association check interval while waiting
+
+# Publish Pipeline (telemetry fire-and-forget, events acknowledged)
+TELEMETRY_QOS = 0
+EVENT_QOS = 1
+EVENT_WINDOW = 4             # events in flight awaiting an acknowledgement
+EVENT_QUEUE = 16             # events waiting beyond the window (oldest dropped)
+EVENT_ACK_MS = 5000          # first retry timeout, doubled per try
+EVENT_MAX_TRIES = 5
+TELEMETRY_SHED_EVERY = 4     # while events back up, send one reading in four
+
+# Edge Rollups (per-window aggregates on their own topic, raw data unchanged)
+ROLLUP_ENABLED = True
+ROLLUP_SAMPLE_MS = 1000      # readings folded into the rollups
+ROLLUP_SHORT_MS = 60000      # 1 minute, aligned to the wall clock
+ROLLUP_LONG_MS = 900000      # 15 minutes
+ROLLUP_BACKLOG = 32          # closed rollups kept while offline
+
+# Batched Telemetry (columnar multi-reading payloads)
+BATCH_ENABLED = True
+BATCH_SAMPLE_MS = 1000       # one reading per second goes into the batch
+BATCH_MAX_READINGS = 10      # flush after this many readings
+BATCH_MAX_AGE_MS = 10000     # ... or when the oldest reading is this old
+BATCH_MAX_BYTES = 1024       # ... or when the payload would exceed this
+
+# Report-by-Exception (readings within the deadband of the last sent
+# reading are not sent; a status change always is)
+DEADBAND_ENABLED = True
+TEMP_DEADBAND = 0.5          # C
+VIB_DEADBAND = 0.2           # g
+DIST_DEADBAND = 5            # cm
+HEARTBEAT_MS = 60000         # keyframe interval while nothing changes
+
+# Task Rates (cooperative scheduler, milliseconds)
+IMU_TASK_MS = 100            # reduce the vibration window
+RANGER_TASK_MS = 200         # ultrasonic ping (must be >= 30 ms)
+ENV_TASK_MS = 1000           # temperature + battery
+UI_TASK_MS = 250             # screen refresh
+UI_MIN_FRAME_MS = 200        # repaint cap, independent of sensor rates
+PUBLISH_TASK_MS = 100        # thresholds, batching, publishing, replay
+
+# Memory (garbage is collected by the publisher between passes)
+GC_COLLECT_BYTES = 16384     # collect once this much was allocated
+GC_MAX_INTERVAL_MS = 10000   # ... or at least this often
+MEM_PROFILE = False          # report heap, bytes per pass and GC pauses
+MEM_REPORT_MS = 10000        # console report interval while profiling
+
+# Stage Profiling (ticks_us histograms on TOPIC_HEALTH, see aegis_prof.py)
+PROFILE_ENABLED = False      # also switched at runtime by the 'profile' command
+HEALTH_INTERVAL_MS = 60000   # health report interval while profiling
+
+# Wire Format: 'json', 'struct' (fixed layout) or 'cbor'
+# Binary payloads are identified by their first byte (see aegis_wire.py)
+WIRE_FORMAT = FORMAT_JSON
+
 # Alert Thresholds
 TEMP_WARNING = 35.0    # Celsius
 TEMP_CRITICAL = 45.0   # Celsius
@@ -57,6 +175,89 @@ VIB_CRITICAL = 2.5     # g-force
 DIST_WARNING = 100     # cm - proximity warning
 DIST_DANGER = 30       # cm - danger zone
 
+# Alert State Machine (one event on entry, one on clear; see aegis_alert.py)
+TEMP_HYSTERESIS = 1.0              # C back below a threshold before it releases
+VIB_HYSTERESIS = 0.2               # g
+DIST_HYSTERESIS = 10               # cm back above a threshold
+ALERT_WARNING_DWELL_MS = 1000      # WARNING must hold this long to be entered
+ALERT_CRITICAL_DWELL_MS = 200      # CRITICAL: two consecutive threshold passes
+ALERT_CLEAR_MS = 5000              # released this long before stepping down
+ALERT_WARNING_COOLDOWN_MS = 60000  # re-entries this soon after clearing coalesce
+ALERT_CRITICAL_COOLDOWN_MS = 120000
+
+# Remote Configuration (see aegis_config.py). A document arrives as
+# {"command": "config", "version": n, "settings": {...}} on TOPIC_COMMANDS
+# (optionally "reset": true, "devices": [ids] for one rollout wave) or as
+# a shadow delta whose desired state holds "configVersion" next to the
+# settings (the shadow's own version counts every shadow update, the
+# node's reports included, so it is not the document's); only the
+# settings below can be changed this way.
+CONFIG_ENABLED = True
+CONFIG_SHADOW = True         # also take shadow deltas and report the settings
+CONFIG_PATH = '/flash/config.json'
+CONFIG_SCHEMA = {
+    'TEMP_WARNING': (float, -20, 120),
+    'TEMP_CRITICAL': (float, -20, 120),
+    'VIB_WARNING': (float, 0.05, 16),
+    'VIB_CRITICAL': (float, 0.05, 16),
+    'DIST_WARNING': (int, 2, 400),
+    'DIST_DANGER': (int, 2, 400),
+    'TEMP_HYSTERESIS': (float, 0, 20),
+    'VIB_HYSTERESIS': (float, 0, 4),
+    'DIST_HYSTERESIS': (int, 0, 100),
+    'PUBLISH_INTERVAL_MS': (int, 1000, 3600000),
+    'BATCH_SAMPLE_MS': (int, 100, 60000),
+}
+CONFIG_ORDER = (('TEMP_WARNING', 'TEMP_CRITICAL'), ('VIB_WARNING', 'VIB_CRITICAL'),
+                ('DIST_DANGER', 'DIST_WARNING'))
+
+# Adaptive Rate (task, sample and publish periods above are the NORMAL rate)
+RATE_ADAPTIVE = True
+RATE_EVAL_MS = 1000          # how often the level is re-evaluated
+RATE_HOLD_MS = 30000         # stay fast this long after the last trigger
+RATE_STEADY_MS = 60000       # quiet time before backing off
+TEMP_NEAR = 3.0              # C below TEMP_WARNING counts as near
+VIB_NEAR = 0.5               # g below VIB_WARNING
+DIST_NEAR = 30               # cm above DIST_WARNING
+TEMP_SLOPE = 0.2             # C/s counted as a fast change
+VIB_SLOPE = 0.5              # g/s
+DIST_SLOPE = 20              # cm/s
+BATTERY_LOW = 20             # % - back off regardless of readings
+BATTERY_CRITICAL = 10        # % - never faster than NORMAL
+LIGHT_SLEEP_ENABLED = True   # light-sleep between samples when backed off
+LIGHT_SLEEP_AWAKE_MS = 1000  # awake time per sample (refills the vibration window)
+LIGHT_SLEEP_MAX_MS = 3000    # keep well below the WiFi/MQTT keepalive
+
+# Vibration Sampling
+VIB_SAMPLE_HZ = 500    # IMU sample rate
+VIB_WINDOW = 256       # samples per feature window (~0.5 s at 500 Hz)
+VIB_TIMER_ID = 0       # hardware timer used by the sampler
+VIB_FFT_ENABLED = True # publish band energies + dominant frequency
+VIB_FFT_BANDS = 8      # equal-width bands from 0 Hz to VIB_SAMPLE_HZ/2
+
+# Acquisition Thread (IMU sampled by a _thread worker, see aegis_acq.py)
+ACQ_THREAD = True          # falls back to the hardware timer without _thread
+ACQ_RING_SAMPLES = 512     # ~1 s at 500 Hz: longest main-thread stall without drops
+
+# Waveform Snapshots (raw vibration around each CRITICAL, see aegis_snap.py)
+SNAP_ENABLED = True
+SNAP_PRE_MS = 1000         # history kept before the trigger
+SNAP_POST_MS = 1000        # recorded after it
+SNAP_CHUNK_BYTES = 512     # per MQTT message
+SNAP_CHUNK_MS = 200        # at most one chunk per interval, after telemetry and events
+
+# Anomaly Detection (streaming baseline per channel, see aegis_detect.py)
+DETECT_ENABLED = True
+DETECT_SAMPLE_MS = 1000      # one detector sample per second
+DETECT_ALPHA = 0.005         # EWMA weight (~200 samples); warm-up is 1/alpha samples
+DETECT_K = 5.0               # standard deviations for a spike
+DETECT_CUSUM = True          # also accumulate slow drift
+DETECT_CUSUM_K = 0.5         # CUSUM slack in standard deviations
+DETECT_CUSUM_H = 10.0        # CUSUM drift alarm level
+DETECT_RELEARN = 3600        # samples out of control before accepting a new level
+DETECT_SAVE_MS = 600000      # persist the baseline every 10 minutes
+DETECT_PATH = '/flash/baseline.json'
+
 # ============================================================================
 # COLORS
 # ============================================================================
@@ -77,14 +278,82 @@ aws = None
 is_connected = False
 is_aws_connected = False
 auto_publish = True
+telemetry_queue = None
+telemetry_batch = TelemetryBatch(DEVICE_ID, BATCH_MAX_READINGS, BATCH_MAX_AGE_MS, BATCH_MAX_BYTES)
+replay_batch = TelemetryBatch(DEVICE_ID, REPLAY_BATCH, 0, 1 << 16)
+wire = WireEncoder(DEVICE_ID, WIRE_FORMAT) if WIRE_FORMAT != FORMAT_JSON else None
+# JSON payloads are filled in place, so publishing only allocates the text
+json_telemetry = {"deviceId": DEVICE_ID}
+json_extras = {}
+wire_state = {}  # node state for the binary encoders, filled the same way
+SPECTRUM_FIELDS = ("vibBands", "vibPeakHz", "vibBandHz")
+mem_report = None
+health_seq = 0
+
+# Scheduler helpers
+loop_lag = LoopLag()
+mem = GcScheduler(GC_COLLECT_BYTES, GC_MAX_INTERVAL_MS, MEM_PROFILE)
+# Budgets are the task periods: a longer run is an overrun
+prof = Profiler(PROFILE_ENABLED)
+prof.stage('imu', IMU_TASK_MS * 1000)
+prof.stage('ranger', RANGER_TASK_MS * 1000)
+prof.stage('env', ENV_TASK_MS * 1000)
+prof.stage('ui', UI_TASK_MS * 1000)
+prof.stage('thresholds')
+prof.stage('publish', PUBLISH_TASK_MS * 1000)
+prof.stage('pass', PUBLISH_TASK_MS * 1000)
+# Time over threshold counts warning-level readings (distance: at or below)
+rollup = Rollup(DEVICE_ID, ('temp', 'vib', 'distance'),
+                ((TEMP_WARNING, True), (VIB_WARNING, True), (DIST_WARNING, False)),
+                ROLLUP_SHORT_MS, ROLLUP_LONG_MS, ROLLUP_BACKLOG)
+outbox = Outbox(EVENT_WINDOW, EVENT_QUEUE, EVENT_ACK_MS, EVENT_MAX_TRIES)
+# Event IDs: random per boot in the high half, counter in the low half
+event_boot = random.getrandbits(16) << 16
+event_n = 0
+link = Link(LINK_FAIL_LIMIT, LINK_BACKOFF_MIN_MS, LINK_BACKOFF_MAX_MS, LINK_STABLE_MS)
+rate = RateController(RATE_EVAL_MS, RATE_HOLD_MS, RATE_STEADY_MS,
+                      BATTERY_LOW, BATTERY_CRITICAL)
+rate.watch(TEMP_WARNING, TEMP_NEAR, TEMP_SLOPE)
+rate.watch(VIB_WARNING, VIB_NEAR, VIB_SLOPE)
+rate.watch(DIST_WARNING, DIST_NEAR, DIST_SLOPE, False)
+deadband = Deadband((TEMP_DEADBAND, VIB_DEADBAND, DIST_DEADBAND), HEARTBEAT_MS)
+detector = Detector(('temp', 'vib', 'distance'), (
+    Baseline(DETECT_ALPHA, DETECT_K, 0.2, DETECT_CUSUM, DETECT_CUSUM_K, DETECT_CUSUM_H,
+             DETECT_RELEARN),
+    Baseline(DETECT_ALPHA, DETECT_K, 0.02, DETECT_CUSUM, DETECT_CUSUM_K, DETECT_CUSUM_H,
+             DETECT_RELEARN),
+    Baseline(DETECT_ALPHA, DETECT_K, 1.0, DETECT_CUSUM, DETECT_CUSUM_K, DETECT_CUSUM_H,
+             DETECT_RELEARN),
+))
+alerts = AlertMachine((0, ALERT_WARNING_DWELL_MS, ALERT_CRITICAL_DWELL_MS), ALERT_CLEAR_MS,
+                      (0, ALERT_WARNING_COOLDOWN_MS, ALERT_CRITICAL_COOLDOWN_MS))
+alerts.watch(TEMP_WARNING, TEMP_CRITICAL, TEMP_HYSTERESIS)
+alerts.watch(VIB_WARNING, VIB_CRITICAL, VIB_HYSTERESIS)
+alerts.watch(DIST_WARNING, DIST_DANGER, DIST_HYSTERESIS, False)
+alert_player = None
+commands = None
+event_acks = None
+limits = Limits(TEMP_WARNING, TEMP_CRITICAL, VIB_WARNING, VIB_CRITICAL, DIST_WARNING, DIST_DANGER)
+boot = BootTimer(BOOT_TICKS)
+config = None  # built by load_config() from the settings in force at boot
 
 # Sensor readings
 current_temp = 0.0
 current_vib = 0.0
+vib_rms = 0.0
+vib_crest = 0.0
+vib_p2p = 0.0
 current_distance = 0.0
 battery_level = 100
 
-# UI Elements
+# UI Elements (dirty-tracking widgets around M5Label)
+view = View(UI_MIN_FRAME_MS)
+last_clock_s = None
+DIST_FORMATS = {
+    "SAFE": '{:.0f} cm | SAFE',
+    "WARNING": '{:.0f} cm | WARNING',
+    "DANGER": '{:.0f} cm | DANGER',
+}
 lbl_status = None
 lbl_temp_value = None
 lbl_vib_value = None
@@ -99,11 +368,21 @@ rect_dist_bg = None
 
 # IMU for vibration
 imu0 = None
+vib_sampler = None
+acq = None
+spectrum = None
+snap = None  # waveform capture, fed every sample by the sampler
 
 # Ultrasonic sensor (if connected to Port B)
 # Adjust pins based on your setup
 TRIG_PIN = 26
 ECHO_PIN = 36
+DIST_FILTER_K = 5      # median over the last K valid pings
+
+# Sensor drivers (aegis_core.py); vibration uses the windowed sampler above
+temp_sensor = AxpTemperature(power)
+battery_sensor = AxpBattery(power)
+distance_sensor = UltrasonicDistance(machine, TRIG_PIN, ECHO_PIN, DIST_FILTER_K)
 
 # ============================================================================
 # UTILITY FUNCTIONS
@@ -115,21 +394,11 @@ def get_timestamp():
 
 def get_status_from_readings(temp, vib, dist):
     """Determine overall status based on sensor readings"""
-    if temp >= TEMP_CRITICAL or vib >= VIB_CRITICAL or dist <= DIST_DANGER:
-        return "CRITICAL"
-    elif temp >= TEMP_WARNING or vib >= VIB_WARNING or dist <= DIST_WARNING:
-        return "WARNING"
-    else:
-        return "RUNNING"
+    return limits.status(temp, vib, dist)
 
 def get_proximity_status(dist):
     """Get proximity status from distance"""
-    if dist <= DIST_DANGER:
-        return "DANGER"
-    elif dist <= DIST_WARNING:
-        return "WARNING"
-    else:
-        return "SAFE"
+    return limits.proximity(dist)
 
 def color_for_status(status):
     """Get color for status"""
@@ -141,22 +410,12 @@ def color_for_status(status):
         return COLOR_PRIMARY
 
 def play_alert(level):
-    """Play alert sound and vibration based on level"""
-    if level == "CRITICAL":
-        # Triple beep for critical
-        for _ in range(3):
-            speaker.tone(2000, 100)
-            wait_ms(150)
-        # Vibrate if available
-        try:
-            power.setVibrationEnable(True)
-            wait_ms(500)
-            power.setVibrationEnable(False)
-        except:
-            pass
-    elif level == "WARNING":
-        # Single beep for warning
-        speaker.tone(1500, 200)
+    """Queue the alert sound/vibration pattern for the alert task"""
+    global alert_player
+    if alert_player is None:
+        alert_player = AlertPlayer(speaker, power)
+    # CRITICAL: triple beep + vibration, WARNING: single beep
+    alert_player.play(level)
 
 # ============================================================================
 # SENSOR READING FUNCTIONS
@@ -165,89 +424,84 @@ def play_alert(level):
 def read_temperature():
     """Read temperature from internal sensor or external probe"""
     global current_temp
-    try:
-        # M5Core2 has internal temperature sensor via AXP192
-        # For external sensor, modify this
-        current_temp = power.getVbatVoltage() * 0.01 + 25  # Simulated
-        # If you have an ENV III sensor:
-        # current_temp = env3.temperature
-        return current_temp
-    except Exception as e:
-        print("Temp read error:", e)
-        return current_temp
+    # AXP192 placeholder; swap the driver for an external probe
+    current_temp = temp_sensor.read()
+    return current_temp
 
 def read_vibration():
-    """Read vibration from IMU accelerometer"""
-    global current_vib, imu0
+    """Read vibration features from the IMU sample window"""
+    global current_vib, vib_rms, vib_crest, vib_p2p, imu0, vib_sampler, acq, snap
     try:
         if imu0 is None:
             imu0 = imu.IMU()
+        if vib_sampler is None:
+            vib_sampler = VibSampler(imu0, VIB_SAMPLE_HZ, VIB_WINDOW)
+            if ACQ_THREAD:
+                try:
+                    from aegis_acq import Acquisition
+                    acq = Acquisition(vib_sampler.magnitude, vib_sampler.period_us,
+                                      ACQ_RING_SAMPLES)
+                    acq.start()
+                except Exception as e:
+                    print("Acquisition thread error:", e)
+                    acq = None
+            if acq is None:
+                try:
+                    vib_sampler.start(VIB_TIMER_ID)
+                except Exception as e:
+                    print("Vibration timer error:", e)
+            if SNAP_ENABLED:
+                snap = Capture(DEVICE_ID, vib_sampler.rate_hz, SNAP_PRE_MS, SNAP_POST_MS,
+                               SNAP_CHUNK_BYTES)
+                vib_sampler.tap = snap.add
         
-        # Read accelerometer
-        ax = imu0.acceleration[0]
-        ay = imu0.acceleration[1]
-        az = imu0.acceleration[2]
+        # Move the worker's samples into the window; without a worker or a
+        # timer, sample once per call
+        if acq is not None:
+            acq.drain(vib_sampler.push)
+        elif vib_sampler.timer is None:
+            vib_sampler.sample()
         
-        # Calculate magnitude (subtract 1g for gravity)
-        magnitude = ((ax**2 + ay**2 + az**2) ** 0.5) - 1.0
-        current_vib = abs(magnitude)
+        # Peak of the window keeps the instantaneous threshold semantics
+        current_vib = vib_sampler.reduce()
+        vib_rms = vib_sampler.rms
+        vib_crest = vib_sampler.crest
+        vib_p2p = vib_sampler.p2p
         return current_vib
     except Exception as e:
         print("Vibration read error:", e)
         return current_vib
 
-def read_distance():
-    """Read distance from ultrasonic sensor"""
-    global current_distance
+def read_spectrum():
+    """Run the FFT over the current vibration window"""
+    global spectrum
+    if not VIB_FFT_ENABLED or vib_sampler is None:
+        return False
     try:
-        # Configure pins
-        trig = machine.Pin(TRIG_PIN, machine.Pin.OUT)
-        echo = machine.Pin(ECHO_PIN, machine.Pin.IN)
-        
-        # Send trigger pulse
-        trig.value(0)
-        wait_ms(2)
-        trig.value(1)
-        wait_ms(10)
-        trig.value(0)
-        
-        # Measure echo time
-        timeout = 30000  # microseconds
-        start_time = time.ticks_us()
-        
-        while echo.value() == 0:
-            if time.ticks_diff(time.ticks_us(), start_time) > timeout:
-                return current_distance
-        pulse_start = time.ticks_us()
-        
-        while echo.value() == 1:
-            if time.ticks_diff(time.ticks_us(), pulse_start) > timeout:
-                return current_distance
-        pulse_end = time.ticks_us()
-        
-        # Calculate distance
-        duration = time.ticks_diff(pulse_end, pulse_start)
-        distance = (duration * 0.034) / 2  # cm
-        
-        if 2 < distance < 400:  # Valid range
-            current_distance = distance
-        
-        return current_distance
+        if spectrum is None:
+            from aegis_fft import Spectrum
+            spectrum = Spectrum(VIB_WINDOW, VIB_FFT_BANDS)
+        return spectrum.analyse(vib_sampler)
     except Exception as e:
-        print("Distance read error:", e)
-        return current_distance
+        print("Spectrum error:", e)
+        return False
+
+def read_env():
+    """Read the slow-changing sensors"""
+    read_temperature()
+    read_battery()
+
+def read_distance():
+    """Read filtered distance from the ultrasonic ranger"""
+    global current_distance
+    current_distance = distance_sensor.read()
+    return current_distance
 
 def read_battery():
     """Read battery level"""
     global battery_level
-    try:
-        voltage = power.getBatVoltage()
-        # Estimate percentage (3.2V = 0%, 4.2V = 100%)
-        percentage = int((voltage - 3.2) / (4.2 - 3.2) * 100)
-        battery_level = max(0, min(100, percentage))
-        return battery_level
-    except:
-        return battery_level
+    battery_level = battery_sensor.read()
+    return battery_level
 
 # ============================================================================
 # UI SETUP
@@ -269,51 +523,52 @@ def setup_ui():
     M5Label('IoT Monitor', x=10, y=30, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
     
     # Status indicators (top right)
-    lbl_wifi = M5Label('WiFi', x=200, y=8, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
-    lbl_aws = M5Label('AWS', x=250, y=8, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
-    lbl_battery = M5Label('100%', x=290, y=8, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
+    lbl_wifi = view.bind(M5Label('WiFi', x=200, y=8, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None), 'WiFi', COLOR_TEXT_DIM)
+    lbl_aws = view.bind(M5Label('AWS', x=250, y=8, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None), 'AWS', COLOR_TEXT_DIM)
+    lbl_battery = view.bind(M5Label('100%', x=290, y=8, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None), '100%', COLOR_TEXT_DIM)
     
     # Overall status badge
-    lbl_status = M5Label('INITIALIZING', x=200, y=28, color=COLOR_TEXT, font=FONT_MONT_12, parent=None)
+    lbl_status = view.bind(M5Label('INITIALIZING', x=200, y=28, color=COLOR_TEXT, font=FONT_MONT_12, parent=None), 'INITIALIZING', COLOR_TEXT)
     
     # ---- Temperature Card ----
     rect_temp_bg = M5Rect(x=10, y=55, w=145, h=70, color=COLOR_CARD_BG, radius=8, parent=None)
     M5Label('TEMPERATURE', x=20, y=62, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
-    lbl_temp_value = M5Label('--.-', x=20, y=82, color=COLOR_TEXT, font=FONT_MONT_26, parent=None)
+    lbl_temp_value = view.bind(M5Label('--.-', x=20, y=82, color=COLOR_TEXT, font=FONT_MONT_26, parent=None), '--.-', COLOR_TEXT)
     M5Label('C', x=120, y=95, color=COLOR_TEXT_DIM, font=FONT_MONT_14, parent=None)
     
     # ---- Vibration Card ----
     rect_vib_bg = M5Rect(x=165, y=55, w=145, h=70, color=COLOR_CARD_BG, radius=8, parent=None)
     M5Label('VIBRATION', x=175, y=62, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
-    lbl_vib_value = M5Label('--.-', x=175, y=82, color=COLOR_TEXT, font=FONT_MONT_26, parent=None)
+    lbl_vib_value = view.bind(M5Label('--.-', x=175, y=82, color=COLOR_TEXT, font=FONT_MONT_26, parent=None), '--.-', COLOR_TEXT)
     M5Label('g', x=275, y=95, color=COLOR_TEXT_DIM, font=FONT_MONT_14, parent=None)
     
     # ---- Distance/Proximity Card ----
     rect_dist_bg = M5Rect(x=10, y=135, w=300, h=55, color=COLOR_CARD_BG, radius=8, parent=None)
     M5Label('PROXIMITY', x=20, y=142, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
-    lbl_dist_value = M5Label('--- cm | SAFE', x=20, y=162, color=COLOR_PRIMARY, font=FONT_MONT_18, parent=None)
+    lbl_dist_value = view.bind(M5Label('--- cm | SAFE', x=20, y=162, color=COLOR_PRIMARY, font=FONT_MONT_18, parent=None), '--- cm | SAFE', COLOR_PRIMARY)
     
     # ---- Last Update ----
-    lbl_last_update = M5Label('Last update: --:--:--', x=10, y=200, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
+    lbl_last_update = view.bind(M5Label('Last update: --:--:--', x=10, y=200, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None), 'Last update: --:--:--', COLOR_TEXT_DIM)
     
     # ---- Button Labels ----
     M5Label('PAUSE', x=40, y=222, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
     M5Label('REFRESH', x=135, y=222, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
     M5Label('ALERT', x=245, y=222, color=COLOR_TEXT_DIM, font=FONT_MONT_10, parent=None)
 
-def update_ui():
-    """Update UI with current sensor readings"""
-    global lbl_temp_value, lbl_vib_value, lbl_dist_value, lbl_status
-    global lbl_wifi, lbl_aws, lbl_battery, lbl_last_update
-    global rect_temp_bg, rect_vib_bg, rect_dist_bg
+def update_ui(force=False):
+    """Update UI with current sensor readings (only changed labels are redrawn)"""
+    global last_clock_s
+    
+    if not view.frame(force=force):
+        return
     
     status = get_status_from_readings(current_temp, current_vib, current_distance)
     proximity = get_proximity_status(current_distance)
     
-    # Update values
-    lbl_temp_value.set_text('{:.1f}'.format(current_temp))
-    lbl_vib_value.set_text('{:.2f}'.format(current_vib))
-    lbl_dist_value.set_text('{:.0f} cm | {}'.format(current_distance, proximity))
+    # Update values (formatted only when the reading changed)
+    lbl_temp_value.set_value(current_temp, '{:.1f}')
+    lbl_vib_value.set_value(current_vib, '{:.2f}')
+    lbl_dist_value.set_value(current_distance, DIST_FORMATS[proximity])
     
     # Update colors based on thresholds
     # Temperature
@@ -343,9 +598,9 @@ def update_ui():
     lbl_wifi.set_text_color(COLOR_PRIMARY if is_connected else COLOR_DANGER)
     lbl_aws.set_text_color(COLOR_PRIMARY if is_aws_connected else COLOR_TEXT_DIM)
     
-    # Battery
-    bat = read_battery()
-    lbl_battery.set_text('{}%'.format(bat))
+    # Battery (read by the env task)
+    bat = battery_level
+    lbl_battery.set_value(bat, '{}%')
     if bat < 20:
         lbl_battery.set_text_color(COLOR_DANGER)
     elif bat < 50:
@@ -353,114 +608,459 @@ def update_ui():
     else:
         lbl_battery.set_text_color(COLOR_TEXT_DIM)
     
-    # Timestamp
-    t = time.localtime()
-    lbl_last_update.set_text('Last update: {:02d}:{:02d}:{:02d}'.format(t[3], t[4], t[5]))
+    # Timestamp, reformatted only when the second changes
+    now = int(time.time())
+    if now != last_clock_s:
+        last_clock_s = now
+        t = time.localtime(now)
+        lbl_last_update.set_text('Last update: {:02d}:{:02d}:{:02d}'.format(t[3], t[4], t[5]))
 
 # ============================================================================
 # AWS IoT FUNCTIONS
 # ============================================================================
 
 def on_command_received(topic_data):
-    """Handle incoming commands from AWS IoT"""
+    """Queue incoming commands from AWS IoT for the command task"""
+    if commands is not None:
+        commands.push(topic_data)
+    else:
+        handle_command(topic_data)
+
+def handle_command(topic_data):
+    """Handle a command from AWS IoT"""
     global auto_publish
     try:
         cmd = json.loads(topic_data)
         command = cmd.get('command', '')
         
-        if command == 'pause':
+        # Shadow deltas share the queue: {"state": {"configVersion": n, ...}}
+        if not command and 'state' in cmd:
+            settings = dict(cmd['state'])
+            receive_config({"version": settings.pop('configVersion', None),
+                            "settings": settings})
+        elif command == 'config':
+            receive_config(cmd)
+        elif command == 'pause':
             auto_publish = False
             lbl_status.set_text('PAUSED')
         elif command == 'resume':
             auto_publish = True
         elif command == 'alert':
             play_alert("WARNING")
+        elif command == 'profile':
+            enabled = cmd.get('enabled', not prof.enabled)
+            if not isinstance(enabled, bool):
+                raise ValueError("enabled must be true or false")
+            prof.enable(enabled)
+            print("Profiling:", prof.enabled)
+        elif command == 'rebaseline':
+            detector.reset()
+            save_baseline()
         elif command == 'reboot':
+            save_baseline()
             machine.reset()
             
     except Exception as e:
         print("Command parse error:", e)
 
-def publish_telemetry():
-    """Publish telemetry data to AWS IoT"""
-    global aws
+def open_queue():
+    """Open the on-flash telemetry queue"""
+    global telemetry_queue
+    try:
+        telemetry_queue = StoreForward(QUEUE_DIR, QUEUE_SEGMENT_BYTES, QUEUE_MAX_SEGMENTS)
+        return True
+    except Exception as e:
+        print("Queue open error:", e)
+        return False
+
+def queue_reading():
+    """Keep the current reading on flash for later replay"""
+    if telemetry_queue is None:
+        return False
     
+    status = get_status_from_readings(current_temp, current_vib, current_distance)
+    try:
+        telemetry_queue.append_reading(get_timestamp(), current_temp, current_vib,
+                                       current_distance, status, battery_level)
+        return True
+    except Exception as e:
+        print("Queue write error:", e)
+        return False
+
+def drain_queue():
+    """Replay one batch of queued readings as a single message"""
     if not is_aws_connected or aws is None:
         return False
+    if telemetry_queue is None or telemetry_queue.is_empty():
+        return False
     
-    status = get_status_from_readings(current_temp, current_vib, current_distance)
-    proximity = get_proximity_status(current_distance)
+    batch = telemetry_queue.read_batch(REPLAY_BATCH)
+    if not batch:
+        telemetry_queue.commit()
+        return False
     
-    payload = {
-        "deviceId": DEVICE_ID,
-        "temp": round(current_temp, 2),
-        "vib": round(current_vib, 3),
-        "distance": round(current_distance, 1),
-        "proximity": proximity,
-        "status": status,
-        "battery": battery_level,
-        "ts": get_timestamp()
-    }
+    for rec in batch:
+        ts, temp, vib, dist, status, battery = unpack_reading(rec)
+        # The flash record keeps no proximity: judged by the limits in force
+        replay_batch.add(ts, temp, vib, dist, status, battery, get_proximity_status(dist))
     
     try:
-        aws.publish(TOPIC_TELEMETRY, json.dumps(payload))
+        mqtt_publish(TOPIC_REPLAY, encode_batch(replay_batch, False))
+        telemetry_queue.commit()
         return True
     except Exception as e:
-        print("Publish error:", e)
+        print("Replay error:", e)
+        return False
+    finally:
+        replay_batch.clear()
+
+def sample_period_ms():
+    """Current interval between published readings"""
+    return rate.period(BATCH_SAMPLE_MS if BATCH_ENABLED else PUBLISH_INTERVAL_MS)
+
+def node_state(fields):
+    """Fill fields with the loop-lag, rate, link, outbox and heap fields
+    every wire format reports"""
+    fields["loopLagMs"] = loop_lag.take_max()
+    fields["rate"] = rate.name()
+    fields["sampleMs"] = sample_period_ms()
+    if acq is not None:
+        fields["vibDropped"] = acq.ring.dropped
+    fields["reconnects"] = link.reconnects
+    fields["eventQueue"] = outbox.depth()
+    fields["offlineMs"] = link.offline(time.ticks_ms())
+    if mem_report is not None:
+        fields["memFree"], fields["allocPerPass"], fields["allocMaxPass"], fields["gcMaxUs"] = mem_report
+    return fields
+
+def telemetry_extras(fields):
+    """Fill fields with the vibration, spectrum and node state fields of a JSON payload"""
+    fields["vibRms"] = round(vib_rms, 3)
+    fields["vibCrest"] = round(vib_crest, 2)
+    fields["vibP2p"] = round(vib_p2p, 3)
+    node_state(fields)
+    if read_spectrum():
+        bands = fields.get("vibBands")
+        if bands is None or len(bands) != len(spectrum.bands):
+            bands = [0.0] * len(spectrum.bands)
+            fields["vibBands"] = bands
+        for i in range(len(bands)):
+            bands[i] = round(spectrum.bands[i], 4)
+        fields["vibPeakHz"] = round(spectrum.peak_hz, 1)
+        fields["vibBandHz"] = round(spectrum.band_hz, 1)
+    else:
+        for key in SPECTRUM_FIELDS:
+            fields.pop(key, None)
+    return fields
+
+def encode_batch(b, features=True, seq=0):
+    """Encode a telemetry batch in the configured wire format"""
+    if wire is None:
+        extra = telemetry_extras(json_extras) if features else None
+        if seq:
+            if extra is None:
+                extra = {"seq": seq}
+            else:
+                extra["seq"] = seq
+        elif extra is not None:
+            extra.pop("seq", None)
+        return b.encode(extra)
+    if not features:
+        return wire.batch(b, seq=seq)
+    state = node_state(wire_state)
+    if read_spectrum():
+        return wire.batch(b, vib_rms, vib_crest, vib_p2p,
+                          spectrum.peak_hz, spectrum.band_hz, spectrum.bands, seq, state)
+    return wire.batch(b, vib_rms, vib_crest, vib_p2p, seq=seq, state=state)
+
+def report_reading(now_ms):
+    """Apply the deadband; True if the current reading should be sent"""
+    if not DEADBAND_ENABLED:
+        return True
+    status = get_status_from_readings(current_temp, current_vib, current_distance)
+    return deadband.offer(now_ms, status, current_temp, current_vib, current_distance)
+
+def add_to_batch():
+    """Add the current reading to the telemetry batch; True when it is due"""
+    status = get_status_from_readings(current_temp, current_vib, current_distance)
+    return telemetry_batch.add(get_timestamp(), current_temp, current_vib,
+                               current_distance, status, battery_level,
+                               get_proximity_status(current_distance))
+
+def queue_batch():
+    """Move every reading of the telemetry batch to the flash queue"""
+    if telemetry_queue is None:
+        return
+    b = telemetry_batch
+    try:
+        for i in range(len(b)):
+            telemetry_queue.append_reading(b.ts[i], b.temp[i], b.vib[i], b.distance[i],
+                                           b.status[i], battery_level)
+    except Exception as e:
+        print("Queue write error:", e)
+
+def flush_batch():
+    """Publish the telemetry batch as one message (queued on flash if offline)"""
+    if len(telemetry_batch) == 0:
         return False
+    
+    try:
+        if not is_aws_connected or aws is None:
+            queue_batch()
+            return False
+        payload = encode_batch(telemetry_batch, True, deadband.next_seq())
+        t0 = prof.start()
+        mqtt_publish(TOPIC_TELEMETRY_BATCH, payload)
+        prof.stop('publish', t0)
+        deadband.sent()
+        return True
+    except Exception as e:
+        print("Batch publish error:", e)
+        queue_batch()
+        return False
+    finally:
+        telemetry_batch.clear()
+
+def encode_telemetry(status, proximity, seq=0):
+    """Encode the current reading in the configured wire format"""
+    if wire is not None:
+        state = node_state(wire_state)
+        if read_spectrum():
+            return wire.telemetry(get_timestamp(), current_temp, current_vib, current_distance,
+                                  status, proximity, battery_level, vib_rms, vib_crest, vib_p2p,
+                                  spectrum.peak_hz, spectrum.band_hz, spectrum.bands, seq, state)
+        return wire.telemetry(get_timestamp(), current_temp, current_vib, current_distance,
+                              status, proximity, battery_level, vib_rms, vib_crest, vib_p2p,
+                              seq=seq, state=state)
+    
+    payload = fill_telemetry(json_telemetry, get_timestamp(), current_temp, current_vib,
+                             current_distance, status, proximity, battery_level)
+    telemetry_extras(payload)
+    if seq:
+        payload["seq"] = seq
+    else:
+        payload.pop("seq", None)
+    return json.dumps(payload)
 
-def publish_event(severity, message):
-    """Publish an event/alert to AWS IoT"""
+def publish_telemetry():
+    """Publish telemetry data to AWS IoT (queued on flash if offline)"""
     global aws
     
     if not is_aws_connected or aws is None:
+        queue_reading()
+        return False
+    
+    status = get_status_from_readings(current_temp, current_vib, current_distance)
+    proximity = get_proximity_status(current_distance)
+    
+    try:
+        payload = encode_telemetry(status, proximity, deadband.next_seq())
+        t0 = prof.start()
+        mqtt_publish(TOPIC_TELEMETRY, payload)
+        prof.stop('publish', t0)
+        deadband.sent()
+        return True
+    except Exception as e:
+        print("Publish error:", e)
+        queue_reading()
         return False
+
+def encode_event(severity, message, event_type, extra=None, event_id=0):
+    """Encode an event in the configured wire format"""
+    vib_base = detector.channel('vib')
+    baseline = vib_base.mean if vib_base.ready() else None
+    drift = vib_base.drift_pct(current_vib)
+    latency = detector.latency_ms()
+    if wire is not None:
+        return wire.event(get_timestamp(), severity, message,
+                          current_temp, current_vib, current_distance,
+                          baseline, drift, latency, event_id,
+                          event_type, detector.active(), sample_period_ms(), extra)
     
     event = {
         "deviceId": DEVICE_ID,
+        "eventId": event_id,
+        "eventType": event_type,
         "severity": severity,
         "message": message,
         "eventTs": get_timestamp(),
         "details": {
             "temp": round(current_temp, 2),
             "vib": round(current_vib, 3),
-            "distance": round(current_distance, 1)
+            "distance": round(current_distance, 1),
+            "alerts": detector.active(),
+            "baselineVib": round(baseline, 3) if baseline is not None else None,
+            "driftPct": round(drift, 1) if drift is not None else None,
+            "detectionLatencyMs": latency,
+            "sampleIntervalMs": sample_period_ms()
         }
     }
-    
+    if extra:
+        event["details"].update(extra)
+    return json.dumps(event)
+
+def next_event_id():
+    global event_n
+    event_n = (event_n + 1) & 0xFFFF
+    return event_boot | event_n
+
+def publish_event(severity, message, event_type="THRESHOLD", extra=None):
+    """Queue an event for acknowledged delivery and send what the window
+    allows; returns its event ID"""
+    event_id = next_event_id()
+    payload = encode_event(severity, message, event_type, extra, event_id)
+    # Binary encoders reuse their buffer; the outbox keeps a copy for retries
+    if not isinstance(payload, str):
+        payload = bytes(payload)
+    outbox.submit(event_id, TOPIC_EVENTS, payload)
+    pump_events()
+    return event_id
+
+def send_event(topic, payload):
+    mqtt_publish(topic, payload, EVENT_QOS)
+
+def pump_events():
+    """Retry overdue events and fill the in-flight window"""
+    if not is_aws_connected or aws is None:
+        return
     try:
-        aws.publish(TOPIC_EVENTS, json.dumps(event))
-        return True
+        outbox.pump(time.ticks_ms(), send_event)
     except Exception as e:
         print("Event publish error:", e)
+
+def on_event_ack(topic_data):
+    """Queue an event acknowledgement for the ack task, with its arrival time"""
+    if event_acks is not None:
+        event_acks.push((topic_data, time.ticks_ms()))
+
+def apply_event_ack(item):
+    """An event acknowledgement from the ingest rule; event IDs are only
+    unique per device, so an ack naming another device is ignored"""
+    topic_data, now = item
+    try:
+        ack = json.loads(topic_data)
+        if ack.get("deviceId") != DEVICE_ID:
+            return
+        outbox.ack(ack["eventId"], now)
+    except Exception as e:
+        print("Event ack error:", e)
+
+def upload_snapshot(now):
+    """Send the next chunk of a frozen snapshot while no event is waiting"""
+    if snap is None:
+        return False
+    snap.poll(now)
+    if not snap.ready() or not is_aws_connected or aws is None:
+        return False
+    if outbox.congested():
+        return False
+    try:
+        mqtt_publish(TOPIC_SNAPSHOTS, snap.chunk(), EVENT_QOS)
+    except Exception as e:
+        print("Snapshot publish error:", e)
         return False
+    if snap.next():
+        print("Snapshot", snap.snap_id, "sent in", snap.index, "chunks")
+    return True
+
+def thin_telemetry():
+    """True to skip this reading: events are backing up on a live link.
+    Offline readings are never thinned, they go to the flash queue."""
+    return is_aws_connected and not outbox.sample(TELEMETRY_SHED_EVERY)
+
+def mqtt_publish(topic, payload, qos=TELEMETRY_QOS):
+    """Publish on the MQTT link; repeated failures take the link down"""
+    try:
+        if qos:
+            aws.publish(topic, payload, qos)
+        else:
+            aws.publish(topic, payload)
+    except Exception:
+        if link.failed(time.ticks_ms()):
+            link_down("publish failing")
+        raise
+    link.ok(time.ticks_ms())
+    if boot.mark('publish'):
+        print("Boot (ms since start):", boot.marks)
+
+def link_down(reason):
+    """Mark the MQTT link down; link_task() reconnects with backoff"""
+    global is_aws_connected
+    link.lost(time.ticks_ms())
+    if not is_aws_connected:
+        return
+    is_aws_connected = False
+    print("MQTT link down:", reason)
+
+def close_aws():
+    """Drop the previous client before reconnecting"""
+    global aws
+    if aws is None:
+        return
+    disconnect = getattr(aws, 'disconnect', None)
+    aws = None
+    if disconnect is not None:
+        try:
+            disconnect()
+        except Exception as e:
+            print("AWS disconnect error:", e)
+
+def probe_link():
+    """Ping the broker when nothing has been published for a while"""
+    ping = getattr(aws, 'ping', None)
+    if ping is None:
+        return
+    try:
+        ping()
+        link.ok(time.ticks_ms())
+    except Exception as e:
+        print("MQTT ping error:", e)
+        link_down("keepalive")
 
 def connect_aws():
-    """Connect to AWS IoT Core"""
+    """Connect to AWS IoT Core; every (re)connect subscribes to commands again"""
     global aws, is_aws_connected
     
     try:
         lbl_status.set_text('Connecting AWS...')
+        close_aws()
         
+        # The client (and its TLS stack) loads on the first connect
+        from IoTcloud.AWS import AWS
         aws = AWS(
             things_name=AWS_THING_NAME,
             host=AWS_HOST,
             port=AWS_PORT,
-            keepalive=60,
+            keepalive=MQTT_KEEPALIVE_S,
             cert_file_path=AWS_CERT_PATH,
             private_key_path=AWS_KEY_PATH
         )
         
-        # Subscribe to commands
+        # Subscribe to commands and event acknowledgements
         aws.subscribe(TOPIC_COMMANDS, on_command_received)
+        aws.subscribe(TOPIC_EVENT_ACKS + DEVICE_ID, on_event_ack)
+        if CONFIG_ENABLED and CONFIG_SHADOW:
+            aws.subscribe(TOPIC_SHADOW_DELTA, on_command_received)
         aws.start()
         
         is_aws_connected = True
+        link.connected(time.ticks_ms())
+        boot.mark('connect')
+        # Acknowledgements sent to the old session are lost
+        outbox.resend()
         lbl_status.set_text('CONNECTED')
         lbl_status.set_text_color(COLOR_PRIMARY)
         
         # Publish connection event
-        publish_event("INFO", "Device connected to AWS IoT")
+        version = config.version if config is not None else 0
+        if link.reconnects:
+            publish_event("INFO", "Device reconnected to AWS IoT", "STATUS",
+                          {"reconnects": link.reconnects, "offlineMs": link.offline_ms,
+                           "configVersion": version})
+        else:
+            publish_event("INFO", "Device connected to AWS IoT", "STATUS",
+                          {"configVersion": version})
+        report_config()
         
         return True
     except Exception as e:
@@ -489,15 +1089,15 @@ def on_btn_b():
     """Button B - Force refresh and publish"""
     speaker.tone(1500, 50)
     read_all_sensors()
-    update_ui()
+    update_ui(True)
     if is_aws_connected:
         publish_telemetry()
 
 def on_btn_c():
     """Button C - Manual alert test"""
     play_alert("WARNING")
-    if is_aws_connected:
-        publish_event("INFO", "Manual alert test triggered")
+    # Queued in the outbox while offline, sent on reconnect
+    publish_event("INFO", "Manual alert test triggered", "TEST")
 
 # ============================================================================
 # MAIN FUNCTIONS
@@ -511,85 +1111,375 @@ def read_all_sensors():
     read_battery()
 
 def check_thresholds():
-    """Check thresholds and trigger alerts"""
+    """Check thresholds and alert on state machine transitions only"""
+    now = time.ticks_ms()
+    event = alerts.update(now, current_temp, current_vib, current_distance)
+    if event is None:
+        return
+    kind, severity, duration_ms, suppressed = event
+    level = SEVERITIES[severity]
+    
+    if kind == ENTERED:
+        # Entering CRITICAL flushes the batch at once, including this reading
+        if BATCH_ENABLED and severity == CRITICAL:
+            report_reading(now)  # a status change always passes
+            add_to_batch()
+            flush_batch()
+        play_alert(level)
+        if severity == CRITICAL:
+            event_id = publish_event(level, "Critical threshold exceeded - Temp:{:.1f}C Vib:{:.2f}g Dist:{:.0f}cm".format(
+                current_temp, current_vib, current_distance
+            ))
+            # The snapshot carries the event's ID so the backend can join them
+            if snap is not None and snap.trigger(event_id, get_timestamp(), now):
+                print("Snapshot", event_id, "recording")
+        else:
+            publish_event(level, "Warning threshold exceeded")
+    else:
+        publish_event("INFO", "{} cleared after {} s ({} suppressed)".format(
+            level, duration_ms // 1000, suppressed
+        ), "CLEARED", {"clearedSeverity": level, "durationMs": duration_ms,
+                       "suppressed": suppressed})
+
+def apply_settings(values):
+    """Assign configurable settings and recompute everything derived from
+    them; runs without yielding, so no task sees half of a change"""
+    global limits
+    globals().update(values)
+    limits = Limits(TEMP_WARNING, TEMP_CRITICAL, VIB_WARNING, VIB_CRITICAL,
+                    DIST_WARNING, DIST_DANGER)
+    alerts.retune(0, TEMP_WARNING, TEMP_CRITICAL, TEMP_HYSTERESIS)
+    alerts.retune(1, VIB_WARNING, VIB_CRITICAL, VIB_HYSTERESIS)
+    alerts.retune(2, DIST_WARNING, DIST_DANGER, DIST_HYSTERESIS)
+    rate.retune(0, TEMP_WARNING)
+    rate.retune(1, VIB_WARNING)
+    rate.retune(2, DIST_WARNING)
+    rollup.limits = ((TEMP_WARNING, True), (VIB_WARNING, True), (DIST_WARNING, False))
+
+def load_config():
+    """Take the firmware's settings as defaults and apply the saved document"""
+    global config
+    config = Config(CONFIG_SCHEMA, {name: globals()[name] for name in CONFIG_SCHEMA},
+                    CONFIG_ORDER)
+    if CONFIG_ENABLED and config.load(CONFIG_PATH):
+        print("Config version", config.version, "restored")
+    apply_settings(config.values())
+
+def receive_config(doc):
+    """Validate, persist and apply a configuration document, then acknowledge it"""
+    if not CONFIG_ENABLED or config is None:
+        return
+    devices = doc.get('devices')
+    if devices is not None and DEVICE_ID not in devices:
+        return  # another rollout wave
+    version = doc.get('version')
+    status, overrides, error = config.offer(version, doc.get('settings', {}),
+                                            doc.get('reset', False))
+    saved = True
+    if status == APPLIED:
+        config.commit(version, overrides)
+        try:
+            config.save(CONFIG_PATH)
+        except Exception as e:
+            print("Config save error:", e)
+            saved = False
+        apply_settings(config.values())
+        print("Config version", version, "applied")
+    elif error:
+        print("Config version", version, "rejected:", error)
+    ack_config(version, status, error, saved)
+    if status in (APPLIED, CURRENT):
+        report_config()
+
+def ack_config(version, status, error=None, saved=True):
+    """One acknowledgement per device and document, for rollout tracking"""
+    if not is_aws_connected or aws is None:
+        return
+    ack = {"deviceId": DEVICE_ID, "version": version, "status": status,
+           "configVersion": config.version, "saved": saved, "ts": get_timestamp()}
+    if error:
+        ack["error"] = error
+    try:
+        mqtt_publish(TOPIC_CONFIG_ACK, json.dumps(ack), EVENT_QOS)
+    except Exception as e:
+        print("Config ack error:", e)
+
+def report_config():
+    """Report the settings in force to the shadow, which clears its delta"""
+    if not (CONFIG_ENABLED and CONFIG_SHADOW) or config is None:
+        return
+    if not is_aws_connected or aws is None:
+        return
+    reported = config.values()
+    reported["configVersion"] = config.version
+    try:
+        mqtt_publish(TOPIC_SHADOW_UPDATE, json.dumps({"state": {"reported": reported}}))
+    except Exception as e:
+        print("Shadow report error:", e)
+
+def load_baseline():
+    """Restore the detector baseline saved before the last reboot"""
+    if DETECT_ENABLED and detector.load(DETECT_PATH):
+        print("Baseline restored")
+
+def save_baseline():
+    """Persist the detector baseline to flash"""
+    if not DETECT_ENABLED:
+        return
+    try:
+        detector.save(DETECT_PATH)
+    except Exception as e:
+        print("Baseline save error:", e)
+
+def update_detector(now_ms):
+    """Feed the detector; a newly alarmed channel publishes an ANOMALY event"""
+    if detector.update(now_ms, current_temp, current_vib, current_distance):
+        publish_event("WARNING", "Anomaly: " + ", ".join(detector.active()), "ANOMALY")
+
+def update_rate(now_ms):
+    """Re-evaluate the adaptive rate and apply it to the telemetry batch"""
+    if not RATE_ADAPTIVE:
+        return
+    if rate.update(now_ms, battery_level, current_temp, current_vib, current_distance):
+        telemetry_batch.max_age_ms = rate.period(BATCH_MAX_AGE_MS)
+        print("Rate:", rate.name())
+
+def report_memory():
+    """Take the memory profile window; it goes into the next JSON telemetry"""
+    global mem_report
+    mem_report = mem.take()
+    print("Mem: {} B free, {} B/pass (max {}), GC max {} us, {} collections".format(
+        mem_report[0], mem_report[1], mem_report[2], mem_report[3], mem.collections))
+
+def publish_health():
+    """Publish the stage timing window on the health topic; the window
+    only restarts once it has been published, so offline time is kept"""
+    global health_seq
+    if not is_aws_connected or aws is None:
+        return False
+    stages, window_ms = prof.report(False)
+    try:
+        mqtt_publish(TOPIC_HEALTH, json.dumps({
+            "deviceId": DEVICE_ID,
+            "ts": get_timestamp(),
+            "seq": health_seq + 1,
+            "windowMs": window_ms,
+            "loopLagMs": loop_lag.max_ms,
+            "acqDropped": acq.ring.dropped if acq is not None else 0,
+            "acqLate": acq.late if acq is not None else 0,
+            "reconnects": link.reconnects,
+            "offlineMs": link.offline(time.ticks_ms()),
+            "events": outbox.report(),
+            "bootMs": boot.report(),
+            "configVersion": config.version if config is not None else 0,
+            "snapshots": snap.report() if snap is not None else None,
+            "stages": stages
+        }))
+        health_seq += 1
+        prof.reset()
+        return True
+    except Exception as e:
+        print("Health publish error:", e)
+        return False
+
+def update_rollup(now_ms):
+    """Fold the current reading into the rollups; publish closed windows"""
     status = get_status_from_readings(current_temp, current_vib, current_distance)
+    rollup.add(get_timestamp(), now_ms, status, current_temp, current_vib, current_distance)
+    publish_rollups()
+
+def publish_rollups():
+    """Publish closed rollup windows, oldest first; kept while offline"""
+    ready = rollup.ready
+    while ready and is_aws_connected and aws is not None:
+        try:
+            mqtt_publish(TOPIC_ROLLUP, json.dumps(ready[0]))
+        except Exception as e:
+            print("Rollup publish error:", e)
+            return
+        ready.pop(0)
+
+def light_sleep():
+    """Light-sleep until shortly before the next sample while backed off"""
+    if not (RATE_ADAPTIVE and LIGHT_SLEEP_ENABLED):
+        return
+    if alert_player.pending or alert_player.playing or commands.items or event_acks.items:
+        return
+    # The sampler must keep running until a snapshot's window is complete
+    if snap is not None and snap.recording():
+        return
+    ms = rate.doze_ms(BATCH_SAMPLE_MS if BATCH_ENABLED else PUBLISH_INTERVAL_MS,
+                      LIGHT_SLEEP_AWAKE_MS, LIGHT_SLEEP_MAX_MS)
+    if ms <= 0:
+        return
+    # Hardware timers stop in light sleep; restart sampling afterwards.
+    # The acquisition thread just resynchronises when the CPU wakes.
+    if vib_sampler is not None and vib_sampler.timer is not None:
+        vib_sampler.stop()
+    try:
+        machine.lightsleep(ms)
+    except Exception as e:
+        print("Light sleep error:", e)
+    finally:
+        loop_lag.skip = True
+        if vib_sampler is not None and acq is None and vib_sampler.timer is None:
+            try:
+                vib_sampler.start(VIB_TIMER_ID)
+            except Exception as e:
+                print("Vibration timer error:", e)
+
+async def publisher_task():
+    """Thresholds, batching/publishing and replay at PUBLISH_TASK_MS"""
+    last_publish = 0
+    last_sample = 0
+    last_replay = 0
+    last_detect = 0
+    last_save = time.ticks_ms()
+    last_mem = last_save
+    last_health = last_save
+    last_rollup = 0
+    last_chunk = 0
     
-    if status == "CRITICAL":
-        play_alert("CRITICAL")
-        publish_event("CRITICAL", "Critical threshold exceeded - Temp:{:.1f}C Vib:{:.2f}g Dist:{:.0f}cm".format(
-            current_temp, current_vib, current_distance
-        ))
-    elif status == "WARNING":
-        play_alert("WARNING")
-        publish_event("WARNING", "Warning threshold exceeded")
+    while True:
+        t_pass = prof.start()
+        t0 = prof.start()
+        check_thresholds()
+        prof.stop('thresholds', t0)
+        
+        current_time = time.ticks_ms()
+        update_rate(current_time)
+        
+        if DETECT_ENABLED and time.ticks_diff(current_time, last_detect) >= DETECT_SAMPLE_MS:
+            update_detector(current_time)
+            last_detect = current_time
+            if time.ticks_diff(current_time, last_save) >= DETECT_SAVE_MS:
+                save_baseline()
+                last_save = current_time
+        
+        # Rollups see every reading, whatever the deadband and rate send
+        if ROLLUP_ENABLED and time.ticks_diff(current_time, last_rollup) >= ROLLUP_SAMPLE_MS:
+            update_rollup(current_time)
+            last_rollup = current_time
+        
+        # Publish telemetry at the current adaptive interval
+        sampled = False
+        if auto_publish and BATCH_ENABLED:
+            if time.ticks_diff(current_time, last_sample) >= sample_period_ms():
+                if not thin_telemetry() and report_reading(current_time):
+                    add_to_batch()
+                last_sample = current_time
+                sampled = True
+            if telemetry_batch.due(current_time):
+                flush_batch()
+        elif auto_publish and time.ticks_diff(current_time, last_publish) >= sample_period_ms():
+            # A failed publish is queued, so the interval always advances
+            if not thin_telemetry() and report_reading(current_time):
+                publish_telemetry()
+            last_publish = current_time
+            sampled = True
+        
+        # Event retries, then queued readings at a controlled rate
+        pump_events()
+        if auto_publish and time.ticks_diff(current_time, last_replay) >= REPLAY_INTERVAL_MS:
+            drain_queue()
+            last_replay = current_time
+        
+        # Snapshot chunks go last, so they never hold up a reading or an event
+        if time.ticks_diff(current_time, last_chunk) >= SNAP_CHUNK_MS:
+            upload_snapshot(current_time)
+            last_chunk = current_time
+        
+        # Idle point of the pass: collect here rather than mid-publish
+        mem.tick(current_time)
+        if MEM_PROFILE and time.ticks_diff(current_time, last_mem) >= MEM_REPORT_MS:
+            report_memory()
+            last_mem = current_time
+        prof.stop('pass', t_pass)
+        if prof.enabled and time.ticks_diff(current_time, last_health) >= HEALTH_INTERVAL_MS:
+            publish_health()
+            last_health = current_time
+        elif not prof.enabled:
+            last_health = current_time
+        
+        if sampled:
+            light_sleep()
+        await sleep_ms(PUBLISH_TASK_MS)
 
-def connect_wifi():
-    """Connect to WiFi with retry"""
+async def link_task():
+    """Supervise the MQTT link: watch WiFi and keepalive while up, reconnect
+    with jittered exponential backoff while down. The first broker connect
+    is spread over 0..LINK_BOOT_SPREAD_MS after boot, overlapping the WiFi
+    association, so a floor powering up together does not arrive at once."""
     global is_connected
     
-    lbl_status.set_text('Connecting WiFi...')
-    wifiCfg.doConnect(WIFI_SSID, WIFI_PASSWORD)
-    
-    retry = 0
-    while not wifiCfg.wlan_sta.isconnected() and retry < 20:
-        wait(1)
-        retry += 1
-        lbl_status.set_text('WiFi... {}'.format(retry))
-    
-    is_connected = wifiCfg.wlan_sta.isconnected()
-    
-    if is_connected:
-        lbl_wifi.set_text_color(COLOR_PRIMARY)
-        return True
-    else:
-        lbl_wifi.set_text_color(COLOR_DANGER)
-        lbl_status.set_text('WiFi FAILED')
-        return False
+    first = time.ticks_add(BOOT_TICKS, (LINK_BOOT_SPREAD_MS * random.getrandbits(16)) >> 16)
+    while True:
+        if is_aws_connected:
+            await sleep_ms(LINK_CHECK_MS)
+            is_connected = wifiCfg.wlan_sta.isconnected()
+            if not is_connected:
+                link_down("WiFi lost")
+            elif link.idle_ms(time.ticks_ms()) >= LINK_IDLE_MS:
+                probe_link()
+            continue
+        
+        if first is None:
+            await sleep_ms(link.retry_ms())
+        is_connected = wifiCfg.wlan_sta.isconnected()
+        if not is_connected:
+            wifiCfg.doConnect(WIFI_SSID, WIFI_PASSWORD)
+            for _ in range(WIFI_CONNECT_S * 1000 // WIFI_POLL_MS):
+                await sleep_ms(WIFI_POLL_MS)
+                if wifiCfg.wlan_sta.isconnected():
+                    break
+            is_connected = wifiCfg.wlan_sta.isconnected()
+        if first is not None:
+            await sleep_ms(max(0, time.ticks_diff(first, time.ticks_ms())))
+            first = None
+        if is_connected:
+            connect_aws()
 
 def main():
     """Main entry point"""
-    global auto_publish
+    global alert_player, commands, event_acks
     
-    # Setup UI
+    # Setup UI and show the first reading before anything slower
     setup_ui()
+    load_config()
+    read_all_sensors()
+    update_ui(True)
+    boot.mark('sample')
+    
+    # Readings left over from a previous outage are replayed after connecting
+    open_queue()
+    load_baseline()
     
-    # Connect to WiFi
-    if not connect_wifi():
-        # Offline mode - just display sensor readings
-        while True:
-            read_all_sensors()
-            update_ui()
-            wait(2)
+    alert_player = AlertPlayer(speaker, power)
+    commands = CommandQueue(handle_command)
+    event_acks = CommandQueue(apply_event_ack, EVENT_WINDOW * 2)
     
-    # Connect to AWS IoT
-    connect_aws()
+    # Start from a clean heap; from here on the publisher collects
+    mem.setup()
     
     # Setup button callbacks
     btnA.wasPressed(on_btn_a)
     btnB.wasPressed(on_btn_b)
     btnC.wasPressed(on_btn_c)
     
-    # Main loop
-    last_publish = 0
-    
-    while True:
-        # Read sensors
-        read_all_sensors()
-        
-        # Update UI
-        update_ui()
-        
-        # Check thresholds for alerts
-        check_thresholds()
-        
-        # Publish telemetry at interval
-        current_time = time.ticks_ms()
-        if auto_publish and time.ticks_diff(current_time, last_publish) >= PUBLISH_INTERVAL_MS:
-            if publish_telemetry():
-                last_publish = current_time
-        
-        # Small delay to prevent overwhelming
-        wait_ms(100)
+    # Each stage runs as its own task at its own rate
+    run([
+        every(lambda: rate.period(IMU_TASK_MS), prof.wrap('imu', read_vibration)),
+        every(lambda: rate.period(RANGER_TASK_MS), prof.wrap('ranger', read_distance)),
+        every(lambda: rate.period(ENV_TASK_MS), prof.wrap('env', read_env)),
+        every(UI_TASK_MS, prof.wrap('ui', update_ui)),
+        publisher_task(),
+        alert_player.run(),
+        commands.run(),
+        event_acks.run(),
+        loop_lag.run(),
+        # Connects to WiFi and AWS IoT; readings are queued until then
+        link_task(),
+    ])
 
 # ============================================================================
 # RUN
@@ -1,15 +1,24 @@
 # ============================================================================
 # AegisOne M5Core2 - Simplified Version for UIFlow
-# Copy this into UIFlow's Python editor
+# Copy this into UIFlow's Python editor; upload aegis_core.py (or
+# aegis_core.mpy, see host/build_mpy.py) to /flash next to it
 # ============================================================================
+# Status rules, sensor drivers and the telemetry fields come from
+# aegis_core.py, shared with aegis_one_m5core2.py. The first reading is on
+# screen before WiFi is up; the AWS client is imported once WiFi is up.
+# ============================================================================
+
+import time
+BOOT_TICKS = time.ticks_ms()
 
 from m5stack import *
 from m5stack_ui import *
 from uiflow import *
-from IoTcloud.AWS import AWS
 import wifiCfg
 import json
 import imu
+from aegis_core import (Limits, BatteryTemperature, AxpBattery, ImuShock, FixedDistance,
+                        fill_telemetry, BootTimer)
 
 # ============= CONFIGURATION - EDIT THESE =============
 WIFI_SSID = 'YOUR_WIFI'
@@ -22,8 +31,18 @@ AWS_KEY = '/flash/res/private.pem.key'
 
 DEVICE_ID = 'aegis-one-m5-01'
 TOPIC_TELEMETRY = 'aegisone/telemetry'
+PUBLISH_INTERVAL_S = 5
+WIFI_CONNECT_S = 15      # readings go on while WiFi associates
 # ======================================================
 
+# Profile: one IMU sample per reading, no ranger
+limits = Limits()
+temp_sensor = BatteryTemperature(power)
+vib_sensor = ImuShock(imu)
+distance_sensor = FixedDistance(150.0)
+battery_sensor = AxpBattery(power)
+boot = BootTimer(BOOT_TICKS)
+
 # Initialize
 screen = M5Screen()
 screen.clean_screen()
@@ -44,35 +63,10 @@ lblDist = M5Label('--- cm', x=20, y=150, color=0x22c55e, font=FONT_MONT_22, pare
 
 lblUpdate = M5Label('Last: --:--:--', x=10, y=200, color=0x94a3b8, font=FONT_MONT_10, parent=None)
 
-# IMU for vibration
-imu0 = imu.IMU()
 aws = None
 connected = False
-
-def get_temp():
-    """Read temperature - modify for your sensor"""
-    # For ENV III: return env3.temperature
-    # Simulated using battery voltage
-    return 25.0 + (power.getBatVoltage() - 3.7) * 10
-
-def get_vibration():
-    """Read vibration from IMU"""
-    ax, ay, az = imu0.acceleration
-    mag = ((ax**2 + ay**2 + az**2) ** 0.5) - 1.0
-    return abs(mag)
-
-def get_distance():
-    """Read ultrasonic - modify pins for your setup"""
-    # If no ultrasonic, return a default
-    return 150.0
-
-def get_status(temp, vib):
-    """Determine status"""
-    if temp > 45 or vib > 2.5:
-        return "CRITICAL"
-    elif temp > 35 or vib > 1.5:
-        return "WARNING"
-    return "RUNNING"
+wifi_wait = 0
+payload = {"deviceId": DEVICE_ID}
 
 def update_display(temp, vib, dist, status):
     """Update screen"""
@@ -80,7 +74,7 @@ def update_display(temp, vib, dist, status):
     lblVib.set_text('{:.2f} g'.format(vib))
     lblDist.set_text('{:.0f} cm'.format(dist))
     lblStatus.set_text(status)
-    
+
     # Color coding
     if status == "CRITICAL":
         lblStatus.set_text_color(0xef4444)
@@ -89,46 +83,32 @@ def update_display(temp, vib, dist, status):
         lblStatus.set_text_color(0xf59e0b)
     else:
         lblStatus.set_text_color(0x22c55e)
-    
+
     # Timestamp
     t = time.localtime()
     lblUpdate.set_text('Last: {:02d}:{:02d}:{:02d}'.format(t[3], t[4], t[5]))
 
 def publish_data(temp, vib, dist, status):
     """Send to AWS IoT"""
-    global aws
     if aws is None:
         return
-    
-    payload = json.dumps({
-        "deviceId": DEVICE_ID,
-        "temp": round(temp, 2),
-        "vib": round(vib, 3),
-        "distance": round(dist, 1),
-        "status": status,
-        "ts": int(time.time() * 1000)
-    })
-    
+
+    fill_telemetry(payload, int(time.time() * 1000), temp, vib, dist, status,
+                   limits.proximity(dist), battery_sensor.read())
     try:
-        aws.publish(TOPIC_TELEMETRY, payload)
+        aws.publish(TOPIC_TELEMETRY, json.dumps(payload))
+        if boot.mark('publish'):
+            print("Boot (ms since start):", boot.marks)
     except:
         pass
 
-# ============= CONNECT WIFI =============
-lblStatus.set_text('WiFi...')
-wifiCfg.doConnect(WIFI_SSID, WIFI_PASSWORD)
-
-retry = 0
-while not wifiCfg.wlan_sta.isconnected() and retry < 15:
-    wait(1)
-    retry += 1
-
-if wifiCfg.wlan_sta.isconnected():
+def connect_aws():
+    """Connect to AWS IoT; the client is only imported here"""
+    global aws, connected
     lblStatus.set_text('AWS...')
     lblStatus.set_text_color(0x22c55e)
-    
-    # ============= CONNECT AWS =============
     try:
+        from IoTcloud.AWS import AWS
         aws = AWS(
             things_name=AWS_THING_NAME,
             host=AWS_HOST,
@@ -139,28 +119,46 @@ if wifiCfg.wlan_sta.isconnected():
         )
         aws.start()
         connected = True
+        boot.mark('connect')
         lblStatus.set_text('ONLINE')
     except Exception as e:
         lblStatus.set_text('AWS Err')
         lblStatus.set_text_color(0xef4444)
-else:
-    lblStatus.set_text('No WiFi')
-    lblStatus.set_text_color(0xef4444)
+
+def check_connection():
+    """Connect once WiFi has associated; called between readings"""
+    global wifi_wait
+    if connected or wifi_wait < 0:
+        return
+    if wifiCfg.wlan_sta.isconnected():
+        connect_aws()
+        wifi_wait = -1
+    elif wifi_wait >= WIFI_CONNECT_S:
+        lblStatus.set_text('No WiFi')
+        lblStatus.set_text_color(0xef4444)
+        wifi_wait = -1
+    else:
+        wifi_wait += PUBLISH_INTERVAL_S
 
 # ============= MAIN LOOP =============
+lblStatus.set_text('WiFi...')
+wifiCfg.doConnect(WIFI_SSID, WIFI_PASSWORD)
+
 while True:
     # Read sensors
-    temp = get_temp()
-    vib = get_vibration()
-    dist = get_distance()
-    status = get_status(temp, vib)
-    
+    temp = temp_sensor.read()
+    vib = vib_sensor.read()
+    dist = distance_sensor.read()
+    status = limits.status(temp, vib, dist)
+
     # Update display
     update_display(temp, vib, dist, status)
-    
+    boot.mark('sample')
+
     # Publish to AWS
+    check_connection()
     if connected:
         publish_data(temp, vib, dist, status)
-    
+
     # Wait 5 seconds
-    wait(5)
+    wait(PUBLISH_INTERVAL_S)
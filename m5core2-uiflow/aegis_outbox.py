@@ -0,0 +1,145 @@
+# ============================================================================
+# AegisOne Event Outbox
+# Acknowledged delivery for events: bounded in-flight window, retries with
+# a growing timeout and duplicate suppression by event ID
+# ============================================================================
+# Telemetry is fire-and-forget (QoS 0); a lost reading is replaced by the
+# next one. Events are not: each one gets an event ID and stays in the
+# outbox until an acknowledgement naming that ID comes back. At most
+# `window` events are in flight; the rest wait in a bounded FIFO (when it
+# is full the oldest waiting event is dropped and counted). An event that
+# is not acknowledged within ack_ms is sent again with the same ID, the
+# timeout doubling per try, and given up after max_tries. After a
+# reconnect every in-flight event is sent again at once with a fresh try
+# count: tries made on the dead link do not count against it. The receiver
+# deduplicates on the ID, so a retry whose original did arrive is harmless;
+# acknowledgements for IDs no longer in flight are counted and ignored.
+#
+# congested() tells the telemetry path to thin out while events back up,
+# and sample() applies the thinning. Acknowledgement latency goes into a
+# fixed-bucket Histogram (milliseconds) that report() summarises.
+#
+# The outbox is not locked: acks arriving in an MQTT callback are queued
+# and applied by a task on the loop, like commands (aegis_sched).
+# ============================================================================
+
+import time
+from aegis_prof import Histogram
+
+ACK_BUCKET_MS = (20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
+# In-flight entry fields
+_TOPIC = 0
+_PAYLOAD = 1
+_FIRST = 2
+_SENT = 3
+_TRIES = 4
+
+
+class Outbox:
+    """Events awaiting acknowledgement, sent through a bounded window"""
+
+    def __init__(self, window=4, capacity=16, ack_ms=5000, max_tries=5):
+        self.window = window
+        self.capacity = capacity
+        self.ack_ms = ack_ms
+        self.max_tries = max_tries
+        self.pending = []      # (event_id, topic, payload) not sent yet
+        self.inflight = {}     # event_id -> [topic, payload, first_ms, sent_ms, tries]
+        self.latency = Histogram(0, ACK_BUCKET_MS)
+        self.shed_n = 0
+
+        self.sent = 0
+        self.acked = 0
+        self.retries = 0
+        self.expired = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.shed = 0
+
+    def depth(self):
+        return len(self.pending) + len(self.inflight)
+
+    def congested(self):
+        return len(self.inflight) >= self.window or len(self.pending) > 0
+
+    def sample(self, every):
+        """False for all but one in `every` telemetry messages while congested"""
+        if not self.congested():
+            self.shed_n = 0
+            return True
+        self.shed_n += 1
+        if self.shed_n >= every:
+            self.shed_n = 0
+            return True
+        self.shed += 1
+        return False
+
+    def submit(self, event_id, topic, payload):
+        """Queue an event; False if that ID is already queued or in flight"""
+        if event_id in self.inflight:
+            return False
+        for entry in self.pending:
+            if entry[0] == event_id:
+                return False
+        if len(self.pending) >= self.capacity:
+            self.pending.pop(0)
+            self.dropped += 1
+        self.pending.append((event_id, topic, payload))
+        return True
+
+    def pump(self, now_ms, send):
+        """Resend overdue events, then fill the window; send(topic, payload)
+        raising stops the pump and leaves the event where it was"""
+        if not self.inflight and not self.pending:
+            return
+        for event_id in list(self.inflight):
+            entry = self.inflight.get(event_id)
+            if entry is None:
+                continue
+            tries = entry[_TRIES]
+            if tries and time.ticks_diff(now_ms, entry[_SENT]) < self.ack_ms << (tries - 1):
+                continue
+            if tries >= self.max_tries:
+                del self.inflight[event_id]
+                self.expired += 1
+                continue
+            send(entry[_TOPIC], entry[_PAYLOAD])
+            entry[_SENT] = now_ms
+            entry[_TRIES] += 1
+            self.retries += 1
+        while self.pending and len(self.inflight) < self.window:
+            event_id, topic, payload = self.pending[0]
+            send(topic, payload)
+            self.pending.pop(0)
+            self.inflight[event_id] = [topic, payload, now_ms, now_ms, 1]
+            self.sent += 1
+
+    def ack(self, event_id, now_ms):
+        """An acknowledgement arrived; False for an unknown or repeated ID"""
+        entry = self.inflight.pop(event_id, None)
+        if entry is None:
+            self.duplicates += 1
+            return False
+        self.acked += 1
+        self.latency.add(time.ticks_diff(now_ms, entry[_FIRST]))
+        return True
+
+    def resend(self):
+        """Make every in-flight event due with its tries reset, e.g. after a
+        reconnect; the next pump() sends each of them again"""
+        for entry in self.inflight.values():
+            entry[_TRIES] = 0
+
+    def report(self):
+        """Counters and acknowledgement latency since the previous report"""
+        h = self.latency
+        out = {
+            "depth": self.depth(), "inflight": len(self.inflight),
+            "sent": self.sent, "acked": self.acked, "retries": self.retries,
+            "expired": self.expired, "dropped": self.dropped,
+            "duplicates": self.duplicates, "shed": self.shed,
+            "ackP50Ms": h.percentile(50), "ackP95Ms": h.percentile(95), "ackMaxMs": h.max,
+        }
+        h.reset()
+        return out
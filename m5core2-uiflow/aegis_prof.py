@@ -0,0 +1,151 @@
+# ============================================================================
+# AegisOne Stage Profiler
+# ticks_us timing of loop stages into fixed-bucket histograms
+# ============================================================================
+# Each stage owns a Histogram: a fixed array of counters over log-linear
+# microsecond buckets (every power of two split into SUB_BUCKETS equal
+# steps, from 16 us to about 2 s) plus the count, the maximum and the
+# number of overruns (runs longer than the stage's budget). Memory is
+# constant however long the device runs (138 counters); percentiles are
+# interpolated inside the bucket that holds them, so their error is below
+# the bucket width: 1/SUB_BUCKETS (12.5%) of the value.
+#
+# Timing is off unless the Profiler is enabled, and can be switched at
+# runtime: a disabled start() returns None and stop() ignores it. report()
+# summarises the window since the previous report and starts a new one.
+# ============================================================================
+
+import time
+from array import array
+
+SUB_BUCKETS = 8
+
+
+def log_edges(lo, hi, sub=SUB_BUCKETS):
+    """Bucket upper edges from lo to at least hi, sub per power of two"""
+    edges = [lo]
+    octave = lo
+    while edges[-1] < hi:
+        step = octave // sub
+        for j in range(1, sub + 1):
+            edges.append(octave + j * step)
+        octave *= 2
+    return tuple(edges)
+
+
+BUCKET_US = log_edges(16, 2000000)
+
+
+class Histogram:
+    """Counts of durations per bucket, with max and budget overruns"""
+
+    def __init__(self, budget_us=0, edges=BUCKET_US):
+        self.budget_us = budget_us
+        self.edges = edges
+        self.counts = array('I', [0] * (len(edges) + 1))
+        self.reset()
+
+    def reset(self):
+        counts = self.counts
+        for i in range(len(counts)):
+            counts[i] = 0
+        self.n = 0
+        self.max = 0
+        self.overruns = 0
+
+    def add(self, us):
+        edges = self.edges
+        lo = 0
+        hi = len(edges)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if us > edges[mid]:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.counts[lo] += 1
+        self.n += 1
+        if us > self.max:
+            self.max = us
+        if self.budget_us and us > self.budget_us:
+            self.overruns += 1
+
+    def percentile(self, p):
+        """Estimated p-th percentile in microseconds (0 when empty)"""
+        if not self.n:
+            return 0
+        rank = (self.n * p + 99) // 100
+        if rank < 1:
+            rank = 1
+        seen = 0
+        edges = self.edges
+        for i in range(len(self.counts)):
+            c = self.counts[i]
+            if seen + c >= rank:
+                lo = edges[i - 1] if i > 0 else 0
+                hi = edges[i] if i < len(edges) else self.max
+                if hi > self.max:
+                    hi = self.max
+                if hi < lo:
+                    return hi
+                return lo + (hi - lo) * (rank - seen) // c
+            seen += c
+        return self.max
+
+
+class Profiler:
+    """Named stage histograms, switched on and off at runtime"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.names = []
+        self.window_start = time.ticks_ms()
+
+    def stage(self, name, budget_us=0):
+        """Declare a stage; a run longer than budget_us is an overrun"""
+        self.stages[name] = Histogram(budget_us)
+        self.names.append(name)
+
+    def enable(self, on=True):
+        if on and not self.enabled:
+            self.reset()
+        self.enabled = on
+
+    def start(self):
+        return time.ticks_us() if self.enabled else None
+
+    def stop(self, name, t0):
+        if t0 is not None:
+            self.stages[name].add(time.ticks_diff(time.ticks_us(), t0))
+
+    def wrap(self, name, fn):
+        """fn with its runs timed as stage name"""
+        def timed():
+            t0 = self.start()
+            fn()
+            self.stop(name, t0)
+        return timed
+
+    def reset(self):
+        for name in self.names:
+            self.stages[name].reset()
+        self.window_start = time.ticks_ms()
+
+    def report(self, reset=True):
+        """({name: {n, p50Us, p95Us, maxUs, overruns}}, window ms), then
+        reset unless told not to"""
+        out = {}
+        for name in self.names:
+            h = self.stages[name]
+            out[name] = {
+                "n": h.n,
+                "p50Us": h.percentile(50),
+                "p95Us": h.percentile(95),
+                "maxUs": h.max,
+                "overruns": h.overruns
+            }
+        window_ms = time.ticks_diff(time.ticks_ms(), self.window_start)
+        if reset:
+            self.reset()
+        return out, window_ms
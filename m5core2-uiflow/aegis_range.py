@@ -0,0 +1,133 @@
+# ============================================================================
+# AegisOne Ultrasonic Ranger
+# HC-SR04 style driver with edge-timestamped echoes and a median filter
+# ============================================================================
+# Pins are configured once. In IRQ mode poll() never waits: it collects the
+# echo of the previous ping (timestamped by the pin interrupt on both
+# edges) and fires the next one, so it must be called at least
+# MAX_ECHO_US after the previous call. Without IRQ support it falls back
+# to machine.time_pulse_us(), bounded by the echo timeout.
+# ============================================================================
+
+import time
+from array import array
+
+CM_PER_US = 0.034 / 2   # round trip at ~340 m/s
+MIN_CM = 2
+MAX_CM = 400
+MAX_ECHO_US = 30000
+
+
+class Ranger:
+    """Ultrasonic ranger returning the median of the last k valid pings"""
+
+    def __init__(self, machine, trig_pin, echo_pin, k=5, use_irq=True):
+        self.machine = machine
+        self.trig = machine.Pin(trig_pin, machine.Pin.OUT)
+        self.echo = machine.Pin(echo_pin, machine.Pin.IN)
+        self.trig.value(0)
+
+        self.k = k
+        self.window = array('f', bytes(4 * k))
+        self.scratch = array('f', bytes(4 * k))
+        self.count = 0
+        self.idx = 0
+
+        self.pings = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+        # Echo edge timestamps written by the IRQ handler
+        self._edges = 0
+        self._rise = 0
+        self._fall = 0
+        self._pending = False
+
+        self.use_irq = False
+        if use_irq:
+            self.use_irq = self._attach_irq()
+
+    def _attach_irq(self):
+        pin = self.machine.Pin
+        trigger = pin.IRQ_RISING | pin.IRQ_FALLING
+        try:
+            self.echo.irq(handler=self._on_edge, trigger=trigger, hard=True)
+            return True
+        except TypeError:
+            pass
+        try:
+            self.echo.irq(handler=self._on_edge, trigger=trigger)
+            return True
+        except Exception as e:
+            print("Ranger IRQ unavailable:", e)
+            return False
+
+    def _on_edge(self, _pin):
+        t = time.ticks_us()
+        if self._edges == 0:
+            self._rise = t
+        elif self._edges == 1:
+            self._fall = t
+        self._edges += 1
+
+    def _fire(self):
+        self._edges = 0
+        self.trig.value(1)
+        time.sleep_us(10)
+        self.trig.value(0)
+        self.pings += 1
+
+    def _accept(self, duration_us):
+        """Filter one echo duration; returns True if it was in range"""
+        if duration_us <= 0:
+            self.timeouts += 1
+            return False
+        cm = duration_us * CM_PER_US
+        if cm < MIN_CM or cm > MAX_CM:
+            self.rejected += 1
+            return False
+        self.window[self.idx] = cm
+        self.idx += 1
+        if self.idx >= self.k:
+            self.idx = 0
+        if self.count < self.k:
+            self.count += 1
+        return True
+
+    def _collect(self):
+        """Consume the echo of the previous ping in IRQ mode"""
+        if not self._pending:
+            return
+        self._pending = False
+        if self._edges >= 2:
+            self._accept(time.ticks_diff(self._fall, self._rise))
+        else:
+            self._accept(-1)
+
+    def poll(self):
+        """Collect the last echo, start the next ping; returns the filtered distance"""
+        if self.use_irq:
+            self._collect()
+            self._fire()
+            self._pending = True
+        else:
+            self._fire()
+            self._accept(self.machine.time_pulse_us(self.echo, 1, MAX_ECHO_US))
+        return self.median()
+
+    def median(self):
+        """Median of the last k valid readings, or None before the first one"""
+        n = self.count
+        if n == 0:
+            return None
+        s = self.scratch
+        for i in range(n):
+            v = self.window[i]
+            j = i
+            while j > 0 and s[j - 1] > v:
+                s[j] = s[j - 1]
+                j -= 1
+            s[j] = v
+        if n & 1:
+            return s[n // 2]
+        return (s[n // 2 - 1] + s[n // 2]) / 2
@@ -0,0 +1,124 @@
+# ============================================================================
+# AegisOne Adaptive Rate Controller
+# Picks a sampling/publishing level from threshold proximity, rate of change
+# and battery level
+# ============================================================================
+# Each watched signal has a warning threshold, a "near" band below it and a
+# slope limit. A signal that is inside the band (or past the threshold), or
+# moves faster than its slope limit, makes the node go FAST and stay there
+# for hold_ms. Once every signal has been quiet for steady_ms the node
+# backs off to SLOW; a low battery backs off to SAVER straight away, and a
+# critical one caps the node at NORMAL even while a signal is active.
+#
+# Task periods are derived from their NORMAL value with period(), so the
+# configured rates stay the reference point.
+# ============================================================================
+
+import time
+
+FAST = 0
+NORMAL = 1
+SLOW = 2
+SAVER = 3
+LEVEL_NAMES = ('fast', 'normal', 'slow', 'saver')
+
+# Period multipliers per level
+DEFAULT_FACTORS = (0.5, 1, 4, 10)
+
+
+class RateController:
+    """Chooses a rate level from watched signals and the battery level"""
+
+    def __init__(self, eval_ms=1000, hold_ms=30000, steady_ms=60000,
+                 low_battery=20, critical_battery=10, factors=DEFAULT_FACTORS):
+        self.eval_ms = eval_ms
+        self.hold_ms = hold_ms
+        self.steady_ms = steady_ms
+        self.low_battery = low_battery
+        self.critical_battery = critical_battery
+        self.factors = factors
+
+        self.warning = []
+        self.band = []
+        self.max_slope = []
+        self.rising = []
+        self.prev = []
+
+        self.level = NORMAL
+        self.changes = 0
+        self.last_eval = None
+        self.last_active = None   # last time a signal was near/fast
+        self.quiet_since = None   # last activity, or the first evaluation
+
+    def watch(self, warning, band, max_slope, rising=True):
+        """Track a signal; rising=False for signals that get worse as they drop"""
+        self.warning.append(warning)
+        self.band.append(band)
+        self.max_slope.append(max_slope)
+        self.rising.append(rising)
+        self.prev.append(None)
+
+    def retune(self, index, warning):
+        """Move a signal's warning threshold; its near band moves with it"""
+        self.warning[index] = warning
+
+    def _near(self, i, v):
+        if self.rising[i]:
+            return v >= self.warning[i] - self.band[i]
+        return v <= self.warning[i] + self.band[i]
+
+    def update(self, now_ms, battery, *values):
+        """Re-evaluate at most every eval_ms; True when the level changed"""
+        last = self.last_eval
+        if last is not None and time.ticks_diff(now_ms, last) < self.eval_ms:
+            return False
+        dt = time.ticks_diff(now_ms, last) if last is not None else 0
+
+        active = False
+        for i in range(len(values)):
+            v = values[i]
+            if self._near(i, v):
+                active = True
+            p = self.prev[i]
+            if p is not None and dt > 0 and abs(v - p) * 1000 / dt >= self.max_slope[i]:
+                active = True
+            self.prev[i] = v
+
+        if active or last is None:
+            self.quiet_since = now_ms
+        if active:
+            self.last_active = now_ms
+        self.last_eval = now_ms
+
+        level = self._choose(now_ms, battery)
+        if level == self.level:
+            return False
+        self.level = level
+        self.changes += 1
+        return True
+
+    def _choose(self, now_ms, battery):
+        if (self.last_active is not None
+                and time.ticks_diff(now_ms, self.last_active) < self.hold_ms):
+            return NORMAL if battery <= self.critical_battery else FAST
+        if battery <= self.low_battery:
+            return SAVER
+        if time.ticks_diff(now_ms, self.quiet_since) >= self.steady_ms:
+            return SLOW
+        return NORMAL
+
+    def period(self, base_ms):
+        """Period for the current level, given the NORMAL period"""
+        return int(base_ms * self.factors[self.level])
+
+    def doze_ms(self, base_ms, awake_ms, max_ms):
+        """Light-sleep allowance after a sample taken every period(base_ms)"""
+        if self.level < SLOW:
+            return 0
+        ms = self.period(base_ms) - awake_ms
+        if ms > max_ms:
+            ms = max_ms
+        return ms if ms > 0 else 0
+
+    def name(self):
+        return LEVEL_NAMES[self.level]
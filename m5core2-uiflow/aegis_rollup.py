@@ -0,0 +1,207 @@
+# ============================================================================
+# AegisOne Edge Rollups
+# Per-window count/min/max/mean/stddev, time over threshold and status
+# dwell, in constant memory per channel
+# ============================================================================
+# Every reading is folded into the open short window (Welford's running
+# mean and sum of squared deviations, so nothing is kept per sample).
+# Windows are aligned to the wall clock: a 60 s window starts on the
+# minute, whatever the boot time, so rollups from different nodes line up.
+# When a short window closes its statistics are merged into the open long
+# window (Chan's parallel update), which closes on its own boundary; the
+# long rollup is exactly what folding its readings directly would give.
+#
+# Time over threshold and status dwell are time-weighted: each reading
+# holds until the next one, and an interval that crosses a window
+# boundary is split between the two windows. Intervals are measured in
+# ticks, so a wall-clock step does not distort them; hold time in windows
+# skipped entirely (no reading at all) is not counted.
+#
+# Closed windows become JSON-ready records in `ready`, oldest first; at
+# most `backlog` are kept (the oldest are dropped and counted) while the
+# link is down.
+# ============================================================================
+
+import math
+import time
+
+STATUSES = ('RUNNING', 'WARNING', 'CRITICAL')
+
+
+class Stats:
+    """Running count, min, max, mean and population variance of one channel"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, x):
+        if self.n == 0:
+            self.min = x
+            self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.n = other.n
+            self.mean = other.mean
+            self.m2 = other.m2
+            self.min = other.min
+            self.max = other.max
+            return
+        n = self.n + other.n
+        d = other.mean - self.mean
+        self.mean += d * other.n / n
+        self.m2 += other.m2 + d * d * self.n * other.n / n
+        self.n = n
+        if other.min < self.min:
+            self.min = other.min
+        if other.max > self.max:
+            self.max = other.max
+
+    def std(self):
+        if self.n == 0:
+            return 0.0
+        return math.sqrt(self.m2 / self.n)
+
+
+class Window:
+    """One aggregation window over every channel"""
+
+    def __init__(self, channels, window_ms, statuses):
+        self.window_ms = window_ms
+        self.stats = [Stats() for _ in range(channels)]
+        self.over_ms = [0] * channels
+        self.status_ms = [0] * len(statuses)
+        self.start = None
+
+    def open(self, ts_ms):
+        self.start = ts_ms - ts_ms % self.window_ms
+        for s in self.stats:
+            s.reset()
+        for i in range(len(self.over_ms)):
+            self.over_ms[i] = 0
+        for i in range(len(self.status_ms)):
+            self.status_ms[i] = 0
+
+    def end(self):
+        return self.start + self.window_ms
+
+    def credit(self, ms, over, status):
+        """Attribute ms of hold time to the readings' over flags and status"""
+        for i in range(len(over)):
+            if over[i]:
+                self.over_ms[i] += ms
+        self.status_ms[status] += ms
+
+    def merge(self, other):
+        for i in range(len(self.stats)):
+            self.stats[i].merge(other.stats[i])
+            self.over_ms[i] += other.over_ms[i]
+        for i in range(len(self.status_ms)):
+            self.status_ms[i] += other.status_ms[i]
+
+    def empty(self):
+        return self.stats[0].n == 0
+
+    def record(self, device_id, names, statuses):
+        rec = {"deviceId": device_id, "ts0": self.start, "windowMs": self.window_ms,
+               "n": self.stats[0].n}
+        for i in range(len(names)):
+            s = self.stats[i]
+            rec[names[i]] = {"min": round(s.min, 3), "max": round(s.max, 3),
+                             "mean": round(s.mean, 3), "std": round(s.std(), 3),
+                             "overMs": self.over_ms[i]}
+        rec["statusMs"] = {statuses[i]: self.status_ms[i] for i in range(len(statuses))}
+        return rec
+
+
+class Rollup:
+    """Short and long aggregation windows fed one reading at a time"""
+
+    def __init__(self, device_id, names, limits, short_ms=60000, long_ms=900000,
+                 backlog=32, statuses=STATUSES):
+        # limits: (threshold, above) per channel; above=False counts time at or under it
+        self.device_id = device_id
+        self.names = names
+        self.limits = limits
+        self.statuses = statuses
+        self.backlog = backlog
+        self.short = Window(len(names), short_ms, statuses)
+        self.long = Window(len(names), long_ms, statuses)
+        self.ready = []
+        self.dropped = 0
+
+        self.last_ts = None
+        self.last_ticks = 0
+        self.last_over = [False] * len(names)
+        self.last_status = 0
+
+    def add(self, ts_ms, ticks_ms, status, *values):
+        """Fold in one reading; True if a window closed (records in ready)"""
+        closed = False
+        if self.last_ts is None:
+            self.short.open(ts_ms)
+            self.long.open(ts_ms)
+        else:
+            dt = time.ticks_diff(ticks_ms, self.last_ticks)
+            if dt < 0:
+                dt = 0
+            if ts_ms >= self.short.end():
+                # Hold time up to the boundary belongs to the closing window
+                part = self.short.end() - self.last_ts
+                if part > dt:
+                    part = dt
+                if part > 0:
+                    self.short.credit(part, self.last_over, self.last_status)
+                    dt -= part
+                self._close(ts_ms)
+                closed = True
+                # After a gap of whole windows only the new window's share is kept
+                if dt > ts_ms - self.short.start:
+                    dt = ts_ms - self.short.start
+            self.short.credit(dt, self.last_over, self.last_status)
+
+        for i in range(len(values)):
+            self.short.stats[i].add(values[i])
+            threshold, above = self.limits[i]
+            self.last_over[i] = values[i] >= threshold if above else values[i] <= threshold
+        self.last_status = self.statuses.index(status) if status in self.statuses else 0
+        self.last_ts = ts_ms
+        self.last_ticks = ticks_ms
+        return closed
+
+    def _close(self, ts_ms):
+        short = self.short
+        if not short.empty():
+            self._ready(short.record(self.device_id, self.names, self.statuses))
+            self.long.merge(short)
+        if ts_ms >= self.long.end():
+            self._close_long(ts_ms)
+        short.open(ts_ms)
+
+    def _close_long(self, ts_ms):
+        if not self.long.empty():
+            self._ready(self.long.record(self.device_id, self.names, self.statuses))
+        self.long.open(ts_ms)
+
+    def _ready(self, rec):
+        if len(self.ready) >= self.backlog:
+            self.ready.pop(0)
+            self.dropped += 1
+        self.ready.append(rec)
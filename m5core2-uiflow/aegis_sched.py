@@ -0,0 +1,178 @@
+# ============================================================================
+# AegisOne Cooperative Scheduler
+# uasyncio helpers: fixed-rate tasks, loop-lag probe, non-blocking alert
+# patterns and a command queue
+# ============================================================================
+# Works with uasyncio (v2 on UIFlow 1.x, v3 on newer firmware) and with
+# CPython's asyncio, so the task structure can be exercised on the host.
+# ============================================================================
+
+import time
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+
+def sleep_ms(ms):
+    """Awaitable millisecond sleep on every asyncio flavour"""
+    return asyncio.sleep(ms / 1000)
+
+
+async def every(period_ms, fn):
+    """Call fn() every period_ms; an overrun resynchronises instead of bursting.
+    period_ms may also be a callable returning the current period."""
+    due = time.ticks_ms()
+    while True:
+        try:
+            fn()
+        except Exception as e:
+            print("Task error:", e)
+        due = time.ticks_add(due, period_ms() if callable(period_ms) else period_ms)
+        delay = time.ticks_diff(due, time.ticks_ms())
+        if delay < 0:
+            due = time.ticks_ms()
+            delay = 0
+        await sleep_ms(delay)
+
+
+def run(coros, duration_ms=None, loop=None):
+    """Schedule coroutines and run the event loop (forever unless duration_ms)"""
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    for c in coros:
+        loop.create_task(c)
+    if duration_ms is None:
+        loop.run_forever()
+        return
+
+    async def _stop():
+        await sleep_ms(duration_ms)
+        loop.stop()
+    loop.create_task(_stop())
+    loop.run_forever()
+
+
+class LoopLag:
+    """Measures how late the event loop wakes a sleeping task"""
+
+    def __init__(self, period_ms=50):
+        self.period_ms = period_ms
+        self.last_ms = 0
+        self.max_ms = 0
+        self.avg_ms = 0.0
+        self.skip = False
+
+    async def run(self):
+        while True:
+            start = time.ticks_ms()
+            await sleep_ms(self.period_ms)
+            if self.skip:
+                # The loop was deliberately stopped (light sleep)
+                self.skip = False
+                continue
+            lag = time.ticks_diff(time.ticks_ms(), start) - self.period_ms
+            if lag < 0:
+                lag = 0
+            self.last_ms = lag
+            if lag > self.max_ms:
+                self.max_ms = lag
+            self.avg_ms += (lag - self.avg_ms) / 8
+
+    def take_max(self):
+        """Worst lag since the previous call"""
+        m = self.max_ms
+        self.max_ms = 0
+        return m
+
+
+# Alert pattern steps: (kind, tone Hz, duration ms)
+TONE = 0
+REST = 1
+VIBRATE = 2
+
+ALERT_PATTERNS = {
+    "CRITICAL": (
+        (TONE, 2000, 100), (REST, 0, 150),
+        (TONE, 2000, 100), (REST, 0, 150),
+        (TONE, 2000, 100), (REST, 0, 150),
+        (VIBRATE, 0, 500),
+    ),
+    "WARNING": (
+        (TONE, 1500, 200),
+    ),
+}
+_PRIORITY = {"WARNING": 1, "CRITICAL": 2}
+
+
+class AlertPlayer:
+    """Plays buzzer/vibration patterns from a task instead of blocking"""
+
+    def __init__(self, speaker, power=None, patterns=ALERT_PATTERNS):
+        self.speaker = speaker
+        self.power = power
+        self.patterns = patterns
+        self.pending = None
+        self.playing = None
+        self.played = 0
+
+    def play(self, level):
+        """Request a pattern; a higher-severity request wins over a lower one"""
+        if level not in self.patterns:
+            return
+        current = self.pending or self.playing
+        if current is None or _PRIORITY.get(level, 0) >= _PRIORITY.get(current, 0):
+            self.pending = level
+
+    def _vibrate(self, on):
+        if self.power is None:
+            return
+        try:
+            self.power.setVibrationEnable(on)
+        except Exception:
+            pass
+
+    async def run(self):
+        while True:
+            if self.pending is None:
+                await sleep_ms(20)
+                continue
+            self.playing = self.pending
+            self.pending = None
+            for kind, freq, duration in self.patterns[self.playing]:
+                if kind == TONE:
+                    self.speaker.tone(freq, duration)
+                elif kind == VIBRATE:
+                    self._vibrate(True)
+                await sleep_ms(duration)
+                if kind == VIBRATE:
+                    self._vibrate(False)
+            self.played += 1
+            self.playing = None
+
+
+class CommandQueue:
+    """Hands MQTT callbacks over to a task so handlers never run in the callback"""
+
+    def __init__(self, handler, maxlen=8):
+        self.handler = handler
+        self.maxlen = maxlen
+        self.items = []
+        self.dropped = 0
+
+    def push(self, data):
+        if len(self.items) >= self.maxlen:
+            self.items.pop(0)
+            self.dropped += 1
+        self.items.append(data)
+
+    async def run(self, period_ms=50):
+        while True:
+            while self.items:
+                data = self.items.pop(0)
+                try:
+                    self.handler(data)
+                except Exception as e:
+                    print("Command error:", e)
+            await sleep_ms(period_ms)
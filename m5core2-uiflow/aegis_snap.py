@@ -0,0 +1,315 @@
+# ============================================================================
+# AegisOne Waveform Snapshots
+# Raw vibration samples around a CRITICAL trigger, encoded and chunked for
+# MQTT, and their reassembly on the receiving side
+# ============================================================================
+# Capture keeps the most recent pre_ms of vibration samples in a ring. A
+# trigger keeps that history and records post_ms more; the window is then
+# frozen until every chunk of it has been sent. One snapshot is held at a
+# time: a trigger while one is recording or uploading is counted in
+# `missed`, not queued. If the samples stop coming (the sampler failed)
+# poll() closes the window with what it has.
+#
+# Samples are stored as signed 16-bit codes of LSB_PER_G per g (0.5 mg,
+# +-16 g), finer than the IMU's own resolution. Quantizing on the way in
+# halves the ring and makes the snapshot exactly reproducible: the
+# receiver gets back the very codes the node held.
+#
+# Encoding: each code minus the previous one (the first minus 0),
+# zigzag-mapped and written as a varint, 7 bits per byte. At 500 Hz a
+# quiet machine moves by less than 64 codes per sample (one byte) and a
+# 50 Hz vibration of up to 2.5 g by less than 8192 (two bytes), against
+# four bytes per float. MicroPython 1.12 has no deflate compressor; this
+# needs none and costs a few operations per sample.
+#
+# Chunks are encoded one at a time as they are sent, so freezing a window
+# costs nothing in the sampler and no full encoded copy is kept. Layout
+# (little-endian), one MQTT message per chunk:
+#   <BBB      MAGIC, VERSION, MSG_SNAPSHOT (the aegis_wire header)
+#   <IHB      snapshot id (the CRITICAL event's eventId), index, last (0/1)
+#   <B        length + device id
+#   index 0 only:
+#   <QHHHH    trigger ts (ms), rate (Hz), samples before the trigger,
+#             samples, LSB per g
+#   + whole varints; the concatenated chunks form one stream
+# Reassembler puts chunks back in order whatever order they arrive in,
+# ignores duplicates and decodes the snapshot once every chunk is there.
+# ============================================================================
+
+import struct
+import time
+from array import array
+from math import floor
+
+from aegis_wire import MAGIC, MSG_SNAPSHOT
+
+VERSION = 1
+LSB_PER_G = 2048
+
+IDLE = 0
+RECORDING = 1
+FROZEN = 2
+
+_HEADER = '<BBB'
+_CHUNK = '<IHB'
+_META = '<QHHHH'
+_VARINT_MAX = 3  # a 16-bit code difference, zigzag-mapped, is at most 17 bits
+
+
+def quantize(v, lsb_per_g=LSB_PER_G):
+    """Signed 16-bit code of a sample in g, rounded to nearest"""
+    code = int(floor(v * lsb_per_g + 0.5))
+    if code > 32767:
+        return 32767
+    if code < -32768:
+        return -32768
+    return code
+
+
+class Capture:
+    """Pre-trigger ring of vibration samples and the snapshot it freezes"""
+
+    def __init__(self, device_id, rate_hz, pre_ms, post_ms, chunk_bytes=512,
+                 lsb_per_g=LSB_PER_G):
+        self.device_bytes = device_id.encode()
+        self.rate_hz = rate_hz
+        self.pre = rate_hz * pre_ms // 1000
+        self.post = rate_hz * post_ms // 1000
+        self.post_ms = post_ms
+        self.lsb_per_g = lsb_per_g
+        self.size = self.pre + self.post
+        self.ring = array('h', bytes(2 * self.size))
+        self.idx = 0
+        self.filled = 0   # samples in the ring, up to size
+
+        self.state = IDLE
+        self.snap_id = 0
+        self.ts = 0
+        self.started = 0  # ticks_ms of the trigger
+        self.pre_n = 0
+        self.remaining = 0
+
+        # Chunk being sent: rebuilt by chunk() until next() moves on
+        self.head = struct.calcsize(_HEADER) + struct.calcsize(_CHUNK) + 1 + len(self.device_bytes)
+        self.buf = bytearray(chunk_bytes)
+        self.mv = memoryview(self.buf)
+        self.length = 0
+        self.index = 0
+        self.cursor = 0   # samples encoded into earlier chunks
+        self.prev = 0     # last code encoded into earlier chunks
+        self.next_cursor = 0
+        self.next_prev = 0
+        self.count = 0    # samples in the frozen window
+
+        self.taken = 0
+        self.missed = 0
+        self.short = 0
+        self.chunks = 0
+        self.sent = 0
+
+    def add(self, v):
+        """One vibration sample in g (safe to call from the sampler)"""
+        if self.state == FROZEN:
+            return
+        self.ring[self.idx] = quantize(v, self.lsb_per_g)
+        self.idx += 1
+        if self.idx >= self.size:
+            self.idx = 0
+        if self.filled < self.size:
+            self.filled += 1
+        if self.state == RECORDING:
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self._freeze()
+
+    def trigger(self, snap_id, ts, now_ms):
+        """Keep the history and record the post-trigger window; False if a
+        snapshot is already being recorded or sent"""
+        if self.state != IDLE:
+            self.missed += 1
+            return False
+        self.snap_id = snap_id
+        self.ts = ts
+        self.started = now_ms
+        self.pre_n = self.filled if self.filled < self.pre else self.pre
+        self.remaining = self.post
+        self.state = RECORDING
+        self.taken += 1
+        if self.remaining <= 0:
+            self._freeze()
+        return True
+
+    def poll(self, now_ms):
+        """Close a window the samples stopped filling (twice post_ms late)"""
+        late = time.ticks_diff(now_ms, self.started)
+        if self.state == RECORDING and late > 2 * self.post_ms + 1000:
+            self.short += 1
+            self._freeze()
+
+    def _freeze(self):
+        self.count = self.pre_n + self.post - self.remaining
+        self.remaining = 0
+        self.state = FROZEN
+        self.index = 0
+        self.cursor = 0
+        self.prev = 0
+        self.length = 0
+
+    def recording(self):
+        return self.state == RECORDING
+
+    def ready(self):
+        """A frozen snapshot has chunks left to send"""
+        return self.state == FROZEN
+
+    def chunk(self):
+        """The current chunk (a memoryview of a reused buffer); the same one
+        again until next() is called, so a failed publish can be retried"""
+        if self.length:
+            return self.mv[:self.length]
+        buf = self.buf
+        struct.pack_into(_HEADER, buf, 0, MAGIC, VERSION, MSG_SNAPSHOT)
+        pos = self.head
+        n = len(self.device_bytes)
+        buf[pos - n - 1] = n
+        buf[pos - n:pos] = self.device_bytes
+        if self.index == 0:
+            struct.pack_into(_META, buf, pos, self.ts, self.rate_hz, self.pre_n,
+                             self.count, self.lsb_per_g)
+            pos += struct.calcsize(_META)
+
+        # Whole varints only, as many as fit
+        ring = self.ring
+        size = self.size
+        end = len(buf) - _VARINT_MAX
+        i = self.idx - self.count + self.cursor
+        while i < 0:
+            i += size
+        k = self.cursor
+        prev = self.prev
+        while k < self.count and pos <= end:
+            code = ring[i]
+            i += 1
+            if i == size:
+                i = 0
+            d = code - prev
+            prev = code
+            z = (d << 1) ^ (d >> 31)
+            while z >= 0x80:
+                buf[pos] = (z & 0x7F) | 0x80
+                z >>= 7
+                pos += 1
+            buf[pos] = z
+            pos += 1
+            k += 1
+        self.next_cursor = k
+        self.next_prev = prev
+        last = 1 if k >= self.count else 0
+        struct.pack_into(_CHUNK, buf, struct.calcsize(_HEADER), self.snap_id, self.index, last)
+        self.length = pos
+        return self.mv[:pos]
+
+    def next(self):
+        """The current chunk went out; True when that was the last one and
+        the ring is recording history again"""
+        if not self.length:
+            return False
+        self.chunks += 1
+        self.cursor = self.next_cursor
+        self.prev = self.next_prev
+        self.length = 0
+        self.index += 1
+        if self.cursor < self.count:
+            return False
+        self.sent += 1
+        self.state = IDLE
+        self.filled = 0
+        return True
+
+    def report(self):
+        return {"taken": self.taken, "missed": self.missed, "short": self.short,
+                "sent": self.sent, "chunks": self.chunks}
+
+
+def decode_chunk(data):
+    """Fields of one chunk; the data bytes are under 'data'"""
+    pos = struct.calcsize(_HEADER)
+    magic, version, msg_type = struct.unpack_from(_HEADER, data, 0)
+    if magic != MAGIC or msg_type != MSG_SNAPSHOT:
+        raise ValueError("not a snapshot chunk")
+    if version != VERSION:
+        raise ValueError("unsupported snapshot version {}".format(version))
+    snap_id, index, last = struct.unpack_from(_CHUNK, data, pos)
+    pos += struct.calcsize(_CHUNK)
+    n = data[pos]
+    out = {'id': snap_id, 'index': index, 'last': bool(last),
+           'deviceId': bytes(data[pos + 1:pos + 1 + n]).decode()}
+    pos += 1 + n
+    if index == 0:
+        ts, rate_hz, pre, samples, lsb = struct.unpack_from(_META, data, pos)
+        pos += struct.calcsize(_META)
+        out.update({'ts': ts, 'rateHz': rate_hz, 'preSamples': pre, 'samples': samples,
+                    'lsbPerG': lsb})
+    out['data'] = bytes(data[pos:])
+    return out
+
+
+def decode_codes(data, count):
+    """The codes of a complete varint stream; it must hold exactly count"""
+    codes = []
+    prev = 0
+    z = 0
+    shift = 0
+    for b in data:
+        z |= (b & 0x7F) << shift
+        if b & 0x80:
+            shift += 7
+            continue
+        prev += (z >> 1) ^ -(z & 1)
+        codes.append(prev)
+        z = 0
+        shift = 0
+    if shift or len(codes) != count:
+        raise ValueError("snapshot holds {} samples, header says {}".format(len(codes), count))
+    return codes
+
+
+class Reassembler:
+    """Collects chunks per device and snapshot and decodes complete ones"""
+
+    def __init__(self):
+        self.partial = {}    # (deviceId, id) -> {index: chunk}
+        self.done = set()
+        self.duplicates = 0
+
+    def add(self, payload):
+        """Take one chunk; returns the snapshot it completes, else None"""
+        chunk = decode_chunk(payload)
+        key = (chunk['deviceId'], chunk['id'])
+        parts = self.partial.get(key)
+        if parts is None:
+            if key in self.done:
+                self.duplicates += 1
+                return None
+            parts = self.partial[key] = {}
+        if chunk['index'] in parts:
+            self.duplicates += 1
+            return None
+        parts[chunk['index']] = chunk
+        last = [c['index'] for c in parts.values() if c['last']]
+        if not last or len(parts) != last[0] + 1:
+            return None
+        del self.partial[key]
+        self.done.add(key)
+        first = parts[0]
+        data = b''.join(parts[i]['data'] for i in range(len(parts)))
+        codes = decode_codes(data, first['samples'])
+        lsb = first['lsbPerG']
+        return {'deviceId': key[0], 'id': key[1], 'ts': first['ts'],
+                'rateHz': first['rateHz'], 'preSamples': first['preSamples'],
+                'lsbPerG': lsb, 'chunks': len(parts), 'bytes': len(data),
+                'codes': codes, 'values': [c / lsb for c in codes]}
+
+    def pending(self):
+        """Snapshots still missing chunks"""
+        return list(self.partial)
@@ -0,0 +1,226 @@
+# ============================================================================
+# AegisOne Store-and-Forward Queue
+# Append-only, length-prefixed binary log on flash with segment rotation
+# ============================================================================
+# Layout under `root`:
+#   q00000.bin, q00001.bin, ...  segments of framed records
+#   cursor                       struct '<II' (read segment, read offset)
+#
+# Each record is framed as <length:u8><checksum:u8><payload>. A torn tail
+# (power loss mid-write) fails the length/checksum check and is skipped;
+# on open a torn active segment is closed and writing continues in a new
+# one. The read cursor is written to a temp file and renamed, and is only
+# advanced by commit() after a batch has been delivered.
+# ============================================================================
+
+import os
+import struct
+from aegis_core import replace
+
+# Telemetry record: ts(ms), temp, vib, distance, status code, battery
+READING_FMT = '<QfffBB'
+READING_SIZE = struct.calcsize(READING_FMT)
+STATUSES = ('RUNNING', 'WARNING', 'CRITICAL')
+
+_CURSOR_FMT = '<II'
+_SEG_PREFIX = 'q'
+_SEG_SUFFIX = '.bin'
+
+
+def pack_reading(ts, temp, vib, dist, status, battery):
+    """Pack one telemetry reading into a fixed 22-byte record"""
+    code = STATUSES.index(status) if status in STATUSES else 0
+    return struct.pack(READING_FMT, ts, temp, vib, dist, code, battery)
+
+
+def unpack_reading(rec):
+    """Unpack a record into (ts, temp, vib, distance, status, battery)"""
+    ts, temp, vib, dist, code, battery = struct.unpack(READING_FMT, rec)
+    return ts, temp, vib, dist, STATUSES[code] if code < len(STATUSES) else 'RUNNING', battery
+
+
+def _checksum(data):
+    c = 0
+    for b in data:
+        c = (c + b) & 0xFF
+    return c ^ 0xA5
+
+
+class StoreForward:
+    """Bounded on-flash FIFO of small binary records"""
+
+    def __init__(self, root='/flash/queue', segment_bytes=16384, max_segments=8):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.dropped = 0
+        self._next = None
+        try:
+            os.mkdir(root)
+        except OSError:
+            pass
+
+        seqs = self._segments()
+        self.read_seg, self.read_off = self._load_cursor()
+        if seqs:
+            if self.read_seg < seqs[0]:
+                self.read_seg, self.read_off = seqs[0], 0
+            self.write_seg = seqs[-1]
+            self.write_off = self._scan(self.write_seg)
+            if self.write_off < self._size(self.write_seg):
+                # Torn tail: never append behind a partial record
+                self.write_seg += 1
+                self.write_off = 0
+        else:
+            self.write_seg = max(self.read_seg, 0)
+            self.write_off = 0
+            self.read_seg, self.read_off = self.write_seg, 0
+        if self.read_seg > self.write_seg:
+            self.read_seg, self.read_off = self.write_seg, 0
+
+    # ---- paths / metadata ----
+
+    def _path(self, seq):
+        return '{}/{}{:05d}{}'.format(self.root, _SEG_PREFIX, seq, _SEG_SUFFIX)
+
+    def _segments(self):
+        seqs = []
+        for name in os.listdir(self.root):
+            if name.startswith(_SEG_PREFIX) and name.endswith(_SEG_SUFFIX):
+                try:
+                    seqs.append(int(name[len(_SEG_PREFIX):-len(_SEG_SUFFIX)]))
+                except ValueError:
+                    pass
+        seqs.sort()
+        return seqs
+
+    def _size(self, seq):
+        try:
+            return os.stat(self._path(seq))[6]
+        except OSError:
+            return 0
+
+    def _load_cursor(self):
+        try:
+            with open(self.root + '/cursor', 'rb') as f:
+                data = f.read()
+            return struct.unpack(_CURSOR_FMT, data)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _save_cursor(self):
+        tmp = self.root + '/cursor.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(struct.pack(_CURSOR_FMT, self.read_seg, self.read_off))
+        # A lost cursor would mean a full replay
+        replace(tmp, self.root + '/cursor')
+
+    def _remove(self, seq):
+        try:
+            os.remove(self._path(seq))
+        except OSError:
+            pass
+
+    def _scan(self, seq):
+        """Offset just past the last intact record in a segment"""
+        off = 0
+        try:
+            with open(self._path(seq), 'rb') as f:
+                while True:
+                    rec = self._read_record(f)
+                    if rec is None:
+                        break
+                    off += 2 + len(rec)
+        except OSError:
+            pass
+        return off
+
+    @staticmethod
+    def _read_record(f):
+        head = f.read(2)
+        if len(head) < 2:
+            return None
+        payload = f.read(head[0])
+        if len(payload) < head[0] or _checksum(payload) != head[1]:
+            return None
+        return payload
+
+    # ---- producer ----
+
+    def append(self, payload):
+        """Append one record (<= 255 bytes); evicts the oldest segment when full"""
+        n = len(payload)
+        if n > 255:
+            raise ValueError("record too large")
+        if self.write_off and self.write_off + 2 + n > self.segment_bytes:
+            self.write_seg += 1
+            self.write_off = 0
+            if self.write_seg - self.read_seg >= self.max_segments:
+                self.dropped += self._count(self.read_seg, self.read_off)
+                self._remove(self.read_seg)
+                self.read_seg += 1
+                self.read_off = 0
+                self._next = None
+                self._save_cursor()
+        with open(self._path(self.write_seg), 'ab') as f:
+            f.write(bytes((n, _checksum(payload))) + payload)
+        self.write_off += 2 + n
+
+    def append_reading(self, ts, temp, vib, dist, status, battery):
+        """Queue one telemetry reading"""
+        self.append(pack_reading(ts, temp, vib, dist, status, battery))
+
+    # ---- consumer ----
+
+    def _count(self, seq, off):
+        n = 0
+        try:
+            with open(self._path(seq), 'rb') as f:
+                f.seek(off)
+                while self._read_record(f) is not None:
+                    n += 1
+        except OSError:
+            pass
+        return n
+
+    def is_empty(self):
+        """True when every record up to the write cursor has been committed"""
+        return self.read_seg == self.write_seg and self.read_off >= self.write_off
+
+    def read_batch(self, max_records):
+        """Return up to max_records payloads from the read cursor (not yet committed)"""
+        out = []
+        seg = self.read_seg
+        off = self.read_off
+        while len(out) < max_records:
+            if seg == self.write_seg and off >= self.write_off:
+                break
+            try:
+                with open(self._path(seg), 'rb') as f:
+                    f.seek(off)
+                    while len(out) < max_records:
+                        rec = self._read_record(f)
+                        if rec is None:
+                            break
+                        out.append(rec)
+                        off += 2 + len(rec)
+            except OSError:
+                pass
+            if len(out) >= max_records or seg >= self.write_seg:
+                break
+            # Segment exhausted (or torn): continue with the next one
+            seg += 1
+            off = 0
+        self._next = (seg, off)
+        return out
+
+    def commit(self):
+        """Advance the read cursor past the last batch and free consumed segments"""
+        if self._next is None:
+            return
+        seg, off = self._next
+        for s in range(self.read_seg, seg):
+            self._remove(s)
+        self.read_seg, self.read_off = seg, off
+        self._next = None
+        self._save_cursor()
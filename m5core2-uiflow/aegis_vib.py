@@ -0,0 +1,121 @@
+# ============================================================================
+# AegisOne Vibration Sampler
+# High-rate IMU ring buffer with windowed vibration features
+# ============================================================================
+# Upload next to aegis_one_m5core2.py (/flash). The sampler keeps a fixed
+# array('f') ring of gravity-compensated acceleration magnitudes, filled at
+# a fixed rate from a machine.Timer callback, and reduces the most recent
+# window to RMS, peak, crest factor and peak-to-peak on demand.
+# ============================================================================
+
+import time
+from array import array
+from math import sqrt
+
+DEFAULT_RATE_HZ = 500
+DEFAULT_WINDOW = 256
+
+
+class VibSampler:
+    """Fixed-rate accelerometer sampler backed by a preallocated ring buffer"""
+
+    def __init__(self, sensor, rate_hz=DEFAULT_RATE_HZ, window=DEFAULT_WINDOW):
+        self.sensor = sensor
+        self.rate_hz = rate_hz
+        self.period_us = 1000000 // rate_hz
+        self.size = window
+        self.buf = array('f', bytes(4 * window))
+        self.idx = 0
+        self.count = 0
+        self.errors = 0
+        self.timer = None
+        self.tap = None   # also gets every sample pushed (waveform capture)
+
+        # Window statistics (updated by reduce())
+        self.rms = 0.0
+        self.peak = 0.0
+        self.crest = 0.0
+        self.p2p = 0.0
+
+    def sample(self, _=None):
+        """Take one sample into the ring (safe to use as a Timer callback)"""
+        v = self.magnitude()
+        if v is not None:
+            self.push(v)
+
+    def magnitude(self):
+        """Read the sensor once; None (and an error counted) if it fails"""
+        try:
+            a = self.sensor.acceleration
+        except Exception:
+            self.errors += 1
+            return None
+        x = a[0]
+        y = a[1]
+        z = a[2]
+        # Dynamic component: magnitude minus 1g of gravity
+        return sqrt(x * x + y * y + z * z) - 1.0
+
+    def push(self, v):
+        """Append a sample taken elsewhere (e.g. by the acquisition thread)"""
+        self.buf[self.idx] = v
+        self.idx += 1
+        if self.idx >= self.size:
+            self.idx = 0
+        self.count += 1
+        if self.tap is not None:
+            self.tap(v)
+
+    def burst(self, n):
+        """Sample n times at the configured rate in a tight loop"""
+        period = self.period_us
+        due = time.ticks_us()
+        for _ in range(n):
+            self.sample()
+            due = time.ticks_add(due, period)
+            while time.ticks_diff(due, time.ticks_us()) > 0:
+                pass
+
+    def start(self, timer_id=0):
+        """Start background sampling from a hardware timer"""
+        import machine
+        period_ms = max(1, 1000 // self.rate_hz)
+        self.rate_hz = 1000 // period_ms
+        self.period_us = period_ms * 1000
+        self.timer = machine.Timer(timer_id)
+        self.timer.init(period=period_ms, mode=machine.Timer.PERIODIC,
+                        callback=self.sample)
+
+    def stop(self):
+        """Stop background sampling"""
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def filled(self):
+        """Number of valid samples currently in the ring"""
+        return self.count if self.count < self.size else self.size
+
+    def reduce(self):
+        """Reduce the current window to RMS, peak, crest factor and p2p"""
+        n = self.filled()
+        if n == 0:
+            return self.peak
+        buf = self.buf
+        lo = buf[0]
+        hi = lo
+        acc = 0.0
+        for i in range(n):
+            v = buf[i]
+            acc += v * v
+            if v < lo:
+                lo = v
+            elif v > hi:
+                hi = v
+        rms = sqrt(acc / n)
+        peak = hi if hi >= -lo else -lo
+        self.rms = rms
+        self.peak = peak
+        self.p2p = hi - lo
+        self.crest = peak / rms if rms > 0 else 0.0
+        return peak
@@ -0,0 +1,79 @@
+# ============================================================================
+# AegisOne View Model
+# Dirty-tracking wrappers around M5Label with a display refresh cap
+# ============================================================================
+# Widget mirrors the M5Label calls the firmware uses (set_text and
+# set_text_color) but only forwards a call when the value differs from the
+# last one rendered, so unchanged labels never trigger an LVGL redraw.
+# set_value() goes one step earlier and compares the number and format,
+# so the text of an unchanged reading is not even formatted (no allocation).
+# View.frame() caps how often the dashboard is repainted, independently of
+# how often sensors are read.
+# ============================================================================
+
+import time
+
+
+class Widget:
+    """Caches the last rendered text and color of one label"""
+
+    def __init__(self, view, label, text=None, color=None):
+        self.view = view
+        self.label = label
+        self.text = text
+        self.color = color
+        self.value = None
+        self.fmt = None
+
+    def set_value(self, value, fmt):
+        """set_text(fmt.format(value)), formatted only when value or fmt changed"""
+        if value == self.value and fmt == self.fmt:
+            self.view.skipped += 1
+            return
+        self.value = value
+        self.fmt = fmt
+        self.set_text(fmt.format(value))
+
+    def set_text(self, text):
+        if text == self.text:
+            self.view.skipped += 1
+            return
+        self.label.set_text(text)
+        self.text = text
+        self.view.pushed += 1
+
+    def set_text_color(self, color):
+        if color == self.color:
+            self.view.skipped += 1
+            return
+        self.label.set_text_color(color)
+        self.color = color
+        self.view.pushed += 1
+
+
+class View:
+    """Owns the widgets and the repaint rate limit"""
+
+    def __init__(self, min_frame_ms=200):
+        self.min_frame_ms = min_frame_ms
+        self.last_frame = None
+        self.frames = 0
+        self.throttled = 0
+        self.pushed = 0
+        self.skipped = 0
+
+    def bind(self, label, text=None, color=None):
+        """Wrap a label created with the given initial text and color"""
+        return Widget(self, label, text, color)
+
+    def frame(self, now_ms=None, force=False):
+        """True if a repaint may happen now; counts throttled frames otherwise"""
+        if now_ms is None:
+            now_ms = time.ticks_ms()
+        if (not force and self.last_frame is not None
+                and time.ticks_diff(now_ms, self.last_frame) < self.min_frame_ms):
+            self.throttled += 1
+            return False
+        self.last_frame = now_ms
+        self.frames += 1
+        return True
@@ -0,0 +1,562 @@
+# ============================================================================
+# AegisOne Wire Formats
+# Compact binary encodings of telemetry, batch and event payloads
+# ============================================================================
+# Every format is self-identifying by its first byte, so the backend can
+# tell them apart on the same topics:
+#   '{'            JSON (the original json.dumps payloads)
+#   0xAE           fixed struct layout: <magic><version><type> + body
+#   0xD9 0xD9 0xF7 CBOR with the self-describe tag (55799)
+#
+# Struct layout, version 6 (little-endian):
+#   telemetry  <I         seq (0 = not numbered), then
+#              <QfffBBB   ts, temp, vib, distance, status, proximity, battery
+#              + features + node state + device id
+#   batch      <I         seq, then
+#              <QBB       ts0, count, battery
+#              + count * <IfffB (dt, temp, vib, distance,
+#                                 status | proximity << 4, 15 = none)
+#              + features + node state + device id
+#   event      <QfffBB    eventTs, temp, vib, distance, severity, len(message)
+#              <ffi       baselineVib, driftPct (NaN = null),
+#                         detectionLatencyMs (-1 = null)
+#              <I         eventId (0 = none)
+#              <BIB       eventType, sampleIntervalMs, number of alerts
+#              + alerts (each <B length + utf-8)
+#              <H         length of the extra details (0 = none), then
+#              + extra details as a CBOR map (clearedSeverity, durationMs...)
+#              + message + device id
+#   features   <fffffB    vibRms, vibCrest, vibP2p, vibPeakHz, vibBandHz, n
+#              + n * <f   vibBands
+#   node state <B         flags: 1 loop and link, 2 memory (0 = neither)
+#              <BIIIIHi   rate, loopLagMs, sampleMs, reconnects, offlineMs,
+#                         eventQueue, vibDropped (-1 = none), if flag 1
+#              <IIII      memFree, allocPerPass, allocMaxPass, gcMaxUs,
+#                         if flag 2
+#   device id  <B         length + utf-8 bytes
+# CBOR carries the node state as top-level keys, like JSON. Older versions
+# are still decoded: version 5 has no node state, version 4 no proximity
+# in batch rows and no eventType, alerts or sampleIntervalMs in events,
+# version 3 no eventId either, version 2 additionally no detector fields,
+# version 1 no seq either.
+# Type 4 is a waveform snapshot chunk; aegis_snap encodes and reassembles
+# those, decode() does not.
+#
+# Encoders write into one preallocated bytearray and return a memoryview
+# of the encoded bytes, valid until the next encode call. decode() turns
+# any of the formats back into the JSON-shaped dict.
+# ============================================================================
+
+import json
+import struct
+
+FORMAT_JSON = 'json'
+FORMAT_STRUCT = 'struct'
+FORMAT_CBOR = 'cbor'
+
+MAGIC = 0xAE
+VERSION = 6
+MSG_TELEMETRY = 1
+MSG_BATCH = 2
+MSG_EVENT = 3
+MSG_SNAPSHOT = 4  # waveform snapshot chunks, see aegis_snap.py
+
+CBOR_TAG = b'\xd9\xd9\xf7'
+
+STATUSES = ('RUNNING', 'WARNING', 'CRITICAL')
+PROXIMITIES = ('SAFE', 'WARNING', 'DANGER')
+SEVERITIES = ('INFO', 'WARNING', 'CRITICAL')
+EVENT_TYPES = ('THRESHOLD', 'ANOMALY', 'CLEARED', 'STATUS', 'TEST')
+RATES = ('fast', 'normal', 'slow', 'saver')
+
+_HEADER = '<BBB'
+_SEQ = '<I'
+_TELEMETRY = '<QfffBBB'
+_BATCH = '<QBB'
+_BATCH_ROW = '<IfffB'
+_NO_PROXIMITY = 15
+_EVENT = '<QfffBB'
+_EVENT_DETECT = '<ffi'
+_EVENT_ID = '<I'
+_EVENT_TYPE = '<BIB'
+_EVENT_EXTRA = '<H'
+_FEATURES = '<fffffB'
+_STATE_FLAGS = '<B'
+_STATE = '<BIIIIHi'
+_STATE_MEM = '<IIII'
+_STATE_LINK = 1
+_STATE_HEAP = 2
+STATE_FIELDS = ('rate', 'loopLagMs', 'sampleMs', 'reconnects', 'offlineMs', 'eventQueue',
+                'vibDropped')
+STATE_MEM_FIELDS = ('memFree', 'allocPerPass', 'allocMaxPass', 'gcMaxUs')
+
+
+def _code(table, value):
+    return table.index(value) if value in table else 0
+
+
+def _name(table, code):
+    return table[code] if code < len(table) else table[0]
+
+
+def _f32(v):
+    """Float32 value as the shortest decimal that round-trips"""
+    return float('{:.7g}'.format(v))
+
+
+def _nan_or(v):
+    return float('nan') if v is None else v
+
+
+class WireEncoder:
+    """Encodes payloads into a reused buffer in the configured format"""
+
+    def __init__(self, device_id, fmt=FORMAT_STRUCT, size=1024):
+        self.device_id = device_id
+        self.device_bytes = device_id.encode()
+        self.fmt = fmt
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.pos = 0
+
+    # ---- low-level writers ----
+
+    def _pack(self, fmt, *values):
+        struct.pack_into(fmt, self.buf, self.pos, *values)
+        self.pos += struct.calcsize(fmt)
+
+    def _bytes(self, data):
+        n = len(data)
+        self.buf[self.pos:self.pos + n] = data
+        self.pos += n
+
+    def _device(self):
+        self._pack('<B', len(self.device_bytes))
+        self._bytes(self.device_bytes)
+
+    def _cbor_head(self, major, n):
+        major <<= 5
+        if n < 24:
+            self._pack('B', major | n)
+        elif n < 0x100:
+            self._pack('>BB', major | 24, n)
+        elif n < 0x10000:
+            self._pack('>BH', major | 25, n)
+        elif n < 0x100000000:
+            self._pack('>BI', major | 26, n)
+        else:
+            self._pack('>BQ', major | 27, n)
+
+    def _cbor(self, value):
+        if value is None:
+            self._pack('B', 0xF6)
+        elif value is True:
+            self._pack('B', 0xF5)
+        elif value is False:
+            self._pack('B', 0xF4)
+        elif isinstance(value, int):
+            if value >= 0:
+                self._cbor_head(0, value)
+            else:
+                self._cbor_head(1, -1 - value)
+        elif isinstance(value, float):
+            self._pack('>Bf', 0xFA, value)
+        elif isinstance(value, str):
+            data = value.encode()
+            self._cbor_head(3, len(data))
+            self._bytes(data)
+        elif isinstance(value, dict):
+            self._cbor_head(5, len(value))
+            for k in value:
+                self._cbor(k)
+                self._cbor(value[k])
+        else:
+            # list, tuple, array
+            self._cbor_head(4, len(value))
+            for v in value:
+                self._cbor(v)
+
+    def _cbor_key(self, key, value):
+        self._cbor(key)
+        self._cbor(value)
+
+    def _features(self, rms, crest, p2p, peak_hz, band_hz, bands):
+        n = len(bands) if bands is not None else 0
+        if self.fmt == FORMAT_CBOR:
+            self._cbor_key('vibRms', rms)
+            self._cbor_key('vibCrest', crest)
+            self._cbor_key('vibP2p', p2p)
+            if n:
+                self._cbor_key('vibBands', bands)
+                self._cbor_key('vibPeakHz', peak_hz)
+                self._cbor_key('vibBandHz', band_hz)
+            return
+        self._pack(_FEATURES, rms, crest, p2p, peak_hz, band_hz, n)
+        for i in range(n):
+            self._pack('<f', bands[i])
+
+    def _state(self, state):
+        """Node state: the STATE_FIELDS (vibDropped may be missing) and,
+        when memFree is there, the STATE_MEM_FIELDS"""
+        if self.fmt == FORMAT_CBOR:
+            if state:
+                for k in state:
+                    self._cbor_key(k, state[k])
+            return
+        if not state:
+            self._pack(_STATE_FLAGS, 0)
+            return
+        mem = state.get('memFree')
+        self._pack(_STATE_FLAGS, _STATE_LINK | (_STATE_HEAP if mem is not None else 0))
+        dropped = state.get('vibDropped')
+        self._pack(_STATE, _code(RATES, state['rate']), state['loopLagMs'], state['sampleMs'],
+                   state['reconnects'], state['offlineMs'], state['eventQueue'],
+                   -1 if dropped is None else dropped)
+        if mem is not None:
+            self._pack(_STATE_MEM, mem, state['allocPerPass'], state['allocMaxPass'],
+                       state['gcMaxUs'])
+
+    def _start(self, msg_type):
+        self.pos = 0
+        if self.fmt == FORMAT_CBOR:
+            self._bytes(CBOR_TAG)
+        else:
+            self._pack(_HEADER, MAGIC, VERSION, msg_type)
+
+    def _done(self):
+        return self.mv[:self.pos]
+
+    # ---- messages ----
+
+    def telemetry(self, ts, temp, vib, dist, status, proximity, battery,
+                  rms=0.0, crest=0.0, p2p=0.0, peak_hz=0.0, band_hz=0.0, bands=None, seq=0,
+                  state=None):
+        """Encode one telemetry reading; state is the node state dict"""
+        self._start(MSG_TELEMETRY)
+        if self.fmt == FORMAT_CBOR:
+            n = 14 if bands is not None and len(bands) else 11
+            if state:
+                n += len(state)
+            self._cbor_head(5, n + 1 if seq else n)
+            self._cbor_key('deviceId', self.device_id)
+            if seq:
+                self._cbor_key('seq', seq)
+            self._cbor_key('ts', ts)
+            self._cbor_key('temp', temp)
+            self._cbor_key('vib', vib)
+            self._cbor_key('distance', dist)
+            self._cbor_key('proximity', proximity)
+            self._cbor_key('status', status)
+            self._cbor_key('battery', battery)
+            self._features(rms, crest, p2p, peak_hz, band_hz, bands)
+            self._state(state)
+            return self._done()
+        self._pack(_SEQ, seq)
+        self._pack(_TELEMETRY, ts, temp, vib, dist, _code(STATUSES, status),
+                   _code(PROXIMITIES, proximity), battery)
+        self._features(rms, crest, p2p, peak_hz, band_hz, bands)
+        self._state(state)
+        self._device()
+        return self._done()
+
+    def batch(self, b, rms=0.0, crest=0.0, p2p=0.0, peak_hz=0.0, band_hz=0.0, bands=None,
+              seq=0, state=None):
+        """Encode a TelemetryBatch; state is the node state dict"""
+        n = len(b)
+        ts0 = b.ts[0] if n else 0
+        battery = b.battery if b.battery is not None else 0
+        self._start(MSG_BATCH)
+        if self.fmt == FORMAT_CBOR:
+            keys = 15 if bands is not None and len(bands) else 12
+            if state:
+                keys += len(state)
+            self._cbor_head(5, keys + 1 if seq else keys)
+            self._cbor_key('deviceId', self.device_id)
+            if seq:
+                self._cbor_key('seq', seq)
+            self._cbor_key('ts0', ts0)
+            self._cbor('ts')
+            self._cbor_head(4, n)
+            for t in b.ts:
+                self._cbor(t - ts0)
+            self._cbor_key('temp', b.temp)
+            self._cbor_key('vib', b.vib)
+            self._cbor_key('distance', b.distance)
+            self._cbor_key('status', b.status)
+            self._cbor_key('proximity', b.proximity)
+            self._cbor_key('battery', battery)
+            self._features(rms, crest, p2p, peak_hz, band_hz, bands)
+            self._state(state)
+            return self._done()
+        self._pack(_SEQ, seq)
+        self._pack(_BATCH, ts0, n, battery)
+        for i in range(n):
+            prox = b.proximity[i]
+            prox = _code(PROXIMITIES, prox) if prox is not None else _NO_PROXIMITY
+            self._pack(_BATCH_ROW, b.ts[i] - ts0, b.temp[i], b.vib[i], b.distance[i],
+                       _code(STATUSES, b.status[i]) | prox << 4)
+        self._features(rms, crest, p2p, peak_hz, band_hz, bands)
+        self._state(state)
+        self._device()
+        return self._done()
+
+    def event(self, ts, severity, message, temp, vib, dist,
+              baseline_vib=None, drift_pct=None, latency_ms=None, event_id=0,
+              event_type='THRESHOLD', alerts=(), sample_ms=0, extra=None):
+        """Encode an event; extra holds further details (the CLEARED
+        episode, the STATUS link counters)"""
+        self._start(MSG_EVENT)
+        if self.fmt == FORMAT_CBOR:
+            self._cbor_head(5, 7 if event_id else 6)
+            self._cbor_key('deviceId', self.device_id)
+            if event_id:
+                self._cbor_key('eventId', event_id)
+            self._cbor_key('eventType', event_type)
+            self._cbor_key('severity', severity)
+            self._cbor_key('message', message)
+            self._cbor_key('eventTs', ts)
+            self._cbor('details')
+            self._cbor_head(5, 8 + len(extra) if extra else 8)
+            self._cbor_key('temp', temp)
+            self._cbor_key('vib', vib)
+            self._cbor_key('distance', dist)
+            self._cbor_key('alerts', alerts)
+            self._cbor_key('baselineVib', baseline_vib)
+            self._cbor_key('driftPct', drift_pct)
+            self._cbor_key('detectionLatencyMs', latency_ms)
+            self._cbor_key('sampleIntervalMs', sample_ms)
+            if extra:
+                for k in extra:
+                    self._cbor_key(k, extra[k])
+            return self._done()
+        text = message.encode()[:255]
+        self._pack(_EVENT, ts, temp, vib, dist, _code(SEVERITIES, severity), len(text))
+        self._pack(_EVENT_DETECT, _nan_or(baseline_vib), _nan_or(drift_pct),
+                   -1 if latency_ms is None else latency_ms)
+        self._pack(_EVENT_ID, event_id)
+        self._pack(_EVENT_TYPE, _code(EVENT_TYPES, event_type), sample_ms, len(alerts))
+        for name in alerts:
+            data = name.encode()
+            self._pack('<B', len(data))
+            self._bytes(data)
+        self._pack(_EVENT_EXTRA, 0)
+        if extra:
+            start = self.pos
+            self._cbor(extra)
+            struct.pack_into(_EVENT_EXTRA, self.buf, start - 2, self.pos - start)
+        self._bytes(text)
+        self._device()
+        return self._done()
+
+
+# ============================================================================
+# DECODING (ingest side)
+# ============================================================================
+
+def _unpack(fmt, data, pos):
+    return struct.unpack_from(fmt, data, pos), pos + struct.calcsize(fmt)
+
+
+def _read_features(data, pos, out):
+    (rms, crest, p2p, peak_hz, band_hz, n), pos = _unpack(_FEATURES, data, pos)
+    out['vibRms'] = _f32(rms)
+    out['vibCrest'] = _f32(crest)
+    out['vibP2p'] = _f32(p2p)
+    if n:
+        bands, pos = _unpack('<{}f'.format(n), data, pos)
+        out['vibBands'] = [_f32(e) for e in bands]
+        out['vibPeakHz'] = _f32(peak_hz)
+        out['vibBandHz'] = _f32(band_hz)
+    return pos
+
+
+def _read_state(data, pos, out):
+    (flags,), pos = _unpack(_STATE_FLAGS, data, pos)
+    if flags & _STATE_LINK:
+        values, pos = _unpack(_STATE, data, pos)
+        for name, v in zip(STATE_FIELDS, values):
+            out[name] = v
+        out['rate'] = _name(RATES, values[0])
+        if out['vibDropped'] < 0:
+            del out['vibDropped']
+    if flags & _STATE_HEAP:
+        values, pos = _unpack(_STATE_MEM, data, pos)
+        for name, v in zip(STATE_MEM_FIELDS, values):
+            out[name] = v
+    return pos
+
+
+def _read_device(data, pos, out):
+    n = data[pos]
+    out['deviceId'] = bytes(data[pos + 1:pos + 1 + n]).decode()
+    return pos + 1 + n
+
+
+def _decode_struct(data):
+    (magic, version, msg_type), pos = _unpack(_HEADER, data, 0)
+    if version < 1 or version > VERSION:
+        raise ValueError("unsupported struct version {}".format(version))
+    out = {}
+    if version >= 2 and msg_type in (MSG_TELEMETRY, MSG_BATCH):
+        (seq,), pos = _unpack(_SEQ, data, pos)
+        if seq:
+            out['seq'] = seq
+    if msg_type == MSG_TELEMETRY:
+        (ts, temp, vib, dist, status, prox, battery), pos = _unpack(_TELEMETRY, data, pos)
+        out.update({'ts': ts, 'temp': _f32(temp), 'vib': _f32(vib), 'distance': _f32(dist),
+                    'status': _name(STATUSES, status), 'proximity': _name(PROXIMITIES, prox),
+                    'battery': battery})
+        pos = _read_features(data, pos, out)
+        if version >= 6:
+            pos = _read_state(data, pos, out)
+    elif msg_type == MSG_BATCH:
+        (ts0, n, battery), pos = _unpack(_BATCH, data, pos)
+        cols = {'ts': [], 'temp': [], 'vib': [], 'distance': [], 'status': []}
+        if version >= 5:
+            cols['proximity'] = []
+        for _ in range(n):
+            (dt, temp, vib, dist, status), pos = _unpack(_BATCH_ROW, data, pos)
+            cols['ts'].append(dt)
+            cols['temp'].append(_f32(temp))
+            cols['vib'].append(_f32(vib))
+            cols['distance'].append(_f32(dist))
+            if version >= 5:
+                prox = status >> 4
+                cols['proximity'].append(
+                    None if prox == _NO_PROXIMITY else _name(PROXIMITIES, prox))
+                status &= 0x0F
+            cols['status'].append(_name(STATUSES, status))
+        out['ts0'] = ts0
+        out.update(cols)
+        out['battery'] = battery
+        pos = _read_features(data, pos, out)
+        if version >= 6:
+            pos = _read_state(data, pos, out)
+    elif msg_type == MSG_EVENT:
+        (ts, temp, vib, dist, severity, n), pos = _unpack(_EVENT, data, pos)
+        out['severity'] = _name(SEVERITIES, severity)
+        out['eventTs'] = ts
+        details = {'temp': _f32(temp), 'vib': _f32(vib), 'distance': _f32(dist)}
+        if version >= 3:
+            (base, drift, latency), pos = _unpack(_EVENT_DETECT, data, pos)
+            details['baselineVib'] = None if base != base else _f32(base)
+            details['driftPct'] = None if drift != drift else _f32(drift)
+            details['detectionLatencyMs'] = None if latency < 0 else latency
+        if version >= 4:
+            (event_id,), pos = _unpack(_EVENT_ID, data, pos)
+            if event_id:
+                out['eventId'] = event_id
+        if version >= 5:
+            (event_type, sample_ms, alerts), pos = _unpack(_EVENT_TYPE, data, pos)
+            out['eventType'] = _name(EVENT_TYPES, event_type)
+            details['alerts'] = []
+            for _ in range(alerts):
+                k = data[pos]
+                details['alerts'].append(bytes(data[pos + 1:pos + 1 + k]).decode())
+                pos += 1 + k
+            details['sampleIntervalMs'] = sample_ms
+            (n_extra,), pos = _unpack(_EVENT_EXTRA, data, pos)
+            if n_extra:
+                details.update(_cbor_item(data, pos)[0])
+                pos += n_extra
+        out['message'] = bytes(data[pos:pos + n]).decode()
+        out['details'] = details
+        pos += n
+    else:
+        raise ValueError("unknown message type {}".format(msg_type))
+    _read_device(data, pos, out)
+    return out
+
+
+def _cbor_item(data, pos):
+    ib = data[pos]
+    pos += 1
+    major = ib >> 5
+    info = ib & 0x1F
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info == 22 or info == 23:
+            return None, pos
+        if info == 25:
+            # half float
+            h = (data[pos] << 8) | data[pos + 1]
+            exp = (h >> 10) & 0x1F
+            mant = h & 0x3FF
+            if exp == 0:
+                v = mant * 2.0 ** -24
+            elif exp == 31:
+                v = float('inf') if mant == 0 else float('nan')
+            else:
+                v = (1 + mant / 1024.0) * 2.0 ** (exp - 15)
+            return (-v if h & 0x8000 else v), pos + 2
+        if info == 26:
+            return _f32(struct.unpack_from('>f', data, pos)[0]), pos + 4
+        if info == 27:
+            return struct.unpack_from('>d', data, pos)[0], pos + 8
+        raise ValueError("unsupported CBOR simple value")
+    if info < 24:
+        n = info
+    elif info == 24:
+        n = data[pos]
+        pos += 1
+    elif info == 25:
+        n = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+    elif info == 26:
+        n = struct.unpack_from('>I', data, pos)[0]
+        pos += 4
+    elif info == 27:
+        n = struct.unpack_from('>Q', data, pos)[0]
+        pos += 8
+    else:
+        raise ValueError("indefinite CBOR lengths not supported")
+    if major == 0:
+        return n, pos
+    if major == 1:
+        return -1 - n, pos
+    if major == 2:
+        return bytes(data[pos:pos + n]), pos + n
+    if major == 3:
+        return bytes(data[pos:pos + n]).decode(), pos + n
+    if major == 4:
+        out = []
+        for _ in range(n):
+            v, pos = _cbor_item(data, pos)
+            out.append(v)
+        return out, pos
+    if major == 5:
+        out = {}
+        for _ in range(n):
+            k, pos = _cbor_item(data, pos)
+            v, pos = _cbor_item(data, pos)
+            out[k] = v
+        return out, pos
+    # major 6: tag, return the tagged item
+    return _cbor_item(data, pos)
+
+
+def detect_format(data):
+    """Identify the wire format of a raw MQTT payload"""
+    if not data:
+        raise ValueError("empty payload")
+    first = data[0]
+    if first == MAGIC:
+        return FORMAT_STRUCT
+    if bytes(data[:3]) == CBOR_TAG:
+        return FORMAT_CBOR
+    return FORMAT_JSON
+
+
+def decode(data):
+    """Decode a payload in any wire format into its JSON-shaped dict"""
+    fmt = detect_format(data)
+    if fmt == FORMAT_STRUCT:
+        return _decode_struct(data)
+    if fmt == FORMAT_CBOR:
+        return _cbor_item(data, 0)[0]
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode()
+    return json.loads(data)
@@ -0,0 +1,164 @@
+# ============================================================================
+# AegisOne Acquisition Thread Harness
+# Runs the firmware's Acquisition worker on a CPython thread with a stubbed
+# IMU while the main thread simulates publishes and redraws, and compares
+# the sample timing with sampling from a cooperative task. A second run
+# stalls the consumer past the ring's capacity and checks the drop-newest
+# policy: samples arrive in order, none twice, and every missing one is
+# counted in `dropped`.
+#
+#   python3 m5core2-uiflow/host/acq_harness.py
+# ============================================================================
+
+import sys
+import time
+
+import stubs
+
+stubs.install()
+
+from aegis_acq import Acquisition, SampleRing
+from aegis_vib import VibSampler
+
+RATE_HZ = 500
+PERIOD_US = 1000000 // RATE_HZ
+RING = 512
+DURATION_MS = 3000
+PUBLISH_EVERY_MS = 100
+PUBLISH_COST_MS = 15   # TLS write: waits on the socket (releases the GIL)
+REDRAW_EVERY_MS = 250
+REDRAW_COST_MS = 4     # LVGL redraw: holds the interpreter
+
+
+class StampedIMU:
+    """Stub accelerometer that records when it was read"""
+
+    def __init__(self):
+        self.stamps = []
+        self.sensor = stubs.SignalIMU(stubs.sine_signal(0.5, 50.0), RATE_HZ)
+
+    @property
+    def acceleration(self):
+        self.stamps.append(time.ticks_us())
+        return self.sensor.acceleration
+
+
+def busy_ms(ms):
+    end = time.ticks_add(time.ticks_ms(), ms)
+    while time.ticks_diff(end, time.ticks_ms()) > 0:
+        pass
+
+
+def main_thread_work(now_ms, state):
+    """One pass of the main thread's non-sampling work"""
+    if time.ticks_diff(now_ms, state['publish']) >= PUBLISH_EVERY_MS:
+        state['publish'] = now_ms
+        time.sleep(PUBLISH_COST_MS / 1000)
+    if time.ticks_diff(now_ms, state['redraw']) >= REDRAW_EVERY_MS:
+        state['redraw'] = now_ms
+        busy_ms(REDRAW_COST_MS)
+
+
+def intervals(stamps):
+    return [time.ticks_diff(b, a) for a, b in zip(stamps, stamps[1:])]
+
+
+def summary(name, stamps, window):
+    gaps = sorted(intervals(stamps))
+    if not gaps:
+        return name, 0, 0, 0
+    p99 = gaps[min(len(gaps) - 1, len(gaps) * 99 // 100)]
+    late = sum(1 for g in gaps if g > 2 * PERIOD_US)
+    print('{:<12} {:>5} samples  p99 interval {:>6} us  max {:>6} us  '
+          '{:>4} gaps > 2 periods  window {:.3f} g'.format(
+              name, len(stamps), p99, gaps[-1], late, window))
+    return name, p99, gaps[-1], late
+
+
+def cooperative():
+    """Sampling from the main loop between the other work (no thread)"""
+    sensor = StampedIMU()
+    sampler = VibSampler(sensor, RATE_HZ, 256)
+    state = {'publish': time.ticks_ms(), 'redraw': time.ticks_ms()}
+    start = time.ticks_ms()
+    due = time.ticks_us()
+    while time.ticks_diff(time.ticks_ms(), start) < DURATION_MS:
+        if time.ticks_diff(time.ticks_us(), due) >= 0:
+            sampler.sample()
+            due = time.ticks_add(due, PERIOD_US)
+            if time.ticks_diff(time.ticks_us(), due) > PERIOD_US:
+                due = time.ticks_us()
+        main_thread_work(time.ticks_ms(), state)
+    sampler.reduce()
+    return summary('cooperative', sensor.stamps, sampler.peak)
+
+
+def threaded():
+    """Sampling by the Acquisition worker, drained by the main loop"""
+    sensor = StampedIMU()
+    sampler = VibSampler(sensor, RATE_HZ, 256)
+    acq = Acquisition(sampler.magnitude, PERIOD_US, RING)
+    acq.start()
+    state = {'publish': time.ticks_ms(), 'redraw': time.ticks_ms()}
+    start = time.ticks_ms()
+    while time.ticks_diff(time.ticks_ms(), start) < DURATION_MS:
+        acq.drain(sampler.push)
+        main_thread_work(time.ticks_ms(), state)
+        time.sleep(0.01)  # IMU task period
+    acq.stop()
+    acq.drain(sampler.push)
+    sampler.reduce()
+    ok = acq.ring.dropped == 0 and not acq.alive
+    return summary('thread', sensor.stamps, sampler.peak) + (ok,)
+
+
+def stall():
+    """Consumer stops for longer than the ring holds"""
+    count = [0]
+
+    def read():
+        count[0] += 1
+        return float(count[0])
+
+    acq = Acquisition(read, PERIOD_US, RING)
+    got = []
+    acq.start()
+    time.sleep(0.2)
+    acq.drain(got.append)
+    time.sleep(2.0)  # ~1000 samples against a 512-slot ring
+    acq.drain(got.append)
+    time.sleep(0.2)
+    acq.stop()
+    acq.drain(got.append)
+
+    ordered = all(b > a for a, b in zip(got, got[1:]))
+    accounted = len(got) + acq.ring.dropped == count[0]
+    print('stall 2 s    {:>5} read  {:>5} delivered  {:>4} dropped  '
+          'in order {}  accounted {}'.format(count[0], len(got), acq.ring.dropped,
+                                             ordered, accounted))
+    return ordered and accounted and acq.ring.dropped > 0
+
+
+def ring_edges():
+    ring = SampleRing(3)
+    ok = [ring.push(v) for v in (1.0, 2.0, 3.0, 4.0)] == [True, True, True, False]
+    out = []
+    ok = ok and ring.drain(out.append, 2) == 2 and len(ring) == 1
+    ok = ok and ring.push(5.0) and ring.push(6.0) and not ring.push(7.0)
+    ring.drain(out.append)
+    return ok and out == [1.0, 2.0, 3.0, 5.0, 6.0] and ring.dropped == 2 and len(ring) == 0
+
+
+def main():
+    ok = ring_edges()
+    print('ring edges  ', 'ok' if ok else 'FAIL')
+    _, coop_p99, coop_max, coop_late = cooperative()
+    _, thr_p99, thr_max, thr_late, thr_ok = threaded()
+    ok = ok and thr_ok and thr_late <= coop_late and thr_max <= coop_max
+    ok = stall() and ok
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
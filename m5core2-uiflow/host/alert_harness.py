@@ -0,0 +1,152 @@
+# ============================================================================
+# AegisOne Alert State Machine Harness
+# Drives the firmware's AlertMachine with synthetic reading sequences at the
+# threshold-check rate and asserts the events each one produces: a sustained
+# excursion, a reading hovering on a threshold, a short spike, an
+# escalation, a flapping machine and two separate episodes. Finally replays
+# a sensor trace and compares the event count with one event per pass.
+#
+#   python3 m5core2-uiflow/host/alert_harness.py [--trace rec.csv]
+# ============================================================================
+
+import argparse
+import random
+import sys
+
+import stubs
+
+stubs.install()
+
+from aegis_alert import AlertMachine, ENTERED, SEVERITIES
+import traces
+
+# Firmware configuration (aegis_one_m5core2.py)
+PUBLISH_TASK_MS = 100
+TEMP_WARNING, TEMP_CRITICAL = 35.0, 45.0
+VIB_WARNING, VIB_CRITICAL = 1.5, 2.5
+DIST_WARNING, DIST_DANGER = 100, 30
+TEMP_HYSTERESIS = 1.0
+VIB_HYSTERESIS = 0.2
+DIST_HYSTERESIS = 10
+ALERT_WARNING_DWELL_MS = 1000
+ALERT_CRITICAL_DWELL_MS = 200
+ALERT_CLEAR_MS = 5000
+ALERT_WARNING_COOLDOWN_MS = 60000
+ALERT_CRITICAL_COOLDOWN_MS = 120000
+
+QUIET = (28.0, 0.3, 180.0)
+
+
+def make_machine():
+    m = AlertMachine((0, ALERT_WARNING_DWELL_MS, ALERT_CRITICAL_DWELL_MS), ALERT_CLEAR_MS,
+                     (0, ALERT_WARNING_COOLDOWN_MS, ALERT_CRITICAL_COOLDOWN_MS))
+    m.watch(TEMP_WARNING, TEMP_CRITICAL, TEMP_HYSTERESIS)
+    m.watch(VIB_WARNING, VIB_CRITICAL, VIB_HYSTERESIS)
+    m.watch(DIST_WARNING, DIST_DANGER, DIST_HYSTERESIS, False)
+    return m
+
+
+def legacy_events(temp, vib, dist):
+    """Events the old check_thresholds() published for one pass"""
+    return int(temp >= TEMP_WARNING or vib >= VIB_WARNING or dist <= DIST_WARNING)
+
+
+def segments(*parts):
+    """Readings per pass from (seconds, fn(t) -> (temp, vib, dist)) parts"""
+    out = []
+    for seconds, fn in parts:
+        for i in range(int(seconds * 1000 // PUBLISH_TASK_MS)):
+            out.append(fn(i * PUBLISH_TASK_MS / 1000.0))
+    return out
+
+
+def quiet(seconds):
+    return (seconds, lambda t: QUIET)
+
+
+def temp_at(seconds, temp):
+    return (seconds, lambda t: (temp, QUIET[1], QUIET[2]))
+
+
+def replay(readings, step_ms=PUBLISH_TASK_MS):
+    m = make_machine()
+    events = []
+    legacy = 0
+    now = 0
+    for temp, vib, dist in readings:
+        legacy += legacy_events(temp, vib, dist)
+        ev = m.update(now, temp, vib, dist)
+        if ev is not None:
+            events.append(ev)
+        now += step_ms
+    return m, events, legacy
+
+
+def describe(events):
+    out = []
+    for kind, severity, duration_ms, suppressed in events:
+        if kind == ENTERED:
+            out.append('+' + SEVERITIES[severity])
+        else:
+            out.append('-{}({}s,{})'.format(SEVERITIES[severity], duration_ms // 1000, suppressed))
+    return ' '.join(out) or '-'
+
+
+def scenarios():
+    rng = random.Random(5)
+    hover = lambda t: (TEMP_WARNING + rng.uniform(-0.4, 0.4), QUIET[1], QUIET[2])
+    spike = lambda t: (QUIET[0], VIB_WARNING + 0.1, QUIET[2])
+    approach = lambda t: (QUIET[0], QUIET[1], 25.0)
+    flap = []
+    for _ in range(4):
+        flap += [temp_at(10, 36.0), quiet(20)]
+    return (
+        # name, readings, expected (ENTERED, CLEARED) events
+        ('sustained warning', segments(quiet(10), temp_at(60, 36.0), quiet(90)), ['+WARNING', '-WARNING']),
+        ('hover on threshold', segments(quiet(10), (120, hover), quiet(90)), ['+WARNING', '-WARNING']),
+        ('short spike', segments(quiet(10), (0.5, spike), quiet(90)), []),
+        ('escalation', segments(quiet(10), temp_at(20, 38.0), temp_at(10, 46.0),
+                                temp_at(10, 38.0), quiet(150)),
+         ['+WARNING', '+CRITICAL', '-CRITICAL']),
+        ('flapping', segments(quiet(10), *(flap + [quiet(90)])), ['+WARNING', '-WARNING']),
+        ('two episodes', segments(quiet(10), temp_at(10, 36.0), quiet(120),
+                                  temp_at(10, 36.0), quiet(90)),
+         ['+WARNING', '-WARNING', '+WARNING', '-WARNING']),
+        ('danger zone', segments(quiet(10), (3, approach), quiet(150)), ['+CRITICAL', '-CRITICAL']),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Alert state machine checks')
+    parser.add_argument('--trace', help='CSV recording (t_ms,temp,vib,distance,battery)')
+    args = parser.parse_args()
+
+    ok = True
+    for name, readings, expected in scenarios():
+        m, events, legacy = replay(readings)
+        got = [e.split('(')[0] for e in describe(events).split() if e != '-']
+        passed = got == expected and not m.active()
+        ok = ok and passed
+        print('{:<20} {:>4} legacy events -> {:<40} {}'.format(
+            name, legacy, describe(events), 'ok' if passed else 'expected ' + ' '.join(expected)))
+
+    # Sustained warning: the cleared event reports duration and suppression
+    m, events, legacy = replay(segments(quiet(10), temp_at(60, 36.0), quiet(90)))
+    _, _, duration_ms, suppressed = events[-1]
+    ok = ok and 60000 <= duration_ms <= 60000 + ALERT_CLEAR_MS and suppressed == legacy - 1
+
+    # Sensor trace, sampled-and-held at the threshold-check rate
+    rows = traces.read_csv(args.trace) if args.trace else traces.synthetic_shift()
+    trace = traces.Trace(rows)
+    readings = [trace.at(t)[1:4] for t in range(0, trace.duration_ms, PUBLISH_TASK_MS)]
+    m, events, legacy = replay(readings)
+    print('trace: {} passes, {} legacy events -> {} entered, {} cleared, {} suppressed'.format(
+        len(readings), legacy, m.entered, m.cleared, m.suppressed_total))
+    ok = ok and m.entered == m.cleared and len(events) * 100 < legacy
+
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
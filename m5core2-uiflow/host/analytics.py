@@ -0,0 +1,446 @@
+# ============================================================================
+# AegisOne Historical Analytics
+# Recorded telemetry as memory-mapped NumPy columns, and the fleet KPIs the
+# firmware decides point by point, computed a whole column at a time
+# ============================================================================
+# Store: a directory of .npy files, one per column, opened with
+# mmap_mode='r' so months of readings are paged in as they are used
+# rather than loaded:
+#   ts (int64 ms), temp, vib, distance (float64), device (int32 index into
+#   meta.json's devices), label (int8, optional: 1 inside a known anomaly)
+#   event_ts, event_device, event_severity (int8 index into SEVERITIES)
+# Rows are sorted by device, then time, and so are events; meta.json also
+# holds each device's first row. --import-parquet builds a store from the
+# files ingest.py writes, --import-csv from a trace CSV; StoreWriter
+# fills the columns through np.lib.format.open_memmap one device at a
+# time, so no more than one device is ever held in memory.
+#
+# Metrics, over chunks of chunk_rows readings (one row of overlap, so no
+# transition across a chunk boundary is lost):
+#   status         Limits.status() of every reading as codes 0/1/2
+#                  (RUNNING/WARNING/CRITICAL); the distribution counts them
+#   time in state  a reading holds its status until the device's next
+#                  reading, for at most max_gap_ms; the rest of a longer
+#                  gap counts as no data (as the rollups' status dwell)
+#   crossings      readings at a limit the device's previous reading was
+#                  not at (temp and vib upward, distance downward, a limit
+#                  reached counts as crossed; a device's first reading
+#                  counts if it is at the limit), and entries into WARNING
+#                  and CRITICAL
+#   percentiles    rolling q-th percentile of a channel over the device's
+#                  last `window` readings, NaN until there are that many,
+#                  interpolated linearly as numpy.percentile does (the
+#                  windows are sorted: faster than its partition)
+# Scoring works on whole columns: the tp/fp/tn/fn of detect_harness for
+# the recorded alarm events (WARNING and CRITICAL). An alarm with an
+# anomalous reading of its device within tolerance_ms is a tp, otherwise
+# an fp; a run of anomalous readings with no alarm from tolerance_ms
+# before it to tolerance_ms after it is an fn; a device minute with
+# readings but neither anomaly nor alarm is a tn. A reading is anomalous
+# if labelled so or, in a store without labels, if it is not RUNNING.
+#
+#   python3 m5core2-uiflow/host/analytics.py --store DIR
+#       [--import-parquet ingest/ | --import-csv trace.csv]
+#       [--set TEMP_WARNING=36] [--window 60] [--q 95]
+# ============================================================================
+
+import argparse
+import ast
+import json
+import os
+import sys
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import stubs
+
+stubs.install()
+
+from aegis_core import Limits
+
+# Firmware configuration (aegis_one_m5core2.py)
+TEMP_WARNING, TEMP_CRITICAL = 35.0, 45.0
+VIB_WARNING, VIB_CRITICAL = 1.5, 2.5
+DIST_WARNING, DIST_DANGER = 100, 30
+
+STATUSES = ('RUNNING', 'WARNING', 'CRITICAL')
+SEVERITIES = ('INFO', 'WARNING', 'CRITICAL')
+COLUMNS = (('ts', np.int64), ('temp', np.float64), ('vib', np.float64),
+           ('distance', np.float64), ('device', np.int32))
+EVENT_COLUMNS = (('event_ts', np.int64), ('event_device', np.int32),
+                 ('event_severity', np.int8))
+
+CHUNK_ROWS = 1 << 22
+MAX_GAP_MS = 60000
+TOLERANCE_MS = 30000
+WINDOW_MS = 60000
+DEVICE_SHIFT = 42     # (device, ms since the first reading) keys: 2**42 ms is 139 years
+
+
+def firmware_limits(**settings):
+    """Limits as the firmware builds them, with any setting overridden"""
+    values = {'TEMP_WARNING': TEMP_WARNING, 'TEMP_CRITICAL': TEMP_CRITICAL,
+              'VIB_WARNING': VIB_WARNING, 'VIB_CRITICAL': VIB_CRITICAL,
+              'DIST_WARNING': DIST_WARNING, 'DIST_DANGER': DIST_DANGER}
+    for name, value in settings.items():
+        if name not in values:
+            raise KeyError('unknown threshold: ' + name)
+        values[name] = value
+    return Limits(values['TEMP_WARNING'], values['TEMP_CRITICAL'], values['VIB_WARNING'],
+                  values['VIB_CRITICAL'], values['DIST_WARNING'], values['DIST_DANGER'])
+
+
+def crossing_levels(limits):
+    """(name, column, level, upward) of every limit a channel can cross"""
+    return (('temp >= {}'.format(limits.temp_warning), 'temp', limits.temp_warning, True),
+            ('temp >= {}'.format(limits.temp_critical), 'temp', limits.temp_critical, True),
+            ('vib >= {}'.format(limits.vib_warning), 'vib', limits.vib_warning, True),
+            ('vib >= {}'.format(limits.vib_critical), 'vib', limits.vib_critical, True),
+            ('distance <= {}'.format(limits.dist_warning), 'distance', limits.dist_warning, False),
+            ('distance <= {}'.format(limits.dist_danger), 'distance', limits.dist_danger, False))
+
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+def _load(path, name):
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+
+class Store:
+    """Memory-mapped columns of one store directory"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.path = path
+        self.devices = meta['devices']
+        self.rows = meta['rows']
+        self.offsets = np.array(meta['offsets'] + [self.rows], dtype=np.int64)
+        for name, _ in COLUMNS + EVENT_COLUMNS:
+            setattr(self, name, _load(path, name))
+        self.label = _load(path, 'label') if meta['labelled'] else None
+
+
+class StoreWriter:
+    """Fills a store's columns in (device, time) order. Readings go straight
+    to the memory-mapped files; events, a few per thousand readings, are
+    collected and written at close()."""
+
+    def __init__(self, path, rows, devices, labelled=False):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.devices = list(devices)
+        self.labelled = labelled
+        self.cols = {}
+        for name, dtype in (COLUMNS + (('label', np.int8),)) if labelled else COLUMNS:
+            self.cols[name] = np.lib.format.open_memmap(
+                os.path.join(path, name + '.npy'), 'w+', dtype, (rows,))
+        self.events = []
+        self.rows = rows
+        self.pos = 0
+        self.offsets = [0] * len(self.devices)
+        self.device = -1
+
+    def add(self, device, ts, temp, vib, distance, label=None):
+        """Readings of one device, sorted by time; a device's readings may
+        come in several calls but devices in index order"""
+        if device != self.device:
+            if device < self.device:
+                raise ValueError('devices out of order')
+            for d in range(self.device + 1, device + 1):
+                self.offsets[d] = self.pos
+            self.device = device
+        a = self.pos
+        b = a + len(ts)
+        c = self.cols
+        c['ts'][a:b] = ts
+        c['temp'][a:b] = temp
+        c['vib'][a:b] = vib
+        c['distance'][a:b] = distance
+        c['device'][a:b] = device
+        if self.labelled:
+            c['label'][a:b] = label
+        self.pos = b
+
+    def add_events(self, device, ts, severity):
+        """Events of one device, in any order"""
+        ts = np.asarray(ts, dtype=np.int64)
+        self.events.append((np.full(len(ts), device, dtype=np.int32), ts,
+                            np.asarray(severity, dtype=np.int8)))
+
+    def close(self):
+        if self.pos != self.rows:
+            raise ValueError('store holds {} of {} rows'.format(self.pos, self.rows))
+        for d in range(self.device + 1, len(self.devices)):
+            self.offsets[d] = self.pos
+        for col in self.cols.values():
+            col.flush()
+        self.cols = {}
+        device, ts, severity = (
+            np.concatenate([e[k] for e in self.events]) if self.events else np.zeros(0, dtype)
+            for k, dtype in enumerate((np.int32, np.int64, np.int8)))
+        order = np.lexsort((ts, device))
+        for name, values in (('event_ts', ts), ('event_device', device),
+                             ('event_severity', severity)):
+            np.save(os.path.join(self.path, name + '.npy'), values[order])
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump({'rows': self.rows, 'events': len(ts), 'devices': self.devices,
+                       'offsets': self.offsets, 'labelled': self.labelled}, f)
+
+
+def import_csv(path, csv_path):
+    """A trace CSV (traces.write_csv) as a one-device store without events"""
+    import traces
+    rows = traces.read_csv(csv_path)
+    cols = list(zip(*rows))
+    labelled = len(rows[0]) > 5
+    writer = StoreWriter(path, len(rows), [os.path.basename(csv_path)], labelled)
+    writer.add(0, cols[0], cols[1], cols[2], cols[3], cols[5] if labelled else None)
+    writer.close()
+
+
+def import_parquet(path, root):
+    """Telemetry and events of the files ingest.py wrote under root"""
+    import ingest
+    if ingest.pa is None:
+        raise SystemExit('pyarrow not found: pip install pyarrow')
+    devices = sorted({d[len('deviceId='):] for table in ('telemetry', 'events')
+                      for d in _listdir(os.path.join(root, table)) if d.startswith('deviceId=')})
+    rows = sum(ingest.read_parts(root, 'telemetry', d, ['ts']).num_rows for d in devices)
+    writer = StoreWriter(path, rows, devices)
+    for index, device in enumerate(devices):
+        tel = ingest.read_parts(root, 'telemetry', device, ['ts', 'temp', 'vib', 'distance'])
+        tel = tel.sort_by('ts')
+        # A reading without a distance (the simple node) never alarms on it
+        writer.add(index, tel.column('ts').to_numpy(),
+                   *(tel.column(name).to_numpy(zero_copy_only=False).astype(np.float64)
+                     for name in ('temp', 'vib', 'distance')))
+        ev = ingest.read_parts(root, 'events', device, ['eventTs', 'severity'])
+        writer.add_events(index, ev.column('eventTs').to_numpy(),
+                          [SEVERITIES.index(v) for v in ev.column('severity').to_pylist()])
+    writer.close()
+
+
+def _listdir(path):
+    return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+def status_codes(temp, vib, distance, limits):
+    """Limits.status() of every reading, as 0/1/2"""
+    critical = ((temp >= limits.temp_critical) | (vib >= limits.vib_critical)
+                | (distance <= limits.dist_danger))
+    warning = ((temp >= limits.temp_warning) | (vib >= limits.vib_warning)
+               | (distance <= limits.dist_warning))
+    return np.where(critical, 2, warning).astype(np.int8)
+
+
+def window_percentiles(values, window, q):
+    """q-th percentile of every `window` consecutive values, interpolated
+    as numpy.percentile does; a window holding a NaN gives NaN"""
+    ordered = np.sort(sliding_window_view(values, window), axis=1)
+    pos = (window - 1) * q / 100.0
+    lo = min(int(pos), window - 1)
+    t = pos - lo
+    below = ordered[:, lo]
+    above = ordered[:, min(lo + 1, window - 1)]
+    diff = above - below
+    out = below + diff * t if t < 0.5 else above - diff * (1 - t)
+    out[np.isnan(ordered[:, -1])] = np.nan
+    return out
+
+
+def entries(flag, device):
+    """Readings where flag holds and did not on the device's previous one"""
+    out = flag.copy()
+    out[1:] &= ~(flag[:-1] & (device[1:] == device[:-1]))
+    return out
+
+
+class Analytics:
+    """The KPIs of one store under one set of limits"""
+
+    def __init__(self, store, limits, chunk_rows=CHUNK_ROWS):
+        self.store = store
+        self.limits = limits
+        self.chunk_rows = chunk_rows
+        self._codes = None
+
+    def chunks(self, overlap=0):
+        """(a, b, lo): rows [a, b) with lo = a - overlap (not below 0)"""
+        for a in range(0, self.store.rows, self.chunk_rows):
+            yield a, min(self.store.rows, a + self.chunk_rows), max(0, a - overlap)
+
+    def codes(self):
+        if self._codes is None:
+            s = self.store
+            out = np.empty(s.rows, dtype=np.int8)
+            for a, b, _ in self.chunks():
+                out[a:b] = status_codes(s.temp[a:b], s.vib[a:b], s.distance[a:b], self.limits)
+            self._codes = out
+        return self._codes
+
+    def distribution(self):
+        """Readings per status"""
+        return np.bincount(self.codes(), minlength=len(STATUSES))
+
+    def time_in_state(self, max_gap_ms=MAX_GAP_MS):
+        """(ms per status, ms of gaps beyond max_gap_ms)"""
+        s = self.store
+        codes = self.codes()
+        held = np.zeros(len(STATUSES), dtype=np.int64)
+        gaps = 0
+        for a, b, _ in self.chunks():
+            end = min(b + 1, s.rows)   # the next reading closes the last one
+            dt = np.diff(s.ts[a:end])
+            same = s.device[a + 1:end] == s.device[a:end - 1]
+            hold = np.where(same, np.minimum(dt, max_gap_ms), 0)
+            gaps += int(np.where(same, dt - hold, 0).sum())
+            held += np.bincount(codes[a:a + len(hold)], weights=hold,
+                                minlength=len(STATUSES)).astype(np.int64)
+        return held, gaps
+
+    def crossings(self):
+        """Readings crossing each limit, and entries into each alarm status"""
+        s = self.store
+        codes = self.codes()
+        levels = crossing_levels(self.limits)
+        out = dict((name, 0) for name, _, _, _ in levels)
+        for status in STATUSES[1:]:
+            out['-> ' + status] = 0
+        for a, b, lo in self.chunks(overlap=1):
+            device = s.device[lo:b]
+            skip = a - lo
+            for name, column, level, upward in levels:
+                x = getattr(s, column)[lo:b]
+                at = x >= level if upward else x <= level
+                out[name] += int(entries(at, device)[skip:].sum())
+            for code, status in enumerate(STATUSES[1:], 1):
+                out['-> ' + status] += int(entries(codes[lo:b] == code, device)[skip:].sum())
+        return out
+
+    def rolling_percentile(self, column, window, q):
+        """q-th percentile of the device's last `window` readings at each row"""
+        s = self.store
+        values = getattr(s, column)
+        out = np.full(s.rows, np.nan)
+        # Each window is copied for the partition: bound the copy to chunk_rows values
+        step = max(1, self.chunk_rows // window)
+        for d in range(len(s.devices)):
+            start, end = int(s.offsets[d]), int(s.offsets[d + 1])
+            for c in range(start + window - 1, end, step):
+                block = values[c - window + 1:min(end, c + step)]
+                out[c:c + len(block) - window + 1] = window_percentiles(block, window, q)
+        return out
+
+    def truth(self):
+        s = self.store
+        if s.label is not None:
+            return np.asarray(s.label) > 0
+        return self.codes() > 0
+
+    def score(self, tolerance_ms=TOLERANCE_MS, window_ms=WINDOW_MS):
+        """tp/fp/tn/fn of the alarm events, and the detection latency (ms)
+        of each anomaly that was caught"""
+        s = self.store
+        truth = self.truth()
+        alarm = np.asarray(s.event_severity) > 0
+        ev_ts = np.asarray(s.event_ts)[alarm]
+        ev_device = np.asarray(s.event_device)[alarm].astype(np.int64)
+        ts = np.asarray(s.ts)
+        device = np.asarray(s.device).astype(np.int64)
+        earliest = [x.min() for x in (ts, ev_ts) if len(x)]
+        t0 = (min(earliest) if earliest else 0) - tolerance_ms
+        row_key = (device << DEVICE_SHIFT) | (ts - t0)
+        ev_key = (ev_device << DEVICE_SHIFT) | (ev_ts - t0)
+
+        # Alarms: an anomalous reading of the device within the tolerance
+        anomalous = np.concatenate(([0], np.cumsum(truth, dtype=np.int64)))
+        lo = np.searchsorted(row_key, ev_key - tolerance_ms, 'left')
+        hi = np.searchsorted(row_key, ev_key + tolerance_ms, 'right')
+        hit = anomalous[hi] > anomalous[lo]
+
+        # Anomalies: runs of anomalous readings and the first alarm around each
+        start = entries(truth, device)
+        end = truth.copy()
+        end[:-1] &= ~(truth[1:] & (device[1:] == device[:-1]))
+        first = np.searchsorted(ev_key, row_key[start] - tolerance_ms, 'left')
+        last = np.searchsorted(ev_key, row_key[end] + tolerance_ms, 'right')
+        caught = last > first
+        latency = np.maximum(0, ev_ts[first[caught]] - ts[start][caught])
+
+        # Device minutes with readings, neither anomalous nor alarmed
+        minute = (device << 32) | ((ts - t0) // window_ms)
+        firsts = np.flatnonzero(np.concatenate(([True], minute[1:] != minute[:-1])))
+        flagged = np.logical_or.reduceat(truth, firsts) if len(firsts) else np.zeros(0, bool)
+        ev_minute = (ev_device << 32) | ((ev_ts - t0) // window_ms)
+        quiet = ~flagged & ~np.isin(minute[firsts], ev_minute)
+        counts = {'tp': int(hit.sum()), 'fp': int((~hit).sum()), 'tn': int(quiet.sum()),
+                  'fn': int((~caught).sum())}
+        return counts, latency
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def report(analytics, window, q, max_gap_ms=MAX_GAP_MS):
+    s = analytics.store
+    print('{} readings from {} devices, {} events'.format(
+        s.rows, len(s.devices), len(s.event_ts)))
+    dist = analytics.distribution()
+    held, gaps = analytics.time_in_state(max_gap_ms)
+    total = max(int(held.sum()) + gaps, 1)
+    for code, status in enumerate(STATUSES):
+        print('  {:<9} {:>6.2f}% of readings  {:>9.1f} h ({:.2f}%)'.format(
+            status, 100.0 * dist[code] / max(s.rows, 1), held[code] / 3.6e6,
+            100.0 * held[code] / total))
+    print('  no data   {:>27.1f} h ({:.2f}%), gaps over {} s'.format(
+        gaps / 3.6e6, 100.0 * gaps / total, max_gap_ms // 1000))
+    print('crossings: ' + ', '.join('{} {}'.format(name, n)
+                                    for name, n in analytics.crossings().items()))
+    for column in ('temp', 'vib', 'distance'):
+        p = analytics.rolling_percentile(column, window, q)
+        valid = p[~np.isnan(p)]
+        if len(valid):
+            print('{} p{:g} over {} readings: median {:.3f}, max {:.3f}'.format(
+                column, q, window, np.median(valid), valid.max()))
+    if len(s.event_ts):
+        counts, latency = analytics.score()
+        print('events: tp {tp} fp {fp} tn {tn} fn {fn}'.format(**counts) +
+              (', latency median {:.1f} s'.format(np.median(latency) / 1000)
+               if len(latency) else ''))
+
+
+def parse_setting(text):
+    name, _, value = text.partition('=')
+    return name, ast.literal_eval(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fleet KPIs over recorded telemetry')
+    parser.add_argument('--store', required=True, help='store directory')
+    parser.add_argument('--import-parquet', metavar='ROOT', help="build the store from ingest.py's files")
+    parser.add_argument('--import-csv', metavar='CSV', help='build the store from a trace CSV')
+    parser.add_argument('--set', action='append', default=[], type=parse_setting,
+                        metavar='NAME=VALUE', help='override a threshold (e.g. TEMP_WARNING=36)')
+    parser.add_argument('--window', type=int, default=60, help='rolling window in readings')
+    parser.add_argument('--q', type=float, default=95, help='rolling percentile')
+    args = parser.parse_args()
+
+    if args.import_parquet:
+        import_parquet(args.store, args.import_parquet)
+    elif args.import_csv:
+        import_csv(args.store, args.import_csv)
+    report(Analytics(Store(args.store), firmware_limits(**dict(args.set))), args.window, args.q)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
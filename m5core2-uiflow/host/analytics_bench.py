@@ -0,0 +1,430 @@
+# ============================================================================
+# AegisOne Analytics Benchmark
+# Builds a synthetic fleet history as an analytics.py store (5 s readings
+# with jitter and outages, a daily temperature swing, vibration, distance
+# and temperature episodes at both alarm levels, labelled drifts that stay
+# below the limits, alarms raised late, missed or spurious) and times every
+# KPI of analytics.py on it against the naive way: a Python loop over the
+# records calling Limits.status() and keeping a sorted window per device.
+# The loop runs on the first --naive-rows rows (whole devices) and both must
+# give the same counts, time in state, crossings, percentiles and scores.
+# Also checks the chunked passes against the loop with chunks of a prime
+# number of rows, and a store imported from ingest.py's Parquet files
+# against the readings and events fed to the ingest (needs pyarrow).
+#
+#   python3 m5core2-uiflow/host/analytics_bench.py [--rows 10000000]
+#       [--devices 200] [--naive-rows 1000000] [--window 60] [--q 95] [--keep DIR]
+# ============================================================================
+
+import argparse
+import bisect
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import stubs
+
+stubs.install()
+
+import analytics
+from analytics import (Analytics, Store, StoreWriter, STATUSES, crossing_levels, firmware_limits,
+                       status_codes, MAX_GAP_MS, TOLERANCE_MS, WINDOW_MS)
+
+INTERVAL_MS = 5000
+JITTER_MS = 200
+OUTAGE_RATE = 0.0005          # readings followed by an outage of 1 to 15 minutes
+EPISODE_ROWS = 2500           # readings per episode, on average
+MISSED = 0.1                  # alarms the node never got out
+SPURIOUS_ROWS = 25000         # readings per spurious alarm
+CHECK_CHUNK = 997
+
+
+# ============================================================================
+# SYNTHETIC FLEET
+# ============================================================================
+
+def device_history(rng, n, t_start):
+    """ts, temp, vib, distance and label of one device's n readings"""
+    dt = INTERVAL_MS + rng.integers(-JITTER_MS, JITTER_MS + 1, n)
+    outage = rng.random(n) < OUTAGE_RATE
+    dt[outage] += rng.integers(60000, 900000, int(outage.sum()))
+    ts = t_start + np.cumsum(dt)
+    temp = 28.0 + 2.0 * np.sin(2 * np.pi * ts / 86400000.0) + rng.normal(0, 0.2, n)
+    vib = np.abs(0.3 + rng.normal(0, 0.05, n))
+    distance = 180.0 + rng.normal(0, 1.0, n)
+    label = np.zeros(n, dtype=np.int8)
+    for _ in range(max(1, n // EPISODE_ROWS)):
+        a = int(rng.integers(0, n))
+        b = min(n, a + int(rng.integers(6, 120)))
+        m = b - a
+        kind = rng.integers(0, 6)
+        if kind == 0:                           # vibration WARNING
+            vib[a:b] = 1.8 + rng.normal(0, 0.1, m)
+        elif kind == 1:                         # vibration CRITICAL
+            vib[a:b] = 2.8 + rng.normal(0, 0.1, m)
+        elif kind == 2:                         # overheating, up to CRITICAL
+            temp[a:b] += np.linspace(0, 20.0, m)
+        elif kind == 3:                         # an approach
+            distance[a:b] = (60.0 if rng.random() < 0.5 else 25.0) + rng.normal(0, 1.0, m)
+        elif kind == 4:                         # bearing wear below the limit
+            vib[a:b] += np.linspace(0, 0.4, m)
+        else:                                   # temperature drift below the limit
+            temp[a:b] += np.linspace(0, 4.0, m)
+        label[a:b] = 1
+    return ts, temp, vib, distance, label
+
+
+def device_events(rng, ts, codes):
+    """The node's events: an alarm a few seconds after each entry into
+    WARNING or CRITICAL unless missed, spurious alarms, INFO on recovery"""
+    out_ts = []
+    out_severity = []
+    for code in (1, 2):
+        at = codes == code
+        start = np.flatnonzero(at & ~np.concatenate(([False], at[:-1])))
+        start = start[rng.random(len(start)) >= MISSED]
+        out_ts.append(ts[start] + rng.integers(0, 3000, len(start)))
+        out_severity.append(np.full(len(start), code))
+    spurious = rng.integers(0, len(ts), max(1, len(ts) // SPURIOUS_ROWS))
+    out_ts.append(ts[spurious] + rng.integers(0, 3000, len(spurious)))
+    out_severity.append(np.full(len(spurious), 1))
+    recovered = np.flatnonzero((codes[:-1] > 0) & (codes[1:] == 0)) + 1
+    out_ts.append(ts[recovered])
+    out_severity.append(np.zeros(len(recovered)))
+    return np.concatenate(out_ts), np.concatenate(out_severity)
+
+
+def generate(path, rows, devices, limits, seed=17):
+    per_device = rows // devices
+    names = ['node-{:04d}'.format(d) for d in range(devices)]
+    writer = StoreWriter(path, per_device * devices, names, labelled=True)
+    for d in range(devices):
+        rng = np.random.default_rng([seed, d])
+        ts, temp, vib, distance, label = device_history(rng, per_device,
+                                                        1700000000000 + d * 7919)
+        writer.add(d, ts, temp, vib, distance, label)
+        writer.add_events(d, *device_events(rng, ts, status_codes(temp, vib, distance, limits)))
+    writer.close()
+
+
+def head(store, rows):
+    """The store's first devices, up to `rows` readings (at least one device)"""
+    k = max(1, int(np.searchsorted(store.offsets, rows, 'right')) - 1)
+    n = int(store.offsets[k])
+    m = int(np.searchsorted(store.event_device, k))
+    sub = Store.__new__(Store)
+    sub.path = store.path
+    sub.devices = store.devices[:k]
+    sub.rows = n
+    sub.offsets = store.offsets[:k + 1]
+    for name in ('ts', 'temp', 'vib', 'distance', 'device'):
+        setattr(sub, name, getattr(store, name)[:n])
+    for name in ('event_ts', 'event_device', 'event_severity'):
+        setattr(sub, name, getattr(store, name)[:m])
+    sub.label = None if store.label is None else store.label[:n]
+    return sub
+
+
+# ============================================================================
+# NAIVE: one record at a time
+# ============================================================================
+
+def device_rows(store, d, *names):
+    a, b = int(store.offsets[d]), int(store.offsets[d + 1])
+    return [getattr(store, name)[a:b].tolist() for name in names]
+
+
+def naive_codes(store, limits):
+    code = dict((status, k) for k, status in enumerate(STATUSES))
+    out = []
+    for d in range(len(store.devices)):
+        for temp, vib, dist in zip(*device_rows(store, d, 'temp', 'vib', 'distance')):
+            out.append(code[limits.status(temp, vib, dist)])
+    return out
+
+
+def naive_distribution(store, limits):
+    counts = [0] * len(STATUSES)
+    for c in naive_codes(store, limits):
+        counts[c] += 1
+    return counts
+
+
+def naive_time_in_state(store, limits, max_gap_ms=MAX_GAP_MS):
+    codes = naive_codes(store, limits)
+    held = [0] * len(STATUSES)
+    gaps = 0
+    for d in range(len(store.devices)):
+        a = int(store.offsets[d])
+        ts, = device_rows(store, d, 'ts')
+        for i in range(len(ts) - 1):
+            dt = ts[i + 1] - ts[i]
+            hold = min(dt, max_gap_ms)
+            held[codes[a + i]] += hold
+            gaps += dt - hold
+    return held, gaps
+
+
+def naive_crossings(store, limits):
+    levels = crossing_levels(limits)
+    codes = naive_codes(store, limits)
+    out = collections.OrderedDict((name, 0) for name, _, _, _ in levels)
+    for status in STATUSES[1:]:
+        out['-> ' + status] = 0
+    for d in range(len(store.devices)):
+        a = int(store.offsets[d])
+        channels = dict(zip(('temp', 'vib', 'distance'),
+                            device_rows(store, d, 'temp', 'vib', 'distance')))
+        was = [False] * len(levels)
+        prev = 0
+        for i in range(len(channels['temp'])):
+            for k, (name, column, level, upward) in enumerate(levels):
+                x = channels[column][i]
+                at = x >= level if upward else x <= level
+                if at and not was[k]:
+                    out[name] += 1
+                was[k] = at
+            code = codes[a + i]
+            if code and (i == 0 or code != prev):
+                out['-> ' + STATUSES[code]] += 1
+            prev = code
+    return dict(out)
+
+
+def naive_percentile(store, column, window, q):
+    out = []
+    pos = (window - 1) * q / 100.0
+    lo = int(pos)
+    frac = pos - lo
+    for d in range(len(store.devices)):
+        recent = collections.deque()
+        ordered = []
+        for x in device_rows(store, d, column)[0]:
+            recent.append(x)
+            bisect.insort(ordered, x)
+            if len(recent) > window:
+                del ordered[bisect.bisect_left(ordered, recent.popleft())]
+            if len(recent) < window:
+                out.append(float('nan'))
+            elif lo + 1 < window:
+                out.append(ordered[lo] + (ordered[lo + 1] - ordered[lo]) * frac)
+            else:
+                out.append(ordered[lo])
+    return out
+
+
+def naive_score(store, limits, tolerance_ms=TOLERANCE_MS, window_ms=WINDOW_MS):
+    truth_all = (store.label.tolist() if store.label is not None
+                 else [c > 0 for c in naive_codes(store, limits)])
+    alarms = [[] for _ in store.devices]
+    for d, t, sev in zip(store.event_device.tolist(), store.event_ts.tolist(),
+                         store.event_severity.tolist()):
+        if sev > 0:
+            alarms[d].append(t)
+    t0 = min([int(store.ts[:].min())] + [t for ev in alarms for t in ev]) - tolerance_ms
+    counts = {'tp': 0, 'fp': 0, 'tn': 0, 'fn': 0}
+    latency = []
+    for d in range(len(store.devices)):
+        a = int(store.offsets[d])
+        ts, = device_rows(store, d, 'ts')
+        truth = truth_all[a:a + len(ts)]
+        ev = alarms[d]
+        for t in ev:
+            lo = bisect.bisect_left(ts, t - tolerance_ms)
+            hi = bisect.bisect_right(ts, t + tolerance_ms)
+            counts['tp' if any(truth[lo:hi]) else 'fp'] += 1
+        start = None
+        for i in range(len(ts)):
+            if truth[i] and start is None:
+                start = ts[i]
+            if start is not None and (i + 1 == len(ts) or not truth[i + 1]):
+                first = bisect.bisect_left(ev, start - tolerance_ms)
+                if first < len(ev) and ev[first] <= ts[i] + tolerance_ms:
+                    latency.append(max(0, ev[first] - start))
+                else:
+                    counts['fn'] += 1
+                start = None
+        minutes = collections.OrderedDict()
+        for t, anomalous in zip(ts, truth):
+            m = (t - t0) // window_ms
+            minutes[m] = minutes.get(m, False) or bool(anomalous)
+        alarmed = set((t - t0) // window_ms for t in ev)
+        counts['tn'] += sum(1 for m, flagged in minutes.items()
+                            if not flagged and m not in alarmed)
+    return counts, latency
+
+
+# ============================================================================
+# RUNS
+# ============================================================================
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def same(name, fast, slow):
+    if name == 'percentile':
+        fast, slow = np.asarray(fast), np.asarray(slow)
+        nan = np.isnan(fast)
+        return (np.array_equal(nan, np.isnan(slow))
+                and np.allclose(fast[~nan], slow[~nan], rtol=0, atol=1e-9))
+    if name == 'score':
+        return fast[0] == slow[0] and list(fast[1]) == list(slow[1])
+    if name == 'time in state':
+        return list(fast[0]) == list(slow[0]) and fast[1] == slow[1]
+    return list(fast) == list(slow) if name == 'distribution' else fast == slow
+
+
+def metrics(args):
+    """(name, vectorized, naive) of every KPI"""
+    return (
+        ('distribution', lambda a: a.distribution(),
+         lambda s, lim: naive_distribution(s, lim)),
+        ('time in state', lambda a: a.time_in_state(),
+         lambda s, lim: naive_time_in_state(s, lim)),
+        ('crossings', lambda a: a.crossings(),
+         lambda s, lim: naive_crossings(s, lim)),
+        ('percentile', lambda a: a.rolling_percentile('vib', args.window, args.q),
+         lambda s, lim: naive_percentile(s, 'vib', args.window, args.q)),
+        ('score', lambda a: a.score(),
+         lambda s, lim: naive_score(s, lim)),
+    )
+
+
+def bench(store, limits, args):
+    sub = head(store, args.naive_rows or store.rows)
+    full = Analytics(store, limits)
+    part = Analytics(sub, limits)
+    print('{:<14} {:>9} {:>12}   {:>9} {:>12}   {:>7}  {}'.format(
+        'metric', 'numpy s', 'rows/s', 'loop s', 'rows/s', 'speedup',
+        'loop on {} rows'.format(sub.rows)))
+    ok = True
+    for name, fast, slow in metrics(args):
+        full._codes = part._codes = None      # every metric pays for its status pass
+        _, vec_s = timed(fast, full)
+        expected, loop_s = timed(slow, sub, limits)
+        match = same(name, fast(part), expected)
+        ok &= match
+        vec_rate = store.rows / vec_s
+        loop_rate = sub.rows / loop_s
+        print('{:<14} {:>9.3f} {:>12.0f}   {:>9.3f} {:>12.0f}   {:>6.0f}x  {}'.format(
+            name, vec_s, vec_rate, loop_s, loop_rate, vec_rate / loop_rate,
+            'same' if match else 'MISMATCH'))
+    counts, latency = full.score()
+    print('{} readings: {}; tp {tp} fp {fp} tn {tn} fn {fn}, latency median {:.1f} s'.format(
+        store.rows, ', '.join('{} {}'.format(s, n) for s, n in zip(STATUSES, full.distribution())),
+        np.median(latency) / 1000 if len(latency) else 0, **counts))
+    return ok
+
+
+def check_chunks(store, limits, args):
+    """Every chunked pass with chunk boundaries all over the devices"""
+    sub = head(store, int(store.offsets[min(3, len(store.devices))]))
+    chunked = Analytics(sub, limits, chunk_rows=CHECK_CHUNK)
+    ok = True
+    for name, fast, slow in metrics(args):
+        match = same(name, fast(chunked), slow(sub, limits))
+        ok &= match
+        if not match:
+            print('  {} MISMATCH'.format(name))
+    print('  {} rows of {} devices in chunks of {}: {}'.format(
+        sub.rows, len(sub.devices), CHECK_CHUNK, 'same as the loop' if ok else 'MISMATCH'))
+    return ok
+
+
+def check_import(limits):
+    """Readings and events through ingest.py's Parquet files into a store"""
+    import ingest
+    if ingest.pa is None:
+        print('  pyarrow not found: pip install pyarrow')
+        return False
+    root = tempfile.mkdtemp(prefix='aegis-analytics-')
+    try:
+        generate(os.path.join(root, 'direct'), 30000, 3, limits, seed=5)
+        src = Store(os.path.join(root, 'direct'))
+        feed = ingest.Ingest(ingest.ParquetSink(os.path.join(root, 'parquet')))
+        codes = status_codes(src.temp, src.vib, src.distance, limits)
+        for d, name in enumerate(src.devices):
+            a, b = int(src.offsets[d]), int(src.offsets[d + 1])
+            for c in range(a, b, 60):
+                ts = src.ts[c:min(b, c + 60)].tolist()
+                feed.handle(ingest.TOPIC_TELEMETRY_BATCH, json.dumps({
+                    'deviceId': name, 'ts0': ts[0], 'ts': [t - ts[0] for t in ts],
+                    'temp': src.temp[c:c + len(ts)].tolist(),
+                    'vib': src.vib[c:c + len(ts)].tolist(),
+                    'distance': src.distance[c:c + len(ts)].tolist(),
+                    'status': [STATUSES[k] for k in codes[c:c + len(ts)]]}).encode())
+        for k, (d, ts, severity) in enumerate(zip(src.event_device.tolist(), src.event_ts.tolist(),
+                                                  src.event_severity.tolist())):
+            feed.handle(ingest.TOPIC_EVENTS, json.dumps({
+                'deviceId': src.devices[d], 'eventId': k + 1, 'eventType': 'THRESHOLD',
+                'severity': analytics.SEVERITIES[severity], 'message': 'm', 'eventTs': ts,
+                'details': {'temp': 28.0, 'vib': 0.3}}).encode())
+        feed.close()
+        analytics.import_parquet(os.path.join(root, 'imported'), os.path.join(root, 'parquet'))
+        got = Store(os.path.join(root, 'imported'))
+        ok = got.devices == src.devices and np.array_equal(got.offsets, src.offsets)
+        ok &= all(np.array_equal(getattr(got, name), getattr(src, name)) for name in
+                  ('ts', 'temp', 'vib', 'distance', 'device', 'event_ts', 'event_device'))
+        # Events of one device at the same ms may come back in either order
+        ok &= np.array_equal(np.sort(got.event_severity), np.sort(src.event_severity))
+        ok &= not feed.stats.rejected
+        # ingest.py keeps no labels: both scored on the status
+        unlabelled = head(src, src.rows)
+        unlabelled.label = None
+        ok &= Analytics(got, limits).score()[0] == Analytics(unlabelled, limits).score()[0]
+        print('  {} readings and {} events of {} devices through {} Parquet files: {}'.format(
+            got.rows, len(got.event_ts), len(got.devices), feed.stats.parts,
+            'same as the store' if ok else 'MISMATCH'))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time analytics.py against a per-record loop')
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--naive-rows', type=int, default=1000000,
+                        help='rows the loop runs on (0: all)')
+    parser.add_argument('--window', type=int, default=60, help='rolling window in readings')
+    parser.add_argument('--q', type=float, default=95, help='rolling percentile')
+    parser.add_argument('--keep', metavar='DIR', help='build the store in DIR and keep it')
+    args = parser.parse_args()
+
+    limits = firmware_limits()
+    path = args.keep or tempfile.mkdtemp(prefix='aegis-analytics-')
+    results = []
+    try:
+        _, gen_s = timed(generate, path, args.rows, args.devices, limits)
+        store = Store(path)
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print('{} readings of {} devices ({:.1f} days each), {} events: built in {:.1f} s, '
+              '{:.0f} MB on disk'.format(store.rows, len(store.devices),
+                                         (store.ts[store.offsets[1] - 1] - store.ts[0]) / 8.64e7,
+                                         len(store.event_ts), gen_s, size / 1e6))
+        results.append(bench(store, limits, args))
+        print('chunk boundaries')
+        results.append(check_chunks(store, limits, args))
+        del store
+    finally:
+        if not args.keep:
+            shutil.rmtree(path, ignore_errors=True)
+    print('store imported from Parquet')
+    results.append(check_import(limits))
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# ============================================================================
+# AegisOne Boot Benchmark
+# Time from the start of the firmware to the first reading on screen, the
+# first MQTT connection and the first publish, as recorded by the
+# firmware's own BootTimer, over simulated boots with a WiFi association
+# time and a blocking TLS connect. The current boot order (first reading,
+# then the link task connects in the background) is compared with the
+# previous one (WiFi and AWS connected first, then sampling started).
+# Also lists what the firmware imports before its first reading and what
+# it loads on first use, with the source size: that is what the node
+# compiles at boot unless the library is shipped as .mpy (build_mpy.py).
+# Simulated times include this host's CPU time, not the device's.
+#
+#   python3 m5core2-uiflow/host/boot_bench.py [--boots 20] [--join 2.5] [--tls 1.5]
+# ============================================================================
+
+import argparse
+import ast
+import contextlib
+import io
+import os
+import random
+import sys
+
+import stubs
+
+stubs.install()
+
+import traces
+from sim import Simulator, FIRMWARE
+
+MARKS = ('sample', 'connect', 'publish')
+# Loaded on first use only; the AWS client is the heaviest module of all
+LAZY = ('IoTcloud.AWS', 'aegis_acq', 'aegis_fft', 'aegis_range')
+
+
+class _Imports(ast.NodeVisitor):
+    """Sorts a module's imports into load time and inside functions"""
+
+    def __init__(self):
+        self.top = []
+        self.deferred = []
+        self.depth = 0
+
+    def visit_FunctionDef(self, node):
+        self.depth += 1
+        self.generic_visit(node)
+        self.depth -= 1
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Import(self, node):
+        self._add([a.name for a in node.names])
+
+    def visit_ImportFrom(self, node):
+        self._add([node.module])
+
+    def _add(self, names):
+        (self.deferred if self.depth else self.top).extend(names)
+
+
+def imports(name, seen):
+    """Modules a firmware module imports at load time and inside functions,
+    following the load-time imports of its aegis modules"""
+    path = os.path.join(stubs.FIRMWARE_DIR, name + '.py')
+    if name in seen or not os.path.exists(path):
+        return [], []
+    seen.add(name)
+    found = _Imports()
+    with open(path) as f:
+        found.visit(ast.parse(f.read()))
+    top, deferred = found.top, found.deferred
+    for dep in list(top):
+        sub_top, sub_deferred = imports(dep, seen)
+        top.extend(sub_top)
+        deferred.extend(sub_deferred)
+    return top, deferred
+
+
+def source_kb(names):
+    total = 0
+    for name in names:
+        path = os.path.join(stubs.FIRMWARE_DIR, name + '.py')
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total / 1024
+
+
+def check_imports():
+    top, deferred = imports(FIRMWARE, set())
+    top = sorted(set(top))
+    deferred = sorted(set(deferred) - set(top))
+    local = [n for n in top if n.startswith('aegis_')]
+    print('  at boot: {} aegis modules, {:.1f} KB of source'.format(len(local), source_kb(local)))
+    print('  on first use: {} ({:.1f} KB)'.format(', '.join(deferred), source_kb(deferred)))
+    return all(name in deferred and name not in top for name in LAZY)
+
+
+def boot(seed, join_s, tls_s, blocking):
+    random.seed(seed)
+    sim = Simulator(traces.synthetic_shift(), join_s=join_s, tls_s=tls_s)
+    fw = sim.load()
+    if blocking:
+        main = fw.main
+
+        def connect_first():
+            # The order before the shared core: block on WiFi and AWS, then sample
+            fw.setup_ui()
+            fw.wifiCfg.doConnect(fw.WIFI_SSID, fw.WIFI_PASSWORD)
+            for _ in range(fw.WIFI_CONNECT_S):
+                if fw.wifiCfg.wlan_sta.isconnected():
+                    break
+                fw.wait(1)
+            fw.connect_aws()
+            main()
+        fw.main = connect_first
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(30)
+    return [fw.boot.marks.get(m) for m in MARKS], fw.LINK_BOOT_SPREAD_MS
+
+
+def summary(label, runs):
+    cols = []
+    for i, mark in enumerate(MARKS):
+        values = sorted(r[i] for r in runs if r[i] is not None)
+        if len(values) < len(runs):
+            cols.append('{:<8} missing'.format(mark))
+            continue
+        cols.append('{} p50 {:>5} ms max {:>5} ms'.format(mark, values[len(values) // 2],
+                                                          values[-1]))
+    print('  {:<14} {}'.format(label, '   '.join(cols)))
+
+
+def p50(runs, i):
+    values = sorted(r[i] for r in runs)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--boots', type=int, default=20)
+    parser.add_argument('--join', type=float, default=2.5, help='WiFi association (s)')
+    parser.add_argument('--tls', type=float, default=1.5, help='TLS + MQTT connect (s)')
+    args = parser.parse_args()
+
+    results = []
+    print('imports')
+    results.append(check_imports())
+
+    print('{} boots, WiFi association {} s, AWS connect {} s'.format(
+        args.boots, args.join, args.tls))
+    lazy, eager = [], []
+    for i in range(args.boots):
+        lazy.append(boot(i, args.join, args.tls, False)[0])
+        marks, spread_ms = boot(i, args.join, args.tls, True)
+        eager.append(marks)
+    summary('connect first', eager)
+    summary('sample first', lazy)
+
+    # The first reading no longer waits for the network; the first publish
+    # waits at most the boot spread longer than connecting first
+    ok = all(None not in r for r in lazy + eager)
+    if ok:
+        ok = p50(lazy, 0) < args.join * 1000 <= p50(eager, 0)
+        ok &= p50(lazy, 2) <= p50(eager, 2) + spread_ms
+        print('  first reading {} ms -> {} ms, first publish {} ms -> {} ms'.format(
+            p50(eager, 0), p50(lazy, 0), p50(eager, 2), p50(lazy, 2)))
+    results.append(ok)
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
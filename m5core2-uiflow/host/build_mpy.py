@@ -0,0 +1,82 @@
+# ============================================================================
+# AegisOne Library Precompiler
+# Compiles the aegis_* library modules to .mpy bytecode with mpy-cross so
+# the node does not compile them from source at every boot. The node
+# scripts (aegis_one_*.py) stay source; UIFlow runs them as they are and
+# they import whichever of aegis_core.mpy / aegis_core.py is on /flash.
+#
+# mpy-cross must match the firmware's MicroPython (UIFlow 1.12 ships
+# MicroPython 1.12, .mpy version 5): pip install mpy-cross==1.12, or pass
+# the binary with --mpy-cross.
+#
+#   python3 m5core2-uiflow/host/build_mpy.py [--out DIR] [--mpy-cross PATH]
+#   then copy DIR/*.mpy to /flash and remove the matching .py files there
+# ============================================================================
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+
+try:
+    import mpy_cross
+except ImportError:
+    mpy_cross = None
+
+FIRMWARE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ('aegis_one_',)
+
+
+def find_compiler(path):
+    if path:
+        return path
+    if mpy_cross is not None:
+        return mpy_cross.mpy_cross
+    return shutil.which('mpy-cross')
+
+
+def modules():
+    paths = sorted(glob.glob(os.path.join(FIRMWARE_DIR, 'aegis_*.py')))
+    return [p for p in paths if not os.path.basename(p).startswith(SCRIPTS)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--out', default=os.path.join(FIRMWARE_DIR, 'build'))
+    parser.add_argument('--mpy-cross', dest='compiler')
+    args = parser.parse_args()
+
+    compiler = find_compiler(args.compiler)
+    if compiler is None:
+        print('mpy-cross not found: pip install mpy-cross==1.12 or pass --mpy-cross')
+        return 2
+    os.makedirs(args.out, exist_ok=True)
+
+    ok = True
+    total_py = 0
+    total_mpy = 0
+    for path in modules():
+        name = os.path.splitext(os.path.basename(path))[0]
+        out = os.path.join(args.out, name + '.mpy')
+        # -s keeps tracebacks naming the module rather than the host path
+        result = subprocess.run([compiler, '-s', name + '.py', '-o', out, path],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print('{:<16} FAILED {}'.format(name, result.stderr.strip()))
+            ok = False
+            continue
+        py = os.path.getsize(path)
+        mpy = os.path.getsize(out)
+        total_py += py
+        total_mpy += mpy
+        print('{:<16} {:>7} B source  {:>6} B .mpy'.format(name, py, mpy))
+    print('{:<16} {:>7} B source  {:>6} B .mpy  -> {}'.format('total', total_py, total_mpy,
+                                                             args.out))
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
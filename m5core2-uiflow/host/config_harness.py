@@ -0,0 +1,223 @@
+# ============================================================================
+# AegisOne Remote Configuration Harness
+# Checks the firmware's Config on its own (schema, kinds, ranges, ordered
+# pairs checked on the merged result, version order, reset, flash
+# round trip, a corrupt file) and then sends documents to the real
+# firmware in the simulator through the AWS client stand-in: a threshold
+# change that must show in the next readings' status and in the alert
+# events without a restart, a rejected document that must change nothing,
+# a repeated and a stale version, a document for another rollout wave, a
+# shadow delta (its configVersion counts, not the shadow's own version)
+# and a command after it. Every document that concerns the node gets
+# exactly one acknowledgement. A reboot on the same flash must come back
+# with the last applied version. Last, config_rollout's Rollout drives two waves,
+# the second naming a node that does not exist.
+#
+#   python3 m5core2-uiflow/host/config_harness.py
+# ============================================================================
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import stubs
+
+stubs.install()
+
+import traces
+from aegis_config import Config, APPLIED, CURRENT, STALE, REJECTED
+from config_rollout import Rollout
+from sim import Simulator
+
+SCHEMA = {'WARN': (float, 0, 100), 'CRIT': (float, 0, 100), 'PERIOD': (int, 100, 10000)}
+ORDER = (('WARN', 'CRIT'),)
+RUN_S = 900
+
+
+def check_unit():
+    ok = True
+    cfg = Config(SCHEMA, {'WARN': 35.0, 'CRIT': 45.0, 'PERIOD': 1000}, ORDER)
+    bad = (
+        ({'NOPE': 1}, 'unknown'),
+        ({'WARN': True}, 'number'),
+        ({'WARN': '40'}, 'number'),
+        ({'PERIOD': 250.5}, 'whole'),
+        ({'PERIOD': 50}, 'range'),
+        ({'WARN': 50}, 'below'),          # passes alone, not merged with CRIT 45
+    )
+    for version, (settings, reason) in enumerate(bad, 1):
+        status, overrides, error = cfg.offer(version, settings)
+        ok &= status == REJECTED and overrides is None and reason in error
+    ok &= cfg.offer(0, {})[0] == REJECTED and cfg.offer('3', {})[0] == REJECTED
+    ok &= cfg.version == 0 and cfg.rejected == len(bad) + 2
+    print('  {} bad documents rejected, nothing applied'.format(cfg.rejected))
+
+    status, overrides, _ = cfg.offer(3, {'CRIT': 60, 'WARN': 50})
+    ok &= status == APPLIED and overrides == {'CRIT': 60.0, 'WARN': 50.0}
+    cfg.commit(3, overrides)
+    ok &= cfg.offer(3, {'WARN': 1})[0] == CURRENT and cfg.offer(2, {})[0] == STALE
+    status, overrides, _ = cfg.offer(4, {'PERIOD': 500})
+    ok &= overrides == {'CRIT': 60.0, 'WARN': 50.0, 'PERIOD': 500}
+    cfg.commit(4, overrides)
+    status, overrides, _ = cfg.offer(5, {'PERIOD': 2000}, reset=True)
+    ok &= overrides == {'PERIOD': 2000}
+    print('  merge, reset, current and stale versions: {}'.format('ok' if ok else 'MISMATCH'))
+
+    path = os.path.join(tempfile.mkdtemp(prefix='aegis-config-'), 'config.json')
+    cfg.save(path)
+    again = Config(SCHEMA, cfg.defaults, ORDER)
+    ok &= again.load(path) and again.version == 4 and again.values() == cfg.values()
+    with open(path, 'w') as f:
+        f.write('{"version": 5, "settings": {"WARN": 80}}')   # above CRIT
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok &= not Config(SCHEMA, cfg.defaults, ORDER).load(path)
+    ok &= not Config(SCHEMA, cfg.defaults, ORDER).load(path + '.missing')
+    print('  saved document restored, invalid one ignored')
+    return ok
+
+
+def topic_payloads(sim, topic):
+    return [(t / 1000, json.loads(p)) for t, name, p in sim.bus.messages if name == topic]
+
+
+def statuses(sim, fw, start, end):
+    seen = set()
+    for t, batch in topic_payloads(sim, fw.TOPIC_TELEMETRY_BATCH):
+        if start <= t < end:
+            seen.update(batch['status'])
+    return seen
+
+
+def check_node(flash):
+    sim = Simulator(traces.synthetic_shift(), flash_dir=flash)
+    fw = sim.load()
+    delta = '$aws/things/{}/shadow/update/delta'.format(fw.AWS_THING_NAME)
+    # The trace sits at 27-29 C: a 25 C warning level puts the node in WARNING
+    sim.command(200, json.dumps({"command": "config", "version": 1,
+                                 "settings": {"TEMP_WARNING": 25.0}}))
+    sim.command(300, json.dumps({"command": "config", "version": 2,
+                                 "settings": {"TEMP_CRITICAL": 20.0}}))
+    sim.command(350, json.dumps({"command": "config", "version": 1,
+                                 "settings": {"TEMP_WARNING": 25.0}}))
+    sim.command(400, json.dumps({"command": "config", "version": 9, "devices": ["other"],
+                                 "settings": {"TEMP_WARNING": 20.0}}))
+    # The shadow's version counts every update of the shadow: far ahead of
+    # the document versions, it must not make the next command stale
+    sim.bus.inject(500, delta, json.dumps({"version": 41, "timestamp": 0,
+                                           "state": {"configVersion": 2, "TEMP_WARNING": 35.0,
+                                                     "PUBLISH_INTERVAL_MS": 2000}}))
+    sim.command(700, json.dumps({"command": "config", "version": 3,
+                                 "settings": {"TEMP_WARNING": 30.0}}))
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(RUN_S)
+
+    acks = topic_payloads(sim, fw.TOPIC_CONFIG_ACK)
+    got = [(round(t), a['version'], a['status']) for t, a in acks]
+    print('  acks: {}'.format(', '.join('{} s v{} {}'.format(*a) for a in got)))
+    rejected = [a for _, a in acks if a['status'] == REJECTED]
+    if rejected:
+        print('  rejection reason: {}'.format(rejected[0].get('error')))
+    ok = [(v, s) for _, v, s in got] == [(1, APPLIED), (2, REJECTED), (1, CURRENT),
+                                         (2, APPLIED), (3, APPLIED)]
+    # A command waits at most one light sleep for the node to wake
+    late_s = fw.LIGHT_SLEEP_MAX_MS / 1000 + 1
+    ok &= all(0 <= t - sent <= late_s for (t, _, _), sent in zip(got, (200, 300, 350, 500, 700)))
+
+    # The ranger's first echoes are still settling during the first seconds
+    # (an alert episode opened then would absorb the one from the document)
+    before = statuses(sim, fw, 10, 200)
+    # A batch published just after a document still holds readings from before it
+    batch_s = fw.BATCH_MAX_AGE_MS / 1000 + late_s
+    during = statuses(sim, fw, 200 + batch_s, 500)
+    after = statuses(sim, fw, 500 + batch_s, RUN_S)      # 35 C, then 30 C from 700 s
+    events = [(round(t), e['eventType'], e['severity']) for t, e in
+              topic_payloads(sim, fw.TOPIC_EVENTS) if e['eventType'] != 'STATUS']
+    print('  readings before {}, after v1 {}, after the delta {}'.format(
+        sorted(before), sorted(during), sorted(after)))
+    print('  events: {}'.format(', '.join('{} s {} {}'.format(*e) for e in sorted(set(events)))))
+    ok &= before == {'RUNNING'} and during == {'WARNING'} and after == {'RUNNING'}
+    ok &= any(k == 'THRESHOLD' and 200 <= t <= 205 for t, k, _ in events)
+    # The episode closes once the warning cooldown has passed with the node back to RUNNING
+    closed_s = 500 + (fw.ALERT_CLEAR_MS + fw.ALERT_WARNING_COOLDOWN_MS) / 1000 + late_s
+    ok &= any(k == 'CLEARED' and 500 <= t <= closed_s for t, k, _ in events)
+
+    # Everything derived from the thresholds follows the documents: v3 on
+    # top of the delta's settings
+    ok &= fw.TEMP_WARNING == 30.0 and fw.limits.temp_warning == 30.0
+    ok &= fw.alerts.rules[0][1] == 30.0 and fw.rate.warning[0] == 30.0
+    ok &= fw.rollup.limits[0] == (30.0, True) and fw.PUBLISH_INTERVAL_MS == 2000
+    reported = topic_payloads(sim, '$aws/things/{}/shadow/update'.format(fw.AWS_THING_NAME))
+    last = reported[-1][1]['state']['reported']
+    ok &= last['configVersion'] == 3 and last['TEMP_WARNING'] == 30.0
+    with open(os.path.join(flash, 'config.json')) as f:
+        saved = json.loads(f.read())
+    print('  saved on flash: {}'.format(saved))
+    ok &= saved['version'] == 3
+    return ok
+
+
+def check_reboot(flash):
+    sim = Simulator(traces.synthetic_shift(), flash_dir=flash)
+    fw = sim.load()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(60)
+    status = [e for _, e in topic_payloads(sim, fw.TOPIC_EVENTS) if e['eventType'] == 'STATUS']
+    version = status[0]['details'].get('configVersion')
+    print('  after reboot: version {}, TEMP_WARNING {}, PUBLISH_INTERVAL_MS {}, '
+          'connect event reports version {}'.format(fw.config.version, fw.TEMP_WARNING,
+                                                     fw.PUBLISH_INTERVAL_MS, version))
+    return (fw.config.version == 3 and fw.TEMP_WARNING == 30.0
+            and fw.PUBLISH_INTERVAL_MS == 2000 and version == 3)
+
+
+def check_rollout():
+    sim = Simulator(traces.synthetic_shift(), flash_dir=tempfile.mkdtemp(prefix='aegis-sim-'))
+    fw = sim.load()
+    rollout = Rollout(4, {"VIB_WARNING": 1.2}, [fw.DEVICE_ID, 'aegis-one-m5-99'], wave=1)
+    publish = sim.bus.publish
+
+    def watched(topic, payload, qos=0):
+        publish(topic, payload, qos)
+        if topic == fw.TOPIC_CONFIG_ACK:
+            rollout.ack(json.loads(payload))
+    sim.bus.publish = watched
+
+    def wave():
+        doc = rollout.next_document()
+        if doc is not None:
+            sim.bus.deliver(fw.TOPIC_COMMANDS, json.dumps(doc))
+            sim.loop.call_later(30, close)
+
+    def close():
+        rollout.close_wave()
+        wave()
+    sim.loop.call_at(60, wave)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(200)
+    print('  2 waves of 1: {}, halted: {}'.format(rollout.status, rollout.halted))
+    return (rollout.status == {fw.DEVICE_ID: APPLIED, 'aegis-one-m5-99': 'missing'}
+            and rollout.halted is not None and not rollout.ok() and fw.VIB_WARNING == 1.2)
+
+
+def main():
+    results = []
+    print('config documents')
+    results.append(check_unit())
+    flash = tempfile.mkdtemp(prefix='aegis-sim-')
+    print('simulated node, documents at 200-700 s')
+    results.append(check_node(flash))
+    print('reboot on the same flash')
+    results.append(check_reboot(flash))
+    print('rollout')
+    results.append(check_rollout())
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
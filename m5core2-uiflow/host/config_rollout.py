@@ -0,0 +1,158 @@
+# ============================================================================
+# AegisOne Configuration Rollout
+# Sends a versioned configuration document to the fleet in waves on the
+# command topic and tracks the acknowledgement every node publishes on
+# aegisone/config/ack (see receive_config() in the firmware)
+# ============================================================================
+# Each wave names its devices in the document; nodes outside the wave
+# ignore it. The next wave starts once every device of the current one has
+# acknowledged, or after --wave-s. The rollout halts on the first
+# rejection (the firmware reports why) or stale acknowledgement (the node
+# already runs a newer version), or when more than --max-missing devices
+# of a wave stay silent. Without --devices the document goes to the whole
+# fleet at once and the acknowledgements of --wave-s are counted.
+#
+#   python3 m5core2-uiflow/host/config_rollout.py --broker localhost:1883
+#       --version 7 --set TEMP_WARNING=36 [--set VIB_WARNING=1.2] [--reset]
+#       [--devices ids.txt] [--wave 50] [--wave-s 30] [--max-missing 0]
+# ============================================================================
+
+import argparse
+import ast
+import asyncio
+import json
+import sys
+import time
+
+TOPIC_COMMANDS = 'aegisone/commands'
+TOPIC_CONFIG_ACK = 'aegisone/config/ack'
+
+
+class Rollout:
+    """Waves of one configuration document and their acknowledgements"""
+
+    def __init__(self, version, settings, devices=None, wave=0, reset=False, max_missing=0):
+        self.version = version
+        self.settings = settings
+        self.reset = reset
+        self.max_missing = max_missing
+        if devices is None:
+            self.waves = [None]
+        else:
+            size = wave or len(devices) or 1
+            self.waves = [devices[i:i + size] for i in range(0, len(devices), size)]
+        self.index = -1
+        self.status = {}      # deviceId -> ack status, or 'missing'
+        self.errors = {}
+        self.halted = None
+
+    def next_document(self):
+        """Command for the next wave; None when the rollout is over"""
+        if self.halted is not None or self.index + 1 >= len(self.waves):
+            return None
+        self.index += 1
+        doc = {"command": "config", "version": self.version, "settings": self.settings}
+        if self.reset:
+            doc["reset"] = True
+        if self.waves[self.index] is not None:
+            doc["devices"] = self.waves[self.index]
+        return doc
+
+    def ack(self, ack):
+        """Record one acknowledgement; acks for other versions are ignored"""
+        if ack.get("version") != self.version:
+            return
+        wave = self.waves[self.index] if self.index >= 0 else None
+        device = ack.get("deviceId")
+        if wave is not None and device not in wave:
+            return
+        self.status[device] = ack.get("status")
+        if ack.get("error"):
+            self.errors[device] = ack["error"]
+
+    def wave_done(self):
+        """Every device of the current wave has acknowledged"""
+        wave = self.waves[self.index]
+        return wave is not None and all(d in self.status for d in wave)
+
+    def close_wave(self):
+        """Mark silent devices and decide whether the rollout goes on"""
+        wave = self.waves[self.index]
+        missing = 0
+        for device in wave or ():
+            if device not in self.status:
+                self.status[device] = 'missing'
+                missing += 1
+        bad = [d for d in (wave or self.status) if self.status[d] in ('rejected', 'stale')]
+        if bad:
+            self.halted = '{} {} in wave {}'.format(len(bad), self.status[bad[0]], self.index + 1)
+        elif missing > self.max_missing:
+            self.halted = '{} silent in wave {}'.format(missing, self.index + 1)
+
+    def counts(self):
+        out = {}
+        for status in self.status.values():
+            out[status] = out.get(status, 0) + 1
+        return out
+
+    def ok(self):
+        """Every wave went out and no device rejected the document"""
+        return self.halted is None and self.index == len(self.waves) - 1 and bool(self.status)
+
+
+async def run(args, rollout):
+    from fleet_load import MqttConn
+    host, _, port = args.broker.partition(':')
+    conn = MqttConn(host, int(port or 1883), 'aegis-rollout-{}'.format(int(time.time())))
+    await conn.connect()
+    conn.on_message = lambda topic, payload: rollout.ack(json.loads(payload))
+    await conn.subscribe(TOPIC_CONFIG_ACK)
+    try:
+        while True:
+            doc = rollout.next_document()
+            if doc is None:
+                break
+            await conn.publish(TOPIC_COMMANDS, json.dumps(doc).encode(), 1)
+            deadline = time.monotonic() + args.wave_s
+            while time.monotonic() < deadline and not rollout.wave_done():
+                await asyncio.sleep(0.1)
+            rollout.close_wave()
+            print('wave {}/{}: {}'.format(rollout.index + 1, len(rollout.waves), rollout.counts()))
+    finally:
+        await conn.close()
+
+
+def parse_setting(text):
+    name, _, value = text.partition('=')
+    return name, ast.literal_eval(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--broker', default='localhost:1883')
+    parser.add_argument('--version', type=int, required=True)
+    parser.add_argument('--set', action='append', default=[], type=parse_setting)
+    parser.add_argument('--reset', action='store_true')
+    parser.add_argument('--devices', help='file with one deviceId per line')
+    parser.add_argument('--wave', type=int, default=0, help='devices per wave (0: one wave)')
+    parser.add_argument('--wave-s', type=float, default=30.0)
+    parser.add_argument('--max-missing', type=int, default=0)
+    args = parser.parse_args()
+
+    devices = None
+    if args.devices:
+        with open(args.devices) as f:
+            devices = [line.strip() for line in f if line.strip()]
+    rollout = Rollout(args.version, dict(args.set), devices, args.wave, args.reset,
+                      args.max_missing)
+    asyncio.run(run(args, rollout))
+    for device, error in sorted(rollout.errors.items()):
+        print('  {}: {}'.format(device, error))
+    if rollout.halted:
+        print('halted: ' + rollout.halted)
+    print('OK' if rollout.ok() else 'FAIL')
+    return 0 if rollout.ok() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# ============================================================================
+# AegisOne Node Core Harness
+# Checks that the shared temperature drivers in aegis_core give each node
+# script the reading its own conversion gave before the shared core: the
+# full node from getVbatVoltage(), the simple node from the battery
+# voltage. A driver whose read fails keeps its previous value. replace()
+# must put the new file in place whether or not the filesystem renames
+# over an existing file, and only remove the old one when it does not.
+#
+#   python3 m5core2-uiflow/host/core_harness.py
+# ============================================================================
+
+import os
+import sys
+import tempfile
+
+import stubs
+
+stubs.install()
+
+from aegis_core import AxpTemperature, BatteryTemperature, replace
+
+VOLTAGES = (3.2, 3.55, 3.7, 3.94, 4.2)
+
+
+class FakePower:
+    def __init__(self, volts):
+        self.volts = volts
+
+    def getBatVoltage(self):
+        if self.volts is None:
+            raise OSError('i2c')
+        return self.volts
+
+    getVbatVoltage = getBatVoltage
+
+
+def simple_before(power):
+    # aegis_one_simple.py get_temp() before aegis_core
+    return 25.0 + (power.getBatVoltage() - 3.7) * 10
+
+
+def full_before(power):
+    # aegis_one_m5core2.py read_temperature() before aegis_core
+    return power.getVbatVoltage() * 0.01 + 25
+
+
+def check(name, driver_cls, before):
+    ok = True
+    for v in VOLTAGES:
+        power = FakePower(v)
+        got, want = driver_cls(power).read(), before(power)
+        if got != want:
+            print('{}: {} V -> {} (was {})'.format(name, v, got, want))
+            ok = False
+    power = FakePower(VOLTAGES[0])
+    driver = driver_cls(power)
+    first = driver.read()
+    power.volts = None
+    if driver.read() != first:
+        print('{}: failed read lost the previous value'.format(name))
+        ok = False
+    print('{:>6}: {} voltages match the old conversion'.format(name, len(VOLTAGES)))
+    return ok
+
+
+def replaced(refuse):
+    """Contents after replace(), and how many files it removed"""
+    root = tempfile.mkdtemp(prefix='aegis-core-')
+    path, tmp = root + '/file', root + '/file.tmp'
+    for name, text in ((path, 'old'), (tmp, 'new')):
+        with open(name, 'w') as f:
+            f.write(text)
+    rename, remove = os.rename, os.remove
+    removed = []
+
+    def strict(src, dst):
+        if refuse and os.path.exists(dst):
+            raise OSError('exists')
+        rename(src, dst)
+
+    def counted(name):
+        removed.append(name)
+        remove(name)
+    os.rename, os.remove = strict, counted
+    try:
+        replace(tmp, path)
+    finally:
+        os.rename, os.remove = rename, remove
+    with open(path) as f:
+        return f.read(), os.path.exists(tmp), len(removed)
+
+
+def main():
+    ok = check('simple', BatteryTemperature, simple_before)
+    ok = check('full', AxpTemperature, full_before) and ok
+    over, fallback = replaced(False), replaced(True)
+    print('replace: {!r} in place, {} removed; rename over refused: {!r} in place, '
+          '{} removed'.format(over[0], over[2], fallback[0], fallback[2]))
+    ok &= over == ('new', False, 0) and fallback == ('new', False, 1)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
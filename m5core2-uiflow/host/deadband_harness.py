@@ -0,0 +1,115 @@
+# ============================================================================
+# AegisOne Report-by-Exception Harness
+# Replays a sensor trace through the firmware's Deadband at the publish
+# interval and reports the message reduction, the worst sample-and-hold
+# reconstruction error per channel, and whether sequence gaps account for
+# exactly the messages dropped on a lossy link.
+#
+#   python3 m5core2-uiflow/host/deadband_harness.py [--trace rec.csv]
+# ============================================================================
+
+import argparse
+import random
+import sys
+
+import stubs
+
+stubs.install()
+
+from aegis_deadband import Deadband
+import traces
+
+# Firmware configuration (aegis_one_m5core2.py)
+TEMP_DEADBAND = 0.5
+VIB_DEADBAND = 0.2
+DIST_DEADBAND = 5
+HEARTBEAT_MS = 60000
+TEMP_WARNING, TEMP_CRITICAL = 35.0, 45.0
+VIB_WARNING, VIB_CRITICAL = 1.5, 2.5
+DIST_WARNING, DIST_DANGER = 100, 30
+
+INTERVALS_MS = (1000, 5000)  # BATCH_SAMPLE_MS, PUBLISH_INTERVAL_MS
+LOSS = 0.02
+CHANNELS = ('temp', 'vib', 'distance')
+
+
+def status_of(temp, vib, dist):
+    if temp >= TEMP_CRITICAL or vib >= VIB_CRITICAL or dist <= DIST_DANGER:
+        return 'CRITICAL'
+    if temp >= TEMP_WARNING or vib >= VIB_WARNING or dist <= DIST_WARNING:
+        return 'WARNING'
+    return 'RUNNING'
+
+
+def replay(rows, interval_ms, seed=3):
+    bands = (TEMP_DEADBAND, VIB_DEADBAND, DIST_DEADBAND)
+    db = Deadband(bands, HEARTBEAT_MS)
+    rng = random.Random(seed)
+    trace = traces.Trace(rows)
+
+    samples = 0
+    held = None          # backend's view (lossless link)
+    worst = [0.0, 0.0, 0.0]
+    worst_gap_ms = 0
+    last_rx_ms = None
+    dropped = 0
+    rx_seq = 0
+    gaps = 0
+    status_misses = 0
+
+    for now in range(0, trace.duration_ms, interval_ms):
+        _, temp, vib, dist, _ = trace.at(now)[:5]
+        values = (temp, vib, dist)
+        status = status_of(temp, vib, dist)
+        samples += 1
+        if db.offer(now, status, *values):
+            held = (values, status)
+            if last_rx_ms is not None:
+                worst_gap_ms = max(worst_gap_ms, now - last_rx_ms)
+            last_rx_ms = now
+            seq = db.next_seq()
+            db.sent()
+            if rng.random() < LOSS:
+                dropped += 1
+            else:
+                gaps += seq - rx_seq - 1
+                rx_seq = seq
+        for i in range(3):
+            worst[i] = max(worst[i], abs(values[i] - held[0][i]))
+        if held[1] != status:
+            status_misses += 1
+
+    return {
+        'samples': samples, 'sent': db.reported, 'keyframes': db.keyframes,
+        'worst': worst, 'bands': bands, 'gap_ms': worst_gap_ms,
+        'dropped': dropped, 'gaps': gaps, 'status_misses': status_misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report-by-exception trace replay')
+    parser.add_argument('--trace', help='CSV recording (t_ms,temp,vib,distance,battery)')
+    args = parser.parse_args()
+    rows = traces.read_csv(args.trace) if args.trace else traces.synthetic_shift()
+
+    ok = True
+    for interval in INTERVALS_MS:
+        r = replay(rows, interval)
+        factor = r['samples'] / r['sent']
+        err = '  '.join('{} {:.3f}/{}'.format(c, e, b)
+                        for c, e, b in zip(CHANNELS, r['worst'], r['bands']))
+        print('every {:>4} ms: {:>5} readings -> {:>4} messages ({:>4.1f}x, {} keyframes, '
+              'longest silence {} s)'.format(interval, r['samples'], r['sent'], factor,
+                                             r['keyframes'], r['gap_ms'] // 1000))
+        print('    max error {}  status misses {}  dropped {} / seq gaps {}'.format(
+            err, r['status_misses'], r['dropped'], r['gaps']))
+        ok = (ok and factor >= 10
+              and all(e <= b + 1e-9 for e, b in zip(r['worst'], r['bands']))
+              and r['status_misses'] == 0 and r['gaps'] == r['dropped']
+              and r['gap_ms'] <= HEARTBEAT_MS)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+# ============================================================================
+# AegisOne Anomaly Detector Evaluation
+# Replays a labelled trace through the firmware's streaming detector and
+# through the fixed thresholds, and reports the event-level tp/fp/tn/fn of
+# the event schema: a raised alarm is a tp inside a labelled anomaly and an
+# fp outside one, an anomaly without an alarm is an fn, and a quiet minute
+# without an alarm is a tn. Also reports detection latency per anomaly, and
+# checks that a baseline persisted mid-trace and restored after a "reboot"
+# gives the same alarms as an uninterrupted run.
+#
+#   python3 m5core2-uiflow/host/detect_harness.py [--trace labelled.csv]
+# ============================================================================
+
+import argparse
+import os
+import sys
+import tempfile
+
+import stubs
+
+stubs.install()
+
+from aegis_detect import Baseline, Detector
+import traces
+
+# Firmware configuration (aegis_one_m5core2.py)
+DETECT_SAMPLE_MS = 1000
+DETECT_ALPHA = 0.005
+DETECT_K = 5.0
+DETECT_CUSUM = True
+DETECT_CUSUM_K = 0.5
+DETECT_CUSUM_H = 10.0
+DETECT_RELEARN = 3600
+TEMP_WARNING, TEMP_CRITICAL = 35.0, 45.0
+VIB_WARNING, VIB_CRITICAL = 1.5, 2.5
+DIST_WARNING, DIST_DANGER = 100, 30
+
+WINDOW_MS = 60000
+
+
+def make_detector(cusum=DETECT_CUSUM):
+    return Detector(('temp', 'vib', 'distance'), (
+        Baseline(DETECT_ALPHA, DETECT_K, 0.2, cusum, DETECT_CUSUM_K, DETECT_CUSUM_H,
+                 DETECT_RELEARN),
+        Baseline(DETECT_ALPHA, DETECT_K, 0.02, cusum, DETECT_CUSUM_K, DETECT_CUSUM_H,
+                 DETECT_RELEARN),
+        Baseline(DETECT_ALPHA, DETECT_K, 1.0, cusum, DETECT_CUSUM_K, DETECT_CUSUM_H,
+                 DETECT_RELEARN),
+    ))
+
+
+def threshold_alarm(temp, vib, dist):
+    return (temp >= TEMP_WARNING or vib >= VIB_WARNING or dist <= DIST_WARNING)
+
+
+def segments(rows):
+    """(start_ms, end_ms) of each labelled anomaly"""
+    out = []
+    start = None
+    for row in rows:
+        if row[5] and start is None:
+            start = row[0]
+        elif not row[5] and start is not None:
+            out.append((start, row[0]))
+            start = None
+    if start is not None:
+        out.append((start, rows[-1][0] + DETECT_SAMPLE_MS))
+    return out
+
+
+def run_detector(rows, detector, start=0, stop=None):
+    """Whether an alarm was newly raised at each sample"""
+    raised = []
+    for row in rows[start:stop]:
+        raised.append(detector.update(row[0], row[1], row[2], row[3]))
+    return raised
+
+
+def run_thresholds(rows):
+    raised = []
+    before = False
+    for row in rows:
+        alarm = threshold_alarm(row[1], row[2], row[3])
+        raised.append(alarm and not before)
+        before = alarm
+    return raised
+
+
+def score(rows, raised):
+    """Event-level tp/fp/tn/fn, plus detection latency per anomaly"""
+    counts = {'tp': 0, 'fp': 0, 'tn': 0, 'fn': 0}
+    for i in range(len(rows)):
+        if raised[i]:
+            counts['tp' if rows[i][5] else 'fp'] += 1
+
+    per_window = WINDOW_MS // DETECT_SAMPLE_MS
+    for i in range(0, len(rows), per_window):
+        window = rows[i:i + per_window]
+        if not any(r[5] for r in window) and not any(raised[i:i + per_window]):
+            counts['tn'] += 1
+
+    caught = []
+    t0 = rows[0][0]
+    for start, end in segments(rows):
+        latency = None
+        for i in range((start - t0) // DETECT_SAMPLE_MS, (end - t0) // DETECT_SAMPLE_MS):
+            if raised[i]:
+                latency = rows[i][0] - start
+                break
+        if latency is None:
+            counts['fn'] += 1
+        caught.append(latency)
+    return counts, caught
+
+
+def report(name, counts, caught):
+    hits = [c for c in caught if c is not None]
+    print('{:<10} tp {:>3} fp {:>3} tn {:>4} fn {:>2}  caught {}/{}  latency {}'.format(
+        name, counts['tp'], counts['fp'], counts['tn'], counts['fn'], len(hits), len(caught),
+        ' '.join('-' if c is None else '{}s'.format(c // 1000) for c in caught)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming detector evaluation')
+    parser.add_argument('--trace', help='labelled CSV (t_ms,temp,vib,distance,battery,anomaly)')
+    args = parser.parse_args()
+    rows = traces.read_csv(args.trace) if args.trace else traces.labelled_shift()
+    if len(rows[0]) < 6:
+        print('trace has no anomaly column')
+        return 2
+
+    fixed_counts, fixed_caught = score(rows, run_thresholds(rows))
+    report('threshold', fixed_counts, fixed_caught)
+
+    z_counts, z_caught = score(rows, run_detector(rows, make_detector(False)))
+    report('ewma', z_counts, z_caught)
+
+    raised = run_detector(rows, make_detector())
+    counts, caught = score(rows, raised)
+    report('ewma+cusum', counts, caught)
+
+    # Reboot half-way: persisted baseline vs cold start
+    half = len(rows) // 2
+    path = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+    before = make_detector()
+    run_detector(rows, before, 0, half)
+    before.save(path)
+    restored = make_detector()
+    restored.load(path)
+    raised_restored = run_detector(rows, restored, half)
+    blind_s = restored.channels[0].warmup * DETECT_SAMPLE_MS // 1000
+    same = raised_restored == raised[half:]
+    print('reboot at {} s: restored baseline {} uninterrupted run; cold start is blind '
+          'for {} s'.format(half, 'matches' if same else 'DIFFERS from', blind_s))
+
+    ok = (same and counts['fn'] == 0 and counts['fp'] <= 1
+          and fixed_counts['fn'] > 0)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
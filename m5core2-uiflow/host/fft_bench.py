@@ -0,0 +1,77 @@
+# ============================================================================
+# AegisOne FFT Benchmark
+# Reports microseconds per FFT size and checks dominant-frequency detection.
+# Runs under CPython or the Unix port of MicroPython:
+#
+#   python3 m5core2-uiflow/host/fft_bench.py
+#   micropython m5core2-uiflow/host/fft_bench.py
+# ============================================================================
+
+import sys
+import time
+from array import array
+from math import sin, pi
+
+_here = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+sys.path.insert(0, _here + '/..')
+
+from aegis_fft import Spectrum
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+RATE_HZ = 500
+SIZES = (64, 128, 256, 512, 1024)
+REPEAT = 20
+
+
+def tone(n, freq, amplitude=0.5):
+    """One window of a pure tone sampled at RATE_HZ"""
+    return array('f', [amplitude * sin(2 * pi * freq * i / RATE_HZ) for i in range(n)])
+
+
+def bench(n):
+    spec = Spectrum(n, 8)
+    buf = tone(n, 60.0)
+    t0 = ticks_us()
+    for _ in range(REPEAT):
+        spec.load(buf)
+        spec.transform()
+        spec.reduce(RATE_HZ)
+    return ticks_diff(ticks_us(), t0) / REPEAT
+
+
+def check(n, freq):
+    """Dominant frequency must land within one bin; band energy ~ A^2/2"""
+    spec = Spectrum(n, 8)
+    spec.load(tone(n, freq))
+    spec.transform()
+    spec.reduce(RATE_HZ)
+    resolution = RATE_HZ / n
+    total = 0.0
+    for b in range(spec.nbands):
+        total += spec.bands[b]
+    ok = abs(spec.peak_hz - freq) <= resolution and abs(total - 0.125) < 0.01
+    print('n={:<5} tone={:>5.1f}Hz peak={:>6.2f}Hz energy={:.4f}g2 {}'.format(
+        n, freq, spec.peak_hz, total, 'OK' if ok else 'MISMATCH'))
+    return ok
+
+
+def main():
+    ok = True
+    for freq in (12.0, 60.0, 180.0):
+        ok = check(256, freq) and ok
+    for n in SIZES:
+        print('FFT {:>5}: {:>9.0f} us'.format(n, bench(n)))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,615 @@
+# ============================================================================
+# AegisOne Fleet Load Generator
+# Thousands of virtual nodes on one asyncio loop, publishing payloads built
+# by the firmware's own publish_telemetry() / publish_event()
+# ============================================================================
+# The firmware is imported once with the simulator's device stand-ins.
+# Before each publish, a device's readings, deviceId, sequence counter and
+# wire encoder are swapped into the firmware's globals and its publish
+# function is called with a capturing client; the captured payload is then
+# sent on that device's connection. Payloads are therefore exactly what a
+# node would send, in any WIRE_FORMAT.
+#
+# Targets:
+#   mqtt://host:port    one MQTT 3.1.1 connection per device (QoS 0 or 1);
+#                       a subscriber on aegisone/# measures end-to-end time
+#   http://host:port/p  POST {"type": "telemetry"|"event", "data": ...} to
+#                       the dashboard's /api/mock-data over a connection pool
+#   mqtt-sink, http-sink, null
+#                       in-process broker / HTTP server / no network, to
+#                       measure the generator itself
+#
+# Scenarios: a steady per-device rate, an alert storm (a fraction of the
+# fleet goes CRITICAL: one event on entry, telemetry at a faster rate, one
+# CLEARED event) and a reconnect storm (a fraction drops its connection
+# and reconnects at once). Latencies go into the firmware's fixed-bucket
+# Histogram (aegis_prof.py).
+#
+#   python3 m5core2-uiflow/host/fleet_load.py --devices 2000 --seconds 60
+#       [--target mqtt://localhost:1883 | http://localhost:3000/api/mock-data]
+#       [--rate 0.2] [--qos 1] [--storm 20:10:0.3] [--reconnect 40:0.5]
+#       [--set WIRE_FORMAT=cbor]
+# ============================================================================
+
+import argparse
+import ast
+import asyncio
+import json
+import random
+import struct
+import sys
+import time
+from urllib.parse import urlsplit
+
+import stubs
+
+stubs.install()
+
+from sim import Simulator
+from aegis_deadband import Deadband
+from aegis_outbox import Outbox
+from aegis_prof import Histogram
+from aegis_wire import WireEncoder, FORMAT_JSON
+
+TOPIC_FILTER = 'aegisone/#'
+CONNECT_TIMEOUT_S = 10
+ACK_TIMEOUT_S = 10
+
+
+# ---- MQTT 3.1.1 (just enough for CONNECT / PUBLISH / SUBSCRIBE) ----
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+
+def _str(s):
+    b = s.encode()
+    return struct.pack('>H', len(b)) + b
+
+
+def _packet(first, body):
+    return bytes((first,)) + _varint(len(body)) + body
+
+
+async def _read_packet(reader):
+    first = (await reader.readexactly(1))[0]
+    n = 0
+    shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return first, await reader.readexactly(n) if n else b''
+
+
+def _payload_bytes(payload):
+    return payload if isinstance(payload, bytes) else payload.encode()
+
+
+class MqttConn:
+    """One MQTT connection; QoS 1 publishes resolve on PUBACK"""
+
+    def __init__(self, host, port, client_id):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.writer = None
+        self.reader_task = None
+        self.pending = {}
+        self.next_id = 0
+        self.on_message = None
+
+    async def connect(self):
+        reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = _str('MQTT') + bytes((4, 0x02)) + struct.pack('>H', 0) + _str(self.client_id)
+        self.writer.write(_packet(0x10, body))
+        first, ack = await _read_packet(reader)
+        if first != 0x20 or ack[1] != 0:
+            raise ConnectionError('CONNACK refused')
+        self.reader_task = asyncio.ensure_future(self._read(reader))
+
+    async def _read(self, reader):
+        try:
+            while True:
+                first, body = await _read_packet(reader)
+                kind = first & 0xf0
+                if kind == 0x40:
+                    fut = self.pending.pop(struct.unpack('>H', body[:2])[0], None)
+                    if fut is not None and not fut.done():
+                        fut.set_result(None)
+                elif kind == 0x30 and self.on_message is not None:
+                    n = struct.unpack('>H', body[:2])[0]
+                    pos = 2 + n + (2 if first & 0x06 else 0)
+                    self.on_message(body[2:2 + n].decode(), body[pos:])
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            for fut in self.pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError('connection lost'))
+            self.pending.clear()
+
+    async def subscribe(self, topic):
+        self.writer.write(_packet(0x82, struct.pack('>H', 1) + _str(topic) + b'\x00'))
+        await self.writer.drain()
+
+    async def publish(self, topic, payload, qos=0):
+        if self.writer is None:
+            raise ConnectionError('not connected')
+        body = _str(topic)
+        fut = None
+        if qos:
+            self.next_id = self.next_id % 0xffff + 1
+            body += struct.pack('>H', self.next_id)
+            fut = asyncio.get_event_loop().create_future()
+            self.pending[self.next_id] = fut
+        self.writer.write(_packet(0x30 | (qos << 1), body + payload))
+        await self.writer.drain()
+        if fut is not None:
+            try:
+                await asyncio.wait_for(fut, ACK_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                self.pending.pop(struct.unpack('>H', body[-2:])[0], None)
+                raise ConnectionError('no PUBACK')
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            self.writer.write(b'\xe0\x00')
+            self.writer.close()
+        except (ConnectionError, OSError):
+            pass
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        self.writer = None
+
+
+class SinkBroker:
+    """In-process MQTT broker: acks QoS 1 and forwards to '#' subscribers"""
+
+    def __init__(self):
+        self.subscribers = []
+        self.received = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._client, '127.0.0.1', 0, backlog=4096)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                first, body = await _read_packet(reader)
+                kind = first & 0xf0
+                if kind == 0x10:
+                    writer.write(b'\x20\x02\x00\x00')
+                elif kind == 0x30:
+                    self.received += 1
+                    qos = (first >> 1) & 3
+                    if qos:
+                        n = struct.unpack('>H', body[:2])[0]
+                        writer.write(b'\x40\x02' + body[2 + n:4 + n])
+                        body = body[:2 + n] + body[4 + n:]
+                    out = _packet(0x30, body)
+                    for sub in self.subscribers:
+                        sub.write(out)
+                elif kind == 0x80:
+                    self.subscribers.append(writer)
+                    writer.write(b'\x90\x03' + body[:2] + b'\x00')
+                elif kind == 0xe0:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            if writer in self.subscribers:
+                self.subscribers.remove(writer)
+            writer.close()
+
+
+# ---- HTTP/1.1 (keep-alive POSTs over a small connection pool) ----
+
+class HttpConn:
+    def __init__(self, host, port, path):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def post(self, body):
+        if self.writer is None:
+            await self.connect()
+        head = ('POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n'
+                'Content-Length: {}\r\n\r\n').format(self.path, self.host, len(body))
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        if length:
+            await self.reader.readexactly(length)
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def http_sink(reader, writer):
+    """In-process HTTP server answering every POST with 200"""
+    try:
+        while True:
+            length = 0
+            line = await reader.readline()
+            if not line:
+                break
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode().partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 16\r\n\r\n{"success":true}')
+    except (asyncio.IncompleteReadError, ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+def mock_data_body(topic, payload):
+    """The firmware's JSON payload as a /api/mock-data request"""
+    msg = json.loads(payload)
+    if topic.endswith('/events'):
+        details = msg['details']
+        data = {'deviceId': msg['deviceId'], 'eventTs': msg['eventTs'],
+                'eventType': msg['eventType'], 'severity': msg['severity'],
+                'temp': details['temp'], 'vib': details['vib'],
+                'distance': details['distance'], 'alerts': details['alerts'],
+                'detectionLatencyMs': details['detectionLatencyMs']}
+        return json.dumps({'type': 'event', 'data': data}).encode()
+    return json.dumps({'type': 'telemetry', 'data': msg, 'count': 1}).encode()
+
+
+# ---- Fleet ----
+
+class Capture:
+    """Stands in for the firmware's aws client and keeps what it publishes"""
+
+    def __init__(self):
+        self.out = []
+
+    def publish(self, topic, payload, qos=0):
+        self.out.append((topic, payload if isinstance(payload, str) else bytes(payload)))
+
+
+class Device:
+    def __init__(self, index, fmt, rng):
+        self.id = 'aegis-load-{:05d}'.format(index)
+        self.deadband = Deadband((0, 0, 0))
+        self.outbox = Outbox()
+        self.wire = WireEncoder(self.id, fmt) if fmt != FORMAT_JSON else None
+        self.temp = 27.0 + rng.uniform(-2, 2)
+        self.vib = 0.3 + rng.uniform(0, 0.2)
+        self.distance = 150.0 + rng.uniform(0, 80)
+        self.battery = rng.randint(40, 100)
+        self.critical = False
+        self.conn = None
+
+
+class Stats:
+    def __init__(self):
+        self.sent = {}
+        self.bytes = 0
+        self.errors = 0
+        self.lost = 0       # not connected, or dropped by a reconnect storm
+        self.publish = Histogram()
+        self.e2e = Histogram()
+        self.connect = Histogram()
+        self.connect_errors = 0
+        self.inflight = {}
+
+
+class Fleet:
+    """Runs the virtual devices against one target"""
+
+    def __init__(self, fw, args):
+        self.fw = fw
+        self.args = args
+        self.rng = random.Random(args.seed)
+        fmt = fw.WIRE_FORMAT
+        self.devices = [Device(i, fmt, self.rng) for i in range(args.devices)]
+        self.capture = Capture()
+        self.stats = Stats()
+        self.loop = asyncio.get_event_loop()
+        self.start = 0.0
+        self.pool = None
+        self.subscriber = None
+        self.sink = None
+
+    # -- payloads --
+
+    def build(self, dev, publish, *args):
+        """Run a firmware publish function as dev; returns [(topic, payload)]"""
+        fw = self.fw
+        fw.DEVICE_ID = dev.id
+        fw.json_telemetry["deviceId"] = dev.id
+        fw.deadband = dev.deadband
+        fw.outbox = dev.outbox
+        fw.wire = dev.wire
+        fw.current_temp = dev.temp + self.rng.gauss(0, 0.05)
+        fw.current_vib = dev.vib + abs(self.rng.gauss(0, 0.02))
+        fw.current_distance = dev.distance + self.rng.gauss(0, 0.5)
+        fw.battery_level = dev.battery
+        fw.aws = self.capture
+        fw.is_aws_connected = True
+        publish(*args)
+        # Delivery is measured on the transport here, not by event acks
+        for event_id in list(dev.outbox.inflight):
+            dev.outbox.ack(event_id, 0)
+        out = self.capture.out
+        self.capture.out = []
+        return out
+
+    # -- transport --
+
+    async def open(self):
+        a = self.args
+        target = a.target
+        if target == 'mqtt-sink':
+            self.sink = SinkBroker()
+            target = 'mqtt://127.0.0.1:{}'.format(await self.sink.start())
+        elif target == 'http-sink':
+            self.sink = await asyncio.start_server(http_sink, '127.0.0.1', 0, backlog=4096)
+            target = 'http://127.0.0.1:{}/api/mock-data'.format(
+                self.sink.sockets[0].getsockname()[1])
+        self.url = urlsplit(target)
+        if self.url.scheme == 'mqtt':
+            self.subscriber = MqttConn(self.url.hostname, self.url.port or 1883,
+                                       'aegis-load-monitor')
+            await self.subscriber.connect()
+            self.subscriber.on_message = self.on_message
+            await self.subscriber.subscribe(TOPIC_FILTER)
+            await asyncio.gather(*(self.connect(d) for d in self.devices))
+        elif self.url.scheme == 'http':
+            if self.fw.WIRE_FORMAT != FORMAT_JSON:
+                raise SystemExit('/api/mock-data takes JSON: use WIRE_FORMAT=json')
+            self.pool = asyncio.Queue()
+            for _ in range(a.connections):
+                self.pool.put_nowait(HttpConn(self.url.hostname, self.url.port or 80,
+                                              self.url.path or '/api/mock-data'))
+
+    async def connect(self, dev):
+        t0 = time.perf_counter()
+        conn = MqttConn(self.url.hostname, self.url.port or 1883, dev.id)
+        try:
+            await asyncio.wait_for(conn.connect(), CONNECT_TIMEOUT_S)
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            self.stats.connect_errors += 1
+            await conn.close()
+            return
+        self.stats.connect.add(int((time.perf_counter() - t0) * 1e6))
+        dev.conn = conn
+
+    def on_message(self, topic, payload):
+        t0 = self.stats.inflight.pop(payload, None)
+        if t0 is not None:
+            self.stats.e2e.add(int((time.perf_counter() - t0) * 1e6))
+
+    async def send(self, dev, topic, payload):
+        s = self.stats
+        s.sent[topic] = s.sent.get(topic, 0) + 1
+        body = _payload_bytes(payload)
+        s.bytes += len(body)
+        t0 = time.perf_counter()
+        try:
+            if self.url.scheme == 'mqtt':
+                conn = dev.conn
+                if conn is None or conn.writer is None:
+                    s.lost += 1
+                    return
+                if len(s.inflight) < 100000:
+                    s.inflight[body] = t0
+                try:
+                    await conn.publish(topic, body, self.args.qos)
+                except ConnectionError:
+                    if conn is dev.conn and conn.writer is not None:
+                        raise
+                    s.lost += 1
+                    return
+            elif self.url.scheme == 'http':
+                conn = await self.pool.get()
+                try:
+                    if await conn.post(mock_data_body(topic, payload)) >= 400:
+                        raise ConnectionError('HTTP error')
+                except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+                    await conn.close()
+                    raise ConnectionError('HTTP request failed')
+                finally:
+                    self.pool.put_nowait(conn)
+            s.publish.add(int((time.perf_counter() - t0) * 1e6))
+        except (ConnectionError, OSError):
+            s.errors += 1
+
+    async def close(self):
+        if self.url.scheme == 'mqtt':
+            await asyncio.sleep(0.5)  # let the monitor see the last messages
+            await asyncio.gather(*(d.conn.close() for d in self.devices if d.conn))
+            await self.subscriber.close()
+        elif self.pool is not None:
+            while not self.pool.empty():
+                await self.pool.get_nowait().close()
+        if self.sink is not None and hasattr(self.sink, 'close'):
+            self.sink.close()
+
+    # -- scenarios --
+
+    def elapsed(self):
+        return self.loop.time() - self.start
+
+    async def device(self, dev):
+        a = self.args
+        fw = self.fw
+        period = 1.0 / a.rate
+        await asyncio.sleep(self.rng.uniform(0, period))
+        while self.elapsed() < a.seconds:
+            for topic, payload in self.build(dev, fw.publish_telemetry):
+                await self.send(dev, topic, payload)
+            fast = dev.critical and a.storm_rate > 1
+            wait = period / a.storm_rate if fast else period
+            await asyncio.sleep(min(wait, max(0.0, a.seconds - self.elapsed())))
+
+    async def storm(self, at, duration, fraction):
+        """A fraction of the fleet goes CRITICAL for `duration` seconds"""
+        await asyncio.sleep(at)
+        fw = self.fw
+        hit = self.rng.sample(self.devices, int(len(self.devices) * fraction))
+        sends = []
+        for dev in hit:
+            dev.critical = True
+            dev.saved = (dev.temp, dev.vib, dev.distance)
+            dev.temp, dev.vib, dev.distance = 47.0, 2.8, 25.0
+            message = "Critical threshold exceeded - Temp:{:.1f}C Vib:{:.2f}g Dist:{:.0f}cm".format(
+                dev.temp, dev.vib, dev.distance)
+            for topic, payload in self.build(dev, fw.publish_event, "CRITICAL", message):
+                sends.append(self.send(dev, topic, payload))
+        await asyncio.gather(*sends)
+        await asyncio.sleep(duration)
+        sends = []
+        for dev in hit:
+            dev.critical = False
+            dev.temp, dev.vib, dev.distance = dev.saved
+            for topic, payload in self.build(
+                    dev, fw.publish_event, "INFO", "CRITICAL cleared after {} s".format(int(duration)),
+                    "CLEARED", {"clearedSeverity": "CRITICAL", "durationMs": int(duration * 1000)}):
+                sends.append(self.send(dev, topic, payload))
+        await asyncio.gather(*sends)
+
+    async def reconnect(self, at, fraction):
+        """A fraction of the fleet loses its connection and reconnects at once"""
+        await asyncio.sleep(at)
+        hit = self.rng.sample(self.devices, int(len(self.devices) * fraction))
+        if self.url.scheme != 'mqtt':
+            return
+        for dev in hit:
+            if dev.conn is not None:
+                await dev.conn.close()
+                dev.conn = None
+        await asyncio.gather(*(self.connect(d) for d in hit))
+
+    async def run(self):
+        a = self.args
+        await self.open()
+        self.start = self.loop.time()
+        jobs = [self.device(d) for d in self.devices]
+        if a.storm:
+            jobs.append(self.storm(*a.storm))
+        if a.reconnect:
+            jobs.append(self.reconnect(*a.reconnect))
+        await asyncio.gather(*jobs)
+        wall = self.elapsed()
+        await self.close()
+        return wall
+
+
+class NullFleet(Fleet):
+    """Builds payloads but sends nothing: the generator's own ceiling"""
+
+    async def open(self):
+        self.url = urlsplit('null:')
+
+    async def close(self):
+        pass
+
+
+def percentiles(h):
+    return 'p50 {:>7.1f}  p95 {:>7.1f}  p99 {:>7.1f}  max {:>7.1f} ms  (n {})'.format(
+        h.percentile(50) / 1000, h.percentile(95) / 1000, h.percentile(99) / 1000,
+        h.max / 1000, h.n)
+
+
+def parse_setting(text):
+    name, _, value = text.partition('=')
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a fleet of AegisOne nodes')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--target', default='mqtt-sink',
+                        help='mqtt://host:port, http://host:port/path, mqtt-sink, http-sink or null')
+    parser.add_argument('--rate', type=float, default=0.2, help='telemetry messages/s per device')
+    parser.add_argument('--qos', type=int, default=1, choices=(0, 1))
+    parser.add_argument('--connections', type=int, default=32, help='HTTP connection pool')
+    parser.add_argument('--storm', metavar='AT:DURATION:FRACTION',
+                        help='alert storm: fraction of devices CRITICAL for DURATION s')
+    parser.add_argument('--storm-rate', type=float, default=5.0,
+                        help='telemetry rate multiplier while CRITICAL')
+    parser.add_argument('--reconnect', metavar='AT:FRACTION',
+                        help='reconnect storm: fraction of devices reconnect at once')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a firmware setting (e.g. WIRE_FORMAT=cbor)')
+    parser.add_argument('--seed', type=int, default=17)
+    args = parser.parse_args()
+    args.storm = tuple(float(x) for x in args.storm.split(':')) if args.storm else None
+    args.reconnect = tuple(float(x) for x in args.reconnect.split(':')) if args.reconnect else None
+
+    # Device stand-ins only: the firmware's main() is never run here
+    sim = Simulator([(0, 27.0, 0.3, 180.0, 90)])
+    fw = sim.load(dict(parse_setting(s) for s in args.set))
+    fw.DEADBAND_ENABLED = False
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    fleet = (NullFleet if args.target == 'null' else Fleet)(fw, args)
+    cpu = time.process_time()
+    wall = loop.run_until_complete(fleet.run())
+    cpu = time.process_time() - cpu
+    s = fleet.stats
+
+    total = sum(s.sent.values())
+    offered = args.devices * args.rate
+    print('{} devices for {:.1f} s against {} ({}), {:.1f} s CPU'.format(
+        args.devices, wall, args.target, fw.WIRE_FORMAT, cpu))
+    for topic, n in sorted(s.sent.items()):
+        print('  {:<28} {:>8} messages'.format(topic, n))
+    print('throughput {:.0f} msg/s ({:.0f} offered steady), {:.1f} KB/s, {} errors, '
+          '{} lost while disconnected'.format(total / wall, offered, s.bytes / wall / 1024,
+                                              s.errors, s.lost))
+    if s.publish.n and not isinstance(fleet, NullFleet):
+        print('publish     ' + percentiles(s.publish))
+    if s.e2e.n:
+        print('end-to-end  ' + percentiles(s.e2e))
+    if s.connect.n or s.connect_errors:
+        print('connect     ' + percentiles(s.connect) + ', {} failed'.format(s.connect_errors))
+
+    ok = total > 0 and s.errors == 0
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,635 @@
+# ============================================================================
+# AegisOne Ingest Service
+# Subscribes to the node topics on a broker, decodes every firmware payload
+# format, validates the records against lib/types.ts and writes them as
+# compressed columnar files per device and time bucket
+# ============================================================================
+# Topics and the rows they become:
+#   aegisone/telemetry            one TelemetryItem, one row
+#   aegisone/telemetry/batch      a TelemetryBatch, one row per reading
+#   aegisone/telemetry/replay     (the same, readings kept through an outage)
+#   aegisone/events               one EventItem, one row, details flattened
+#   aegisone/snapshots            chunks; one row per reassembled waveform
+# Each payload is JSON, struct or CBOR (aegis_wire.decode tells them apart
+# by the first byte). In a batch, battery, rate, sampleMs and seq are
+# repeated on every row; the other message-level fields (vibration
+# features, link and memory counters) describe the moment of the flush and
+# go on its last row only. Struct readings from nodes older than wire
+# version 6 carry no node state (rate, loop lag, link, outbox and memory
+# counters), and struct events older than version 5 no eventType, alerts
+# or sampleIntervalMs: those columns stay null for them. Event details
+# other than the fixed ones (clearedSeverity, durationMs, configVersion...)
+# are kept as a JSON text column.
+#
+# A record that does not match the dashboard's types (missing or
+# mistyped field, unknown status, NaN, ragged batch columns) is counted
+# under its reason and dropped; the rest of its message is still written.
+# Events are deduplicated per device on eventId over the last DEDUP_IDS
+# (the node retries until it is acknowledged) and, with --ack, every copy
+# is acknowledged on aegisone/events/ack/<deviceId> the way the cloud rule
+# does, so a node only receives its own acks.
+#
+# Rows go into an open bucket per (table, device, bucket_ms window of the
+# record's own time), kept column by column in typed arrays, and the
+# bucket is handed to the sink as one Arrow table when it holds max_rows,
+# when no row came for linger_s, or at shutdown. A late row for a bucket
+# already written starts a new part. Sinks:
+#   parquet   table/deviceId=.../bucket=.../part-*.parquet, zstd
+#   arrow     the same layout as Arrow IPC files, zstd
+#   null      counts rows only
+# Anything with write(table, device_id, bucket_start_ms, arrow_table)
+# returning the bytes written will do.
+#
+#   python3 m5core2-uiflow/host/ingest.py --broker localhost:1883
+#       [--out ingest] [--sink parquet|arrow|null] [--bucket-s 3600]
+#       [--max-rows 50000] [--linger-s 60] [--ack] [--report-s 10]
+# ============================================================================
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import struct
+import sys
+import time
+from array import array
+
+import stubs
+
+stubs.install()
+
+from aegis_snap import Reassembler
+from aegis_wire import detect_format, decode, STATUSES, PROXIMITIES, SEVERITIES
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+TOPIC_TELEMETRY = 'aegisone/telemetry'
+TOPIC_TELEMETRY_BATCH = 'aegisone/telemetry/batch'
+TOPIC_REPLAY = 'aegisone/telemetry/replay'
+TOPIC_EVENTS = 'aegisone/events'
+TOPIC_EVENT_ACKS = 'aegisone/events/ack/'  # + deviceId
+TOPIC_SNAPSHOTS = 'aegisone/snapshots'
+TOPICS = (TOPIC_TELEMETRY, TOPIC_TELEMETRY_BATCH, TOPIC_REPLAY, TOPIC_EVENTS, TOPIC_SNAPSHOTS)
+
+TELEMETRY = 'telemetry'
+EVENTS = 'events'
+SNAPSHOTS = 'snapshots'
+
+RATES = ('fast', 'normal', 'slow', 'saver')
+DEDUP_IDS = 256
+NULL_INT = -1 << 63
+NAN = float('nan')
+
+# ---- Columns: (name, kind, rule) ----
+# kind is the Arrow type; rule checks a value: 'int' / 'num' (finite, not
+# bool), 'str', a tuple of allowed strings, 'nums' (list of numbers)
+# or None (not checked, filled by the ingest itself)
+
+TELEMETRY_COLUMNS = (
+    ('deviceId', 'string', 'str'),
+    ('ts', 'int64', 'int'),
+    ('temp', 'float64', 'num'),
+    ('vib', 'float64', 'num'),
+    ('distance', 'float64', 'num'),
+    ('status', 'string', STATUSES),
+    ('proximity', 'string', PROXIMITIES),
+    ('battery', 'int64', 'int'),
+    ('vibRms', 'float64', 'num'),
+    ('vibCrest', 'float64', 'num'),
+    ('vibP2p', 'float64', 'num'),
+    ('vibBands', 'floats', 'nums'),
+    ('vibPeakHz', 'float64', 'num'),
+    ('vibBandHz', 'float64', 'num'),
+    ('loopLagMs', 'int64', 'int'),
+    ('rate', 'string', RATES),
+    ('sampleMs', 'int64', 'int'),
+    ('seq', 'int64', 'int'),
+    ('vibDropped', 'int64', 'int'),
+    ('reconnects', 'int64', 'int'),
+    ('offlineMs', 'int64', 'int'),
+    ('eventQueue', 'int64', 'int'),
+    ('memFree', 'int64', 'int'),
+    ('allocPerPass', 'float64', 'num'),
+    ('allocMaxPass', 'int64', 'int'),
+    ('gcMaxUs', 'int64', 'int'),
+    ('topic', 'string', None),
+    ('format', 'string', None),
+)
+TELEMETRY_REQUIRED = ('deviceId', 'ts', 'temp', 'vib', 'status')
+# Batch fields holding one value per reading (proximity only from nodes
+# that report it), and message fields every row gets
+BATCH_ROWS = ('ts', 'temp', 'vib', 'distance', 'status')
+BATCH_OPTIONAL_ROWS = ('proximity',)
+BATCH_REPEATED = ('battery', 'rate', 'sampleMs', 'seq')
+
+EVENT_COLUMNS = (
+    ('deviceId', 'string', 'str'),
+    ('eventId', 'int64', 'int'),
+    ('eventType', 'string', 'str'),
+    ('severity', 'string', SEVERITIES),
+    ('message', 'string', 'str'),
+    ('eventTs', 'int64', 'int'),
+    ('temp', 'float64', 'num'),
+    ('vib', 'float64', 'num'),
+    ('distance', 'float64', 'num'),
+    ('alerts', 'strings', None),
+    ('baselineVib', 'float64', 'num'),
+    ('driftPct', 'float64', 'num'),
+    ('detectionLatencyMs', 'int64', 'int'),
+    ('sampleIntervalMs', 'int64', 'int'),
+    ('extra', 'string', None),
+    ('format', 'string', None),
+)
+EVENT_REQUIRED = ('deviceId', 'severity', 'eventTs', 'temp', 'vib')
+EVENT_DETAILS = ('temp', 'vib', 'distance', 'alerts', 'baselineVib', 'driftPct',
+                 'detectionLatencyMs', 'sampleIntervalMs')
+
+SNAPSHOT_COLUMNS = (
+    ('deviceId', 'string', None),
+    ('id', 'int64', None),
+    ('ts', 'int64', None),
+    ('rateHz', 'int64', None),
+    ('preSamples', 'int64', None),
+    ('lsbPerG', 'int64', None),
+    ('codes', 'int16s', None),
+)
+
+COLUMNS = {TELEMETRY: TELEMETRY_COLUMNS, EVENTS: EVENT_COLUMNS, SNAPSHOTS: SNAPSHOT_COLUMNS}
+KINDS = {table: {name: kind for name, kind, _ in columns} for table, columns in COLUMNS.items()}
+TIME_COLUMN = {TELEMETRY: 'ts', EVENTS: 'eventTs', SNAPSHOTS: 'ts'}
+
+
+def arrow_schema(table):
+    types = {'string': pa.string(), 'int64': pa.int64(), 'float64': pa.float64(),
+             'floats': pa.list_(pa.float32()), 'strings': pa.list_(pa.string()),
+             'int16s': pa.list_(pa.int16())}
+    return pa.schema([(name, types[kind]) for name, kind, _ in COLUMNS[table]])
+
+
+def problem(value, rule):
+    """Why value breaks rule, or None"""
+    if rule == 'str':
+        return None if isinstance(value, str) else 'not a string'
+    if isinstance(rule, tuple):
+        return None if value in rule else 'unknown value'
+    if rule == 'nums':
+        if not isinstance(value, list):
+            return 'not a list'
+        rule = 'num'
+        values = value
+    else:
+        values = (value,)
+    for v in values:
+        # A decoded true or false must not pass as 1 or 0
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            return 'not a number'
+        if isinstance(v, float) and not math.isfinite(v):
+            return 'not finite'
+        if rule == 'int' and v != int(v):
+            return 'not a whole number'
+    return None
+
+
+def check(record, columns, required):
+    """None if the record fits the columns, else the reason; whole numbers
+    sent as floats (2.0) are made ints on the way"""
+    for name in required:
+        if record.get(name) is None:
+            return 'missing ' + name
+    for name, _, rule in columns:
+        value = record.get(name)
+        if value is not None and rule is not None:
+            why = problem(value, rule)
+            if why is not None:
+                return '{} {}'.format(name, why)
+            if rule == 'int':
+                record[name] = int(value)
+    return None
+
+
+# ============================================================================
+# BUCKETS AND SINKS
+# ============================================================================
+
+class Bucket:
+    """Rows of one table, device and time window, column by column.
+
+    Numbers are kept in typed arrays (8 bytes a value, NaN or NULL_INT
+    standing for null: validation has already turned real NaNs away), text
+    as lists of interned strings, and a column only once some row has it.
+    deviceId is the bucket's own and is not stored per row."""
+
+    def __init__(self, table, device_id, start_ms, now):
+        self.table = table
+        self.device_id = device_id
+        self.start_ms = start_ms
+        self.kinds = KINDS[table]
+        self.cols = {}
+        self.rows = 0
+        self.touched = now
+
+    def add(self, row, now):
+        n = self.rows
+        cols = self.cols
+        for name, value in row.items():
+            kind = self.kinds.get(name)
+            if kind is None or value is None:
+                continue
+            col = cols.get(name)
+            if col is None:
+                col = cols[name] = _column(kind)
+            if len(col) < n:
+                col.extend(_nulls(kind, n - len(col)))
+            col.append(sys.intern(value) if kind == 'string' else value)
+        self.rows = n + 1
+        self.touched = now
+
+    def arrow(self):
+        n = self.rows
+        schema = arrow_schema(self.table)
+        arrays = []
+        for field in schema:
+            kind = self.kinds[field.name]
+            col = self.cols.get(field.name)
+            if field.name == 'deviceId':
+                arrays.append(pa.repeat(self.device_id, n))
+                continue
+            if col is None:
+                arrays.append(pa.nulls(n, field.type))
+                continue
+            col.extend(_nulls(kind, n - len(col)))
+            if kind == 'float64':
+                values = pa.Array.from_buffers(field.type, n, [None, pa.py_buffer(col)])
+                arrays.append(pc.if_else(pc.is_nan(values), pa.scalar(None, field.type), values))
+            elif kind == 'int64':
+                values = pa.Array.from_buffers(field.type, n, [None, pa.py_buffer(col)])
+                arrays.append(pc.if_else(pc.equal(values, NULL_INT),
+                                         pa.scalar(None, field.type), values))
+            else:
+                arrays.append(pa.array(col, field.type))
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _column(kind):
+    if kind == 'float64':
+        return array('d')
+    if kind == 'int64':
+        return array('q')
+    return []
+
+
+def _nulls(kind, n):
+    if kind == 'float64':
+        return array('d', [NAN]) * n
+    if kind == 'int64':
+        return array('q', [NULL_INT]) * n
+    return [None] * n
+
+
+class PartitionedSink:
+    """Files under root/table/deviceId=.../bucket=.../, one per part"""
+
+    suffix = ''
+
+    def __init__(self, root):
+        self.root = root
+        self.run = int(time.time() * 1000)
+        self.parts = 0
+
+    def path(self, table, device_id, start_ms):
+        folder = os.path.join(self.root, table, 'deviceId=' + device_id,
+                              'bucket={}'.format(start_ms))
+        os.makedirs(folder, exist_ok=True)
+        self.parts += 1
+        return os.path.join(folder, 'part-{}-{:06d}{}'.format(self.run, self.parts, self.suffix))
+
+    def write(self, table, device_id, start_ms, data):
+        path = self.path(table, device_id, start_ms)
+        tmp = path + '.tmp'
+        self._write(tmp, data)
+        os.replace(tmp, path)   # readers never see half a file
+        return os.path.getsize(path)
+
+
+class ParquetSink(PartitionedSink):
+    suffix = '.parquet'
+
+    def _write(self, path, data):
+        pq.write_table(data, path, compression='zstd')
+
+
+class ArrowSink(PartitionedSink):
+    suffix = '.arrow'
+
+    def _write(self, path, data):
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.OSFile(path, 'wb') as f:
+            with pa.ipc.new_file(f, data.schema, options=options) as writer:
+                writer.write_table(data)
+
+
+class MemorySink:
+    """Keeps every part: (table, deviceId, bucket start, arrow table)"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, table, device_id, start_ms, data):
+        self.parts.append((table, device_id, start_ms, data))
+        return data.nbytes
+
+
+class NullSink:
+    def write(self, table, device_id, start_ms, data):
+        return 0
+
+
+def read_parts(root, table, device_id=None, columns=None):
+    """Every part a partitioned sink wrote for table (or for one device of
+    it), as one Arrow table"""
+    folder = os.path.join(root, table)
+    if device_id is not None:
+        folder = os.path.join(folder, 'deviceId=' + device_id)
+    schema = arrow_schema(table)
+    if columns is not None:
+        schema = pa.schema([schema.field(name) for name in columns])
+    parts = []
+    for path, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            if name.endswith('.parquet'):
+                parts.append(pq.read_table(os.path.join(path, name), columns=columns,
+                                           schema=schema))
+            elif name.endswith('.arrow'):
+                with pa.memory_map(os.path.join(path, name)) as f:
+                    data = pa.ipc.open_file(f).read_all()
+                parts.append(data.select(columns) if columns is not None else data)
+    if not parts:
+        return schema.empty_table()
+    return pa.concat_tables(parts)
+
+
+# ============================================================================
+# INGEST
+# ============================================================================
+
+class Stats:
+    def __init__(self):
+        self.messages = 0
+        self.bytes_in = 0
+        self.rows = {TELEMETRY: 0, EVENTS: 0, SNAPSHOTS: 0}
+        self.rejected = {}     # reason -> records
+        self.duplicates = 0
+        self.parts = 0
+        self.bytes_out = 0
+
+    def reject(self, reason, n=1):
+        self.rejected[reason] = self.rejected.get(reason, 0) + n
+
+
+class Ingest:
+    """Decodes payloads into rows and hands full buckets to a sink"""
+
+    def __init__(self, sink, bucket_ms=3600000, max_rows=50000, linger_s=60.0,
+                 clock=time.monotonic):
+        self.sink = sink
+        self.bucket_ms = bucket_ms
+        self.max_rows = max_rows
+        self.linger_s = linger_s
+        self.clock = clock
+        self.buckets = {}      # (table, deviceId, start ms) -> Bucket
+        self.seen = {}         # deviceId -> {eventId: None}, oldest first
+        self.snapshots = Reassembler()
+        self.stats = Stats()
+
+    # -- rows --
+
+    def _add(self, table, row):
+        start = row[TIME_COLUMN[table]] // self.bucket_ms * self.bucket_ms
+        key = (table, row['deviceId'], start)
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(table, row['deviceId'], start, now)
+        bucket.add(row, now)
+        self.stats.rows[table] += 1
+        if bucket.rows >= self.max_rows:
+            self._flush(key)
+
+    def _flush(self, key):
+        bucket = self.buckets.pop(key)
+        self.stats.bytes_out += self.sink.write(bucket.table, bucket.device_id,
+                                                bucket.start_ms, bucket.arrow())
+        self.stats.parts += 1
+
+    def poll(self):
+        """Write the buckets no row came to for linger_s"""
+        now = self.clock()
+        for key in [k for k, b in self.buckets.items() if now - b.touched >= self.linger_s]:
+            self._flush(key)
+
+    def close(self):
+        for key in list(self.buckets):
+            self._flush(key)
+
+    def open_rows(self):
+        return sum(b.rows for b in self.buckets.values())
+
+    # -- messages --
+
+    def handle(self, topic, payload):
+        """Take one MQTT message; returns the event IDs to acknowledge"""
+        self.stats.messages += 1
+        self.stats.bytes_in += len(payload)
+        if not payload:
+            self.stats.reject('empty payload')
+            return ()
+        fmt = 'snapshot' if topic == TOPIC_SNAPSHOTS else detect_format(payload)
+        try:
+            if topic == TOPIC_SNAPSHOTS:
+                snap = self.snapshots.add(payload)
+                if snap is not None:
+                    self._add(SNAPSHOTS, snap)
+                return ()
+            msg = decode(payload)
+        except (ValueError, KeyError, IndexError, struct.error):
+            self.stats.reject('undecodable ' + fmt)
+            return ()
+        if not isinstance(msg, dict):
+            self.stats.reject('not an object')
+            return ()
+        if topic == TOPIC_EVENTS:
+            return self._event(msg, fmt, fmt == 'struct' and payload[1] < 5)
+        if topic == TOPIC_TELEMETRY:
+            self._reading(msg, topic, fmt)
+        elif topic in (TOPIC_TELEMETRY_BATCH, TOPIC_REPLAY):
+            self._batch(msg, topic, fmt)
+        else:
+            self.stats.reject('unknown topic')
+        return ()
+
+    def _reading(self, row, topic, fmt):
+        why = check(row, TELEMETRY_COLUMNS, TELEMETRY_REQUIRED)
+        if why is not None:
+            self.stats.reject(why)
+            return
+        row['topic'] = topic
+        row['format'] = fmt
+        self._add(TELEMETRY, row)
+
+    def _batch(self, msg, topic, fmt):
+        for name in ('deviceId', 'ts0') + BATCH_ROWS:
+            if msg.get(name) is None:
+                self.stats.reject('missing ' + name)
+                return
+        names = BATCH_ROWS + tuple(name for name in BATCH_OPTIONAL_ROWS if name in msg)
+        columns = [msg[name] for name in names]
+        n = len(columns[0])
+        if not all(isinstance(c, list) and len(c) == n for c in columns):
+            self.stats.reject('ragged batch')
+            return
+        ts0 = msg['ts0']
+        if problem(ts0, 'int') is not None:
+            self.stats.reject('ts0 not a whole number')
+            return
+        shared = {name: msg[name] for name in BATCH_REPEATED if name in msg}
+        shared['deviceId'] = msg['deviceId']
+        last = {name: v for name, v in msg.items() if name not in names}
+        for i in range(n):
+            row = dict(last) if i == n - 1 else dict(shared)
+            for name, column in zip(names, columns):
+                row[name] = column[i]
+            if problem(row['ts'], 'int') is None:
+                row['ts'] += ts0
+            self._reading(row, topic, fmt)
+
+    def _event(self, msg, fmt, legacy=False):
+        details = msg.get('details')
+        if not isinstance(details, dict):
+            self.stats.reject('missing details')
+            return ()
+        row = {name: msg.get(name) for name in ('deviceId', 'eventId', 'eventType',
+                                                 'severity', 'message', 'eventTs')}
+        row['eventId'] = row['eventId'] or None    # 0: sent by a node without IDs
+        for name in EVENT_DETAILS:
+            row[name] = details.get(name)
+        extra = {k: v for k, v in details.items() if k not in EVENT_DETAILS}
+        row['extra'] = json.dumps(extra, sort_keys=True) if extra else None
+        row['format'] = fmt
+        # Every format names the event type but struct before version 5
+        required = EVENT_REQUIRED if legacy else EVENT_REQUIRED + ('eventType',)
+        why = check(row, EVENT_COLUMNS, required)
+        alerts = row['alerts']
+        if why is None and alerts is not None and not (
+                isinstance(alerts, list) and all(isinstance(a, str) for a in alerts)):
+            why = 'alerts not a list of strings'
+        if why is not None:
+            self.stats.reject(why)
+            return ()
+        event_id = row['eventId']
+        if event_id is None:
+            self._add(EVENTS, row)
+            return ()
+        seen = self.seen.setdefault(row['deviceId'], {})
+        if event_id in seen:
+            self.stats.duplicates += 1
+        else:
+            seen[event_id] = None
+            if len(seen) > DEDUP_IDS:
+                del seen[next(iter(seen))]
+            self._add(EVENTS, row)
+        # Every copy is acknowledged: the node retries when an ack was lost
+        return ((row['deviceId'], event_id),)
+
+
+# ============================================================================
+# SERVICE
+# ============================================================================
+
+def make_sink(kind, root):
+    if kind == 'parquet':
+        return ParquetSink(root)
+    if kind == 'arrow':
+        return ArrowSink(root)
+    return NullSink()
+
+
+def report(ingest, elapsed):
+    s = ingest.stats
+    rejected = sum(s.rejected.values())
+    print('{:.0f} s: {} messages ({:.0f}/s), rows {}, {} parts, {:.1f} KB in, {:.1f} KB out, '
+          '{} duplicate events, {} rejected, {} rows open for {} devices'.format(
+              elapsed, s.messages, s.messages / max(elapsed, 1e-9), s.rows, s.parts,
+              s.bytes_in / 1024, s.bytes_out / 1024, s.duplicates, rejected,
+              ingest.open_rows(), len(ingest.seen)))
+    for reason, n in sorted(s.rejected.items()):
+        print('  rejected {:>6}  {}'.format(n, reason))
+
+
+async def serve(args, ingest):
+    from fleet_load import MqttConn
+    host, _, port = args.broker.partition(':')
+    conn = MqttConn(host, int(port or 1883), 'aegis-ingest-{}'.format(int(time.time())))
+    await conn.connect()
+    acks = []
+
+    def on_message(topic, payload):
+        ids = ingest.handle(topic, payload)
+        if args.ack:
+            acks.extend(ids)
+    conn.on_message = on_message
+    for topic in TOPICS:
+        await conn.subscribe(topic)
+    next_report = time.monotonic() + args.report_s
+    try:
+        while conn.writer is not None and not conn.reader_task.done():
+            while acks:
+                device, event_id = acks.pop(0)
+                body = json.dumps({'deviceId': device, 'eventId': event_id}).encode()
+                await conn.publish(TOPIC_EVENT_ACKS + device, body, 1)
+            ingest.poll()
+            now = time.monotonic()
+            if now >= next_report:
+                report(ingest, now - args.started)
+                next_report = now + args.report_s
+            await asyncio.sleep(0.05)
+    finally:
+        ingest.close()
+        await conn.close()
+    print('connection closed')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write node telemetry to columnar files')
+    parser.add_argument('--broker', default='localhost:1883')
+    parser.add_argument('--out', default='ingest')
+    parser.add_argument('--sink', default='parquet', choices=('parquet', 'arrow', 'null'))
+    parser.add_argument('--bucket-s', type=int, default=3600)
+    parser.add_argument('--max-rows', type=int, default=50000)
+    parser.add_argument('--linger-s', type=float, default=60.0)
+    parser.add_argument('--ack', action='store_true',
+                        help='acknowledge events on aegisone/events/ack/<deviceId>')
+    parser.add_argument('--report-s', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if pa is None:
+        print('pyarrow not found: pip install pyarrow')
+        return 2
+    ingest = Ingest(make_sink(args.sink, args.out), args.bucket_s * 1000, args.max_rows,
+                    args.linger_s)
+    args.started = time.monotonic()
+    try:
+        asyncio.run(serve(args, ingest))
+    except KeyboardInterrupt:
+        ingest.close()
+    report(ingest, time.monotonic() - args.started)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+# ============================================================================
+# AegisOne Ingest Benchmark
+# Builds a fleet's payloads with fleet_load (the firmware's own publish
+# functions, in any WIRE_FORMAT, as single readings or batches, with an
+# alert storm whose events are partly retried) and measures ingest.py on
+# them: messages and rows per second through decoding, validation and the
+# sink, bytes on disk against bytes on the wire, and memory per device
+# while every device has a bucket open. With --e2e the fleet publishes over
+# one MQTT connection per device through the in-process broker and the
+# ingest is the subscriber: the rate it sustains is what it keeps up with.
+# Needs pyarrow.
+#
+#   python3 m5core2-uiflow/host/ingest_bench.py [--devices 1000] [--rounds 30]
+#       [--batch] [--sink parquet|arrow|null] [--set WIRE_FORMAT=cbor]
+#       [--e2e [--seconds 20] [--rate 1]]
+# ============================================================================
+
+import argparse
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import stubs
+
+stubs.install()
+
+from aegis_batch import TelemetryBatch
+from fleet_load import Fleet, NullFleet, parse_setting
+from ingest import Ingest, NullSink, make_sink
+from sim import Simulator
+
+STORM_FRACTION = 0.2
+RETRY_FRACTION = 0.3      # storm events sent twice (the ack was lost)
+
+
+class BatchFleet(NullFleet):
+    """NullFleet whose devices each keep their own telemetry batch"""
+
+    def build(self, dev, publish, *args):
+        if not hasattr(dev, 'batch'):
+            dev.batch = TelemetryBatch(dev.id, self.fw.BATCH_MAX_READINGS, 1 << 30, 1 << 20)
+        self.fw.telemetry_batch = dev.batch
+        return NullFleet.build(self, dev, publish, *args)
+
+
+def fleet_args(args, target='null'):
+    return argparse.Namespace(devices=args.devices, seconds=args.seconds, target=target,
+                              rate=args.rate, qos=1, connections=1, storm=None,
+                              storm_rate=1.0, reconnect=None, seed=17)
+
+
+def payloads(sim, fw, args):
+    """(topic, bytes) of every message the fleet sends in args.rounds rounds"""
+    fleet = BatchFleet(fw, fleet_args(args))
+    out = []
+    per_round = fw.BATCH_MAX_READINGS if args.batch else 1
+    storm = set(fleet.rng.sample(range(args.devices), int(args.devices * STORM_FRACTION)))
+    for r in range(args.rounds):
+        for i in range(per_round):
+            if args.batch:
+                for dev in fleet.devices:
+                    fleet.build(dev, fw.add_to_batch)
+            sim.clock.advance_us(1e6)
+        publish = fw.flush_batch if args.batch else fw.publish_telemetry
+        for k, dev in enumerate(fleet.devices):
+            out.extend(fleet.build(dev, publish))
+            if k in storm and r == args.rounds // 3:
+                sent = fleet.build(dev, fw.publish_event, "CRITICAL", "Critical threshold exceeded")
+                out.extend(sent)
+                if fleet.rng.random() < RETRY_FRACTION:
+                    out.extend(sent)
+    return [(topic, p.encode() if isinstance(p, str) else p) for topic, p in out]
+
+
+def offline(sim, fw, args):
+    messages = payloads(sim, fw, args)
+    size = sum(len(p) for _, p in messages)
+    root = tempfile.mkdtemp(prefix='aegis-ingest-')
+    try:
+        ingest = Ingest(make_sink(args.sink, root), max_rows=1 << 30, linger_s=1e9)
+        t0 = time.perf_counter()
+        for topic, payload in messages:
+            ingest.handle(topic, payload)
+        decoded = time.perf_counter() - t0
+        ingest.close()
+        total = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    s = ingest.stats
+    rows = sum(s.rows.values())
+    print('{} devices x {} rounds, {} ({}): {} messages, {:.1f} KB, {} rows'.format(
+        args.devices, args.rounds, fw.WIRE_FORMAT, 'batches' if args.batch else 'single',
+        len(messages), size / 1024, rows))
+    print('  decode + validate   {:>9.0f} msg/s  {:>9.0f} rows/s'.format(
+        len(messages) / decoded, rows / decoded))
+    print('  + {:<16} {:>9.0f} msg/s  {:>9.0f} rows/s  ({} parts, {:.1f} KB on disk, '
+          '{:.2f} of the payload bytes)'.format(
+              args.sink, len(messages) / total, rows / total, s.parts, s.bytes_out / 1024,
+              s.bytes_out / size))
+    print('  events: {} stored, {} duplicates, {} rejected'.format(
+        s.rows['events'], s.duplicates, sum(s.rejected.values())))
+
+    # Memory held by the open buckets (every device has one), measured half
+    # way and at the end: the growth is per row, the rest per device
+    ingest = Ingest(NullSink(), max_rows=1 << 30, linger_s=1e9)
+    half = len(messages) // 2
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    points = []
+    for k, (topic, payload) in enumerate(messages, 1):
+        ingest.handle(topic, payload)
+        if k in (half, len(messages)):
+            points.append((tracemalloc.get_traced_memory()[0] - base, ingest.open_rows()))
+    tracemalloc.stop()
+    (held1, rows1), (held2, rows2) = points
+    per_row = (held2 - held1) / max(rows2 - rows1, 1)
+    per_device = (held2 - per_row * rows2) / args.devices
+    print('  open buckets: {:.1f} KB per device with {} rows each: {:.0f} B per row '
+          '+ {:.1f} KB per device'.format(held2 / 1024 / args.devices, rows2 // args.devices,
+                                         per_row, per_device / 1024))
+    return rows > 0 and not s.rejected
+
+
+class IngestFleet(Fleet):
+    """Fleet whose monitor connection feeds every message to an ingest"""
+
+    def __init__(self, fw, args, ingest):
+        Fleet.__init__(self, fw, args)
+        self.ingest = ingest
+        self.busy = 0.0
+
+    def on_message(self, topic, payload):
+        Fleet.on_message(self, topic, payload)
+        t0 = time.perf_counter()
+        self.ingest.handle(topic, payload)
+        self.busy += time.perf_counter() - t0
+
+
+def end_to_end(fw, args):
+    root = tempfile.mkdtemp(prefix='aegis-ingest-')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        ingest = Ingest(make_sink(args.sink, root), linger_s=args.seconds / 4)
+        fleet = IngestFleet(fw, fleet_args(args, 'mqtt-sink'), ingest)
+        fleet.args.storm = (args.seconds / 3, args.seconds / 3, STORM_FRACTION)
+        fleet.args.storm_rate = 5.0
+        wall = loop.run_until_complete(fleet.run())
+        open_rows = ingest.open_rows()
+        ingest.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    s = ingest.stats
+    sent = sum(fleet.stats.sent.values())
+    print('{} devices over MQTT for {:.1f} s ({}): {} sent, {} ingested'.format(
+        args.devices, wall, fw.WIRE_FORMAT, sent, s.messages))
+    busy = fleet.busy / wall
+    print('  sustained {:.0f} msg/s, {:.0f} rows/s with the ingest busy {:.0f}% of the time '
+          '(room for about {:.0f} msg/s)'.format(
+              s.messages / wall, sum(s.rows.values()) / wall, 100 * busy,
+              s.messages / wall / max(busy, 1e-9)))
+    print('  {} rows open at the end ({:.1f} per device), {} parts'.format(
+        open_rows, open_rows / args.devices, s.parts))
+    return s.messages == sent and not s.rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the ingest service')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=30, help='messages per device')
+    parser.add_argument('--batch', action='store_true', help='send TelemetryBatch messages')
+    parser.add_argument('--sink', default='parquet', choices=('parquet', 'arrow', 'null'))
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a firmware setting (e.g. WIRE_FORMAT=cbor)')
+    parser.add_argument('--e2e', action='store_true', help='through MQTT as the fleet runs')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--rate', type=float, default=1.0, help='telemetry messages/s per device')
+    args = parser.parse_args()
+
+    sim = Simulator([(0, 27.0, 0.3, 180.0, 90)])
+    fw = sim.load(dict(parse_setting(s) for s in args.set))
+    fw.DEADBAND_ENABLED = False
+    ok = end_to_end(fw, args) if args.e2e else offline(sim, fw, args)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+# ============================================================================
+# AegisOne Ingest Harness
+# Runs the firmware in the simulator through a CRITICAL vibration episode
+# and a network outage in every wire format (batches, the replay after the
+# outage, single readings with batching off, events, a snapshot) and feeds
+# what it published to ingest.py. Every reading, event and waveform must
+# come back from the Parquet and the Arrow files exactly as decoding the
+# payloads gives it, and the node state (rate, loop lag, link and outbox
+# counters) must reach the table in every format. Then payloads that break
+# the dashboard's types must be rejected under their reason without losing
+# the valid rows next to them, and buckets must split on the hour, on
+# max_rows and on linger, with retried events stored once and acknowledged
+# every time.
+# Needs pyarrow.
+#
+#   python3 m5core2-uiflow/host/ingest_harness.py
+# ============================================================================
+
+import contextlib
+import io
+import json
+import sys
+import tempfile
+
+import stubs
+
+stubs.install()
+
+from aegis_snap import Reassembler
+from aegis_wire import WireEncoder, decode, FORMAT_STRUCT
+from ingest import (Ingest, ParquetSink, ArrowSink, MemorySink, read_parts, DEDUP_IDS, TOPICS,
+                    TOPIC_TELEMETRY, TOPIC_TELEMETRY_BATCH, TOPIC_EVENTS, TOPIC_SNAPSHOTS)
+from sim import Simulator
+
+HOUR_MS = 3600000
+RUNS = (('json', True), ('struct', True), ('cbor', True), ('json', False))
+NODE_STATE = ('rate', 'sampleMs', 'loopLagMs', 'reconnects', 'offlineMs', 'eventQueue')
+
+
+def episode():
+    """Steady machine, 2.8 g (CRITICAL) from 100 s to 130 s, offline 160-200 s"""
+    return [(s * 1000, 28.0, 2.8 if 100 <= s < 130 else 0.3, 180.0, 70) for s in range(300)]
+
+
+def node_messages(fmt, batch):
+    sim = Simulator(episode(), outages=[(160, 200)])
+    sim.load({'WIRE_FORMAT': fmt, 'BATCH_ENABLED': batch, 'DEADBAND_ENABLED': False})
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(300)
+    return [(topic, p.encode() if isinstance(p, str) else p)
+            for _, topic, p in sim.bus.messages if topic in TOPICS]
+
+
+def expected(messages):
+    """Readings, event IDs and snapshot codes, decoded straight from the payloads"""
+    readings = []
+    events = set()
+    snaps = []
+    asm = Reassembler()
+    for topic, payload in messages:
+        if topic == TOPIC_SNAPSHOTS:
+            snap = asm.add(payload)
+            if snap is not None:
+                snaps.append(snap['codes'])
+            continue
+        msg = decode(payload)
+        if topic == TOPIC_EVENTS:
+            events.add(msg['eventId'])
+        elif topic == TOPIC_TELEMETRY:
+            readings.append((msg['ts'], msg['temp'], msg['vib'], msg['status'],
+                             msg['proximity']))
+        else:
+            readings.extend((msg['ts0'] + dt, t, v, s, p) for dt, t, v, s, p in
+                            zip(msg['ts'], msg['temp'], msg['vib'], msg['status'],
+                                msg['proximity']))
+    return sorted(readings), events, snaps
+
+
+def check_run(fmt, batch):
+    messages = node_messages(fmt, batch)
+    readings, events, snaps = expected(messages)
+    topics = sorted({t.rsplit('/', 1)[-1] for t, _ in messages})
+    ok = bool(readings) and bool(events) and len(snaps) == 1
+    for sink in (ParquetSink, ArrowSink):
+        root = tempfile.mkdtemp(prefix='aegis-ingest-')
+        ingest = Ingest(sink(root))
+        for topic, payload in messages:
+            ingest.handle(topic, payload)
+        ingest.close()
+        s = ingest.stats
+        tel = read_parts(root, 'telemetry').to_pydict()
+        got = sorted(zip(tel['ts'], tel['temp'], tel['vib'], tel['status'], tel['proximity']))
+        ev = read_parts(root, 'events').to_pydict()
+        codes = read_parts(root, 'snapshots').column('codes').to_pylist()
+        typed = all(t is not None for t in ev['eventType'])
+        typed &= all(a is not None for a in ev['alerts'])
+        typed &= all(any(v is not None for v in tel[name]) for name in NODE_STATE)
+        typed &= max(v or 0 for v in tel['reconnects']) >= 1
+        same = got == readings and sorted(ev['eventId']) == sorted(events) and codes == snaps
+        ok &= same and typed and not s.rejected and set(tel['format']) == {fmt}
+        print('  {:<6} {:<8} {:>3} messages ({}): {} readings, {} events, {} snapshot; '
+              '{:>6} B in, {:>6} B as {} {} files {}'.format(
+                  fmt, 'batch' if batch else 'single', s.messages, ', '.join(topics),
+                  len(got), len(ev['eventId']), len(codes), s.bytes_in, s.bytes_out, s.parts,
+                  sink.suffix[1:], '' if same and typed else 'MISMATCH'))
+    return ok
+
+
+def reading(ts, **fields):
+    row = {'deviceId': 'node-a', 'ts': ts, 'temp': 28.0, 'vib': 0.3, 'distance': 180.0,
+           'status': 'RUNNING'}
+    row.update(fields)
+    return json.dumps(row).encode()
+
+
+def check_rejects():
+    ingest = Ingest(MemorySink())
+    batch = {'deviceId': 'node-a', 'ts0': 1000, 'ts': [0, 1000, 2000],
+             'temp': [28.0, 28.1, 28.2], 'vib': [0.3, 0.3, 0.3],
+             'distance': [180.0, 180.0, 180.0], 'status': ['RUNNING', 'BROKEN', 'RUNNING'],
+             'battery': 70, 'vibRms': 0.31}
+    ragged = dict(batch, temp=[28.0])
+    wire = WireEncoder('node-a', FORMAT_STRUCT)
+    good_struct = bytes(wire.telemetry(5000, 28.0, 0.3, 180.0, 'RUNNING', 'SAFE', 70))
+    cases = (
+        (TOPIC_TELEMETRY, reading(1000, temp=None), 'missing temp'),
+        (TOPIC_TELEMETRY, reading(1000, status='BROKEN'), 'status unknown value'),
+        (TOPIC_TELEMETRY, reading(1000, vib=float('nan')), 'vib not finite'),
+        (TOPIC_TELEMETRY, reading(1000, battery=True), 'battery not a number'),
+        (TOPIC_TELEMETRY, reading(1000.5), 'ts not a whole number'),
+        (TOPIC_TELEMETRY, reading(1000, vibBands=[0.1, 'x']), 'vibBands not a number'),
+        (TOPIC_TELEMETRY_BATCH, json.dumps(ragged).encode(), 'ragged batch'),
+        (TOPIC_TELEMETRY, b'{"deviceId": ', 'undecodable json'),
+        (TOPIC_TELEMETRY, b'\xae\x09\x01', 'undecodable struct'),   # unknown version
+        (TOPIC_TELEMETRY, good_struct[:12], 'undecodable struct'),    # cut short
+        (TOPIC_TELEMETRY, b'', 'empty payload'),
+        (TOPIC_EVENTS, b'{"deviceId": "node-a", "severity": "INFO", "eventTs": 1}',
+         'missing details'),
+        (TOPIC_EVENTS, json.dumps({'deviceId': 'node-a', 'severity': 'INFO', 'eventTs': 1,
+                                   'eventId': 5, 'details': {'temp': 1, 'vib': 0}}).encode(),
+         'missing eventType'),
+        (TOPIC_SNAPSHOTS, b'\xae\x01\x01\x00', 'undecodable snapshot'),
+    )
+    for topic, payload, _ in cases:
+        ingest.handle(topic, payload)
+    # One bad row in a batch costs that row only
+    ingest.handle(TOPIC_TELEMETRY_BATCH, json.dumps(batch).encode())
+    ingest.handle(TOPIC_TELEMETRY, good_struct)
+    ingest.close()
+
+    want = {}
+    for _, _, reason in cases:
+        want[reason] = want.get(reason, 0) + 1
+    want['status unknown value'] += 1
+    rows = [r for part in ingest.sink.parts for r in part[3].to_pylist()]
+    ok = ingest.stats.rejected == want
+    ok &= [r['ts'] for r in rows] == [1000, 3000, 5000]
+    # Message-level fields: battery on every row, features on the last one only
+    ok &= [r['battery'] for r in rows[:2]] == [70, 70] and rows[1]['vibRms'] == 0.31
+    ok &= rows[0]['vibRms'] is None and rows[2]['format'] == 'struct'
+    for reason, n in sorted(ingest.stats.rejected.items()):
+        print('  rejected {}  {}'.format(n, reason))
+    if ingest.stats.rejected != want:
+        print('  expected {}'.format(want))
+    print('  kept {} of the batch\'s 3 rows and the struct reading'.format(len(rows) - 1))
+    return ok
+
+
+class Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def event(event_id, ts, device='node-a'):
+    return json.dumps({'deviceId': device, 'eventId': event_id, 'eventType': 'THRESHOLD',
+                       'severity': 'CRITICAL', 'message': 'm', 'eventTs': ts,
+                       'details': {'temp': 28.0, 'vib': 2.8, 'distance': 180.0, 'alerts': ['vib'],
+                                   'durationMs': 5}}).encode()
+
+
+def check_buckets():
+    clock = Clock()
+    sink = MemorySink()
+    ingest = Ingest(sink, HOUR_MS, max_rows=5, linger_s=60, clock=clock)
+    start = 10 * HOUR_MS - 3000
+    for i in range(6):                          # 3 before the hour, 3 after
+        ingest.handle(TOPIC_TELEMETRY, reading(start + 1000 * i))
+    ingest.handle(TOPIC_TELEMETRY, reading(start, deviceId='node-b'))
+    ok = not sink.parts and ingest.open_rows() == 7
+    clock.t = 30
+    for i in range(4):                          # fills the second hour to max_rows
+        ingest.handle(TOPIC_TELEMETRY, reading(start + 6000 + 1000 * i))
+    ok &= [(p[1], p[2], p[3].num_rows) for p in sink.parts] == [('node-a', 10 * HOUR_MS, 5)]
+    clock.t = 95                                # the first hour and node-b linger out
+    ingest.poll()
+    ok &= sorted((p[1], p[2], p[3].num_rows) for p in sink.parts[1:]) == [
+        ('node-a', 9 * HOUR_MS, 3), ('node-a', 10 * HOUR_MS, 2), ('node-b', 9 * HOUR_MS, 1)]
+    ingest.handle(TOPIC_TELEMETRY, reading(start + 500))   # late: a new part
+    ingest.close()
+    last = sink.parts[-1]
+    ok &= len(sink.parts) == 5 and (last[2], last[3].num_rows) == (9 * HOUR_MS, 1)
+    print('  {} parts: {}'.format(len(sink.parts), ', '.join(
+        '{} h{} x{}'.format(p[1], p[2] // HOUR_MS, p[3].num_rows) for p in sink.parts)))
+
+    ingest = Ingest(MemorySink())
+    acks = []
+    for payload in (event(7, 1000), event(7, 1000), event(7, 1000, 'node-b'), event(8, 2000)):
+        acks.extend(ingest.handle(TOPIC_EVENTS, payload))
+    for i in range(DEDUP_IDS):                  # pushes event 7 of node-a out of the window
+        ingest.handle(TOPIC_EVENTS, event(100 + i, 3000))
+    acks.extend(ingest.handle(TOPIC_EVENTS, event(7, 1000)))
+    ingest.close()
+    rows = [r for part in ingest.sink.parts for r in part[3].to_pylist()]
+    ok &= acks == [('node-a', 7), ('node-a', 7), ('node-b', 7), ('node-a', 8), ('node-a', 7)]
+    ok &= ingest.stats.duplicates == 1
+    ok &= len(rows) == 3 + DEDUP_IDS + 1
+    ok &= rows[0]['alerts'] == ['vib'] and json.loads(rows[0]['extra']) == {'durationMs': 5}
+    print('  events: ID 7 sent 4 times by 2 nodes, acknowledged {} times, {} duplicate dropped, '
+          'stored again after {} newer IDs'.format(len(acks) - 1, ingest.stats.duplicates,
+                                                   DEDUP_IDS))
+    return ok
+
+
+def main():
+    results = []
+    print('simulated node, every wire format, Parquet and Arrow files')
+    for fmt, batch in RUNS:
+        results.append(check_run(fmt, batch))
+    print('invalid records')
+    results.append(check_rejects())
+    print('buckets and duplicates')
+    results.append(check_buckets())
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
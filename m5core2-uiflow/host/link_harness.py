@@ -0,0 +1,165 @@
+# ============================================================================
+# AegisOne Connection Supervisor Harness
+# Checks the firmware's jittered backoff (bounds, cap, reset after a stable
+# link, growth while flapping), how a floor of nodes that lose the link
+# together spreads its reconnects, and the Link offline accounting. Then
+# runs the real firmware in the simulator against a broker that drops
+# every connection on purpose (and a WiFi outage) and checks that the
+# node reconnects each time, subscribes to commands again, replays what
+# it queued and reports reconnects and offline time in telemetry.
+#
+#   python3 m5core2-uiflow/host/link_harness.py
+# ============================================================================
+
+import contextlib
+import io
+import json
+import random
+import sys
+
+import stubs
+
+stubs.install()
+
+import traces
+from aegis_link import Backoff, Link
+from sim import Simulator
+
+BASE_MS = 5000
+CAP_MS = 300000
+FLOOR = 1000          # nodes that lose power together
+OUTAGE = (300, 600)   # WiFi down (simulation seconds)
+DROPS = (900, 1500)   # broker closes every connection
+COMMANDS = (200, 450, 1300, 2000)
+RUN_S = 2400
+
+
+def check_backoff():
+    ok = True
+    b = Backoff(BASE_MS, CAP_MS)
+    for attempt in range(12):
+        ceiling = b.ceiling_ms()
+        delays = []
+        for _ in range(200):
+            b.attempt = attempt
+            delays.append(b.next_ms())
+        inside = all(0 <= d < ceiling for d in delays)
+        spread = max(delays) - min(delays)
+        print('  attempt {:>2}: ceiling {:>6} ms, delays {:>6}..{:>6} ms'.format(
+            attempt, ceiling, min(delays), max(delays)))
+        ok &= inside and ceiling <= CAP_MS and spread > ceiling // 2
+    b.attempt = 40
+    ok &= b.ceiling_ms() == CAP_MS
+    return ok
+
+
+def check_stampede():
+    """First reconnects of a floor of nodes that dropped together"""
+    ok = True
+    limit = FLOOR
+    for attempt in range(3):
+        times = []
+        for _ in range(FLOOR):
+            b = Backoff(BASE_MS, CAP_MS)
+            t = sum(b.next_ms() for _ in range(attempt + 1))
+            times.append(t)
+        buckets = {}
+        for t in times:
+            buckets[t // 1000] = buckets.get(t // 1000, 0) + 1
+        peak = max(buckets.values())
+        print('  reconnect {}: {} nodes over {:.0f} s, peak {} per second '
+              '(no jitter: {})'.format(attempt + 1, FLOOR, (max(times) - min(times)) / 1000,
+                                      peak, FLOOR))
+        # Each window doubles, so the peak load at least roughly halves
+        ok &= peak <= limit * 3 // 5
+        limit = peak
+    return ok
+
+
+def check_accounting():
+    link = Link(2, BASE_MS, CAP_MS, 60000)
+    link.retry_ms()
+    link.connected(1000)                      # boot: not a reconnect
+    ok = link.reconnects == 0 and link.offline(5000) == 0
+    ok &= not link.failed(2000)               # one failure is tolerated
+    link.ok(2500)
+    ok &= not link.failed(3000)               # ... and the count restarts
+    ok &= link.failed(4000)                   # two in a row drop the link
+    ok &= link.offline(10000) == 6000
+    link.connected(14000)
+    ok &= link.reconnects == 1 and link.offline(20000) == 10000
+    # Flapping: up for less than stable_ms keeps growing the backoff
+    attempt = link.backoff.attempt
+    link.lost(20000)
+    ok &= link.backoff.attempt == attempt
+    link.retry_ms()
+    link.connected(21000)
+    link.lost(200000)                         # stable: backoff starts over
+    ok &= link.backoff.attempt == 0 and link.drops == 3
+    print('  {} drops, {} reconnects, {} ms offline, {} attempts'.format(
+        link.drops, link.reconnects, link.offline(200000), link.attempts))
+    return ok
+
+
+def check_node():
+    sim = Simulator(traces.synthetic_shift(), [OUTAGE], drops=DROPS)
+    fw = sim.load()
+    received = []
+    handled = fw.on_command_received
+
+    def on_command(data):
+        received.append(round(sim.clock.now_us() / 1e6))
+        handled(data)
+    fw.on_command_received = on_command
+    for at in COMMANDS:
+        sim.command(at, json.dumps({"command": "profile", "enabled": False}))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        r = sim.run(RUN_S)
+
+    times = [t for t, _, _ in sim.bus.messages]
+    replays = [t for t, topic, _ in sim.bus.messages if topic == fw.TOPIC_REPLAY]
+    last = json.loads([p for _, topic, p in sim.bus.messages
+                       if topic == fw.TOPIC_TELEMETRY_BATCH][-1])
+    gap = max(b - a for a, b in zip(times, times[1:])) / 1000
+    print('  {} sessions, {} reconnects, {:.0f} s offline, {} WiFi connects, '
+          'longest silence {:.0f} s'.format(r['sessions'], r['reconnects'], r['offline_s'],
+                                             sim.network.connects, gap))
+    print('  commands sent at {}, received at {}'.format(list(COMMANDS), received))
+    print('  {} replay messages, last telemetry reports {} reconnects / {} ms offline'.format(
+        len(replays), last.get('reconnects'), last.get('offlineMs')))
+
+    ok = r['reconnects'] == 1 + len(DROPS) and r['sessions'] == 2 + len(DROPS)
+    # Sent while the broker is unreachable: lost; every other one exactly
+    # once, late by at most a light sleep
+    expected = (200, 1300, 2000)
+    ok &= len(received) == len(expected) and all(
+        0 <= r - t <= fw.LIGHT_SLEEP_MAX_MS / 1000 for r, t in zip(received, expected))
+    ok &= OUTAGE[1] - OUTAGE[0] <= r['offline_s'] < OUTAGE[1] - OUTAGE[0] + 600
+    ok &= bool(replays) and min(replays) > OUTAGE[1] * 1000
+    ok &= last.get('reconnects') == r['reconnects'] and last.get('offlineMs', 0) > 0
+    # Backoff keeps the retries during a 5 minute outage to a handful
+    ok &= sim.network.connects <= 8
+    return ok
+
+
+def main():
+    random.seed(18)
+    results = []
+    print('backoff bounds')
+    results.append(check_backoff())
+    print('floor of {} nodes reconnecting after a power blip'.format(FLOOR))
+    results.append(check_stampede())
+    print('link accounting')
+    results.append(check_accounting())
+    print('simulated node: outage {}-{} s, broker drops at {}'.format(
+        OUTAGE[0], OUTAGE[1], ', '.join(str(t) for t in DROPS)))
+    results.append(check_node())
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# ============================================================================
+# AegisOne Memory Benchmark
+# Replays a sensor trace through the publisher's hot path (threshold
+# state machine, deadband, batching with JSON flushes, dashboard labels)
+# once with the previous allocate-per-pass code and once with the reused
+# buffers, and reports bytes allocated per pass, collections and the
+# worst GC pause from the firmware's GcScheduler.
+#
+# CPython frees garbage by reference counting, so gc.mem_alloc() is
+# modelled on tracemalloc (stubs.install_gc): it grows by every pass's
+# allocation high-water mark until a collection, like the MicroPython heap.
+#
+#   python3 m5core2-uiflow/host/mem_bench.py [--trace rec.csv] [--seconds N]
+# ============================================================================
+
+import argparse
+import json
+import sys
+import time
+
+import stubs
+
+stubs.install()
+stubs.install_gc()
+
+from aegis_alert import AlertMachine
+from aegis_batch import TelemetryBatch
+from aegis_deadband import Deadband
+from aegis_mem import GcScheduler
+from aegis_view import View
+import traces
+
+# Firmware configuration (aegis_one_m5core2.py)
+DEVICE_ID = 'aegis-one-m5-01'
+PUBLISH_TASK_MS = 100
+UI_TASK_MS = 250
+UI_MIN_FRAME_MS = 200
+BATCH_SAMPLE_MS = 1000
+BATCH_MAX_READINGS = 10
+BATCH_MAX_AGE_MS = 10000
+BATCH_MAX_BYTES = 1024
+TEMP_DEADBAND, VIB_DEADBAND, DIST_DEADBAND = 0.5, 0.2, 5
+HEARTBEAT_MS = 60000
+TEMP_WARNING, TEMP_CRITICAL = 35.0, 45.0
+VIB_WARNING, VIB_CRITICAL = 1.5, 2.5
+DIST_WARNING, DIST_DANGER = 100, 30
+GC_COLLECT_BYTES = 16384
+GC_MAX_INTERVAL_MS = 10000
+
+DIST_FORMATS = {
+    'SAFE': '{:.0f} cm | SAFE',
+    'WARNING': '{:.0f} cm | WARNING',
+    'DANGER': '{:.0f} cm | DANGER',
+}
+
+
+class Label:
+    def set_text(self, text):
+        pass
+
+    def set_text_color(self, color):
+        pass
+
+
+class LegacyBatch(TelemetryBatch):
+    """TelemetryBatch.encode() as it was: a new payload and delta list per flush"""
+
+    def encode(self, extra=None):
+        ts0 = self.ts[0] if self.ts else 0
+        payload = {
+            "deviceId": self.device_id,
+            "ts0": ts0,
+            "ts": [t - ts0 for t in self.ts],
+            "temp": self.temp,
+            "vib": self.vib,
+            "distance": self.distance,
+            "status": self.status
+        }
+        if self.battery is not None:
+            payload["battery"] = self.battery
+        if extra:
+            payload.update(extra)
+        return json.dumps(payload)
+
+
+def status_of(temp, vib, dist):
+    if temp >= TEMP_CRITICAL or vib >= VIB_CRITICAL or dist <= DIST_DANGER:
+        return 'CRITICAL'
+    if temp >= TEMP_WARNING or vib >= VIB_WARNING or dist <= DIST_WARNING:
+        return 'WARNING'
+    return 'RUNNING'
+
+
+def proximity_of(dist):
+    return 'DANGER' if dist <= DIST_DANGER else 'WARNING' if dist <= DIST_WARNING else 'SAFE'
+
+
+class HotPath:
+    """The publisher pass and the UI task of aegis_one_m5core2.py"""
+
+    def __init__(self, pooled):
+        self.pooled = pooled
+        batch_cls = TelemetryBatch if pooled else LegacyBatch
+        self.batch = batch_cls(DEVICE_ID, BATCH_MAX_READINGS, BATCH_MAX_AGE_MS, BATCH_MAX_BYTES)
+        self.deadband = Deadband((TEMP_DEADBAND, VIB_DEADBAND, DIST_DEADBAND), HEARTBEAT_MS)
+        self.alerts = AlertMachine()
+        self.alerts.watch(TEMP_WARNING, TEMP_CRITICAL, 1.0)
+        self.alerts.watch(VIB_WARNING, VIB_CRITICAL, 0.2)
+        self.alerts.watch(DIST_WARNING, DIST_DANGER, 10, False)
+        self.view = View(UI_MIN_FRAME_MS)
+        self.labels = [self.view.bind(Label()) for _ in range(4)]
+        self.extras = {}
+        self.bands = [0.0] * 8
+        self.last_sample = -BATCH_SAMPLE_MS
+        self.last_ui = -UI_TASK_MS
+        self.sent = 0
+
+    def telemetry_extras(self, t):
+        raw = [0.01 * ((t // 100 + i) % 7) for i in range(8)]
+        if self.pooled:
+            fields = self.extras
+            fields["vibRms"] = 0.31
+            fields["loopLagMs"] = 2
+            fields["rate"] = 'normal'
+            fields["sampleMs"] = BATCH_SAMPLE_MS
+            for i in range(8):
+                self.bands[i] = round(raw[i], 4)
+            fields["vibBands"] = self.bands
+            fields["seq"] = self.deadband.next_seq()
+            return fields
+        return {"vibRms": 0.31, "loopLagMs": 2, "rate": 'normal', "sampleMs": BATCH_SAMPLE_MS,
+                "vibBands": [round(e, 4) for e in raw], "seq": self.deadband.next_seq()}
+
+    def update_ui(self, t, temp, vib, dist):
+        if not self.view.frame(t):
+            return
+        temp_l, vib_l, dist_l, bat_l = self.labels
+        proximity = proximity_of(dist)
+        if self.pooled:
+            temp_l.set_value(temp, '{:.1f}')
+            vib_l.set_value(vib, '{:.2f}')
+            dist_l.set_value(dist, DIST_FORMATS[proximity])
+            bat_l.set_value(90, '{}%')
+        else:
+            temp_l.set_text('{:.1f}'.format(temp))
+            vib_l.set_text('{:.2f}'.format(vib))
+            dist_l.set_text('{:.0f} cm | {}'.format(dist, proximity))
+            bat_l.set_text('{}%'.format(90))
+
+    def run_pass(self, t, temp, vib, dist):
+        self.alerts.update(t, temp, vib, dist)
+        if t - self.last_sample >= BATCH_SAMPLE_MS:
+            status = status_of(temp, vib, dist)
+            if self.deadband.offer(t, status, temp, vib, dist):
+                self.batch.add(1700000000000 + t, temp, vib, dist, status, 90)
+            self.last_sample = t
+        if self.batch.due(t):
+            self.batch.encode(self.telemetry_extras(t))
+            self.deadband.sent()
+            self.batch.clear()
+            self.sent += 1
+        if t - self.last_ui >= UI_TASK_MS:
+            self.update_ui(t, temp, vib, dist)
+            self.last_ui = t
+
+
+def replay(rows, pooled, seconds):
+    # Trace time for ticks_ms; GC pauses are still timed with the real ticks_us
+    now = [0]
+    time.ticks_ms = lambda: now[0]
+    path = HotPath(pooled)
+    mem = GcScheduler(GC_COLLECT_BYTES, GC_MAX_INTERVAL_MS, profile=True)
+    mem.setup()
+    trace = traces.Trace(rows)
+    end = min(trace.duration_ms, seconds * 1000)
+    for t in range(0, end, PUBLISH_TASK_MS):
+        now[0] = t
+        row = trace.at(t)
+        path.run_pass(t, row[1], row[2], row[3])
+        mem.tick(t)
+    passes = mem.passes
+    mean = mem.pass_bytes / passes if passes else 0
+    return {
+        'passes': passes, 'mean': mean, 'max': mem.max_pass_bytes,
+        'collections': mem.collections, 'pause_us': mem.max_pause_us,
+        'sent': path.sent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hot-path allocation benchmark')
+    parser.add_argument('--trace', help='CSV recording (t_ms,temp,vib,distance,battery)')
+    parser.add_argument('--seconds', type=int, default=1800, help='trace time to replay')
+    args = parser.parse_args()
+    rows = traces.read_csv(args.trace) if args.trace else traces.synthetic_shift()
+
+    results = {}
+    for name, pooled in (('per-pass', False), ('reused', True)):
+        r = replay(rows, pooled, args.seconds)
+        results[name] = r
+        print('{:<9} {:>6} passes  {:>6.1f} B/pass (max {:>5})  {:>4} collections  '
+              'GC max {:>5} us  {} flushes'.format(
+                  name, r['passes'], r['mean'], r['max'], r['collections'], r['pause_us'],
+                  r['sent']))
+    old, new = results['per-pass'], results['reused']
+    print('bytes per pass: {:.0f}% less, collections: {} -> {}'.format(
+        100.0 * (1 - new['mean'] / old['mean']), old['collections'], new['collections']))
+
+    ok = new['mean'] < old['mean'] and new['collections'] <= old['collections']
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
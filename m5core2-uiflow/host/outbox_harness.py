@@ -0,0 +1,219 @@
+# ============================================================================
+# AegisOne Event Outbox Harness
+# Checks the firmware's Outbox on its own (window bound, overflow policy,
+# retry schedule, give-up, duplicate suppression, telemetry thinning) and
+# then runs the real firmware in the simulator against the broker
+# stand-in's ingest rule with slow, lossy acknowledgements: every event
+# pressed out of the node must reach the receiver under one ID, at most
+# EVENT_WINDOW unacknowledged at a time. A last run with no
+# acknowledgements at all checks that telemetry is thinned while the
+# window is stuck and that stuck events are given up. Event IDs are only
+# unique per device: an ack naming another device leaves the event in
+# flight. A button event raised offline must be sent after the reconnect.
+#
+#   python3 m5core2-uiflow/host/outbox_harness.py
+# ============================================================================
+
+import contextlib
+import io
+import json
+import sys
+
+import stubs
+
+stubs.install()
+
+import traces
+from aegis_outbox import Outbox
+from aegis_wire import decode
+from sim import Simulator
+
+PRESSES = 60          # button C events, in bursts of 10
+BURST_S = 120
+RUN_S = 1200
+
+
+def check_unit():
+    ok = True
+    sent = []
+    send = lambda topic, payload: sent.append(payload)
+    box = Outbox(window=4, capacity=8, ack_ms=1000, max_tries=3)
+
+    # Window and overflow: 4 in flight, 8 waiting, the 3 oldest waiting dropped
+    for i in range(1, 16):
+        box.submit(i, 'e', 'event {}'.format(i))
+        box.pump(0, send)
+    ok &= not box.submit(15, 'e', 'again') and not box.submit(2, 'e', 'again')
+    ok &= sent == ['event {}'.format(i) for i in (1, 2, 3, 4)]
+    ok &= box.dropped == 3 and box.depth() == 12 and box.congested()
+    print('  15 submitted, window 4 / queue 8: {} in flight, {} waiting, {} dropped'.format(
+        len(box.inflight), len(box.pending), box.dropped))
+
+    # Acks open the window for the oldest waiting events (5 to 7 were dropped)
+    ok &= box.ack(1, 300) and box.ack(2, 400) and not box.ack(2, 450)
+    box.pump(500, send)
+    ok &= sent[4:] == ['event 8', 'event 9'] and box.duplicates == 1
+
+    # Retries at 1 s, then 2 s after that; given up after the third try
+    del sent[:]
+    for now in range(600, 8000, 100):
+        box.pump(now, send)
+    retried = sent.count('event 3')
+    ok &= retried == 2 and box.expired >= 2
+    print('  unacknowledged event sent {} times, then given up; {} expired'.format(
+        retried + 1, box.expired))
+
+    # A reconnect resends at once, even an event on its last try, and
+    # restarts its retries
+    box = Outbox(window=2, ack_ms=1000, max_tries=3)
+    box.submit(1, 'e', 'a')
+    for now in (0, 1000, 3000):
+        box.pump(now, send)
+    del sent[:]
+    box.resend()
+    box.pump(3100, send)
+    box.pump(4000, send)
+    ok &= sent == ['a'] and box.expired == 0
+    box.pump(4100, send)
+    ok &= sent == ['a', 'a'] and box.inflight[1][4] == 2
+    print('  reconnect: event on its last try sent again, {} expired'.format(box.expired))
+
+    # An ack landing while pump() resends: the acked entry is skipped
+    box = Outbox(window=2, ack_ms=1000)
+    box.submit(1, 'e', 'a')
+    box.submit(2, 'e', 'b')
+    box.pump(0, send)
+    box.pump(1000, lambda topic, payload: box.ack(2, 1000) if payload == 'a' else None)
+    ok &= box.acked == 1 and list(box.inflight) == [1]
+
+    # Telemetry thinning: one reading in four while the window is full
+    box = Outbox(window=2)
+    ok &= all(box.sample(4) for _ in range(10))
+    box.submit(1, 'e', 'a')
+    box.submit(2, 'e', 'b')
+    box.pump(0, send)
+    passed = sum(box.sample(4) for _ in range(40))
+    ok &= passed == 10 and box.shed == 30
+    print('  congested: {} of 40 readings sent, {} shed'.format(passed, box.shed))
+    r = box.report()
+    ok &= r['inflight'] == 2 and r['ackP95Ms'] == 0
+    return ok
+
+
+def run_node(ack_loss, ack_delay_s, overrides=None):
+    sim = Simulator(traces.synthetic_shift())
+    fw = sim.load(overrides)
+    sim.bus.acknowledge(fw.TOPIC_EVENTS, fw.TOPIC_EVENT_ACKS, ack_delay_s, ack_loss)
+    peak = [0]
+    pump = fw.outbox.pump
+
+    def watched(now_ms, send):
+        pump(now_ms, send)
+        peak[0] = max(peak[0], len(fw.outbox.inflight))
+    fw.outbox.pump = watched
+    for i in range(PRESSES):
+        at = 60 + (i // 10) * BURST_S + (i % 10) * 0.5
+        sim.loop.call_at(at, sim.buttons[2].press)
+    with contextlib.redirect_stdout(io.StringIO()):
+        r = sim.run(RUN_S)
+
+    ids = []
+    for _, topic, payload in sim.bus.messages:
+        if topic == fw.TOPIC_EVENTS:
+            if isinstance(payload, str):
+                payload = payload.encode()
+            ids.append(decode(payload)['eventId'])
+    return fw, r, ids, peak[0]
+
+
+def check_lossy():
+    ok = True
+    for fmt in ('json', 'cbor'):
+        fw, r, ids, peak = run_node(0.3, 1.0, {'WIRE_FORMAT': fmt})
+        e = r['events']
+        unique = len(set(ids))
+        print('  {:<4}: {} events, {} messages on the wire ({} retries), {} delivered once '
+              'deduplicated, {} acked, {} expired, peak in flight {}, ack p50 {} ms p95 {} ms'.format(
+                  fmt, e['sent'], len(ids), e['retries'], unique, e['acked'], e['expired'],
+                  peak, e['ackP50Ms'], e['ackP95Ms']))
+        # Every button press (and the status events) reached the receiver,
+        # retries only repeat IDs; a few may give up after every ack was lost
+        ok &= e['sent'] > PRESSES and unique == e['sent'] and e['dropped'] == 0
+        ok &= e['retries'] > 0 and len(ids) == e['sent'] + e['retries']
+        ok &= e['acked'] + e['expired'] == e['sent'] and e['depth'] == 0
+        ok &= e['expired'] <= e['sent'] // 10
+        ok &= peak <= fw.EVENT_WINDOW
+    return ok
+
+
+def check_stuck():
+    # No acknowledgements: the window fills, telemetry is thinned, events
+    # are retried and given up; the link itself stays up
+    plain = {'BATCH_ENABLED': False, 'DEADBAND_ENABLED': False}
+    fw, r, ids, peak = run_node(1.0, 0.0, plain)
+    normal = run_node(0.0, 0.0, plain)[1]['topics'][fw.TOPIC_TELEMETRY][0]
+    e = r['events']
+    sent = r['topics'][fw.TOPIC_TELEMETRY][0]
+    print('  no acks: {} events sent, {} expired, {} dropped, {} readings shed, '
+          '{} telemetry messages ({} with acks), {} reconnects'.format(
+              e['sent'], e['expired'], e['dropped'], e['shed'], sent, normal, r['reconnects']))
+    print('  peak in flight {}'.format(peak))
+    return (e['acked'] == 0 and e['expired'] > 0 and e['shed'] > 0 and sent < normal
+            and peak == fw.EVENT_WINDOW and r['reconnects'] == 0)
+
+
+def check_foreign():
+    sim = Simulator(traces.synthetic_shift())
+    fw = sim.load()
+    sim.bus.acknowledge(fw.TOPIC_EVENTS, fw.TOPIC_EVENT_ACKS, 5.0)
+    topic = fw.TOPIC_EVENT_ACKS + fw.DEVICE_ID
+    ids, kept = [], []
+
+    def foreign():
+        ids.extend(fw.outbox.inflight)
+        for event_id in ids:
+            sim.bus.deliver(topic, json.dumps({'deviceId': 'aegis-other', 'eventId': event_id}))
+    sim.loop.call_at(60, sim.buttons[2].press)
+    sim.loop.call_at(61, foreign)
+    sim.loop.call_at(62, lambda: kept.append(all(i in fw.outbox.inflight for i in ids)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        r = sim.run(120)
+    e = r['events']
+    print('  {} in flight when another node\'s ack for the same ID came: kept {}, '
+          'then {} of {} acked by their own'.format(len(ids), kept == [True], e['acked'], e['sent']))
+    return ids != [] and kept == [True] and e['acked'] == e['sent'] and e['depth'] == 0
+
+
+def check_offline():
+    sim = Simulator(traces.synthetic_shift(), outages=[(100, 200)])
+    fw = sim.load()
+    sim.loop.call_at(150, sim.buttons[2].press)
+    with contextlib.redirect_stdout(io.StringIO()):
+        r = sim.run(300)
+    tests = [t for t, topic, p in sim.bus.messages if topic == fw.TOPIC_EVENTS
+             and decode(p.encode() if isinstance(p, str) else p).get('eventType') == 'TEST']
+    print('  pressed at 150 s, offline 100-200 s: TEST event sent at {} s, {} acked of {}'.format(
+        [t // 1000 for t in tests], r['events']['acked'], r['events']['sent']))
+    return len(tests) == 1 and tests[0] > 200000 and r['events']['depth'] == 0
+
+
+def main():
+    results = []
+    print('outbox')
+    results.append(check_unit())
+    print('simulated node, {} events in bursts, 30% of acks lost, 1 s ack delay'.format(PRESSES))
+    results.append(check_lossy())
+    print('simulated node, acknowledgements never arrive')
+    results.append(check_stuck())
+    print('simulated node, acks for the same event ID from another node')
+    results.append(check_foreign())
+    print('simulated node, button event while offline')
+    results.append(check_offline())
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
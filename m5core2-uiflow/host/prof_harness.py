@@ -0,0 +1,119 @@
+# ============================================================================
+# AegisOne Stage Profiler Harness
+# Feeds known duration distributions through the firmware's Histogram and
+# checks the p50/p95/p99/max estimates against the exact values (within
+# the bucket width: 1/SUB_BUCKETS of the value), the overrun
+# count, that a disabled Profiler records nothing, and what one timed
+# stage costs on the host. Then runs the firmware in the simulator with
+# profiling on through an outage: the health windows must cover the whole
+# run with no gap (a window is only restarted once it is published), and
+# a profile command whose enabled is not a bool must change nothing.
+#
+#   python3 m5core2-uiflow/host/prof_harness.py
+# ============================================================================
+
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+
+import stubs
+
+stubs.install()
+
+from aegis_prof import Histogram, Profiler, BUCKET_US, SUB_BUCKETS
+import traces
+from sim import Simulator
+
+SAMPLES = 20000
+BUDGET_US = 100000  # PUBLISH_TASK_MS
+
+
+def exact(values, p):
+    ordered = sorted(values)
+    rank = max(1, (len(ordered) * p + 99) // 100)
+    return ordered[rank - 1]
+
+
+def distributions(rng):
+    yield 'sensor read', [int(rng.gauss(800, 150)) for _ in range(SAMPLES)]
+    yield 'ui redraw', [int(rng.expovariate(1 / 6000)) + 300 for _ in range(SAMPLES)]
+    # TLS publish: mostly fast, with slow tail past the task budget
+    yield 'publish', [int(rng.gauss(15000, 3000)) if rng.random() > 0.03
+                      else int(rng.uniform(120000, 400000)) for _ in range(SAMPLES)]
+
+
+def check(name, values):
+    h = Histogram(BUDGET_US)
+    for us in values:
+        h.add(us)
+    ok = h.n == len(values) and h.max == max(values)
+    ok = ok and h.overruns == sum(1 for us in values if us > BUDGET_US)
+    line = []
+    for p in (50, 95, 99):
+        est, ref = h.percentile(p), exact(values, p)
+        error = abs(est - ref) / max(ref, BUCKET_US[0])
+        ok = ok and error <= 1.0 / SUB_BUCKETS
+        line.append('p{} {:>6} us ({:+.1%})'.format(p, est, (est - ref) / max(ref, 1)))
+    print('{:<12} {}  max {:>6} us  overruns {:>4}  {}'.format(
+        name, '  '.join(line), h.max, h.overruns, 'ok' if ok else 'FAIL'))
+    return ok
+
+
+def overhead_us():
+    prof = Profiler(True)
+    prof.stage('noop')
+    timed = prof.wrap('noop', lambda: None)
+    n = 20000
+    start = time.perf_counter()
+    for _ in range(n):
+        timed()
+    return (time.perf_counter() - start) * 1e6 / n
+
+
+def check_node():
+    sim = Simulator(traces.synthetic_shift(), [(100, 400)])
+    fw = sim.load()
+    fw.prof.enable()
+    sim.command(450, json.dumps({"command": "profile", "enabled": "no"}))
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(600)
+    health = [(t, json.loads(p)) for t, topic, p in sim.bus.messages if topic == fw.TOPIC_HEALTH]
+    seqs = [h['seq'] for _, h in health]
+    covered = sum(h['windowMs'] for _, h in health)
+    longest = max(h['windowMs'] for _, h in health)
+    print('simulated node, offline 100-400 s: {} health reports, seq {}..{}, windows cover '
+          '{:.0f} of {:.0f} s, longest {:.0f} s'.format(
+              len(health), seqs[0], seqs[-1], covered / 1000, health[-1][0] / 1000,
+              longest / 1000))
+    return (seqs == list(range(1, len(health) + 1)) and longest > 300000
+            and abs(covered - health[-1][0]) < 2000 and health[-1][0] > 450000
+            and fw.prof.enabled is True)
+
+
+def main():
+    rng = random.Random(14)
+    ok = True
+    for name, values in distributions(rng):
+        ok = check(name, [max(0, us) for us in values]) and ok
+
+    prof = Profiler(False)
+    prof.stage('noop')
+    prof.wrap('noop', lambda: None)()
+    ok = ok and prof.stages['noop'].n == 0
+    prof.enable()
+    prof.wrap('noop', lambda: None)()
+    stages, _ = prof.report()
+    ok = ok and stages['noop']['n'] == 1 and prof.stages['noop'].n == 0
+
+    print('histogram: {} counters per stage, {:.1f} us per timed stage on this host'.format(
+        len(BUCKET_US) + 1, overhead_us()))
+    ok = check_node() and ok
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
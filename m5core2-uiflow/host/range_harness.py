@@ -0,0 +1,84 @@
+# ============================================================================
+# AegisOne Ultrasonic Ranger Harness
+# Drives Ranger against a simulated HC-SR04 on a virtual clock and reports
+# filter accuracy, rejected echoes and time spent blocking per poll, for
+# both the IRQ and the time_pulse_us() backends.
+#
+#   python3 m5core2-uiflow/host/range_harness.py
+# ============================================================================
+
+import sys
+
+import stubs
+
+stubs.install()
+
+from aegis_range import Ranger
+
+TRIG_PIN = 26
+ECHO_PIN = 36
+PERIOD_US = 200000  # RANGER_TASK_MS
+K = 5
+STEPS = ((0.0, 150.0), (8.0, 80.0), (16.0, 25.0))  # (from s, distance cm)
+DURATION_S = 24.0
+
+# Old read_distance(): wait_ms(2) + wait_ms(10) + busy-wait through the echo
+LEGACY_FIXED_US = 12000
+
+
+def distance_at(t):
+    d = STEPS[0][1]
+    for start, cm in STEPS:
+        if t >= start:
+            d = cm
+    return d
+
+
+def run(use_irq):
+    clock = stubs.VirtualClock().install()
+    sonar = stubs.SimSonar(clock, TRIG_PIN, ECHO_PIN, distance_at,
+                           jitter_us=40, dropout=0.05, spurious=0.10)
+    ranger = Ranger(sonar.machine(), TRIG_PIN, ECHO_PIN, K, use_irq)
+
+    blocked = 0
+    polls = 0
+    worst_err = 0.0
+    settled = 0
+    legacy = 0
+    while clock.now_us < DURATION_S * 1e6:
+        t0 = clock.now_us
+        d = ranger.poll()
+        blocked += clock.now_us - t0
+        polls += 1
+        if sonar.last_pulse_us is not None:
+            legacy += LEGACY_FIXED_US + 450 + sonar.last_pulse_us[1]
+        else:
+            legacy += LEGACY_FIXED_US + 30000
+        t = clock.now_us / 1e6
+        # Skip K+1 polls after each step while the median catches up
+        since_step = min(t - s for s, _ in STEPS if t >= s)
+        if d is not None and since_step > (K + 1) * PERIOD_US / 1e6:
+            worst_err = max(worst_err, abs(d - distance_at(t)))
+            settled += 1
+        clock.advance(PERIOD_US - (clock.now_us - t0))
+
+    print('{:<6} polls {:>3} settled {:>3} worst error {:>5.2f} cm  rejected {:>2} '
+          'timeouts {:>2}  blocking {:>6.0f} us/poll (legacy ~{:.0f})'.format(
+              'irq' if use_irq else 'pulse', polls, settled, worst_err, ranger.rejected,
+              ranger.timeouts, blocked / polls, legacy / polls))
+    return worst_err, ranger, blocked / polls
+
+
+def main():
+    ok = True
+    for use_irq in (True, False):
+        err, ranger, blocking = run(use_irq)
+        ok = ok and err < 1.0 and ranger.rejected > 0 and ranger.use_irq == use_irq
+        if use_irq:
+            ok = ok and blocking < 100
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
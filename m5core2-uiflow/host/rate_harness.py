@@ -0,0 +1,159 @@
+# ============================================================================
+# AegisOne Adaptive Rate Harness
+# Replays a sensor trace through the publisher's sampling/batching policy on
+# a virtual clock, once with the fixed schedule and once with the adaptive
+# rate controller, and reports messages sent, estimated charge and how long
+# a status change waits for the node to be awake.
+#
+#   python3 m5core2-uiflow/host/rate_harness.py [--trace rec.csv] [--write-trace out.csv]
+# ============================================================================
+
+import argparse
+import sys
+
+import stubs
+
+stubs.install()
+
+from aegis_batch import TelemetryBatch
+from aegis_rate import RateController, LEVEL_NAMES
+import traces
+
+# Firmware configuration (aegis_one_m5core2.py)
+PUBLISH_TASK_MS = 100
+TASKS = (('imu', 100), ('ranger', 200), ('env', 1000))
+BATCH_SAMPLE_MS = 1000
+BATCH_MAX_READINGS = 10
+BATCH_MAX_AGE_MS = 10000
+TEMP_WARNING, TEMP_CRITICAL, TEMP_NEAR, TEMP_SLOPE = 35.0, 45.0, 3.0, 0.2
+VIB_WARNING, VIB_CRITICAL, VIB_NEAR, VIB_SLOPE = 1.5, 2.5, 0.5, 0.5
+DIST_WARNING, DIST_DANGER, DIST_NEAR, DIST_SLOPE = 100, 30, 30, 20
+LIGHT_SLEEP_AWAKE_MS = 1000
+LIGHT_SLEEP_MAX_MS = 3000
+
+# Charge model (mA and mA*ms), rough M5Core2 figures with WiFi associated
+ACTIVE_MA = 95.0
+LIGHT_SLEEP_MA = 20.0
+TASK_MA_MS = {'imu': 120.0, 'ranger': 30.0, 'env': 30.0, 'publisher': 10.0}
+PUBLISH_MA_MS = 180.0 * 60
+
+
+def status_of(temp, vib, dist):
+    if temp >= TEMP_CRITICAL or vib >= VIB_CRITICAL or dist <= DIST_DANGER:
+        return 'CRITICAL'
+    if temp >= TEMP_WARNING or vib >= VIB_WARNING or dist <= DIST_WARNING:
+        return 'WARNING'
+    return 'RUNNING'
+
+
+def simulate(rows, adaptive):
+    clock = stubs.VirtualClock().install()
+    trace = traces.Trace(rows)
+    rate = RateController()
+    rate.watch(TEMP_WARNING, TEMP_NEAR, TEMP_SLOPE)
+    rate.watch(VIB_WARNING, VIB_NEAR, VIB_SLOPE)
+    rate.watch(DIST_WARNING, DIST_NEAR, DIST_SLOPE, False)
+    batch = TelemetryBatch('sim', BATCH_MAX_READINGS, BATCH_MAX_AGE_MS)
+
+    messages = readings = 0
+    awake_ms = sleep_ms = 0
+    charge = 0.0
+    wakes = dict((name, 0.0) for name, _ in TASKS)
+    level_ms = [0] * len(LEVEL_NAMES)
+    last_sample = -BATCH_SAMPLE_MS
+    last_status = 'RUNNING'
+    worst_latency = 0
+
+    end_ms = trace.duration_ms
+    while clock.now_us // 1000 < end_ms:
+        now = clock.now_us // 1000
+        t, temp, vib, dist, battery = trace.at(now)[:5]
+
+        # Time a status change waits for an awake publisher pass
+        status_now = status_of(temp, vib, dist)
+        if status_now != last_status:
+            worst_latency = max(worst_latency, now - t)
+            if status_now == 'CRITICAL':
+                # check_thresholds() flushes the batch on entering CRITICAL
+                batch.add(now, temp, vib, dist, status_now, battery)
+                readings += 1
+                messages += 1
+                charge += PUBLISH_MA_MS
+                batch.clear()
+            last_status = status_now
+
+        if adaptive and rate.update(now, battery, temp, vib, dist):
+            batch.max_age_ms = rate.period(BATCH_MAX_AGE_MS)
+
+        sampled = False
+        if now - last_sample >= rate.period(BATCH_SAMPLE_MS):
+            batch.add(now, temp, vib, dist, status_now, battery)
+            readings += 1
+            last_sample = now
+            sampled = True
+        if batch.due(clock.ticks_ms()):
+            messages += 1
+            charge += PUBLISH_MA_MS
+            batch.clear()
+
+        for name, base in TASKS:
+            wakes[name] += PUBLISH_TASK_MS / rate.period(base)
+        charge += TASK_MA_MS['publisher']
+        awake_ms += PUBLISH_TASK_MS
+        level_ms[rate.level] += PUBLISH_TASK_MS
+        clock.advance(PUBLISH_TASK_MS * 1000)
+
+        doze = rate.doze_ms(BATCH_SAMPLE_MS, LIGHT_SLEEP_AWAKE_MS, LIGHT_SLEEP_MAX_MS) if sampled else 0
+        if doze:
+            sleep_ms += doze
+            level_ms[rate.level] += doze
+            clock.advance(doze * 1000)
+
+    charge += awake_ms * ACTIVE_MA + sleep_ms * LIGHT_SLEEP_MA
+    for name, _ in TASKS:
+        charge += wakes[name] * TASK_MA_MS[name]
+    mah = charge / 3600000.0
+    hours = end_ms / 3600000.0
+    return {
+        'messages': messages, 'readings': readings, 'mah': mah, 'ma': mah / hours,
+        'sleep_pct': 100.0 * sleep_ms / (awake_ms + sleep_ms),
+        'latency_ms': worst_latency, 'level_ms': level_ms, 'changes': rate.changes,
+    }
+
+
+def report(name, r, total_ms):
+    levels = ' '.join('{} {:.0f}%'.format(n, 100.0 * ms / total_ms)
+                      for n, ms in zip(LEVEL_NAMES, r['level_ms']) if ms)
+    print('{:<9} messages {:>5} readings {:>5}  charge {:>6.1f} mAh ({:>5.1f} mA avg)  '
+          'asleep {:>4.1f}%  worst status delay {:>4} ms  [{}]'.format(
+              name, r['messages'], r['readings'], r['mah'], r['ma'], r['sleep_pct'],
+              r['latency_ms'], levels))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fixed vs adaptive rate simulation')
+    parser.add_argument('--trace', help='CSV recording (t_ms,temp,vib,distance,battery)')
+    parser.add_argument('--write-trace', help='write the synthetic trace to this CSV')
+    args = parser.parse_args()
+
+    rows = traces.read_csv(args.trace) if args.trace else traces.synthetic_shift()
+    if args.write_trace:
+        traces.write_csv(args.write_trace, rows)
+    total_ms = traces.Trace(rows).duration_ms
+
+    fixed = simulate(rows, False)
+    adaptive = simulate(rows, True)
+    report('fixed', fixed, total_ms)
+    report('adaptive', adaptive, total_ms)
+
+    saved_msgs = 1 - adaptive['messages'] / fixed['messages']
+    saved_mah = 1 - adaptive['mah'] / fixed['mah']
+    ok = (adaptive['messages'] < fixed['messages'] and adaptive['mah'] < fixed['mah']
+          and adaptive['latency_ms'] <= LIGHT_SLEEP_MAX_MS + PUBLISH_TASK_MS)
+    print('messages -{:.0%}  charge -{:.0%}  level changes {} -> {}'.format(
+        saved_msgs, saved_mah, adaptive['changes'], 'OK' if ok else 'FAIL'))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
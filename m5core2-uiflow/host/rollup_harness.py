@@ -0,0 +1,164 @@
+# ============================================================================
+# AegisOne Edge Rollup Harness
+# Feeds random streams (Gaussian, heavy-tailed with spikes, a large offset
+# with tiny noise, a constant, a threshold-crossing drift) through the
+# firmware's Rollup at jittered sample intervals with a random status
+# walk, and checks every 1 min and 15 min record against a NumPy
+# reference computed from the raw samples: count, min, max, mean and
+# population stddev, time over threshold and status dwell (hold-until-
+# next, split at window boundaries). Stats.merge() is checked against
+# NumPy over the concatenated halves. A simulated node then checks the
+# rollup topic's cadence. Needs numpy.
+#
+#   python3 m5core2-uiflow/host/rollup_harness.py
+# ============================================================================
+
+import contextlib
+import io
+import json
+import random
+import sys
+
+import numpy as np
+
+import stubs
+
+stubs.install()
+
+import traces
+from aegis_rollup import Rollup, Stats, STATUSES
+from sim import Simulator
+
+SHORT_MS = 60000
+LONG_MS = 900000
+HOURS = 2
+EPOCH_MS = 1767225600000 + 37123   # not on a window boundary
+THRESHOLD = 1.0
+TOL = 1e-3                         # records are rounded to 3 decimals
+
+
+def streams(rng):
+    n = HOURS * 3600
+    yield 'gauss', [rng.gauss(0.5, 0.3) for _ in range(n)]
+    yield 'spiky', [rng.expovariate(4.0) + (8.0 if rng.random() < 0.01 else 0.0)
+                    for _ in range(n)]
+    yield 'offset', [25000.0 + rng.gauss(0, 0.01) for _ in range(n)]
+    yield 'constant', [0.75] * n
+    yield 'drift', [0.2 + 1.6 * i / n + rng.gauss(0, 0.1) for i in range(n)]
+
+
+def feed(values, rng):
+    """Run the firmware Rollup; returns (records, ts, statuses)"""
+    roll = Rollup('harness', ('x',), ((THRESHOLD, True),), SHORT_MS, LONG_MS, 10000)
+    ts = []
+    codes = []
+    t = EPOCH_MS
+    status = 0
+    for v in values:
+        if rng.random() < 0.02:
+            status = rng.randrange(len(STATUSES))
+        roll.add(t, t, STATUSES[status], v)
+        ts.append(t)
+        codes.append(status)
+        t += int(rng.uniform(200, 1800))
+    return roll.ready, np.array(ts, dtype=np.int64), np.array(codes)
+
+
+def hold_ms(ts, mask, start, end):
+    """Time-weighted: reading i holds from ts[i] to ts[i+1], clipped to [start, end)"""
+    a = np.clip(ts[:-1], start, end)
+    b = np.clip(ts[1:], start, end)
+    return int(np.sum((b - a)[mask[:-1]]))
+
+
+def check_records(name, values, records, ts, codes):
+    x = np.array(values)
+    over = x >= THRESHOLD
+    ok = True
+    worst = 0.0
+    counts = {SHORT_MS: 0, LONG_MS: 0}
+    for rec in records:
+        start = rec['ts0']
+        end = start + rec['windowMs']
+        counts[rec['windowMs']] += 1
+        sel = (ts >= start) & (ts < end)
+        ref = x[sel]
+        r = rec['x']
+        errs = (abs(r['min'] - ref.min()), abs(r['max'] - ref.max()),
+                abs(r['mean'] - ref.mean()), abs(r['std'] - ref.std()))
+        worst = max(worst, max(errs))
+        ok &= rec['n'] == len(ref) and max(errs) <= TOL
+        ok &= r['overMs'] == hold_ms(ts, over, start, end)
+        for i, status in enumerate(STATUSES):
+            ok &= rec['statusMs'][status] == hold_ms(ts, codes == i, start, end)
+        ok &= start % rec['windowMs'] == 0
+    # Every closed window is reported; the last, still open, is not
+    last = ts[-1]
+    expect_short = int((last - last % SHORT_MS - (EPOCH_MS - EPOCH_MS % SHORT_MS)) // SHORT_MS)
+    expect_long = int((last - last % LONG_MS - (EPOCH_MS - EPOCH_MS % LONG_MS)) // LONG_MS)
+    ok &= counts[SHORT_MS] == expect_short and counts[LONG_MS] == expect_long
+    print('  {:<9} {:>3} x 1 min  {:>2} x 15 min  max error {:.1e}  {}'.format(
+        name, counts[SHORT_MS], counts[LONG_MS], worst, 'ok' if ok else 'MISMATCH'))
+    return ok
+
+
+def check_merge(rng):
+    ok = True
+    for _ in range(200):
+        n1 = rng.randrange(0, 50)
+        n2 = rng.randrange(1, 50)
+        scale = 10 ** rng.uniform(-3, 4)
+        a = [rng.gauss(scale, scale / 10) for _ in range(n1)]
+        b = [rng.gauss(-scale, scale) for _ in range(n2)]
+        sa, sb = Stats(), Stats()
+        for v in a:
+            sa.add(v)
+        for v in b:
+            sb.add(v)
+        sa.merge(sb)
+        ref = np.array(a + b)
+        ok &= sa.n == len(ref) and sa.min == ref.min() and sa.max == ref.max()
+        ok &= abs(sa.mean - ref.mean()) <= 1e-9 * (1 + abs(ref.mean()))
+        ok &= abs(sa.std() - ref.std()) <= 1e-9 * (1 + ref.std())
+    print('  merge of random halves: {}'.format('ok' if ok else 'MISMATCH'))
+    return ok
+
+
+def check_node():
+    sim = Simulator(traces.synthetic_shift())
+    fw = sim.load()
+    seconds = 1900
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(seconds)
+    records = [json.loads(p) for _, topic, p in sim.bus.messages if topic == fw.TOPIC_ROLLUP]
+    short = [r for r in records if r['windowMs'] == fw.ROLLUP_SHORT_MS]
+    long = [r for r in records if r['windowMs'] == fw.ROLLUP_LONG_MS]
+    dwell = [sum(r['statusMs'].values()) for r in short[1:]]
+    print('  simulated {} s: {} x 1 min, {} x 15 min rollups, {}..{} readings per minute, '
+          'dwell {}..{} ms'.format(seconds, len(short), len(long),
+                                   min(r['n'] for r in short), max(r['n'] for r in short),
+                                   min(dwell), max(dwell)))
+    # The first minute is partial; the others account for their whole span
+    ok = len(short) >= seconds // 60 - 1 and len(long) >= 1
+    ok &= all(abs(d - fw.ROLLUP_SHORT_MS) <= 2 * fw.ROLLUP_SAMPLE_MS for d in dwell)
+    return ok
+
+
+def main():
+    rng = random.Random(20)
+    results = []
+    print('rollups against numpy ({} h at 0.2-1.8 s intervals)'.format(HOURS))
+    for name, values in streams(rng):
+        records, ts, codes = feed(values, rng)
+        results.append(check_records(name, values, records, ts, codes))
+    results.append(check_merge(rng))
+    print('firmware')
+    results.append(check_node())
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
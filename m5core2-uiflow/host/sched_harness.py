@@ -0,0 +1,114 @@
+# ============================================================================
+# AegisOne Scheduler Harness
+# Runs the cooperative task layout under CPython asyncio with stubbed
+# hardware, and compares IMU task rate and loop lag during a CRITICAL alert
+# against the old blocking play_alert().
+#
+#   python3 m5core2-uiflow/host/sched_harness.py
+# ============================================================================
+
+import asyncio
+import sys
+import time
+
+import stubs
+
+stubs.install()
+
+from aegis_sched import every, run, sleep_ms, LoopLag, AlertPlayer, CommandQueue, ALERT_PATTERNS
+
+DURATION_MS = 3000
+IMU_TASK_MS = 10
+UI_TASK_MS = 250
+PUBLISH_TASK_MS = 100
+PUBLISH_COST_MS = 15  # simulated TLS publish
+
+
+class FakeSpeaker:
+    def __init__(self):
+        self.tones = []
+
+    def tone(self, freq, duration):
+        self.tones.append((time.ticks_ms(), freq, duration))
+
+
+class FakePower:
+    def __init__(self):
+        self.vibration = []
+
+    def setVibrationEnable(self, on):
+        self.vibration.append(on)
+
+
+def blocking_alert_ms(pattern):
+    """How long the old wait_ms()-based play_alert() held the loop"""
+    return sum(step[2] for step in pattern)
+
+
+def scenario(blocking):
+    counters = {'imu': 0, 'ui': 0, 'publish': 0, 'commands': 0}
+    speaker = FakeSpeaker()
+    player = AlertPlayer(speaker, FakePower())
+    commands = CommandQueue(lambda data: counters.__setitem__('commands', counters['commands'] + 1))
+    lag = LoopLag(20)
+    worst = [0]
+
+    def imu():
+        counters['imu'] += 1
+
+    def ui():
+        counters['ui'] += 1
+        time.sleep(0.004)  # LVGL redraw
+
+    async def publisher():
+        tick = 0
+        while True:
+            tick += 1
+            if tick == 5:
+                # Entering CRITICAL
+                if blocking:
+                    time.sleep(blocking_alert_ms(ALERT_PATTERNS['CRITICAL']) / 1000)
+                else:
+                    player.play('CRITICAL')
+                commands.push('{"command": "alert"}')
+            if tick % 10 == 0:
+                time.sleep(PUBLISH_COST_MS / 1000)
+                counters['publish'] += 1
+            worst[0] = max(worst[0], lag.last_ms)
+            await sleep_ms(PUBLISH_TASK_MS)
+
+    loop = asyncio.new_event_loop()
+    try:
+        run([
+            every(IMU_TASK_MS, imu),
+            every(UI_TASK_MS, ui),
+            publisher(),
+            player.run(),
+            commands.run(),
+            lag.run(),
+        ], DURATION_MS, loop)
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+    expected = DURATION_MS // IMU_TASK_MS
+    print('{:<12} imu {:>4}/{:<4} ui {:>3} publish {:>2} worst lag {:>4} ms'.format(
+        'blocking' if blocking else 'cooperative', counters['imu'], expected, counters['ui'],
+        counters['publish'], max(worst[0], lag.max_ms)))
+    return counters['imu'] / expected, max(worst[0], lag.max_ms), len(speaker.tones), counters
+
+
+def main():
+    blocking_rate, blocking_lag, _, _ = scenario(True)
+    rate, worst_lag, tones, counters = scenario(False)
+    ok = rate > blocking_rate and worst_lag < blocking_lag and tones == 3 and counters['commands'] == 1
+    print('IMU task rate {:.0%} vs {:.0%} blocking -> {}'.format(
+        rate, blocking_rate, 'OK' if ok else 'FAIL'))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
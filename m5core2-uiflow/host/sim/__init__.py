@@ -0,0 +1,181 @@
+# ============================================================================
+# AegisOne Host Simulator
+# Runs the unmodified aegis_one_m5core2.main() under CPython, in virtual
+# time, against a recorded or synthetic sensor trace
+# ============================================================================
+# Simulator installs stand-ins for every device module the firmware
+# imports (m5stack, m5stack_ui, uiflow, IoTcloud.AWS, wifiCfg, imu,
+# machine), imports the firmware, and runs main() on a SimLoop until the
+# requested simulation time. /flash paths are redirected to a scratch
+# directory and the acquisition thread is disabled (a thread sleeping on
+# the shared virtual clock would move it for everyone); the IMU is
+# sampled by the simulated hardware timer instead. MicroPython's
+# gc.mem_alloc()/mem_free()/threshold() report an empty heap unless
+# heap=True, which models them on tracemalloc (stubs.install_gc) at a
+# large cost in speed. The bus acknowledges events the way the cloud's
+# ingest rule does (sim.bus.acknowledge() changes the delay and loss).
+# WiFi association and the AWS connect take no time unless join_s and
+# tls_s are given.
+#
+#   sim = Simulator(traces.synthetic_shift())
+#   fw = sim.load({'WIRE_FORMAT': 'cbor'})
+#   report = sim.run(600)
+# ============================================================================
+
+import asyncio
+import gc
+import sys
+import tempfile
+import time
+import types
+
+import stubs
+import traces
+
+from sim.clock import SimClock, SimLoop
+from sim.hardware import Plant, SimIMU, Power, Speaker, Button, Sonar, make_machine
+from sim.cloud import Bus, Network, make_aws
+from sim import ui
+
+FIRMWARE = 'aegis_one_m5core2'
+# Tasks counted for the loop-rate report: (firmware function, rate setting)
+TASKS = (('read_vibration', 'IMU_TASK_MS'), ('read_distance', 'RANGER_TASK_MS'),
+         ('read_env', 'ENV_TASK_MS'), ('update_ui', 'UI_TASK_MS'),
+         ('check_thresholds', 'PUBLISH_TASK_MS'))
+
+
+def _module(name, attrs):
+    mod = types.ModuleType(name)
+    for key, value in attrs.items():
+        setattr(mod, key, value)
+    return mod
+
+
+class Simulator:
+    """One simulated node: clock, loop, plant, bus and the device modules"""
+
+    def __init__(self, rows, outages=(), noise=0.0, flash_dir=None, heap=False, drops=(),
+                 join_s=0.0, tls_s=0.0):
+        self.clock = SimClock().install()
+        self.loop = SimLoop(self.clock)
+        asyncio.set_event_loop(self.loop)
+        self.plant = Plant(self.clock, traces.Trace(rows), noise)
+        self.sonar = Sonar(self.loop, self.plant)
+        self.power = Power(self.plant)
+        self.speaker = Speaker()
+        self.buttons = (Button(self.loop), Button(self.loop), Button(self.loop))
+        self.display = ui.Display()
+        self.bus = Bus(self.loop, self.clock)
+        self.network = Network(self.clock, outages, drops, join_s)
+        self.tls_s = tls_s
+        self.flash = flash_dir or tempfile.mkdtemp(prefix='aegis-sim-')
+        self.fw = None
+        self.calls = {}
+        self.machine = make_machine(self.loop, self.clock, self.sonar)
+        self.install(heap)
+
+    def install(self, heap=False):
+        """Register the device modules in sys.modules"""
+        if heap:
+            stubs.install_gc()
+        elif not hasattr(gc, 'mem_alloc'):
+            gc.mem_alloc = lambda: 0
+            gc.mem_free = lambda: 100 * 1024
+            gc.threshold = lambda amount=None: -1
+        wait = lambda s: self.clock.advance_us(s * 1e6)
+        wait_ms = lambda ms: self.clock.advance_us(ms * 1000)
+        aws = _module('IoTcloud.AWS', {'AWS': make_aws(self.bus, self.network, self.tls_s)})
+        modules = {
+            'm5stack': _module('m5stack', {
+                'speaker': self.speaker, 'power': self.power,
+                'btnA': self.buttons[0], 'btnB': self.buttons[1], 'btnC': self.buttons[2],
+                'wait': wait, 'wait_ms': wait_ms}),
+            'm5stack_ui': _module('m5stack_ui', ui.names(self.display)),
+            'uiflow': _module('uiflow', {'wait': wait, 'wait_ms': wait_ms}),
+            'IoTcloud': _module('IoTcloud', {'AWS': aws}),
+            'IoTcloud.AWS': aws,
+            'wifiCfg': self.network.wifi_cfg(),
+            'imu': _module('imu', {'IMU': lambda: SimIMU(self.plant)}),
+            'machine': self.machine,
+        }
+        sys.modules.update(modules)
+
+    def load(self, overrides=None):
+        """Import a fresh copy of the firmware and apply config overrides"""
+        sys.modules.pop(FIRMWARE, None)
+        fw = __import__(FIRMWARE)
+        for name, value in list(vars(fw).items()):
+            if isinstance(value, str) and value.startswith('/flash/'):
+                setattr(fw, name, self.flash + value[len('/flash'):])
+        fw.ACQ_THREAD = False
+        for name, value in (overrides or {}).items():
+            if not hasattr(fw, name):
+                raise KeyError('unknown firmware setting: ' + name)
+            setattr(fw, name, value)
+        # Built from settings at import time
+        fw.wire = fw.WireEncoder(fw.DEVICE_ID, fw.WIRE_FORMAT) if fw.WIRE_FORMAT != fw.FORMAT_JSON else None
+        if fw.TOPIC_EVENTS not in self.bus.acks:
+            self.bus.acknowledge(fw.TOPIC_EVENTS, fw.TOPIC_EVENT_ACKS)
+        for name, _ in TASKS:
+            self._count(fw, name)
+        self.fw = fw
+        return fw
+
+    def _count(self, fw, name):
+        fn = getattr(fw, name)
+        self.calls[name] = 0
+
+        def counted(*args, **kw):
+            self.calls[name] += 1
+            return fn(*args, **kw)
+        setattr(fw, name, counted)
+
+    def command(self, at_s, payload):
+        """Send a command to the node at simulation time at_s"""
+        self.bus.inject(at_s, self.fw.TOPIC_COMMANDS, payload)
+
+    def run(self, seconds):
+        """Run main() for `seconds` of simulation time and report"""
+        if self.fw is None:
+            self.load()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self.loop.call_at(seconds, self.loop.stop)
+        try:
+            self.fw.main()
+            return self.report(time.perf_counter() - wall, time.process_time() - cpu)
+        finally:
+            self.bus.close()
+            self.close()
+
+    def close(self):
+        """Cancel the firmware's tasks so another Simulator can run after this one"""
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def report(self, wall_s, cpu_s):
+        sim_s = self.clock.now_us() / 1e6
+        fw = self.fw
+        topics = {}
+        for _, topic, payload in self.bus.messages:
+            count, size = topics.get(topic, (0, 0))
+            topics[topic] = (count + 1, size + len(payload))
+        tasks = {}
+        for name, setting in TASKS:
+            tasks[name] = (self.calls[name] / sim_s, 1000.0 / getattr(fw, setting))
+        return {
+            'sim_s': sim_s, 'wall_s': wall_s, 'cpu_s': cpu_s,
+            'speedup': sim_s / wall_s if wall_s else 0.0,
+            'loop_hz': self.loop.iterations / sim_s,
+            'idle_pct': 100.0 * self.loop.selector.idle_us / (sim_s * 1e6),
+            'sleep_pct': 100.0 * self.machine.slept_us / (sim_s * 1e6),
+            'tasks': tasks, 'topics': topics, 'rejected': self.bus.rejected,
+            'sessions': self.bus.sessions, 'reconnects': fw.link.reconnects,
+            'events': fw.outbox.report(),
+            'offline_s': fw.link.offline(fw.time.ticks_ms()) / 1000,
+            'redraws': self.display.redraws, 'tones': self.speaker.tones,
+            'pings': self.sonar.pings, 'lag_avg_ms': fw.loop_lag.avg_ms,
+        }
@@ -0,0 +1,101 @@
+# ============================================================================
+# AegisOne Simulator Clock
+# Virtual time for the firmware: host execution time plus skipped sleeps
+# ============================================================================
+# now_us() is the host's elapsed time plus every sleep the firmware asked
+# for. Sleeps return at once and move the clock forward instead, so code
+# runs at full host speed while its own cost still shows in ticks_us()
+# (loop lag, stage timing). The event loop's idle waits are skipped the
+# same way by SimLoop, which is what makes a run faster than real time.
+# ============================================================================
+
+import asyncio
+import selectors
+import time
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+
+class SimClock:
+    """Host time plus skipped sleeps, exposed as MicroPython time functions"""
+
+    def __init__(self, epoch_s=None):
+        # Wall-clock time at start unless a fixed epoch is given
+        self.epoch_s = time.time() if epoch_s is None else epoch_s
+        self.start_ns = time.perf_counter_ns()
+        self.skipped_us = 0
+
+    def now_us(self):
+        return (time.perf_counter_ns() - self.start_ns) // 1000 + self.skipped_us
+
+    def advance_us(self, us):
+        if us > 0:
+            self.skipped_us += int(us)
+
+    # MicroPython time module
+    def ticks_us(self):
+        return self.now_us() & _TICKS_MAX
+
+    def ticks_ms(self):
+        return (self.now_us() // 1000) & _TICKS_MAX
+
+    def ticks_add(self, ticks, delta):
+        return (ticks + delta) & _TICKS_MAX
+
+    def ticks_diff(self, end, start):
+        return ((end - start + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+    def sleep_us(self, us):
+        self.advance_us(us)
+
+    def sleep_ms(self, ms):
+        self.advance_us(ms * 1000)
+
+    def time(self):
+        return self.epoch_s + self.now_us() / 1e6
+
+    def install(self):
+        """Route the time module's MicroPython functions and time() here"""
+        time.ticks_us = self.ticks_us
+        time.ticks_ms = self.ticks_ms
+        time.ticks_add = self.ticks_add
+        time.ticks_diff = self.ticks_diff
+        time.sleep_us = self.sleep_us
+        time.sleep_ms = self.sleep_ms
+        time.time = self.time
+        return self
+
+
+class _IdleSelector(selectors.DefaultSelector):
+    """Polls instead of waiting; the wait is added to the clock"""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.idle_us = 0
+
+    def select(self, timeout=None):
+        if timeout:
+            us = int(timeout * 1e6)
+            self.clock.advance_us(us)
+            self.idle_us += us
+        return super().select(0)
+
+
+class SimLoop(asyncio.SelectorEventLoop):
+    """asyncio event loop running on a SimClock"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.selector = _IdleSelector(clock)
+        self.iterations = 0
+        super().__init__(self.selector)
+
+    def time(self):
+        return self.clock.now_us() / 1e6
+
+    def _run_once(self):
+        self.iterations += 1
+        super()._run_once()
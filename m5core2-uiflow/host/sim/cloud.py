@@ -0,0 +1,191 @@
+# ============================================================================
+# AegisOne Simulator Cloud
+# In-memory MQTT bus, a recording `IoTcloud.AWS` client and `wifiCfg`
+# ============================================================================
+# The Bus keeps every message the firmware publishes with its simulation
+# time and delivers injected commands to the firmware's subscriptions.
+# With paho-mqtt installed and a broker given, messages are also forwarded
+# to that broker and its command topic is fed back in, so the dashboard
+# backend can be pointed at a simulated node.
+#
+# The bus can also play the cloud's ingest rule that acknowledges events:
+# every message on a watched topic that carries an eventId is answered on
+# the ack topic followed by the sender's deviceId with {"deviceId": d,
+# "eventId": n} after a delay, unless it is lost.
+#
+# Network outages are scripted as (start_s, end_s) windows: the WiFi link
+# drops and publishes raise as they do on the device. Broker drops are
+# scripted as times at which the broker closes every connection while
+# WiFi stays up. Either one ends the client's session: its publishes
+# raise and its subscriptions are gone until it connects and subscribes
+# again.
+#
+# Connecting is instant unless join_s (WiFi association after the first
+# doConnect) or the client's connect_s (TLS handshake and MQTT CONNECT,
+# blocking like the device's client) is given; the boot benchmark uses
+# both.
+# ============================================================================
+
+import json
+import random
+
+from aegis_wire import decode
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+
+class Bus:
+    """Records publishes and routes commands to subscribers"""
+
+    def __init__(self, loop, clock):
+        self.loop = loop
+        self.clock = clock
+        self.messages = []   # (sim ms, topic, payload)
+        self.subscribers = {}
+        self.rejected = 0
+        self.sessions = 0
+        self.qos1 = 0
+        self.acks = {}
+        self.acked = 0
+        self.client = None
+
+    def publish(self, topic, payload, qos=0):
+        # Encoders hand out views of a reused buffer; the broker keeps a copy
+        if isinstance(payload, memoryview):
+            payload = bytes(payload)
+        self.messages.append((self.clock.now_us() // 1000, topic, payload))
+        if qos:
+            self.qos1 += 1
+        if self.client is not None:
+            self.client.publish(topic, payload, qos)
+        rule = self.acks.get(topic)
+        if rule is not None:
+            self._acknowledge(rule, payload)
+
+    def acknowledge(self, topic, ack_topic, delay_s=0.2, loss=0.0, seed=19):
+        """Answer every event on topic with its eventId on ack_topic + deviceId"""
+        self.acks[topic] = (ack_topic, delay_s, loss, random.Random(seed))
+
+    def _acknowledge(self, rule, payload):
+        ack_topic, delay_s, loss, rng = rule
+        if isinstance(payload, str):
+            payload = payload.encode()
+        msg = decode(payload)
+        event_id = msg.get('eventId')
+        if not event_id or rng.random() < loss:
+            return
+        self.acked += 1
+        device = msg.get('deviceId')
+        self.loop.call_later(delay_s, self.deliver, ack_topic + device,
+                             json.dumps({'deviceId': device, 'eventId': event_id}))
+
+    def subscribe(self, topic, callback, owner=None):
+        self.subscribers.setdefault(topic, []).append((owner, callback))
+        if self.client is not None:
+            self.client.subscribe(topic)
+
+    def deliver(self, topic, payload):
+        for owner, callback in self.subscribers.get(topic, ()):
+            if owner is None or owner.alive():
+                callback(payload)
+
+    def inject(self, at_s, topic, payload):
+        """Deliver payload on topic at simulation time at_s"""
+        self.loop.call_at(at_s, self.deliver, topic, payload)
+
+    def connect(self, host, port=1883):
+        """Mirror traffic to an MQTT broker (needs paho-mqtt)"""
+        if mqtt is None:
+            raise RuntimeError('paho-mqtt is not installed')
+        client = mqtt.Client()
+        client.on_message = lambda c, u, msg: self.loop.call_soon_threadsafe(
+            self.deliver, msg.topic, msg.payload.decode())
+        client.connect(host, port)
+        client.loop_start()
+        self.client = client
+
+    def close(self):
+        if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.client = None
+
+
+class Network:
+    """WiFi link state with scripted outages and broker drops"""
+
+    def __init__(self, clock, outages=(), drops=(), join_s=0.0):
+        self.clock = clock
+        self.outages = [(a * 1e6, b * 1e6) for a, b in outages]
+        self.drops = [t * 1e6 for t in drops]
+        self.join_us = join_s * 1e6
+        self.joined_at = None if join_s else 0
+        self.connects = 0
+
+    def session(self):
+        """Number of connection-ending events so far"""
+        now = self.clock.now_us()
+        return (sum(1 for start, _ in self.outages if start <= now)
+                + sum(1 for t in self.drops if t <= now))
+
+    def up(self):
+        now = self.clock.now_us()
+        if self.joined_at is None or now < self.joined_at:
+            return False
+        for start, end in self.outages:
+            if start <= now < end:
+                return False
+        return True
+
+    def wifi_cfg(self):
+        """The `wifiCfg` module"""
+        net = self
+
+        class Station:
+            def isconnected(self):
+                return net.up()
+
+        class WifiCfg:
+            wlan_sta = Station()
+
+            @staticmethod
+            def doConnect(ssid, password):
+                net.connects += 1
+                if net.joined_at is None:
+                    net.joined_at = net.clock.now_us() + net.join_us
+
+        return WifiCfg
+
+
+def make_aws(bus, network, connect_s=0.0):
+    """The `IoTcloud.AWS.AWS` client class"""
+
+    class AWS:
+        def __init__(self, things_name=None, host=None, port=None, keepalive=60,
+                     cert_file_path=None, private_key_path=None):
+            if not network.up():
+                raise OSError('MQTT connect failed: network down')
+            network.clock.advance_us(connect_s * 1e6)
+            self.things_name = things_name
+            self.session = network.session()
+            bus.sessions += 1
+
+        def alive(self):
+            return network.up() and self.session == network.session()
+
+        def subscribe(self, topic, callback):
+            bus.subscribe(topic, callback, self)
+
+        def start(self):
+            pass
+
+        def publish(self, topic, payload, qos=0):
+            if not self.alive():
+                bus.rejected += 1
+                raise OSError('MQTT publish failed: connection lost')
+            bus.publish(topic, payload, qos)
+
+    return AWS
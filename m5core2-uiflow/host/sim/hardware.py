@@ -0,0 +1,232 @@
+# ============================================================================
+# AegisOne Simulator Hardware
+# Scripted sensors and the `machine` / `imu` / `m5stack` stand-ins
+# ============================================================================
+# A Plant holds the sensor trace and answers "what is the reading now" on
+# the simulation clock. The IMU turns the trace's vibration level into a
+# 50 Hz sine on top of gravity (the firmware's window peak then equals the
+# trace value), the ultrasonic echo pin is driven by events on the event
+# loop so the firmware's IRQ path runs unchanged, and the AXP192 fakes
+# report the trace battery and temperature.
+#
+# Hardware timers run on the event loop. A callback due every few
+# milliseconds is called in bursts of TIMER_BURST_MS worth of periods, which
+# keeps a 500 Hz sampler affordable at the cost of bunching its samples.
+# ============================================================================
+
+import math
+import random
+import types
+
+TIMER_BURST_MS = 10
+VIB_TONE_HZ = 50.0
+ECHO_DELAY_US = 450   # HC-SR04 burst before the echo goes high
+US_PER_CM = 2 / 0.034
+
+
+class Plant:
+    """Sensor values from a trace (t_ms, temp, vib, distance, battery[, ...])"""
+
+    def __init__(self, clock, trace, noise=0.0, seed=16):
+        self.clock = clock
+        self.trace = trace
+        self.noise = noise
+        self.rng = random.Random(seed)
+
+    def row(self):
+        return self.trace.at(self.clock.now_us() // 1000)
+
+    @property
+    def temp(self):
+        return self.row()[1]
+
+    @property
+    def vib(self):
+        return self.row()[2]
+
+    @property
+    def distance(self):
+        return self.row()[3]
+
+    @property
+    def battery(self):
+        return self.row()[4]
+
+
+class SimIMU:
+    """imu.IMU(): trace vibration as a tone on the Z axis"""
+
+    def __init__(self, plant, rate_hz=500):
+        self.plant = plant
+        self.dt = 1.0 / rate_hz
+        self.n = 0
+        self.w = 2 * math.pi * VIB_TONE_HZ
+
+    @property
+    def acceleration(self):
+        t = self.n * self.dt
+        self.n += 1
+        amp = self.plant.vib
+        if self.plant.noise:
+            amp += self.plant.rng.gauss(0, self.plant.noise)
+        return (0.0, 0.0, 1.0 + amp * math.sin(self.w * t))
+
+
+class Power:
+    """AXP192 fake: battery from the trace; getVbatVoltage() is what the
+    firmware's placeholder turns into the trace temperature"""
+
+    def __init__(self, plant):
+        self.plant = plant
+        self.vibration = False
+        self.vibrations = 0
+
+    def getBatVoltage(self):
+        return 3.2 + self.plant.battery / 100.0
+
+    def getVbatVoltage(self):
+        # read_temperature(): temp = getVbatVoltage() * 0.01 + 25
+        return (self.plant.temp - 25) * 100
+
+    def setVibrationEnable(self, on):
+        if on and not self.vibration:
+            self.vibrations += 1
+        self.vibration = on
+
+
+class Speaker:
+    def __init__(self):
+        self.tones = 0
+
+    def tone(self, freq, duration):
+        self.tones += 1
+
+
+class Button:
+    def __init__(self, loop):
+        self.loop = loop
+        self.callback = None
+
+    def wasPressed(self, callback):
+        self.callback = callback
+
+    def press(self):
+        if self.callback is not None:
+            self.loop.call_soon(self.callback)
+
+
+class Sonar:
+    """Drives the echo pin for every trigger pulse"""
+
+    def __init__(self, loop, plant):
+        self.loop = loop
+        self.plant = plant
+        self.echo = None
+        self.pings = 0
+
+    def on_trigger(self):
+        self.pings += 1
+        if self.echo is None:
+            return
+        now = self.loop.time()
+        start = now + ECHO_DELAY_US / 1e6
+        width = self.plant.distance * US_PER_CM / 1e6
+        echo = self.echo
+        self.loop.call_at(start, echo.drive, 1)
+        self.loop.call_at(start + width, echo.drive, 0)
+
+    def pulse_us(self):
+        return int(self.plant.distance * US_PER_CM)
+
+
+def make_machine(loop, clock, sonar):
+    """A `machine` module: Pin (with IRQs), Timer, time_pulse_us, lightsleep"""
+
+    class Pin:
+        IN = 1
+        OUT = 3
+        IRQ_RISING = 1
+        IRQ_FALLING = 2
+
+        def __init__(self, pin_id, mode=IN):
+            self.id = pin_id
+            self.mode = mode
+            self.level = 0
+            self.handler = None
+            self.trigger = 0
+            if mode == Pin.IN:
+                sonar.echo = self
+
+        def value(self, v=None):
+            if v is None:
+                return self.level
+            old = self.level
+            self.level = 1 if v else 0
+            if self.mode == Pin.OUT and old == 1 and self.level == 0:
+                sonar.on_trigger()
+
+        def irq(self, handler=None, trigger=0, hard=False):
+            self.handler = handler
+            self.trigger = trigger
+
+        def drive(self, level):
+            if level == self.level:
+                return
+            self.level = level
+            edge = Pin.IRQ_RISING if level else Pin.IRQ_FALLING
+            if self.handler is not None and self.trigger & edge:
+                self.handler(self)
+
+    class Timer:
+        PERIODIC = 1
+        ONE_SHOT = 0
+
+        def __init__(self, timer_id=0):
+            self.id = timer_id
+            self.handle = None
+
+        def init(self, period=1000, mode=PERIODIC, callback=None):
+            self.deinit()
+            self.period_us = period * 1000
+            self.mode = mode
+            self.callback = callback
+            self.due_us = clock.now_us() + self.period_us
+            self._schedule()
+
+        def _schedule(self):
+            wait_us = max(self.period_us, TIMER_BURST_MS * 1000)
+            self.handle = loop.call_later(wait_us / 1e6, self._fire)
+
+        def _fire(self):
+            now = clock.now_us()
+            while self.due_us <= now:
+                self.callback(self)
+                if self.mode != Timer.PERIODIC:
+                    self.handle = None
+                    return
+                self.due_us += self.period_us
+            self._schedule()
+
+        def deinit(self):
+            if self.handle is not None:
+                self.handle.cancel()
+                self.handle = None
+
+    def time_pulse_us(pin, level, timeout_us):
+        width = sonar.pulse_us()
+        if width > timeout_us:
+            clock.advance_us(timeout_us)
+            return -1
+        clock.advance_us(ECHO_DELAY_US + width)
+        return width
+
+    def lightsleep(ms=0):
+        clock.advance_us(ms * 1000)
+        machine.slept_us += ms * 1000
+
+    def reset():
+        raise SystemExit('machine.reset()')
+
+    machine = types.SimpleNamespace(Pin=Pin, Timer=Timer, time_pulse_us=time_pulse_us,
+                                    lightsleep=lightsleep, reset=reset, slept_us=0)
+    return machine
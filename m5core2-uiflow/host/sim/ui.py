@@ -0,0 +1,71 @@
+# ============================================================================
+# AegisOne Simulator UI
+# Headless `m5stack_ui` widgets that keep their state and count redraws
+# ============================================================================
+
+FONTS = ('FONT_MONT_10', 'FONT_MONT_12', 'FONT_MONT_14', 'FONT_MONT_16',
+         'FONT_MONT_18', 'FONT_MONT_20', 'FONT_MONT_22', 'FONT_MONT_24',
+         'FONT_MONT_26', 'FONT_MONT_28', 'FONT_MONT_30', 'FONT_MONT_32',
+         'FONT_MONT_34', 'FONT_MONT_36', 'FONT_MONT_38', 'FONT_MONT_40',
+         'FONT_MONT_44', 'FONT_MONT_48')
+
+
+class Display:
+    """Every widget created, and how many calls would have redrawn one"""
+
+    def __init__(self):
+        self.widgets = []
+        self.redraws = 0
+        self.bg = None
+
+
+class M5Screen:
+    display = None
+
+    def clean_screen(self):
+        self.display.widgets = []
+
+    def set_screen_bg_color(self, color):
+        self.display.bg = color
+        self.display.redraws += 1
+
+
+class _Widget:
+    display = None
+
+    def __init__(self, text='', x=0, y=0, color=0, font=None, parent=None, **kw):
+        self.text = text
+        self.x = x
+        self.y = y
+        self.color = color
+        self.display.widgets.append(self)
+
+    def set_text(self, text):
+        self.text = text
+        self.display.redraws += 1
+
+    def set_text_color(self, color):
+        self.color = color
+        self.display.redraws += 1
+
+
+class M5Label(_Widget):
+    pass
+
+
+class M5Rect(_Widget):
+    def __init__(self, x=0, y=0, w=0, h=0, color=0, radius=0, parent=None, **kw):
+        _Widget.__init__(self, '', x, y, color)
+
+    def set_bg_color(self, color):
+        self.set_text_color(color)
+
+
+def names(display):
+    """Names exported by the `m5stack_ui` module"""
+    M5Screen.display = display
+    _Widget.display = display
+    out = {'M5Screen': M5Screen, 'M5Label': M5Label, 'M5Rect': M5Rect}
+    for font in FONTS:
+        out[font] = font
+    return out
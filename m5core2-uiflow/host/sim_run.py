@@ -0,0 +1,123 @@
+# ============================================================================
+# AegisOne Simulator Runner
+# Runs the real firmware main() faster than real time against a sensor
+# trace and reports messages per topic, task and loop rates and host CPU
+# time. Optional network outages, broker drops, event acknowledgement
+# delay and loss, scripted commands, firmware setting overrides, a JSONL
+# recording of every message and a local MQTT broker.
+#
+#   python3 m5core2-uiflow/host/sim_run.py [--trace rec.csv] [--seconds N]
+#       [--outage 600:900] [--drop 1200] [--ack-delay 0.2] [--ack-loss 0.1] [--command '120:{"command": "profile"}']
+#       [--set WIRE_FORMAT=cbor] [--record messages.jsonl]
+#       [--broker localhost:1883] [--verbose]
+# ============================================================================
+
+import argparse
+import ast
+import base64
+import contextlib
+import io
+import json
+import sys
+
+import stubs
+
+stubs.install()
+
+import traces
+from sim import Simulator
+
+
+def parse_setting(text):
+    name, _, value = text.partition('=')
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+def parse_window(text):
+    start, _, end = text.partition(':')
+    return float(start), float(end)
+
+
+def record(path, messages):
+    with open(path, 'w') as f:
+        for t_ms, topic, payload in messages:
+            row = {'t_ms': t_ms, 'topic': topic}
+            if isinstance(payload, (bytes, bytearray)):
+                row['b64'] = base64.b64encode(bytes(payload)).decode()
+            else:
+                row['payload'] = payload
+            f.write(json.dumps(row) + '\n')
+
+
+def print_report(r):
+    print('simulated {:.0f} s in {:.1f} s wall ({:.0f}x real time), {:.1f} s CPU'.format(
+        r['sim_s'], r['wall_s'], r['speedup'], r['cpu_s']))
+    print('event loop {:.0f} iterations/s, {:.1f}% idle, {:.1f}% light sleep, '
+          'loop lag avg {:.1f} ms'.format(r['loop_hz'], r['idle_pct'], r['sleep_pct'],
+                                          r['lag_avg_ms']))
+    for name, (got, nominal) in r['tasks'].items():
+        print('  {:<17} {:>6.2f}/s (nominal {:>5.2f}/s)'.format(name, got, nominal))
+    total = 0
+    for topic, (count, size) in sorted(r['topics'].items()):
+        total += count
+        print('  {:<28} {:>6} messages {:>9} bytes'.format(topic, count, size))
+    print('{} messages, {} rejected while offline, {} label redraws, {} tones, {} pings'.format(
+        total, r['rejected'], r['redraws'], r['tones'], r['pings']))
+    print('{} MQTT sessions, {} reconnects, {:.0f} s offline'.format(
+        r['sessions'], r['reconnects'], r['offline_s']))
+    e = r['events']
+    print('events: {} sent, {} acked, {} retries, {} expired, {} dropped, {} queued, '
+          '{} readings shed, ack p50 {} ms p95 {} ms'.format(
+              e['sent'], e['acked'], e['retries'], e['expired'], e['dropped'], e['depth'],
+              e['shed'], e['ackP50Ms'], e['ackP95Ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the firmware against a trace')
+    parser.add_argument('--trace', help='CSV recording (t_ms,temp,vib,distance,battery)')
+    parser.add_argument('--seconds', type=float, default=600, help='simulation time')
+    parser.add_argument('--outage', action='append', default=[], metavar='START:END',
+                        help='network down between these simulation seconds')
+    parser.add_argument('--drop', action='append', default=[], type=float, metavar='T',
+                        help='broker closes the connection at simulation second T')
+    parser.add_argument('--ack-delay', type=float, default=0.2, help='event ack delay in s')
+    parser.add_argument('--ack-loss', type=float, default=0.0, help='fraction of acks lost')
+    parser.add_argument('--command', action='append', default=[], metavar='T:JSON',
+                        help='command delivered at simulation second T')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a firmware setting')
+    parser.add_argument('--noise', type=float, default=0.0, help='IMU noise in g')
+    parser.add_argument('--record', help='write every message to this JSONL file')
+    parser.add_argument('--broker', help='also publish to this MQTT broker (host:port)')
+    parser.add_argument('--verbose', action='store_true', help='show firmware output')
+    args = parser.parse_args()
+    rows = traces.read_csv(args.trace) if args.trace else traces.synthetic_shift()
+
+    sim = Simulator(rows, [parse_window(w) for w in args.outage], args.noise, drops=args.drop)
+    fw = sim.load(dict(parse_setting(s) for s in args.set))
+    sim.bus.acknowledge(fw.TOPIC_EVENTS, fw.TOPIC_EVENT_ACKS, args.ack_delay, args.ack_loss)
+    for c in args.command:
+        at, _, payload = c.partition(':')
+        sim.command(float(at), payload)
+    if args.broker:
+        host, _, port = args.broker.partition(':')
+        sim.bus.connect(host, int(port or 1883))
+
+    out = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(out):
+        r = sim.run(args.seconds)
+    print_report(r)
+    if args.record:
+        record(args.record, sim.bus.messages)
+        print('recorded to', args.record)
+
+    ok = r['speedup'] > 1 and sum(c for c, _ in r['topics'].values()) > 0
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
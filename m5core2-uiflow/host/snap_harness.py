@@ -0,0 +1,236 @@
+# ============================================================================
+# AegisOne Waveform Snapshot Harness
+# Checks aegis_snap's Capture and Reassembler on their own: waveforms
+# (a 50 Hz tone, noise, values clipped at +-16 g, full-scale steps, a short
+# history after boot) go through a trigger, are chunked, delivered out of
+# order with a duplicate and must come back as exactly the codes the
+# capture held. Also a trigger while one snapshot is held, a window the
+# samples stop filling and two nodes sending the same snapshot ID.
+# Then runs the firmware in the simulator through a CRITICAL vibration
+# episode: the snapshot must carry the CRITICAL event's ID, reproduce the
+# samples the sampler fed it bit for bit, show the onset, and go out after
+# the event, only while no event is waiting, one chunk at a time.
+#
+#   python3 m5core2-uiflow/host/snap_harness.py
+# ============================================================================
+
+import contextlib
+import io
+import math
+import random
+import sys
+
+import stubs
+
+stubs.install()
+
+from aegis_snap import Capture, Reassembler, quantize, IDLE, FROZEN
+from aegis_wire import decode
+from sim import Simulator
+
+RATE_HZ = 500
+PRE_MS = 1000
+POST_MS = 1000
+CHUNK = 512
+
+
+def tone(n, amp=2.8, hz=50.0):
+    return [amp * math.sin(2 * math.pi * hz * i / RATE_HZ) for i in range(n)]
+
+
+def noise(n, seed=3):
+    rng = random.Random(seed)
+    return [rng.gauss(0, 0.05) for _ in range(n)]
+
+
+def chunks_of(cap):
+    out = []
+    while cap.ready():
+        first = bytes(cap.chunk())
+        if bytes(cap.chunk()) != first:  # a retry sends the same chunk
+            return None
+        out.append(first)
+        cap.next()
+    return out
+
+
+def roundtrip(name, samples, at, device='node-a', snap_id=7):
+    """Feed samples, trigger at index `at`, and reassemble shuffled chunks"""
+    cap = Capture(device, RATE_HZ, PRE_MS, POST_MS, CHUNK)
+    for v in samples[:at]:
+        cap.add(v)
+    cap.trigger(snap_id, 1700000000000, 0)
+    for v in samples[at:]:
+        cap.add(v)
+    pre_n = min(at, cap.pre)
+    expected = [quantize(v) for v in samples[at - pre_n:at + cap.post]]
+    chunks = chunks_of(cap)
+    if chunks is None or cap.state != IDLE:
+        print('  {:<14} chunks not repeatable or capture not released'.format(name))
+        return False
+    mixed = chunks + chunks[:1]
+    random.Random(len(samples)).shuffle(mixed)
+    asm = Reassembler()
+    done = [s for s in map(asm.add, mixed) if s is not None]
+    ok = len(done) == 1 and list(done[0]['codes']) == expected
+    ok &= asm.duplicates == 1 and not asm.pending() and max(map(len, chunks)) <= CHUNK
+    if ok:
+        snap = done[0]
+        ok = snap['preSamples'] == pre_n and snap['id'] == snap_id and snap['deviceId'] == device
+        # Dequantised values are within half a code of every sample inside the range
+        ok &= all(abs(v - s) <= 0.5 / snap['lsbPerG'] + 1e-9
+                  for v, s in zip(snap['values'], samples[at - pre_n:])
+                  if abs(s) < 32767 / snap['lsbPerG'])
+        print('  {:<14} {:>4} samples in {} chunks, {:.2f} bytes/sample (float: 4)'.format(
+            name, len(expected), snap['chunks'], snap['bytes'] / len(expected)))
+    else:
+        print('  {:<14} MISMATCH'.format(name))
+    return ok
+
+
+def check_codec():
+    ok = True
+    ok &= roundtrip('quiet', noise(2000), 1500)
+    ok &= roundtrip('50 Hz 2.8 g', noise(1000) + tone(1000), 1200)
+    ok &= roundtrip('clipped', [(-1) ** i * 20.0 for i in range(1500)], 700)
+    ok &= roundtrip('full-scale', [16.0 if (i // 3) % 2 else -16.0 for i in range(1500)], 600)
+    ok &= roundtrip('after boot', tone(700), 120)
+
+    cap = Capture('node-a', RATE_HZ, PRE_MS, POST_MS, CHUNK)
+    for v in noise(600):
+        cap.add(v)
+    busy = cap.trigger(1, 0, 0) and not cap.trigger(2, 0, 10)
+    for v in noise(100):
+        cap.add(v)
+    cap.poll(2 * POST_MS + 900)
+    still = cap.recording()
+    cap.poll(2 * POST_MS + 1100)  # the samples stopped: close with what there is
+    short = cap.state == FROZEN and cap.count == cap.pre + 100 and cap.short == 1
+    snap = [s for s in map(Reassembler().add, chunks_of(cap)) if s is not None]
+    ok &= busy and cap.missed == 1 and still and short and len(snap) == 1
+    print('  trigger while held: missed {}, stalled window closed with {} samples'.format(
+        cap.missed, cap.count))
+
+    asm = Reassembler()
+    parts = []
+    for device in ('node-a', 'node-b'):
+        cap = Capture(device, RATE_HZ, PRE_MS, POST_MS, CHUNK)
+        for v in tone(3000):
+            cap.add(v)
+            if cap.state == IDLE and cap.filled == cap.pre:
+                cap.trigger(9, 0, 0)
+        parts.append(chunks_of(cap))
+    interleaved = [c for pair in zip(*parts) for c in pair]
+    done = [s for s in map(asm.add, interleaved) if s is not None]
+    ok &= sorted(s['deviceId'] for s in done) == ['node-a', 'node-b']
+    print('  two nodes, one snapshot ID: {} snapshots'.format(len(done)))
+    return ok
+
+
+class LoggedCapture(Capture):
+    """The firmware's Capture, also keeping every sample it was given"""
+
+    def __init__(self, *args):
+        Capture.__init__(self, *args)
+        self.log = []
+        self.marks = []
+
+    def add(self, v):
+        self.log.append(v)
+        Capture.add(self, v)
+
+    def trigger(self, snap_id, ts, now_ms):
+        started = Capture.trigger(self, snap_id, ts, now_ms)
+        if started:
+            self.marks.append(len(self.log))
+        return started
+
+
+def episode():
+    """Steady machine with 30 s of 2.8 g vibration (CRITICAL) from 100 s"""
+    return [(s * 1000, 28.0, 2.8 if 100 <= s < 130 else 0.3, 180.0, 70) for s in range(240)]
+
+
+def simulate():
+    sim = Simulator(episode())
+    fw = sim.load()
+    fw.Capture = LoggedCapture
+    # Events waiting or in flight whenever a chunk goes out
+    fw.chunk_depths = []
+    publish = sim.bus.publish
+
+    def watched(topic, payload, qos=0):
+        if topic == fw.TOPIC_SNAPSHOTS:
+            fw.chunk_depths.append(fw.outbox.depth())
+        publish(topic, payload, qos)
+    sim.bus.publish = watched
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(240)
+    return sim, fw
+
+
+def check_node():
+    sim, fw = simulate()
+    cap = fw.snap
+    chunks = [(t, p) for t, topic, p in sim.bus.messages if topic == fw.TOPIC_SNAPSHOTS]
+    critical = [(t, decode(p.encode() if isinstance(p, str) else p))
+                for t, topic, p in sim.bus.messages if topic == fw.TOPIC_EVENTS]
+    critical = [(t, e) for t, e in critical if e.get('severity') == 'CRITICAL']
+    asm = Reassembler()
+    mixed = [p for _, p in chunks]
+    random.Random(1).shuffle(mixed)
+    done = [s for s in map(asm.add, mixed) if s is not None]
+    if len(done) != 1 or len(critical) != 1 or len(cap.marks) != 1:
+        print('  {} snapshots, {} CRITICAL events'.format(len(done), len(critical)))
+        return False
+    snap = done[0]
+    event_ms, event = critical[0]
+
+    at = cap.marks[0]
+    pre_n = snap['preSamples']
+    expected = [quantize(v) for v in cap.log[at - pre_n:at + cap.post]]
+    exact = list(snap['codes']) == expected
+    values = snap['values']
+    quiet = max(abs(v) for v in values[:50])
+    loud = max(abs(v) for v in values[pre_n:])
+    onset = next(i for i, v in enumerate(values) if abs(v) > 1.0) - pre_n
+    print('  snapshot {} for event {}: {} + {} samples at {} Hz, {} chunks, {} bytes'.format(
+        snap['id'], event.get('eventId'), pre_n, len(values) - pre_n, snap['rateHz'],
+        snap['chunks'], snap['bytes']))
+    print('  bit-exact: {}, peak before onset {:.2f} g, after trigger {:.2f} g, '
+          'onset {} ms before the trigger'.format('yes' if exact else 'NO', quiet, loud,
+                                                  -onset * 1000 // snap['rateHz']))
+    ok = exact and snap['id'] == event.get('eventId') and pre_n == cap.pre
+    ok &= quiet < 1.0 and loud > fw.VIB_CRITICAL and onset < 0
+    ok &= abs(snap['ts'] - event['eventTs']) <= 1000
+
+    # Low priority: after the CRITICAL batch and event, only with no event
+    # waiting or in flight, one chunk per SNAP_CHUNK_MS at most
+    times = [t for t, _ in chunks]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    flushed = [t for t, topic, _ in sim.bus.messages
+               if topic == fw.TOPIC_TELEMETRY_BATCH and t <= event_ms]
+    ok &= bool(flushed) and times[0] > event_ms and min(gaps) >= fw.SNAP_CHUNK_MS
+    ok &= len(fw.chunk_depths) == len(chunks) and not any(fw.chunk_depths)
+    rate = max(len(p) for _, p in chunks) * 1000 / fw.SNAP_CHUNK_MS
+    print('  chunks from {:.1f} s to {:.1f} s (event at {:.1f} s), min gap {} ms, '
+          'events pending at each chunk: {}, at most {:.0f} B/s'.format(
+              times[0] / 1000, times[-1] / 1000, event_ms / 1000, min(gaps),
+              max(fw.chunk_depths), rate))
+    return ok
+
+
+def main():
+    results = []
+    print('capture, chunks and reassembly')
+    results.append(check_codec())
+    print('simulated node, 2.8 g from 100 s to 130 s')
+    results.append(check_node())
+
+    ok = all(results)
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
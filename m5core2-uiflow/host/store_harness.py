@@ -0,0 +1,153 @@
+# ============================================================================
+# AegisOne Store-and-Forward Harness
+# Exercises StoreForward against a temp directory: ordering, batching,
+# rotation with bounded size, cursor persistence and torn-tail recovery.
+#
+#   python3 m5core2-uiflow/host/store_harness.py
+# ============================================================================
+
+import os
+import sys
+import tempfile
+import time
+
+import stubs
+
+stubs.install()
+
+from aegis_store import StoreForward, pack_reading, unpack_reading, READING_SIZE
+
+SEGMENT_BYTES = 24 * 50  # 50 readings per segment
+MAX_SEGMENTS = 4
+
+failures = []
+
+
+def check(name, cond):
+    print('{:<44} {}'.format(name, 'OK' if cond else 'FAIL'))
+    if not cond:
+        failures.append(name)
+
+
+def reading(i):
+    return pack_reading(1700000000000 + i * 5000, 25.0 + i * 0.01, 0.2, 150.0,
+                        'WARNING' if i % 7 == 0 else 'RUNNING', 80)
+
+
+def drain(q, batch=20):
+    out = []
+    while not q.is_empty():
+        recs = q.read_batch(batch)
+        out.extend(recs)
+        q.commit()
+    return out
+
+
+def check_roundtrip(root):
+    rec = reading(3)
+    ts, temp, vib, dist, status, bat = unpack_reading(rec)
+    check('record is {} bytes'.format(READING_SIZE), len(rec) == READING_SIZE)
+    check('pack/unpack round trip', ts == 1700000015000 and status == 'RUNNING' and bat == 80)
+
+
+def check_fifo_and_batches(root):
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    for i in range(120):
+        q.append(reading(i))
+    batches = 0
+    out = []
+    while not q.is_empty():
+        recs = q.read_batch(20)
+        out.extend(recs)
+        batches += 1
+        q.commit()
+    check('120 records drained in 6 batches', batches == 6 and len(out) == 120)
+    check('FIFO order preserved across segments', out == [reading(i) for i in range(120)])
+    check('consumed segments deleted', len([n for n in os.listdir(root) if n.endswith('.bin')]) <= 1)
+
+
+def check_uncommitted_batch_is_redelivered(root):
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    for i in range(10):
+        q.append(reading(i))
+    first = q.read_batch(5)
+    # Publish failed: no commit, reopen as if rebooted
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    again = q.read_batch(5)
+    check('uncommitted batch redelivered after reopen', first == again)
+    q.commit()
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    check('committed cursor persisted', drain(q) == [reading(i) for i in range(5, 10)])
+
+
+def check_cursor_never_missing(root):
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    for i in range(10):
+        q.append(reading(i))
+    q.read_batch(5)
+    q.commit()
+    # Power lost between removing the cursor and renaming the new one in
+    # would leave none and replay everything: the rename must replace it
+    removed = []
+    remove = os.remove
+
+    def watched(path):
+        removed.append(path)
+        remove(path)
+    os.remove = watched
+    try:
+        q.read_batch(5)
+        q.commit()
+    finally:
+        os.remove = remove
+    check('cursor replaced, never removed', not any(p.endswith('/cursor') for p in removed))
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    check('replaced cursor persisted', q.is_empty())
+
+
+def check_bounded(root):
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    for i in range(1000):
+        q.append(reading(i))
+    total = sum(os.stat(root + '/' + n).st_size for n in os.listdir(root) if n.endswith('.bin'))
+    check('size bounded to max_segments', total <= SEGMENT_BYTES * MAX_SEGMENTS)
+    out = drain(q)
+    check('newest records kept, oldest dropped', out[-1] == reading(999) and q.dropped + len(out) == 1000)
+
+
+def check_torn_tail(root):
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    for i in range(10):
+        q.append(reading(i))
+    # Simulate power loss half-way through a write
+    with open(q._path(q.write_seg), 'ab') as f:
+        f.write(bytes((22, 0)) + b'\x01\x02\x03')
+    q = StoreForward(root, SEGMENT_BYTES, MAX_SEGMENTS)
+    for i in range(10, 15):
+        q.append(reading(i))
+    check('torn tail skipped, later records intact', drain(q) == [reading(i) for i in range(15)])
+
+
+def bench(root):
+    q = StoreForward(root, 16384, 8)
+    n = 2000
+    t0 = time.perf_counter()
+    for i in range(n):
+        q.append(reading(i))
+    t1 = time.perf_counter()
+    drain(q, 20)
+    t2 = time.perf_counter()
+    print('append: {:.1f} us/record, drain: {:.1f} us/record'.format(
+        (t1 - t0) / n * 1e6, (t2 - t1) / n * 1e6))
+
+
+def main():
+    for fn in (check_roundtrip, check_fifo_and_batches, check_uncommitted_batch_is_redelivered,
+               check_cursor_never_missing, check_bounded, check_torn_tail, bench):
+        with tempfile.TemporaryDirectory() as root:
+            fn(root)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
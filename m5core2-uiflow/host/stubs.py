@@ -0,0 +1,284 @@
+# ============================================================================
+# AegisOne Host Stubs
+# Minimal stand-ins for MicroPython/UIFlow modules so firmware modules can be
+# imported and exercised under CPython on Linux.
+# ============================================================================
+
+import gc
+import math
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+FIRMWARE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_gc_collect = gc.collect
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+
+def _ticks_us():
+    return (time.perf_counter_ns() // 1000) & _TICKS_MAX
+
+
+def _ticks_ms():
+    return (time.perf_counter_ns() // 1000000) & _TICKS_MAX
+
+
+def _ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def _ticks_diff(end, start):
+    return ((end - start + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def _sleep_ms(ms):
+    time.sleep(ms / 1000.0)
+
+
+def _sleep_us(us):
+    time.sleep(us / 1000000.0)
+
+
+def install_time():
+    """Add the MicroPython ticks_* / sleep_* helpers to CPython's time module"""
+    for name, fn in (('ticks_us', _ticks_us), ('ticks_ms', _ticks_ms),
+                     ('ticks_add', _ticks_add), ('ticks_diff', _ticks_diff),
+                     ('sleep_ms', _sleep_ms), ('sleep_us', _sleep_us)):
+        if not hasattr(time, name):
+            setattr(time, name, fn)
+
+
+class HeapModel:
+    """MicroPython-like gc.mem_alloc()/mem_free() on top of tracemalloc.
+
+    CPython frees most objects as soon as they are unreferenced, so the
+    traced memory alone never shows garbage. Each reading adds the peak
+    reached since the previous one, as if nothing had been freed, until
+    collect() brings it back to the memory actually in use."""
+
+    def __init__(self, heap_bytes=100 * 1024):
+        self.heap_bytes = heap_bytes
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.current = tracemalloc.get_traced_memory()[0]
+        self.alloc = self.current
+        tracemalloc.reset_peak()
+
+    def mem_alloc(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.alloc += max(0, peak - self.current)
+        self.current = current
+        tracemalloc.reset_peak()
+        return self.alloc
+
+    def mem_free(self):
+        return max(0, self.heap_bytes - self.mem_alloc())
+
+    def collect(self):
+        _gc_collect()
+        self.mem_alloc()
+        self.alloc = self.current
+        return 0
+
+    def threshold(self, amount=None):
+        return -1
+
+
+def install_gc(heap_bytes=100 * 1024):
+    """Add gc.mem_alloc / mem_free / threshold backed by a HeapModel; the
+    model's collect() replaces gc.collect() so it can reset the count"""
+    model = HeapModel(heap_bytes)
+    gc.mem_alloc = model.mem_alloc
+    gc.mem_free = model.mem_free
+    gc.threshold = model.threshold
+    gc.collect = model.collect
+    return model
+
+
+class SignalIMU:
+    """Scripted accelerometer: replays fn(t) -> (ax, ay, az) in g at a fixed rate"""
+
+    def __init__(self, fn, rate_hz):
+        self.fn = fn
+        self.dt = 1.0 / rate_hz
+        self.n = 0
+
+    @property
+    def acceleration(self):
+        t = self.n * self.dt
+        self.n += 1
+        return self.fn(t)
+
+
+def sine_signal(amplitude, freq_hz, axis=2):
+    """Gravity on Z plus a sinusoid of the given amplitude (g) on one axis"""
+    w = 2 * math.pi * freq_hz
+
+    def fn(t):
+        v = [0.0, 0.0, 1.0]
+        v[axis] += amplitude * math.sin(w * t)
+        return (v[0], v[1], v[2])
+    return fn
+
+
+def install_imu(fn=None, rate_hz=500):
+    """Register a stub `imu` module whose IMU() replays fn"""
+    fn = fn or sine_signal(0.0, 1.0)
+    mod = types.ModuleType('imu')
+    mod.IMU = lambda: SignalIMU(fn, rate_hz)
+    sys.modules['imu'] = mod
+    return mod
+
+
+def install():
+    """Install all stubs and put the firmware directory on sys.path"""
+    install_time()
+    if FIRMWARE_DIR not in sys.path:
+        sys.path.insert(0, FIRMWARE_DIR)
+
+
+class VirtualClock:
+    """Simulated microsecond clock with scheduled callbacks"""
+
+    def __init__(self):
+        self.now_us = 0
+        self.events = []
+
+    def ticks_us(self):
+        return self.now_us & _TICKS_MAX
+
+    def ticks_ms(self):
+        return (self.now_us // 1000) & _TICKS_MAX
+
+    def at(self, t_us, fn):
+        self.events.append((t_us, fn))
+        self.events.sort(key=lambda e: e[0])
+
+    def advance(self, us):
+        end = self.now_us + us
+        while self.events and self.events[0][0] <= end:
+            t, fn = self.events.pop(0)
+            self.now_us = max(self.now_us, t)
+            fn()
+        self.now_us = end
+
+    def sleep_us(self, us):
+        self.advance(us)
+
+    def sleep_ms(self, ms):
+        self.advance(ms * 1000)
+
+    def install(self):
+        """Route time.ticks_* / sleep_* through this clock"""
+        time.ticks_us = self.ticks_us
+        time.ticks_ms = self.ticks_ms
+        time.sleep_us = self.sleep_us
+        time.sleep_ms = self.sleep_ms
+        return self
+
+
+class SimPin:
+    """machine.Pin stand-in driven by a SimSonar"""
+    IN = 1
+    OUT = 3
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, sonar, pin_id, mode=IN):
+        self.sonar = sonar
+        self.id = pin_id
+        self.mode = mode
+        self.level = 0
+        self.handler = None
+        self.trigger = 0
+        sonar.pins[pin_id] = self
+
+    def value(self, v=None):
+        if v is None:
+            return self.level
+        old = self.level
+        self.level = 1 if v else 0
+        if self.id == self.sonar.trig_id and old == 1 and self.level == 0:
+            self.sonar.on_trigger()
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        self.handler = handler
+        self.trigger = trigger
+
+    def drive(self, level):
+        """Set the pin from the simulated device, firing the IRQ handler"""
+        if level == self.level:
+            return
+        self.level = level
+        edge = self.IRQ_RISING if level else self.IRQ_FALLING
+        if self.handler is not None and self.trigger & edge:
+            self.handler(self)
+
+
+class SimSonar:
+    """HC-SR04 model: echo pulse of 2*d/c after each trigger, with optional
+    timing jitter, dropouts and spurious echoes"""
+
+    US_PER_CM = 2 / 0.034
+
+    def __init__(self, clock, trig_id, echo_id, distance_fn, jitter_us=0,
+                 dropout=0.0, spurious=0.0, seed=1):
+        import random
+        self.clock = clock
+        self.trig_id = trig_id
+        self.echo_id = echo_id
+        self.distance_fn = distance_fn
+        self.jitter_us = jitter_us
+        self.dropout = dropout
+        self.spurious = spurious
+        self.rng = random.Random(seed)
+        self.pins = {}
+        self.last_pulse_us = None
+
+    def on_trigger(self):
+        t = self.clock.now_us
+        if self.rng.random() < self.dropout:
+            self.last_pulse_us = None
+            return
+        if self.rng.random() < self.spurious:
+            cm = self.rng.choice((0.5, 600.0))
+        else:
+            cm = self.distance_fn(t / 1e6)
+        width = int(cm * self.US_PER_CM + self.rng.uniform(-self.jitter_us, self.jitter_us))
+        start = t + 450  # sensor burst before echo goes high
+        self.last_pulse_us = (start, width)
+        echo = self.pins[self.echo_id]
+        self.clock.at(start, lambda: echo.drive(1))
+        self.clock.at(start + width, lambda: echo.drive(0))
+
+    def machine(self):
+        """A `machine`-like namespace exposing Pin and time_pulse_us"""
+        sonar = self
+
+        class Pin(SimPin):
+            def __init__(self, pin_id, mode=SimPin.IN):
+                SimPin.__init__(self, sonar, pin_id, mode)
+
+        def time_pulse_us(pin, level, timeout_us):
+            pulse = sonar.last_pulse_us
+            if pulse is None:
+                sonar.clock.advance(timeout_us)
+                return -2
+            start, width = pulse
+            wait = start - sonar.clock.now_us
+            if wait > timeout_us:
+                sonar.clock.advance(timeout_us)
+                return -2
+            if width > timeout_us:
+                sonar.clock.advance(wait + timeout_us)
+                return -1
+            sonar.clock.advance(wait + width)
+            return width
+
+        return types.SimpleNamespace(Pin=Pin, time_pulse_us=time_pulse_us)
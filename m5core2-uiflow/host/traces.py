@@ -0,0 +1,111 @@
+# ============================================================================
+# AegisOne Sensor Traces
+# CSV sensor recordings (one row per second) and synthetic shifts used
+# when no recording is given. Labelled traces add a 0/1 anomaly column.
+#
+#   t_ms,temp,vib,distance,battery[,anomaly]
+# ============================================================================
+
+import csv
+import math
+import random
+
+FIELDS = ('t_ms', 'temp', 'vib', 'distance', 'battery')
+
+
+def synthetic_shift(hours=2.0, seed=7):
+    """Mostly steady machine with a warm-up, two vibration episodes, two
+    approaches and a battery draining from 70% to 12%"""
+    rng = random.Random(seed)
+    n = int(hours * 3600)
+    rows = []
+    for s in range(n):
+        f = s / n
+        temp = 28.0 + math.sin(2 * math.pi * s / 1800) + rng.gauss(0, 0.05)
+        if 0.40 * n <= s < 0.50 * n:
+            temp += 9.0 * (s - 0.40 * n) / (0.10 * n)
+        elif 0.50 * n <= s < 0.58 * n:
+            temp += 9.0 * (1 - (s - 0.50 * n) / (0.08 * n))
+        vib = abs(0.30 + rng.gauss(0, 0.05))
+        if 0.25 * n <= s < 0.25 * n + 100:
+            vib = 1.8 + rng.gauss(0, 0.1)
+        elif 0.70 * n <= s < 0.70 * n + 30:
+            vib = 2.8 + rng.gauss(0, 0.1)
+        dist = 180.0 + rng.gauss(0, 1.0)
+        if 0.33 * n <= s < 0.33 * n + 60:
+            dist = 60.0 + rng.gauss(0, 1.0)
+        elif 0.83 * n <= s < 0.83 * n + 20:
+            dist = 25.0 + rng.gauss(0, 1.0)
+        battery = int(round(70 - 58 * f))
+        rows.append((s * 1000, round(temp, 2), round(vib, 3), round(dist, 1), battery))
+    return rows
+
+
+def labelled_shift(hours=6.0, seed=11):
+    """Steady machine with four labelled anomalies, three of them below the
+    fixed warning thresholds: a short vibration step, a slow vibration
+    drift (bearing wear), a slow temperature drift and a vibration warning"""
+    rng = random.Random(seed)
+    n = int(hours * 3600)
+    rows = []
+    for s in range(n):
+        h = s / 3600.0
+        temp = 28.0 + 0.5 * math.sin(2 * math.pi * s / (4 * 3600)) + rng.gauss(0, 0.05)
+        vib = abs(0.30 + rng.gauss(0, 0.03))
+        dist = 180.0 + rng.gauss(0, 1.0)
+        label = 0
+        if 1.0 <= h < 1.0 + 60 / 3600.0:
+            vib = 1.0 + rng.gauss(0, 0.05)
+            label = 1
+        elif 2.0 <= h < 2.5:
+            vib += 0.25 * (h - 2.0) / 0.5
+            label = 1
+        elif 2.5 <= h < 2.5 + 600 / 3600.0:
+            vib += 0.25
+            label = 1
+        elif 3.5 <= h < 3.5 + 40 / 60.0:
+            temp += 4.0 * (h - 3.5) / (40 / 60.0)
+            label = 1
+        elif 5.0 <= h < 5.0 + 100 / 3600.0:
+            vib = 1.8 + rng.gauss(0, 0.1)
+            label = 1
+        rows.append((s * 1000, round(temp, 2), round(vib, 3), round(dist, 1), 90, label))
+    return rows
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        rows = []
+        for r in csv.DictReader(f):
+            row = (int(r['t_ms']), float(r['temp']), float(r['vib']),
+                   float(r['distance']), int(r['battery']))
+            if r.get('anomaly') not in (None, ''):
+                row += (int(r['anomaly']),)
+            rows.append(row)
+        return rows
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(FIELDS + ('anomaly',) if rows and len(rows[0]) > 5 else FIELDS)
+        w.writerows(rows)
+
+
+class Trace:
+    """Sample-and-hold lookup over rows sorted by time"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.i = 0
+
+    @property
+    def duration_ms(self):
+        return self.rows[-1][0] + 1000 if self.rows else 0
+
+    def at(self, t_ms):
+        """Row in effect at t_ms (t_ms must not go backwards)"""
+        rows = self.rows
+        while self.i + 1 < len(rows) and rows[self.i + 1][0] <= t_ms:
+            self.i += 1
+        return rows[self.i]
@@ -0,0 +1,129 @@
+# ============================================================================
+# AegisOne UI Harness
+# Replays a reading trace through the dashboard's label updates with plain
+# M5Label stand-ins and with the dirty-tracking View, and reports how many
+# set_text / set_text_color calls reach the display in each case. Also
+# checks that set_value() repaints a label whose format changes while the
+# value stays the same (the distance label when proximity limits move).
+#
+#   python3 m5core2-uiflow/host/ui_harness.py
+# ============================================================================
+
+import sys
+
+import stubs
+
+stubs.install()
+
+from aegis_view import View
+
+UI_TASK_MS = 50        # an aggressive refresh task
+UI_MIN_FRAME_MS = 200
+DURATION_MS = 60000
+
+COLOR_PRIMARY = 0x00D4AA
+COLOR_WARNING = 0xFFB800
+COLOR_DANGER = 0xFF4757
+COLOR_TEXT = 0xFFFFFF
+COLOR_TEXT_DIM = 0x8892A0
+
+
+class FakeLabel:
+    """M5Label stand-in that counts calls reaching the display"""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.text = None
+        self.color = None
+
+    def set_text(self, text):
+        self.counter[0] += 1
+        self.text = text
+
+    def set_text_color(self, color):
+        self.counter[0] += 1
+        self.color = color
+
+
+def reading(t_ms):
+    """Mostly steady plant with a slow temperature ramp and one vibration spike"""
+    temp = 30.0 + t_ms / 10000.0
+    vib = 2.8 if 20000 <= t_ms < 23000 else 0.42
+    dist = 150.0 if t_ms < 40000 else 80.0
+    return temp, vib, dist
+
+
+def render(labels, t_ms):
+    """Same call sequence as update_ui()"""
+    temp, vib, dist = reading(t_ms)
+    proximity = 'SAFE' if dist > 100 else 'WARNING'
+    status = 'CRITICAL' if vib >= 2.5 else 'RUNNING'
+    labels['temp'].set_text('{:.1f}'.format(temp))
+    labels['vib'].set_text('{:.2f}'.format(vib))
+    labels['dist'].set_text('{:.0f} cm | {}'.format(dist, proximity))
+    labels['temp'].set_text_color(COLOR_WARNING if temp >= 35.0 else COLOR_PRIMARY)
+    labels['vib'].set_text_color(COLOR_DANGER if vib >= 2.5 else COLOR_PRIMARY)
+    labels['dist'].set_text_color(COLOR_PRIMARY if proximity == 'SAFE' else COLOR_WARNING)
+    labels['status'].set_text(status)
+    labels['status'].set_text_color(COLOR_DANGER if status == 'CRITICAL' else COLOR_PRIMARY)
+    labels['wifi'].set_text_color(COLOR_PRIMARY)
+    labels['aws'].set_text_color(COLOR_PRIMARY)
+    labels['battery'].set_text('{}%'.format(100 - t_ms // 30000))
+    labels['battery'].set_text_color(COLOR_TEXT_DIM)
+    labels['clock'].set_text('Last update: 00:{:02d}:{:02d}'.format(t_ms // 60000, t_ms // 1000 % 60))
+    return temp, vib, dist, status
+
+
+def run(use_view):
+    counter = [0]
+    names = ('temp', 'vib', 'dist', 'status', 'wifi', 'aws', 'battery', 'clock')
+    view = View(UI_MIN_FRAME_MS)
+    if use_view:
+        labels = dict((n, view.bind(FakeLabel(counter))) for n in names)
+    else:
+        labels = dict((n, FakeLabel(counter)) for n in names)
+
+    stale = 0
+    for t in range(0, DURATION_MS, UI_TASK_MS):
+        if use_view and not view.frame(t):
+            continue
+        temp, _, _, status = render(labels, t)
+        shown = labels['temp'].label if use_view else labels['temp']
+        if shown.text != '{:.1f}'.format(temp):
+            stale += 1
+        shown = labels['status'].label if use_view else labels['status']
+        if shown.text != status:
+            stale += 1
+
+    print('{:<6} display calls {:>5}  frames {:>4}  throttled {:>4}  skipped {:>5}  stale {}'.format(
+        'view' if use_view else 'plain', counter[0], view.frames if use_view else DURATION_MS // UI_TASK_MS,
+        view.throttled, view.skipped, stale))
+    return counter[0], stale, view
+
+
+def check_format_change():
+    """Same distance, proximity SAFE then WARNING (DIST_WARNING raised)"""
+    counter = [0]
+    label = FakeLabel(counter)
+    widget = View(UI_MIN_FRAME_MS).bind(label)
+    widget.set_value(120.0, '{:.0f} cm | SAFE')
+    widget.set_value(120.0, '{:.0f} cm | SAFE')
+    widget.set_value(120.0, '{:.0f} cm | WARNING')
+    ok = label.text == '120 cm | WARNING' and counter[0] == 2
+    print('format change only: label shows {!r} after {} display calls'.format(
+        label.text, counter[0]))
+    return ok
+
+
+def main():
+    plain, _, _ = run(False)
+    calls, stale, view = run(True)
+    ok = calls < plain // 4 and stale == 0 and view.throttled > 0 and view.pushed == calls
+    print('display calls {} -> {} ({:.0%} saved)'.format(plain, calls, 1 - calls / plain))
+    ok &= check_format_change()
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
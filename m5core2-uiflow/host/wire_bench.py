@@ -0,0 +1,132 @@
+# ============================================================================
+# AegisOne Wire Format Benchmark
+# Compares bytes per message and encode time for JSON, struct and CBOR, and
+# checks that decode() round-trips every format, including the node state
+# of telemetry and batches and the extra details of a CLEARED event.
+#
+#   python3 m5core2-uiflow/host/wire_bench.py
+# ============================================================================
+
+import json
+import sys
+import time
+
+import stubs
+
+stubs.install()
+
+from aegis_batch import TelemetryBatch
+from aegis_wire import WireEncoder, decode, detect_format, FORMAT_JSON, FORMAT_STRUCT, FORMAT_CBOR
+
+DEVICE_ID = 'aegis-one-m5-01'
+TS = 1760000000000
+BANDS = [0.0012, 0.0451, 0.0031, 0.0009, 0.0004, 0.0002, 0.0001, 0.0001]
+REPEAT = 5000
+STATE = {"loopLagMs": 12, "rate": "normal", "sampleMs": 1000, "vibDropped": 0,
+         "reconnects": 2, "eventQueue": 1, "offlineMs": 61500,
+         "memFree": 81234, "allocPerPass": 312, "allocMaxPass": 1024, "gcMaxUs": 5400}
+
+failures = []
+
+
+def json_telemetry():
+    payload = {
+        "deviceId": DEVICE_ID, "temp": 31.25, "vib": 0.412, "distance": 152.5,
+        "proximity": "SAFE", "status": "RUNNING", "battery": 87, "ts": TS,
+        "vibRms": 0.291, "vibCrest": 1.42, "vibP2p": 0.823,
+        "vibBands": BANDS, "vibPeakHz": 29.3, "vibBandHz": 31.2
+    }
+    payload.update(STATE)
+    return json.dumps(payload)
+
+
+def json_event():
+    return json.dumps({
+        "deviceId": DEVICE_ID, "eventType": "ANOMALY", "severity": "WARNING",
+        "message": "Anomaly: vib_drift", "eventTs": TS,
+        "details": {"temp": 36.5, "vib": 0.412, "distance": 152.5,
+                    "alerts": ["vib_drift", "temp_spike"], "baselineVib": 0.305,
+                    "driftPct": 35.1, "detectionLatencyMs": 4000, "sampleIntervalMs": 1000}
+    })
+
+
+def json_cleared():
+    return json.dumps({
+        "deviceId": DEVICE_ID, "eventId": 0x10002, "eventType": "CLEARED", "severity": "INFO",
+        "message": "CRITICAL cleared after 64 s (12 suppressed)", "eventTs": TS,
+        "details": {"temp": 31.2, "vib": 0.41, "distance": 152.5, "alerts": [],
+                    "baselineVib": None, "driftPct": None, "detectionLatencyMs": None,
+                    "sampleIntervalMs": 1000, "clearedSeverity": "CRITICAL",
+                    "durationMs": 64350, "suppressed": 12}
+    })
+
+
+def make_batch():
+    b = TelemetryBatch(DEVICE_ID)
+    for i in range(10):
+        b.add(TS + i * 1000, 31.25 + i * 0.05, 0.412, 152.5 - i * 10, 'RUNNING', 87,
+              'SAFE' if i < 6 else 'WARNING')
+    return b
+
+
+def encode(fmt, kind, enc, batch):
+    if fmt == FORMAT_JSON:
+        if kind == 'telemetry':
+            return json_telemetry()
+        if kind == 'event':
+            return json_event()
+        if kind == 'cleared':
+            return json_cleared()
+        extra = {"vibRms": 0.291, "vibCrest": 1.42, "vibP2p": 0.823,
+                 "vibBands": BANDS, "vibPeakHz": 29.3, "vibBandHz": 31.2}
+        extra.update(STATE)
+        return batch.encode(extra)
+    if kind == 'telemetry':
+        return enc.telemetry(TS, 31.25, 0.412, 152.5, 'RUNNING', 'SAFE', 87,
+                             0.291, 1.42, 0.823, 29.3, 31.2, BANDS, state=STATE)
+    if kind == 'event':
+        return enc.event(TS, 'WARNING', 'Anomaly: vib_drift', 36.5, 0.412, 152.5,
+                         0.305, 35.1, 4000, 0, 'ANOMALY', ['vib_drift', 'temp_spike'], 1000)
+    if kind == 'cleared':
+        return enc.event(TS, 'INFO', 'CRITICAL cleared after 64 s (12 suppressed)', 31.2, 0.41,
+                         152.5, None, None, None, 0x10002, 'CLEARED', [], 1000,
+                         {"clearedSeverity": "CRITICAL", "durationMs": 64350, "suppressed": 12})
+    return enc.batch(batch, 0.291, 1.42, 0.823, 29.3, 31.2, BANDS, state=STATE)
+
+
+def close(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(a - b) <= 1e-4 * max(1.0, abs(b))
+    if isinstance(a, dict):
+        return set(a) == set(b) and all(close(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(close(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def main():
+    batch = make_batch()
+    print('{:<10} {:<7} {:>7} {:>12}'.format('message', 'format', 'bytes', 'encode us'))
+    for kind in ('telemetry', 'batch', 'event', 'cleared'):
+        reference = json.loads(encode(FORMAT_JSON, kind, None, batch))
+        for fmt in (FORMAT_JSON, FORMAT_STRUCT, FORMAT_CBOR):
+            enc = WireEncoder(DEVICE_ID, fmt)
+            data = encode(fmt, kind, enc, batch)
+            size = len(data)
+            decoded = decode(data if fmt != FORMAT_JSON else data.encode())
+            if detect_format(data if fmt != FORMAT_JSON else data.encode()) != fmt:
+                failures.append('{} {} format detection'.format(kind, fmt))
+            if not close(decoded, reference):
+                failures.append('{} {} round trip'.format(kind, fmt))
+            t0 = time.perf_counter()
+            for _ in range(REPEAT):
+                encode(fmt, kind, enc, batch)
+            us = (time.perf_counter() - t0) / REPEAT * 1e6
+            print('{:<10} {:<7} {:>7} {:>12.1f}'.format(kind, fmt, size, us))
+    for name in failures:
+        print('FAIL:', name)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())